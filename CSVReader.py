@@ -25,19 +25,34 @@ from builtins import range
 from builtins import object
 
 import csv
+import mmap
 import struct
+from bisect import bisect_left
 
 from . import mavutil
 from . import mavextra
 from . import mavexpression
 
+# number of rows used to decide which columns are numeric
+DTYPE_SAMPLE_ROWS = 100
+
+# number of rows converted at a time when working out timestamps
+TIMESTAMP_CHUNK_ROWS = 65536
+
 class CSVMessage(object):
     def __init__(self, message_type, fmt, line):
         self.fmt = fmt
         self.message_type = message_type
 
         self.line = []
-        for entry in line:
+        for (entry, numeric) in zip(line, fmt.numeric):
+            if numeric:
+                try:
+                    entry = float(entry)
+                except ValueError:
+                    pass
+            self.line.append(entry)
+        for entry in line[len(fmt.numeric):]:
             try:
                 self.line.append(float(entry))
             except ValueError:
@@ -61,15 +76,22 @@ class CSVMessage(object):
         '''override field getter'''
         if field == '_timestamp':
             if self.fmt.timestamp_expression is not None:
-                return mavexpression.evaluate_expression(self.fmt.timestamp_expression, self.fmt.messages)
+                # the reader works out every row's timestamp once
+                self._timestamp = float(self.fmt.messages['MAV'].timestamps()[self._row])
+                return self._timestamp
             return int(self.line[0])
-        return self.line[self.fmt.field_offset[field]]
+        try:
+            return self.line[self.fmt.field_offset[field]]
+        except KeyError:
+            raise AttributeError(field)
 
 class CSVFormat(object):
     def __init__(self, headings, messages, timestamp_expression=None):
         self.headings = headings
         self.messages = messages
         self.timestamp_expression = timestamp_expression
+        # True for columns holding numbers, see CSVReader.infer_types()
+        self.numeric = [True] * len(headings)
 
         # map from a field name to an offset in the line:
         self.field_offset = {}
@@ -79,7 +101,12 @@ class CSVFormat(object):
             count += 1
 
 class CSVReader(object):
-    '''parse a CSV file'''
+    '''parse a CSV file.
+
+    The file is memory mapped and the start of each line found once
+    when it is opened, so rewinding, counting and seeking don't need to
+    re-read it. Columns are typed as numbers or strings from the first
+    rows, and extract_arrays() gives whole columns as numpy arrays'''
     def __init__(self,
                  filename,
                  zero_time_base=False,
@@ -90,6 +117,7 @@ class CSVReader(object):
                  ):
 
         self.messages = { 'MAV' : self }
+        self.filter_state = mavextra.FilterState(self)
         self.filename = filename
         self.separator = separator
         self.message_type = message_type
@@ -98,12 +126,29 @@ class CSVReader(object):
 
         self.timestamp = 0
         self.verbose = False
-        self.f = None
-        self.linecount = None
+        self._timestamps = None
+
+        f = open(filename, mode='rb')
+        try:
+            self.data_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can't be mapped
+            self.data_map = b''
+        f.close()
+        self.data_len = len(self.data_map)
+
+        header_end = self.data_map.find(b'\n')
+        if header_end == -1:
+            header_end = self.data_len
+        self.fmt = CSVFormat(self._split(self.data_map[:header_end]),
+                             self.messages,
+                             timestamp_expression=self.timestamp_expression)
+        self._index_lines(header_end + 1)
+        self.infer_types()
 
-        self._rewind()  # opens files etc etc
+        self._rewind()
         self.recv_msg()  # populate self.messages
-        self._rewind()  # opens files etc etc
+        self._rewind()
 
         # start attributes for MAVExplorer
         self._flightmodes = []
@@ -115,25 +160,10 @@ class CSVReader(object):
 
     @property
     def _count(self):
-        # implicitly rewinds
-        if self.linecount is None:
-            self.linecount = self.count_lines()
-        return self.linecount
+        return len(self.line_starts)
 
     def count_lines(self):
-        self._rewind()
-        count = 0
-        while True:
-            try:
-                if count == 0:
-                    if self._parse_next() == None:
-                        raise StopIteration
-                else:
-                    next(self.reader)
-                count += 1
-            except StopIteration:
-                self._rewind()
-                return count
+        return self._count
 
     def rewind(self):
         self._rewind()
@@ -143,24 +173,87 @@ class CSVReader(object):
 
     # end methods for MAVExplorer
 
+    def _index_lines(self, offset):
+        '''find the start and end of each non-empty line from offset'''
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+        if np is None or self.data_len <= offset:
+            starts = []
+            ends = []
+            while offset < self.data_len:
+                end = self.data_map.find(b'\n', offset)
+                if end == -1:
+                    end = self.data_len
+                if self.data_map[offset:end].strip():
+                    starts.append(offset)
+                    ends.append(end)
+                offset = end + 1
+            self.line_starts = starts
+            self.line_ends = ends
+            return
+        data = np.frombuffer(self.data_map, dtype=np.uint8)
+        newlines = [np.array([offset - 1], dtype=np.int64)]
+        chunk = 1 << 24
+        for ofs in range(offset, self.data_len, chunk):
+            newlines.append(np.flatnonzero(data[ofs:ofs+chunk] == ord('\n')) + ofs)
+            if self.progress_callback is not None:
+                self.progress_callback((100 * min(ofs + chunk, self.data_len)) // self.data_len)
+        newlines = np.concatenate(newlines)
+        starts = newlines + 1
+        ends = np.append(newlines[1:], self.data_len)
+        # drop blank lines, including bare carriage returns
+        length = ends - starts
+        blank = (length == 0) | ((length == 1) & (data[np.minimum(starts, self.data_len-1)] == ord('\r')))
+        self.line_starts = starts[~blank]
+        self.line_ends = ends[~blank]
+
+    def _split(self, line):
+        '''split one line into its fields'''
+        line = line.decode('utf-8', 'replace').rstrip('\r\n')
+        if '"' in line:
+            return next(csv.reader([line], delimiter=self.separator))
+        return line.split(self.separator)
+
+    def _line(self, n):
+        return self._split(self.data_map[self.line_starts[n]:self.line_ends[n]])
+
+    def infer_types(self):
+        '''decide which columns are numeric from the first rows. A column
+        is numeric if every non-empty value in the sample is a number'''
+        numeric = [True] * len(self.fmt.headings)
+        for n in range(min(DTYPE_SAMPLE_ROWS, self._count)):
+            line = self._line(n)
+            for i in range(min(len(line), len(numeric))):
+                if not numeric[i] or line[i] == '':
+                    continue
+                try:
+                    float(line[i])
+                except ValueError:
+                    numeric[i] = False
+        self.fmt.numeric = numeric
+
     def _rewind(self):
         '''reset state on rewind'''
         self.percent = 0
-
-        if self.f is not None:
-            self.f.close()
-
-        self.f = open(self.filename, mode='r')
-
-        self.reader = csv.reader(self.f, delimiter=self.separator)
-
-        self.fmt = CSVFormat(next(self.reader),
-                             self.messages,
-                             timestamp_expression=self.timestamp_expression)
+        self.filter_state.reset()
+        self.line_number = 0
 
     def recv_msg(self):
         return self._parse_next()
 
+    def skip_to_type(self, type):
+        '''skip to the next message of the given types; every line is
+        of the one type, so this only matters for other types'''
+        if not self.message_type in type:
+            self.line_number = self._count
+
+    def skip_to_timestamp(self, timestamp):
+        '''seek to the first message at or after the given time.
+        Timestamps are assumed to increase through the file'''
+        self.line_number = bisect_left(self.timestamps(), timestamp)
+
     def recv_match(self, condition=None, type=None, blocking=False):
 #        print("recv_match called (condition=%s type=%s blocking=%s" % (str(condition), str(type), str(blocking)))
         '''recv the next message that matches the given condition
@@ -168,6 +261,8 @@ class CSVReader(object):
         if type is not None and not isinstance(type, list) and not isinstance(type, set):
             type = [type]
         while True:
+            if type is not None:
+                self.skip_to_type(type)
             m = self.recv_msg()
             if m is None:
                 return None
@@ -184,12 +279,14 @@ class CSVReader(object):
     def _parse_next(self):
         '''read one message, returning it as an object'''
 
-        try:
-            line = next(self.reader)
-        except StopIteration:
+        if self.line_number >= self._count:
             return None
+        line = self._line(self.line_number)
+        self.line_number += 1
+        self.percent = 100.0 * self.line_number / self._count
 
         m = CSVMessage(self.message_type, self.fmt, line)
+        m._row = self.line_number - 1
 
         self._add_msg(m)
 
@@ -199,5 +296,93 @@ class CSVReader(object):
         '''add a new message'''
         self.messages[self.message_type] = m
 
+    def _columns(self, start, end):
+        '''the columns of lines start to end as numpy arrays, numeric
+        columns as float64 with NaN for missing values'''
+        import numpy as np
+        ncols = len(self.fmt.headings)
+        rows = [self._line(n) for n in range(start, end)]
+        ret = {}
+        for i in range(ncols):
+            values = [(r[i] if i < len(r) else '') for r in rows]
+            if self.fmt.numeric[i]:
+                try:
+                    ret[self.fmt.headings[i]] = np.array(values, dtype=np.float64)
+                    continue
+                except ValueError:
+                    pass
+                col = np.empty(len(values), dtype=np.float64)
+                for j in range(len(values)):
+                    try:
+                        col[j] = float(values[j])
+                    except ValueError:
+                        col[j] = np.nan
+                ret[self.fmt.headings[i]] = col
+            else:
+                ret[self.fmt.headings[i]] = np.array(values, dtype=str)
+        return ret
+
+    def _column_timestamps(self, columns, start, end):
+        '''timestamps of the rows in columns, evaluating the timestamp
+        expression over whole columns where possible'''
+        import numpy as np
+        n = end - start
+        if self.timestamp_expression is None:
+            first = columns[self.fmt.headings[0]]
+            if first.dtype.kind == 'f':
+                return np.trunc(first)
+        else:
+            try:
+                from . import mavarray
+                arrays = mavarray.MessageArrays(self.message_type, columns,
+                                                np.zeros(n), np.arange(start, end))
+                with np.errstate(all='ignore'):
+                    v = eval(self.timestamp_expression, dict(mavarray.vector_namespace),
+                             {self.message_type : arrays})
+                v = np.asarray(v, dtype=np.float64)
+                if v.shape == (n,):
+                    return v
+            except Exception:
+                pass
+        # fall back to one row at a time
+        ret = np.empty(n, dtype=np.float64)
+        for j in range(n):
+            m = CSVMessage(self.message_type, self.fmt, self._line(start + j))
+            if self.timestamp_expression is None:
+                v = int(m.line[0])
+            else:
+                v = mavexpression.evaluate_expression(self.timestamp_expression,
+                                                      { 'MAV' : self, self.message_type : m })
+            ret[j] = np.nan if v is None else v
+        return ret
+
+    def timestamps(self):
+        '''the timestamp of every row as a numpy array, computed once'''
+        import numpy as np
+        if self._timestamps is None:
+            ret = np.empty(self._count, dtype=np.float64)
+            for start in range(0, self._count, TIMESTAMP_CHUNK_ROWS):
+                end = min(start + TIMESTAMP_CHUNK_ROWS, self._count)
+                ret[start:end] = self._column_timestamps(self._columns(start, end), start, end)
+            self._timestamps = ret
+        return self._timestamps
+
+    def extract_arrays(self, type, start=0, count=None):
+        '''return a dict of numpy arrays, one per column, for rows start
+        to start+count (default all), plus _timestamp and _offset (the
+        row number) arrays. Returns None for other message types'''
+        import numpy as np
+        if type != self.message_type:
+            return None
+        end = self._count if count is None else min(start + count, self._count)
+        start = min(start, end)
+        ret = self._columns(start, end)
+        if self._timestamps is not None:
+            ret['_timestamp'] = self._timestamps[start:end]
+        else:
+            ret['_timestamp'] = self._column_timestamps(dict(ret), start, end)
+        ret['_offset'] = np.arange(start, end)
+        return ret
+
 if __name__ == "__main__":
     print("FIXME")
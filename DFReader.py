@@ -21,6 +21,7 @@ import platform
 import struct
 import sys
 from . import mavutil
+from . import mavextra
 
 try:
     long        # Python 2 has long
@@ -50,6 +51,24 @@ FORMAT_TO_STRUCT = {
     "Q": ("Q", None, long),  # Backward compat
     }
 
+# numpy equivalents of the struct codes in FORMAT_TO_STRUCT, used for
+# bulk extraction of columns
+FORMAT_TO_NUMPY = {
+    "64s": "S64",
+    "4s": "S4",
+    "16s": "S16",
+    "b": "<i1",
+    "B": "<u1",
+    "h": "<i2",
+    "H": "<u2",
+    "i": "<i4",
+    "I": "<u4",
+    "f": "<f4",
+    "d": "<f8",
+    "q": "<i8",
+    "Q": "<u8",
+    }
+
 def u_ord(c):
 	return ord(c) if sys.version_info.major < 3 else c
 
@@ -122,6 +141,35 @@ class DFFormat(object):
         return ("DFFormat(%s,%s,%s,%s)" %
                 (self.type, self.name, self.format, self.columns))
 
+    def numpy_dtype(self):
+        '''return a numpy structured dtype matching msg_struct, with
+        fields named f0, f1, ... in column order'''
+        import numpy as np
+        fields = []
+        for i in range(len(self.msg_fmts)):
+            c = self.msg_fmts[i]
+            if c == 'a':
+                # arrays of 32 int16 values, as transformed by _parse_next
+                fields.append(('f%u' % i, '<i2', (32,)))
+                continue
+            (s, mul, type) = FORMAT_TO_STRUCT[c]
+            fields.append(('f%u' % i, FORMAT_TO_NUMPY[s]))
+        return np.dtype(fields)
+
+def numpy_column(fmt, i, values):
+    '''convert a raw column from a structured array into the values
+    DFMessage would give, as a numpy array'''
+    import numpy as np
+    if fmt.msg_fmts[i] == 'a':
+        return values.astype(np.int64)
+    if fmt.msg_types[i] == str:
+        return np.array([null_term(v) for v in values.tolist()], dtype=str)
+    if fmt.msg_mults[i] is not None:
+        return values.astype(np.float64) * fmt.msg_mults[i]
+    if values.dtype.kind == 'f':
+        return values.astype(np.float64)
+    return values.astype(np.int64)
+
 # Swiped into mavgen_python.py
 def to_string(s):
     '''desperate attempt to convert a string regardless of what garbage we get'''
@@ -461,6 +509,7 @@ class DFReader(object):
         self.params = {}
         self._flightmodes = None
         self.messages = {}
+        self.filter_state = mavextra.FilterState(self)
 
     def _rewind(self):
         '''reset state on rewind'''
@@ -475,6 +524,7 @@ class DFReader(object):
         else:
             self.flightmode = "UNKNOWN"
         self.percent = 0
+        self.filter_state.reset()
         if self.clock:
             self.clock.rewind_event()
 
@@ -695,15 +745,7 @@ class DFReader_binary(DFReader):
     '''parse a binary dataflash file'''
     def __init__(self, filename, zero_time_base=False, progress_callback=None):
         DFReader.__init__(self)
-        # read the whole file into memory for simplicity
-        self.filehandle = open(filename, 'r')
-        self.filehandle.seek(0, 2)
-        self.data_len = self.filehandle.tell()
-        self.filehandle.seek(0)
-        if platform.system() == "Windows":
-            self.data_map = mmap.mmap(self.filehandle.fileno(), self.data_len, None, mmap.ACCESS_READ)
-        else:
-            self.data_map = mmap.mmap(self.filehandle.fileno(), self.data_len, mmap.MAP_PRIVATE, mmap.PROT_READ)
+        self._open_data(filename)
 
         self.HEAD1 = 0xA3
         self.HEAD2 = 0x95
@@ -725,6 +767,17 @@ class DFReader_binary(DFReader):
         self._rewind()
         self.init_arrays(progress_callback)
 
+    def _open_data(self, filename):
+        '''map the log into memory, setting data_map and data_len'''
+        self.filehandle = open(filename, 'r')
+        self.filehandle.seek(0, 2)
+        self.data_len = self.filehandle.tell()
+        self.filehandle.seek(0)
+        if platform.system() == "Windows":
+            self.data_map = mmap.mmap(self.filehandle.fileno(), self.data_len, None, mmap.ACCESS_READ)
+        else:
+            self.data_map = mmap.mmap(self.filehandle.fileno(), self.data_len, mmap.MAP_PRIVATE, mmap.PROT_READ)
+
     def _rewind(self):
         '''rewind to start of log'''
         DFReader._rewind(self)
@@ -785,36 +838,15 @@ class DFReader_binary(DFReader):
             mlen = lengths[mtype]
 
             if mtype == fmt_type:
-                body = self.data_map[ofs+3:ofs+mlen]
-                if len(body)+3 < mlen:
+                mfmt = self._index_fmt(ofs, mlen)
+                if mfmt is None:
                     break
-                fmt = self.formats[mtype]
-                elements = list(struct.unpack(fmt.msg_struct, body))
-                ftype = elements[0]
-                mfmt = DFFormat(
-                    ftype,
-                    null_term(elements[2]), elements[1],
-                    null_term(elements[3]), null_term(elements[4]),
-                    oldfmt=self.formats.get(ftype,None))
-                self.formats[ftype] = mfmt
-                self.name_to_id[mfmt.name] = mfmt.type
-                self.id_to_name[mfmt.type] = mfmt.name
                 if mfmt.name == 'FMTU':
                     fmtu_type = mfmt.type
 
             if fmtu_type is not None and mtype == fmtu_type:
-                fmt = self.formats[mtype]
-                body = self.data_map[ofs+3:ofs+mlen]
-                if len(body)+3 < mlen:
+                if not self._index_fmtu(mtype, ofs, mlen):
                     break
-                elements = list(struct.unpack(fmt.msg_struct, body))
-                ftype = int(elements[1])
-                if ftype in self.formats:
-                    fmt2 = self.formats[ftype]
-                    if 'UnitIds' in fmt.colhash:
-                        fmt2.set_unit_ids(null_term(elements[fmt.colhash['UnitIds']]))
-                    if 'MultIds' in fmt.colhash:
-                        fmt2.set_mult_ids(null_term(elements[fmt.colhash['MultIds']]))
 
             ofs += mlen
             if progress_callback is not None:
@@ -827,6 +859,42 @@ class DFReader_binary(DFReader):
             self._count += self.counts[i]
         self.offset = 0
 
+    def _index_fmt(self, ofs, mlen):
+        '''add the format defined by the FMT message at ofs, returning
+        it, or None if the message is truncated'''
+        body = self.data_map[ofs+3:ofs+mlen]
+        if len(body)+3 < mlen:
+            return None
+        fmt = self.formats[0x80]
+        elements = list(struct.unpack(fmt.msg_struct, body))
+        ftype = elements[0]
+        mfmt = DFFormat(
+            ftype,
+            null_term(elements[2]), elements[1],
+            null_term(elements[3]), null_term(elements[4]),
+            oldfmt=self.formats.get(ftype,None))
+        self.formats[ftype] = mfmt
+        self.name_to_id[mfmt.name] = mfmt.type
+        self.id_to_name[mfmt.type] = mfmt.name
+        return mfmt
+
+    def _index_fmtu(self, mtype, ofs, mlen):
+        '''apply the units from the FMTU message at ofs, returning
+        False if the message is truncated'''
+        fmt = self.formats[mtype]
+        body = self.data_map[ofs+3:ofs+mlen]
+        if len(body)+3 < mlen:
+            return False
+        elements = list(struct.unpack(fmt.msg_struct, body))
+        ftype = int(elements[1])
+        if ftype in self.formats:
+            fmt2 = self.formats[ftype]
+            if 'UnitIds' in fmt.colhash:
+                fmt2.set_unit_ids(null_term(elements[fmt.colhash['UnitIds']]))
+            if 'MultIds' in fmt.colhash:
+                fmt2.set_mult_ids(null_term(elements[fmt.colhash['MultIds']]))
+        return True
+
     def last_timestamp(self):
         '''get the last timestamp in the log'''
         highest_offset = 0
@@ -849,6 +917,48 @@ class DFReader_binary(DFReader):
             m = self.recv_msg()
         return m._timestamp
 
+    def extract_arrays(self, type, start=0, count=None):
+        '''return a dict of numpy arrays holding every column of
+        messages of the given type, plus _timestamp and _offset
+        arrays, without parsing the messages one at a time.  start and
+        count select a range of the messages of that type, so large
+        logs can be processed in chunks.  Returns None if the type
+        can't be extracted in bulk'''
+        import numpy as np
+        if not type in self.name_to_id:
+            return None
+        mtype = self.name_to_id[type]
+        fmt = self.formats[mtype]
+        if len(fmt.columns) == 0 or len(fmt.columns) != len(fmt.msg_fmts):
+            return None
+        if isinstance(self.clock, DFReaderClock_usec) and fmt.columns[0] == 'TimeUS':
+            time_scale = 1.0e-6
+        elif isinstance(self.clock, DFReaderClock_msec) and fmt.columns[0] == 'TimeMS':
+            time_scale = 1.0e-3
+        else:
+            # timestamps depend on message order, not just this type
+            return None
+        end = None if count is None else start + count
+        offsets = np.array(self.offsets[mtype][start:end], dtype=np.int64)
+        offsets = offsets[offsets + fmt.len <= self.data_len]
+        dtype = fmt.numpy_dtype()
+        if dtype.itemsize != fmt.len - 3:
+            return None
+        (data, base) = self._data_array(offsets, fmt.len)
+        body = data[(offsets - base)[:,None] + 3 + np.arange(fmt.len - 3)]
+        records = body.view(dtype).reshape(len(offsets))
+        ret = {}
+        for i in range(len(fmt.columns)):
+            ret[fmt.columns[i]] = numpy_column(fmt, i, records['f%u' % i])
+        ret['_timestamp'] = self.clock.timebase + ret[fmt.columns[0]] * time_scale
+        ret['_offset'] = offsets
+        return ret
+
+    def _data_array(self, offsets, length):
+        '''return a numpy uint8 array covering the messages of the given
+        length at offsets, and the log offset of its first element'''
+        import numpy as np
+        return (np.frombuffer(self.data_map, dtype=np.uint8), 0)
 
     def skip_to_type(self, type):
         '''skip fwd to next msg matching given type set'''
@@ -1048,33 +1158,82 @@ class DFReader_text(DFReader):
 
     def init_arrays(self, progress_callback=None):
         '''initialise arrays for fast recv_match()'''
+        try:
+            # _index_lines needs numpy
+            offsets = self._index_lines(progress_callback)
+        except ImportError:
+            offsets = self._index_lines_slow(progress_callback)
         self.offsets = {}
         self.counts = {}
-        self._count = 0
+        for mtype in offsets:
+            self.offsets[mtype] = offsets[mtype]
+            self.counts[mtype] = len(offsets[mtype])
+        self._count = sum(self.counts.values())
+
+        # parse the formats and units, and the first message of each
+        # type, in the order they appear in the log
+        parse = set(self.offsets.get('FMT', []) + self.offsets.get('FMTU', []))
+        for mtype in self.offsets:
+            parse.add(self.offsets[mtype][0])
+        for ofs in sorted(parse):
+            self.offset = ofs
+            self._parse_next()
+        self.offset = 0
+
+    def _index_lines(self, progress_callback=None):
+        '''find the offsets of the lines of each message type, scanning
+        the log with numpy. Returns a dict of offset lists keyed by
+        message name'''
+        import numpy as np
+        data = np.frombuffer(self.data_map, dtype=np.uint8)
+        starts = [np.array([self.offset], dtype=np.int64)]
+        chunk = 1 << 24
+        for ofs in range(self.offset, self.data_len, chunk):
+            starts.append(np.flatnonzero(data[ofs:ofs+chunk] == ord('\n')) + (ofs + 1))
+            if progress_callback is not None:
+                progress_callback((100 * min(ofs + chunk, self.data_len)) // self.data_len)
+        starts = np.concatenate(starts)
+        self._line_starts = starts
+        starts = starts[starts + 4 < self.data_len]
+
+        # the name is up to 4 characters before the first comma
+        head = data[np.minimum(starts[:,None] + np.arange(5), self.data_len - 1)]
+        is_comma = head == ord(',')
+        name_len = np.argmax(is_comma, axis=1)
+        name_chars = np.arange(4)[None,:] < name_len[:,None]
+        c = head[:,:4]
+        good = ((c >= ord('A')) & (c <= ord('Z'))) | ((c >= ord('0')) & (c <= ord('9')))
+        valid = is_comma.any(axis=1) & (name_len > 0) & np.all(good | ~name_chars, axis=1)
+        starts = starts[valid]
+        name_len = name_len[valid]
+        c = np.where(name_chars[valid], c[valid], 0).astype(np.uint32)
+        keys = c[:,0] | (c[:,1] << 8) | (c[:,2] << 16) | (c[:,3] << 24)
+
+        (ukeys, first, inverse) = np.unique(keys, return_index=True, return_inverse=True)
+        order = np.argsort(inverse, kind='stable')
+        bounds = np.cumsum(np.bincount(inverse, minlength=len(ukeys)))
+        ret = {}
+        for i in range(len(ukeys)):
+            ofs = starts[first[i]]
+            name = self.data_map[ofs:ofs+name_len[first[i]]].decode('ascii')
+            lines = order[(bounds[i-1] if i > 0 else 0):bounds[i]]
+            ret[name] = starts[lines].tolist()
+        return ret
+
+    def _index_lines_slow(self, progress_callback=None):
+        '''find the offsets of the lines of each message type one line
+        at a time, for when numpy isn't available'''
+        ret = {}
         ofs = self.offset
         pct = 0
-
-        while ofs+16 < self.data_len:
-            mtype = self.data_map[ofs:ofs+4]
-            if mtype[3] == b',':
-                mtype = mtype[0:3]
-            if not mtype in self.offsets:
-                self.counts[mtype] = 0
-                self.offsets[mtype] = []
-                self.offset = ofs
-                self._parse_next()
-            self.offsets[mtype].append(ofs)
-
-            self.counts[mtype] += 1
-
-            if mtype == "FMT":
-                self.offset = ofs
-                self._parse_next()
-
-            if mtype == "FMTU":
-                self.offset = ofs
-                self._parse_next()
-                
+        while ofs+4 < self.data_len:
+            comma = self.data_map.find(b',', ofs, ofs+5)
+            if comma > ofs:
+                name = self.data_map[ofs:comma].decode('ascii', 'ignore')
+                if name.isalnum() and name.upper() == name:
+                    if not name in ret:
+                        ret[name] = []
+                    ret[name].append(ofs)
             ofs = self.data_map.find(b"\n", ofs)
             if ofs == -1:
                 break
@@ -1083,10 +1242,7 @@ class DFReader_text(DFReader):
             if progress_callback is not None and new_pct != pct:
                 progress_callback(new_pct)
                 pct = new_pct
-
-        for mtype in self.counts.keys():
-            self._count += self.counts[mtype]
-        self.offset = 0
+        return ret
 
     def skip_to_type(self, type):
         '''skip fwd to next msg matching given type set'''
@@ -1115,10 +1271,22 @@ class DFReader_text(DFReader):
         if smallest_index >= 0:
             self.indexes[smallest_index] += 1
             self.offset = smallest_offset
+        else:
+            # the index covers every line, so there are no more
+            self.offset = self.data_len
 
     def _parse_next(self):
         '''read one message, returning it as an object'''
 
+        # lines which can't be parsed are skipped
+        while True:
+            m = self._parse_line()
+            if m is not False:
+                return m
+
+    def _parse_line(self):
+        '''parse the line at self.offset, returning the message, None
+        at the end of the log or False if the line should be skipped'''
         while True:
             endline = self.data_map.find(b'\n',self.offset)
             if endline == -1:
@@ -1147,13 +1315,13 @@ class DFReader_text(DFReader):
         msg_type = elements[0]
 
         if msg_type not in self.formats:
-            return self._parse_next()
+            return False
 
         fmt = self.formats[msg_type]
 
         if len(elements) < len(fmt.format)+1:
             # not enough columns
-            return self._parse_next()
+            return False
 
         elements = elements[1:]
 
@@ -1181,7 +1349,7 @@ class DFReader_text(DFReader):
         try:
             m = DFMessage(fmt, elements, False, self)
         except ValueError:
-            return self._parse_next()
+            return False
 
         if m.get_type() == 'FMTU':
             fmtid = getattr(m, 'FmtType', None)
@@ -1194,6 +1362,71 @@ class DFReader_text(DFReader):
 
         return m
 
+    def extract_arrays(self, type, start=0, count=None):
+        '''return a dict of numpy arrays holding every column of
+        messages of the given type, plus _timestamp and _offset
+        arrays, as DFReader_binary.extract_arrays() does. Values are as
+        written in the log, as for messages from this reader. Returns
+        None if the type can't be extracted in bulk, including types
+        with string or array columns'''
+        import numpy as np
+        if not type in self.formats or not type in self.offsets:
+            return None
+        fmt = self.formats[type]
+        ncols = len(fmt.columns)
+        if ncols == 0 or ncols != len(fmt.msg_fmts) or getattr(self, '_line_starts', None) is None:
+            return None
+        for i in range(ncols):
+            if fmt.msg_fmts[i] in 'aM' or not fmt.msg_types[i] in (int, float):
+                return None
+        if isinstance(self.clock, DFReaderClock_usec) and fmt.columns[0] == 'TimeUS':
+            time_scale = 1.0e-6
+        elif isinstance(self.clock, DFReaderClock_msec) and fmt.columns[0] == 'TimeMS':
+            time_scale = 1.0e-3
+        else:
+            # timestamps depend on message order, not just this type
+            return None
+        end = None if count is None else start + count
+        offsets = np.array(self.offsets[type][start:end], dtype=np.int64)
+        line_starts = self._line_starts
+        nxt = np.searchsorted(line_starts, offsets, 'right')
+        ends = np.where(nxt < len(line_starts), line_starts[np.minimum(nxt, len(line_starts)-1)] - 1, self.data_len)
+        prefix = len(type) + 1
+        data_map = self.data_map
+        lines = [data_map[a:b] for (a, b) in zip((offsets + prefix).tolist(), ends.tolist())]
+        try:
+            values = np.fromstring(b','.join(lines), dtype=np.float64, sep=',')
+        except ValueError:
+            # newer numpy raises on fields that aren't numbers
+            values = None
+        if values is not None and len(values) == len(lines) * ncols:
+            values = values.reshape(len(lines), ncols)
+        else:
+            # some lines have the wrong number of columns; parse them
+            # one at a time, skipping the bad ones as _parse_next does
+            rows = []
+            good = []
+            for i in range(len(lines)):
+                elements = lines[i].split(b',')
+                if len(elements) < ncols:
+                    continue
+                try:
+                    rows.append([float(e) for e in elements[:ncols]])
+                except ValueError:
+                    continue
+                good.append(i)
+            values = np.array(rows, dtype=np.float64).reshape(len(rows), ncols)
+            offsets = offsets[good]
+        ret = {}
+        for i in range(ncols):
+            if fmt.msg_types[i] == int:
+                ret[fmt.columns[i]] = values[:,i].astype(np.int64)
+            else:
+                ret[fmt.columns[i]] = values[:,i]
+        ret['_timestamp'] = self.clock.timebase + values[:,0] * time_scale
+        ret['_offset'] = offsets
+        return ret
+
     def last_timestamp(self):
         '''get the last timestamp in the log'''
         highest_offset = 0
@@ -168,6 +168,84 @@ templatefooter = '''
 
 });'''
 
+# decode throughput, run with eg: mocha test --grep 'throughput'
+templatethroughput = '''
+//--------------------------------------------------------------------------------------------------------------------------------------------------------
+
+describe('throughput of ${MAVTYPE}/${VERSION} parsing and CRC', function() {
+
+    this.timeout(60000);
+
+    beforeEach(function() {
+        var {mavlink${VERS}, MAVLink${VERS}Processor} = require('../implementations/mavlink_${MAVTYPE}_v${VERSION}/mavlink.js');// hardcoded here by make_tests.py generator
+        this.mavlink = mavlink${VERS};
+        this.Processor = MAVLink${VERS}Processor;
+        this.tests = require('../implementations/mavlink_${MAVTYPE}_v${VERSION}/mavlink.tests.js');//// hardcoded here by make_tests.py generator
+        this.tests.set_mav(new MAVLink${VERS}Processor(null, 42, 150));
+
+        // one packed copy of every message in the dialect
+        var packets = [];
+        for (var name in this.tests) {
+            if (name.startsWith('test_')) {
+                try {
+                    packets.push(this.tests[name]()[1]);
+                } catch (e) {
+                    // a few test messages can't be packed by jspack
+                }
+            }
+        }
+        this.packets = packets;
+        this.stream = Buffer.concat(packets);
+    });
+
+    it('table driven CRC matches the bitwise CRC', function() {
+        var buf = require('crypto').randomBytes(4096);
+        var crc = 0xffff;
+        for (var i = 0; i < buf.length; i++) {
+            var tmp = buf[i] ^ (crc & 0xff);
+            tmp = (tmp ^ (tmp << 4)) & 0xff;
+            crc = ((crc >> 8) ^ (tmp << 8) ^ (tmp << 3) ^ (tmp >> 4)) & 0xffff;
+        }
+        this.mavlink.x25Crc(buf).should.equal(crc);
+        this.mavlink.x25Crc(Array.from(buf)).should.equal(crc);
+        this.mavlink.x25Crc(new Uint8Array(buf)).should.equal(crc);
+    });
+
+    it('CRC throughput', function() {
+        var buf = Buffer.alloc(1 << 22, 0x55);
+        var start = process.hrtime();
+        this.mavlink.x25Crc(buf);
+        var t = process.hrtime(start);
+        var secs = t[0] + t[1] / 1e9;
+        console.log('        x25Crc: ' + (buf.length / secs / 1e6).toFixed(1) + ' MB/s');
+    });
+
+    it('parseBuffer throughput', function() {
+        var repeat = 50;
+        var big = Buffer.concat(Array(repeat).fill(this.stream));
+        var mav = new this.Processor(null, 1, 1);
+        var start = process.hrtime();
+        var msgs = mav.parseBuffer(big);
+        var t = process.hrtime(start);
+        var secs = t[0] + t[1] / 1e9;
+        msgs.length.should.equal(repeat * this.packets.length);
+        mav.total_receive_errors.should.equal(0);
+        console.log('        parseBuffer: ' + Math.round(msgs.length / secs) + ' msgs/s, ' +
+                    (big.length / secs / 1e6).toFixed(1) + ' MB/s');
+    });
+
+    it('decodes packets split across many small chunks', function() {
+        var mav = new this.Processor(null, 1, 1);
+        var count = 0;
+        for (var i = 0; i < this.stream.length; i += 7) {
+            var msgs = mav.parseBuffer(this.stream.subarray(i, i + 7));
+            count += (msgs === null) ? 0 : msgs.length;
+        }
+        count.should.equal(this.packets.length);
+        mav.total_receive_errors.should.equal(0);
+    });
+});'''
+
 #------------------------------------------------
 
 def is_packet_and_field_in_long_list(pname,fname):
@@ -360,6 +438,10 @@ for mt in mavtypes:
         llines = []
         make_long_lookup_table(mt, v);
         do_make_output(mt,v,lines)
+        t = templatethroughput.replace('${MAVTYPE}',mt)
+        t =                  t.replace('${VERSION}',v)
+        t =                  t.replace('${VERS}',v.replace('.',''))
+        print(t)
 
 
 print("//output done")
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+'''
+build the python dialect modules
+
+Used by setup.py to generate every dialect for each wire protocol.
+Each XML file is parsed once per wire protocol and shared between the
+dialects including it, dialects whose XML (and includes) and generator
+haven't changed since the last build are skipped, and the rest are
+generated in a pool of processes.
+
+The hash of the inputs of each generated module is kept in a
+.build_hashes file next to it.
+
+Released under GNU GPL version 3 or later
+'''
+from __future__ import print_function
+from __future__ import absolute_import
+
+import json
+import os
+import time
+
+from . import mavcache
+from . import mavgen
+
+HASH_FILE = '.build_hashes'
+
+# parsed XML shared between the dialects built by one process
+_cache = None
+
+
+def _load_hashes(directory):
+    try:
+        with open(os.path.join(directory, HASH_FILE)) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def _save_hashes(directory, hashes):
+    tmp = os.path.join(directory, HASH_FILE + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(hashes, f, indent=1, sort_keys=True)
+    os.rename(tmp, os.path.join(directory, HASH_FILE))
+
+
+def _build_one(job):
+    '''generate one dialect, returning (dialect, wire_protocol, ok, seconds)'''
+    global _cache
+    (dialect, wire_protocol, lazy, schema) = job
+    if _cache is None:
+        _cache = mavgen.XMLCache()
+    t0 = time.time()
+    try:
+        ok = mavgen.mavgen_python_dialect(dialect, wire_protocol, lazy=lazy, cache=_cache, schema=schema)
+    except Exception as ex:
+        print("Building %s failed: %s" % (dialect, ex))
+        ok = False
+    return (dialect, wire_protocol, ok, time.time() - t0)
+
+
+def _pool(processes):
+    '''a process pool, or None if building in parallel isn't possible.
+    Only fork is used, as spawned workers would re-run setup.py'''
+    if processes is not None and processes <= 1:
+        return None
+    try:
+        import multiprocessing
+        if not 'fork' in multiprocessing.get_all_start_methods():
+            return None
+        return multiprocessing.get_context('fork').Pool(processes)
+    except (ImportError, OSError, AttributeError):
+        return None
+
+
+def build_dialects(dialects, lazy=False, processes=None, force=False, schema=False):
+    '''generate python modules for a list of (dialect, wire_protocol)
+    pairs, returning the list of those which failed. Up to processes
+    dialects (default one per CPU) are built at once, and with force
+    dialects are rebuilt even if unchanged. lazy and schema are passed
+    to mavgen_python.generate()'''
+    t0 = time.time()
+    todo = []
+    hashes = {}
+    skipped = 0
+    for (dialect, wire_protocol) in dialects:
+        (py, xml) = mavgen.dialect_paths(dialect, wire_protocol)
+        directory = os.path.dirname(py)
+        if not directory in hashes:
+            hashes[directory] = _load_hashes(directory)
+        key = mavcache.dialect_hash(xml, wire_protocol, lazy, schema)
+        name = os.path.basename(py)
+        outputs = [py]
+        if schema:
+            outputs.append(py[:-3] + '.schema')
+        if (not force and all(os.path.exists(f) for f in outputs) and
+            hashes[directory].get(name, None) == key):
+            skipped += 1
+            continue
+        # forget the old hash until the new module is built
+        hashes[directory].pop(name, None)
+        todo.append(((dialect, wire_protocol, lazy, schema), directory, name, key))
+
+    # the largest dialects take longest, so start them first
+    def size(job):
+        return os.path.getsize(mavgen.dialect_paths(job[0][0], job[0][1])[1])
+    todo.sort(key=size, reverse=True)
+
+    pool = None
+    if len(todo) > 1:
+        pool = _pool(processes)
+    jobs = [t[0] for t in todo]
+    if pool is not None:
+        try:
+            results = pool.map(_build_one, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_build_one(job) for job in jobs]
+
+    failed = []
+    for (t, (dialect, wire_protocol, ok, elapsed)) in zip(todo, results):
+        (job, directory, name, key) = t
+        if ok:
+            print("Built %s for protocol %s in %.1fs" % (dialect, wire_protocol, elapsed))
+            hashes[directory][name] = key
+        else:
+            print("Building failed %s for protocol %s" % (dialect, wire_protocol))
+            failed.append((dialect, wire_protocol))
+    for directory in hashes:
+        try:
+            _save_hashes(directory, hashes[directory])
+        except (IOError, OSError):
+            pass
+    print("Built %u dialects (%u unchanged) in %.1fs" % (len(todo) - len(failed), skipped, time.time() - t0))
+    return failed
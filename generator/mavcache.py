@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+'''
+cache of generated python dialect modules
+
+When a dialect module hasn't been installed, mavutil generates it from
+the XML definitions. The generated module and its bytecode are kept in
+a per-user cache directory, in a subdirectory named by a hash of the
+XML files (including everything they include), the wire protocol and
+the generator itself, so each dialect is only generated once per
+machine and a changed definition is picked up automatically.
+
+The cache directory is $MAVLINK_DIALECT_CACHE if set, otherwise
+pymavlink/dialects under the user cache directory. Setting
+MAVLINK_DIALECT_CACHE to an empty string disables the cache.
+
+Released under GNU GPL version 3 or later
+'''
+from __future__ import print_function
+from __future__ import absolute_import
+
+import hashlib
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+from . import mavgen
+
+# files whose contents determine the generated code
+GENERATOR_FILES = ['mavgen_python.py', 'mavparse.py', 'mavgen.py', 'mavtemplate.py', 'mavschema.py']
+
+re_include = re.compile(r'<include>\s*([^<\s]+)\s*</include>')
+
+
+def cache_dir():
+    '''the directory holding cached dialects, or None if disabled'''
+    path = os.environ.get('MAVLINK_DIALECT_CACHE', None)
+    if path is not None:
+        if path == '':
+            return None
+        return path
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA', os.path.expanduser('~'))
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache'))
+    return os.path.join(base, 'pymavlink', 'dialects')
+
+
+def xml_files(xml):
+    '''the XML file and all the files it includes, directly or not'''
+    ret = []
+    todo = [os.path.abspath(xml)]
+    while len(todo) > 0:
+        fname = todo.pop(0)
+        if fname in ret:
+            continue
+        ret.append(fname)
+        if not os.path.exists(fname):
+            # left for the generator to report
+            continue
+        with open(fname, 'rb') as f:
+            text = f.read().decode('utf-8', 'replace')
+        for inc in re_include.findall(text):
+            todo.append(os.path.abspath(os.path.join(os.path.dirname(fname), inc)))
+    return ret
+
+
+def dialect_hash(xml, wire_protocol, lazy=False, schema=False):
+    '''hash identifying the code generated for an XML file'''
+    h = hashlib.sha256()
+    h.update(('%s\n%s\n' % (wire_protocol, lazy)).encode('ascii'))
+    if schema:
+        h.update(b'schema\n')
+    gendir = os.path.dirname(os.path.realpath(__file__))
+    for fname in GENERATOR_FILES:
+        with open(os.path.join(gendir, fname), 'rb') as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    files = xml_files(xml)
+    for fname in files:
+        # the root file's name is the dialect name; includes are hashed
+        # by name relative to it
+        h.update(os.path.relpath(fname, os.path.dirname(files[0])).encode('utf-8'))
+        if os.path.exists(fname):
+            with open(fname, 'rb') as f:
+                h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()[:32]
+
+
+def cached_dialect(dialect, wire_protocol):
+    '''return the path of the cached module for a dialect, generating
+    it if needed, or None if the dialect can't be cached'''
+    cdir = cache_dir()
+    if cdir is None:
+        return None
+    (py, xml) = mavgen.dialect_paths(dialect, wire_protocol)
+    if not os.path.exists(xml):
+        return None
+    key = dialect_hash(xml, wire_protocol)
+    final = os.path.join(cdir, key)
+    path = os.path.join(final, dialect + '.py')
+    if os.path.exists(path):
+        return path
+
+    # generate into a private directory then rename it into place, so
+    # concurrent processes never see a partly written module
+    try:
+        if not os.path.isdir(cdir):
+            os.makedirs(cdir)
+        tmpdir = tempfile.mkdtemp(prefix='.tmp-', dir=cdir)
+    except OSError:
+        return None
+    try:
+        tmppath = os.path.join(tmpdir, dialect + '.py')
+        if not mavgen.mavgen_python_dialect(dialect, wire_protocol, output=tmppath):
+            return None
+        compile_module(tmppath, path)
+        try:
+            os.rename(tmpdir, final)
+        except OSError:
+            # another process got there first
+            if not os.path.exists(path):
+                return None
+    finally:
+        if os.path.exists(tmpdir):
+            shutil.rmtree(tmpdir, ignore_errors=True)
+    return path
+
+
+def compile_module(filename, final_filename):
+    '''write the bytecode for a module which will be moved to final_filename'''
+    import py_compile
+    try:
+        import importlib.util
+        cfile = importlib.util.cache_from_source(filename)
+    except ImportError:
+        cfile = filename + 'c'
+    try:
+        py_compile.compile(filename, cfile=cfile, dfile=final_filename, doraise=True)
+    except (py_compile.PyCompileError, OSError):
+        # the module still works, it just gets compiled on import
+        pass
+
+
+def import_dialect(dialect, wire_protocol, modname):
+    '''import a dialect from the cache as module modname, returning the
+    module or None if it isn't available'''
+    path = cached_dialect(dialect, wire_protocol)
+    if path is None:
+        return None
+    if sys.version_info[0] < 3:
+        import imp
+        mod = imp.load_source(modname, path)
+    else:
+        import importlib.util
+        spec = importlib.util.spec_from_file_location(modname, path)
+        mod = importlib.util.module_from_spec(spec)
+        sys.modules[modname] = mod
+        try:
+            spec.loader.exec_module(mod)
+        except Exception:
+            del sys.modules[modname]
+            raise
+    if '.' in modname:
+        (parent, name) = modname.rsplit('.', 1)
+        if parent in sys.modules:
+            setattr(sys.modules[parent], name, mod)
+    return mod
@@ -27,6 +27,7 @@ from future import standard_library
 standard_library.install_aliases()
 from builtins import object
 import os
+import pickle
 import re
 import sys
 from . import mavparse
@@ -40,6 +41,8 @@ DEFAULT_LANGUAGE = 'Python'
 DEFAULT_ERROR_LIMIT = 200
 DEFAULT_VALIDATE = True
 DEFAULT_STRICT_UNITS = False
+DEFAULT_LAZY = False
+DEFAULT_SCHEMA = False
 
 MAXIMUM_INCLUDE_FILE_NESTING = 5
 
@@ -48,17 +51,32 @@ MAXIMUM_INCLUDE_FILE_NESTING = 5
 supportedLanguages = ["C", "CS", "JavaScript", "JavaScript_Stable","JavaScript_NextGen", "TypeScript", "Python", "Lua", "WLua", "ObjC", "Swift", "Java", "C++11"]
 
 
-def mavgen(opts, args):
+class XMLCache(object):
+    '''validated and parsed XML files, shared between mavgen() calls so
+    that building several dialects reads each file once per wire
+    protocol. Generating a dialect merges its includes into the parsed
+    files, so each call gets its own copy, unpickled from the first
+    parse'''
+    def __init__(self):
+        self.schemas = {}
+        self.validated = {}
+        self.parsed = {}
+
+
+def mavgen(opts, args, cache=None):
     """Generate mavlink message formatters and parsers (C and Python ) using options
     and args where args are a list of xml files. This function allows python
     scripts under Windows to control mavgen using the same interface as
-    shell scripts under Unix"""
+    shell scripts under Unix. cache is an optional XMLCache"""
 
     xml = []
     all_files = set()
 
     # Enable validation by default, disabling it if explicitly requested
-    if opts.validate:
+    if opts.validate and cache is not None and opts.strict_units in cache.schemas:
+        from lxml import etree
+        xmlschema = cache.schemas[opts.strict_units]
+    elif opts.validate:
         try:
             from lxml import etree
             with open(schemaFile, 'r') as f:
@@ -79,6 +97,27 @@ def mavgen(opts, args):
             print("Exception:", e)
             print("WARNING: Unable to load XML validator libraries. XML validation will not be performed", file=sys.stderr)
             opts.validate = False
+        if opts.validate and cache is not None:
+            cache.schemas[opts.strict_units] = xmlschema
+
+    def validate(fname):
+        if cache is None:
+            return mavgen_validate(fname)
+        key = os.path.abspath(fname)
+        if not key in cache.validated:
+            cache.validated[key] = mavgen_validate(fname)
+        return cache.validated[key]
+
+    def parse(fname):
+        if cache is None:
+            return mavparse.MAVXML(fname, opts.wire_protocol)
+        # parsed by absolute name, as includes are looked up that way
+        key = (os.path.abspath(fname), opts.wire_protocol)
+        if not key in cache.parsed:
+            x = mavparse.MAVXML(key[0], opts.wire_protocol)
+            cache.parsed[key] = pickle.dumps(x, pickle.HIGHEST_PROTOCOL)
+            return x
+        return pickle.loads(cache.parsed[key])
 
     def expand_includes():
         """Expand includes. Root files already parsed objects in the xml list."""
@@ -100,14 +139,14 @@ def mavgen(opts, args):
                     # Validate XML file with XSD file if possible.
                     if opts.validate:
                         print("Validating %s" % fname)
-                        if not mavgen_validate(fname):
+                        if not validate(fname):
                             print("ERROR Validation of %s failed" % fname)
                             exit(1)
                     else:
                         print("Validation skipped for %s." % fname)
                     # Parsing
                     print("Parsing %s" % fname)
-                    xml.append(mavparse.MAVXML(fname, opts.wire_protocol))
+                    xml.append(parse(fname))
                     all_files.add(fname)
                     includeadded = True
             return includeadded
@@ -228,13 +267,13 @@ def mavgen(opts, args):
 
         if opts.validate:
             print("Validating %s" % fname)
-            if not mavgen_validate(fname):
+            if not validate(fname):
                 return False
         else:
             print("Validation skipped for %s." % fname)
 
         print("Parsing %s" % fname)
-        xml.append(mavparse.MAVXML(fname, opts.wire_protocol))
+        xml.append(parse(fname))
 
     # expand includes
     expand_includes()
@@ -247,7 +286,8 @@ def mavgen(opts, args):
     opts.language = opts.language.lower()
     if opts.language == 'python':
         from . import mavgen_python
-        mavgen_python.generate(opts.output, xml)
+        mavgen_python.generate(opts.output, xml, lazy=getattr(opts, 'lazy', DEFAULT_LAZY),
+                                schema=getattr(opts, 'schema', DEFAULT_SCHEMA))
     elif opts.language == 'c':
         from . import mavgen_c
         mavgen_c.generate(opts.output, xml)
@@ -289,17 +329,19 @@ def mavgen(opts, args):
 
 # build all the dialects in the dialects subpackage
 class Opts(object):
-    def __init__(self, output, wire_protocol=DEFAULT_WIRE_PROTOCOL, language=DEFAULT_LANGUAGE, validate=DEFAULT_VALIDATE, error_limit=DEFAULT_ERROR_LIMIT, strict_units=DEFAULT_STRICT_UNITS):
+    def __init__(self, output, wire_protocol=DEFAULT_WIRE_PROTOCOL, language=DEFAULT_LANGUAGE, validate=DEFAULT_VALIDATE, error_limit=DEFAULT_ERROR_LIMIT, strict_units=DEFAULT_STRICT_UNITS, lazy=DEFAULT_LAZY, schema=DEFAULT_SCHEMA):
         self.wire_protocol = wire_protocol
         self.error_limit = error_limit
         self.language = language
         self.output = output
         self.validate = validate
         self.strict_units = strict_units
+        self.lazy = lazy
+        self.schema = schema
 
 
-def mavgen_python_dialect(dialect, wire_protocol):
-    '''generate the python code on the fly for a MAVLink dialect'''
+def dialect_paths(dialect, wire_protocol):
+    '''the python module and XML definition paths for a dialect'''
     dialects = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'dialects')
     mdef = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'message_definitions')
     if wire_protocol == mavparse.PROTOCOL_0_9:
@@ -317,7 +359,20 @@ def mavgen_python_dialect(dialect, wire_protocol):
         xml = os.path.join(dialects, 'v20', dialect + '.xml')
         if not os.path.exists(xml):
             xml = os.path.join(mdef, 'v1.0', dialect + '.xml')
-    opts = Opts(py, wire_protocol)
+    return (py, xml)
+
+
+def mavgen_python_dialect(dialect, wire_protocol, lazy=DEFAULT_LAZY, output=None, cache=None, schema=DEFAULT_SCHEMA):
+    '''generate the python code on the fly for a MAVLink dialect. With
+    lazy, message classes are created on first use, and with schema the
+    tables are also written to a .schema file, see
+    mavgen_python.generate(). The module is written to the dialects
+    package unless an output filename is given. cache is an optional
+    XMLCache'''
+    (py, xml) = dialect_paths(dialect, wire_protocol)
+    if output is not None:
+        py = output
+    opts = Opts(py, wire_protocol, lazy=lazy, schema=schema)
 
     # Python 2 to 3 compatibility
     try:
@@ -330,7 +385,7 @@ def mavgen_python_dialect(dialect, wire_protocol):
     sys.stdout = io.StringIO()
     try:
         xml = os.path.relpath(xml)
-        if not mavgen(opts, [xml]):
+        if not mavgen(opts, [xml], cache=cache):
             sys.stdout = stdout_saved
             return False
     except Exception:
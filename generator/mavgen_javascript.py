@@ -48,17 +48,25 @@ Buffer.prototype.toByteArray = function () {
 
 ${MAVHEAD} = function(){};
 
+// CRC-16/MCRF4XX of each byte value, so the CRC can be updated a byte at a time
+${MAVHEAD}.x25CrcTable = (function() {
+    var table = new Uint16Array(256);
+    for (var i = 0; i < 256; i++) {
+        var tmp = (i ^ (i << 4)) & 0xff;
+        table[i] = ((tmp << 8) ^ (tmp << 3) ^ (tmp >> 4)) & 0xffff;
+    }
+    return table;
+})();
+
 // Implement the CRC-16/MCRF4XX function (present in the Python version through the mavutil.py package)
+// buffer may be an Array, Buffer or Uint8Array
 ${MAVHEAD}.x25Crc = function(buffer, crcIN) {
 
-    var bytes = buffer;
+    var table = ${MAVHEAD}.x25CrcTable;
     var crcOUT = crcIN || 0xffff;
-    _.each(bytes, function(e) {
-        var tmp = e ^ (crcOUT & 0xff);
-        tmp = (tmp ^ (tmp << 4)) & 0xff;
-        crcOUT = (crcOUT >> 8) ^ (tmp << 8) ^ (tmp << 3) ^ (tmp >> 4);
-        crcOUT = crcOUT & 0xffff;
-    });
+    for (var i = 0, len = buffer.length; i < len; i++) {
+        crcOUT = (crcOUT >> 8) ^ table[(crcOUT ^ buffer[i]) & 0xff];
+    }
     return crcOUT;
 
 }
@@ -130,17 +138,13 @@ ${MAVHEAD}.message = function() {};
 
 // Convenience setter to facilitate turning the unpacked array of data into member properties
 ${MAVHEAD}.message.prototype.set = function(args,verbose) {
-// inspect
-    _.each(this.fieldnames, function(e, i) {
-        var num = parseInt(i,10);
-        if (this.hasOwnProperty(e) && isNaN(num)  ){ // asking for an attribure thats non-numeric is ok unless its already an attribute we have
-            console.log("WARNING, overwriting an existing property is DANGEROUS:"+e+" ==>"+i+"==>"+args[i]+" -> "+JSON.stringify(this)); 
-        }
-    }, this);
-// then modify
-    _.each(this.fieldnames, function(e, i) {
-        this[e] = args[i];
-    }, this);
+    var fieldnames = this.fieldnames;
+    if (fieldnames === undefined) {
+        return;
+    }
+    for (var i = 0, len = fieldnames.length; i < len; i++) {
+        this[fieldnames[i]] = args[i];
+    }
 };
 
 // trying to be the same-ish as the python function of the same name
@@ -366,15 +370,87 @@ def mavfmt(field):
         return str(field.array_length)+map[field.type]
     return map[field.type]
 
+def unpack_expression(f, xml):
+    '''javascript expression decoding a field from the payload buffer buf
+    and a DataView over it, giving the same value as jspack.Unpack()'''
+    getters = {
+        'float'    : ('getFloat32', 4),
+        'double'   : ('getFloat64', 8),
+        'int8_t'   : ('getInt8', 1),
+        'int16_t'  : ('getInt16', 2),
+        'uint16_t' : ('getUint16', 2),
+        'int32_t'  : ('getInt32', 4),
+        'uint32_t' : ('getUint32', 4),
+        }
+    ofs = f.wire_offset
+    le = 'true' if xml.little_endian else 'false'
+    ftype = f.type
+    if ftype == 'uint8_t_mavlink_version':
+        ftype = 'uint8_t'
+
+    if f.array_length and ftype in ['char', 'int8_t', 'uint8_t']:
+        # jspack 's'
+        return "%s.unpackString(buf, %u, %u)" % (get_mavhead(xml), ofs, f.array_length)
+    if ftype in ['int64_t', 'uint64_t']:
+        # jspack gives [lowBits, highBits, unsigned]
+        unsigned = 'true' if ftype == 'uint64_t' else 'false'
+        if f.array_length > 1:
+            return "%s.unpackInt64Array(view, %u, %u, %s, %s)" % (get_mavhead(xml), ofs, f.array_length, unsigned, le)
+        if xml.little_endian:
+            (low, high) = (ofs, ofs + 4)
+        else:
+            (low, high) = (ofs + 4, ofs)
+        return "[view.getUint32(%u, %s), view.getUint32(%u, %s), %s]" % (low, le, high, le, unsigned)
+    if ftype == 'char':
+        return "String.fromCharCode(buf[%u])" % ofs
+    if ftype == 'uint8_t' and f.array_length <= 1:
+        return "buf[%u]" % ofs
+    (getter, size) = getters.get(ftype, ('getUint8', 1))
+    if f.array_length > 1:
+        return "%s.unpackArray(view, DataView.prototype.%s, %u, %u, %u, %s)" % (
+            get_mavhead(xml), getter, ofs, f.array_length, size, le)
+    if size == 1:
+        return "view.%s(%u)" % (getter, ofs)
+    return "view.%s(%u, %s)" % (getter, ofs, le)
+
 def generate_mavlink_class(outf, msgs, xml):
     print("Generating MAVLink class")
 
-    # Write mapper to enable decoding based on the integer message type
+    # Write mapper to enable decoding based on the integer message type.
+    # unpack() decodes a payload padded to wire_length straight into a message
     t.write(outf, "\n\n${MAVHEAD}.map = {\n", {'MAVHEAD': get_mavhead(xml)});
     for m in msgs:
-        outf.write("        %s: { format: '%s', type: %s.messages.%s, order_map: %s, crc_extra: %u },\n" % (
-            m.id, m.fmtstr, get_mavhead(xml), m.name.lower(), m.order_map, m.crc_extra))
+        outf.write("        %s: { format: '%s', type: %s.messages.%s, order_map: %s, crc_extra: %u, wire_length: %u,\n" % (
+            m.id, m.fmtstr, get_mavhead(xml), m.name.lower(), m.order_map, m.crc_extra, m.wire_length))
+        outf.write("            unpack: function(buf, view) { return new %s.messages.%s(%s); } },\n" % (
+            get_mavhead(xml), m.name.lower(), ", ".join([unpack_expression(f, xml) for f in m.fields])))
     outf.write("}\n\n")
+
+    t.write(outf, """
+// Payload decoding helpers used by the unpack() functions above
+${MAVHEAD}.unpackString = function(buf, ofs, len) {
+    return String.fromCharCode.apply(null, buf.subarray(ofs, ofs + len));
+}
+
+${MAVHEAD}.unpackArray = function(view, getter, ofs, count, size, little_endian) {
+    var ret = new Array(count);
+    for (var i = 0; i < count; i++) {
+        ret[i] = getter.call(view, ofs + i * size, little_endian);
+    }
+    return ret;
+}
+
+${MAVHEAD}.unpackInt64Array = function(view, ofs, count, unsigned, little_endian) {
+    var ret = new Array(count);
+    for (var i = 0; i < count; i++) {
+        var lo = view.getUint32(ofs + (little_endian ? 0 : 4), little_endian);
+        var hi = view.getUint32(ofs + (little_endian ? 4 : 0), little_endian);
+        ret[i] = [lo, hi, unsigned];
+        ofs += 8;
+    }
+    return ret;
+}
+""", {'MAVHEAD': get_mavhead(xml)})
     
     t.write(outf, """
 
@@ -496,10 +572,9 @@ ${MAVPROCESSOR}.prototype.parsePrefix = function() {
 ${MAVPROCESSOR}.prototype.parseLength = function() {
     
     if( this.buf.length >= 3 ) { 
-        var unpacked = jspack.Unpack('BBB', this.buf.slice(0, 3)); 
-        var magic = unpacked[0]; // stx ie fd or fe etc 
-        this.expected_length = unpacked[1] + ${MAVHEAD}.HEADER_LEN + 2 // length of message + header + CRC (ie non-signed length) 
-        this.incompat_flags = unpacked[2];  
+        var magic = this.buf[0]; // stx ie fd or fe etc 
+        this.expected_length = this.buf[1] + ${MAVHEAD}.HEADER_LEN + 2 // length of message + header + CRC (ie non-signed length) 
+        this.incompat_flags = this.buf[2];  
         // mavlink2 only..  in mavlink1, incompat_flags var above is actually the 'seq', but for this test its ok. 
         if ((magic == ${MAVHEAD}.PROTOCOL_MARKER_V2 ) && ( this.incompat_flags & ${MAVHEAD}.MAVLINK_IFLAG_SIGNED )){ 
             this.expected_length += ${MAVHEAD}.MAVLINK_SIGNATURE_BLOCK_LEN; 
@@ -711,45 +786,39 @@ ${MAVPROCESSOR}.prototype.check_signature = function(msgbuf, srcSystem, srcCompo
 /* decode a buffer as a MAVLink message */
 ${MAVPROCESSOR}.prototype.decode = function(msgbuf) {
 
-    var magic, incompat_flags, compat_flags, mlen, seq, srcSystem, srcComponent, unpacked, msgId, signature_len; 
+    var magic, incompat_flags, compat_flags, mlen, seq, srcSystem, srcComponent, msgId, signature_len; 
 
     // decode the header
-    try {
+    if (msgbuf.length < ${MAVHEAD}.HEADER_LEN) {
+        throw new Error('Unable to unpack MAVLink header: only ' + msgbuf.length + ' bytes');
+    }
         """, {'MAVPROCESSOR': get_mavprocessor(xml),
               'MAVHEAD': get_mavhead(xml),
               'PROTOCOL_MARKER': xml.protocol_marker})
     # Mavlink2 only
     if (xml.protocol_marker == 253):
         t.write(outf, """
-unpacked = jspack.Unpack('cBBBBBBHB', msgbuf.slice(0, 10));  // the H in here causes msgIDlow to takeup 2 bytes, the rest 1 
-        magic = unpacked[0];
-        mlen = unpacked[1];
-        incompat_flags = unpacked[2];
-        compat_flags = unpacked[3];
-        seq = unpacked[4];
-        srcSystem = unpacked[5];
-        srcComponent = unpacked[6];
-        var msgIDlow = ((unpacked[7] & 0xFF) << 8) | ((unpacked[7] >> 8) & 0xFF); // first-two msgid bytes 
-        var msgIDhigh = unpacked[8];   // the 3rd msgid byte 
-        msgId = msgIDlow | (msgIDhigh<<16);  // combined result. 0 - 16777215  24bit number 
+    magic = String.fromCharCode(msgbuf[0]);
+    mlen = msgbuf[1];
+    incompat_flags = msgbuf[2];
+    compat_flags = msgbuf[3];
+    seq = msgbuf[4];
+    srcSystem = msgbuf[5];
+    srcComponent = msgbuf[6];
+    msgId = msgbuf[7] | (msgbuf[8] << 8) | (msgbuf[9] << 16);  // little endian 24bit number, 0 - 16777215 
         """, {'MAVHEAD': get_mavhead(xml)})
     # Mavlink1
     else:
         t.write(outf, """
-unpacked = jspack.Unpack('cBBBBB', msgbuf.slice(0, 6));
-        magic = unpacked[0];
-        mlen = unpacked[1];
-        seq = unpacked[2];
-        srcSystem = unpacked[3];
-        srcComponent = unpacked[4];
-        msgId = unpacked[5];
+    magic = String.fromCharCode(msgbuf[0]);
+    mlen = msgbuf[1];
+    seq = msgbuf[2];
+    srcSystem = msgbuf[3];
+    srcComponent = msgbuf[4];
+    msgId = msgbuf[5];
         """, {'MAVHEAD': get_mavhead(xml)})
 
     t.write(outf, """
-}
-    catch(e) {
-        throw new Error('Unable to unpack MAVLink header: ' + e.message);
-    }
 
     //  TODO allow full parsing of 1.0 inside the 2.0 parser, this is just a start 
     if (magic == ${MAVHEAD}.PROTOCOL_MARKER_V1){ 
@@ -806,38 +875,20 @@ unpacked = jspack.Unpack('cBBBBB', msgbuf.slice(0, 6));
 
     }  
  
-    if( false === _.has(${MAVHEAD}.map, msgId) ) {
+    // decode the payload
+    // refs: (fmt, type, order_map, crc_extra, wire_length, unpack) = ${MAVHEAD}.map[msgId]
+    var decoder = ${MAVHEAD}.map[msgId];
+    if( decoder === undefined ) {
         throw new Error("Unknown MAVLink message ID (" + msgId + ")");
     }
 
     // here's the common chunks of packet we want to work with below.. 
-    var headerBuf= msgbuf.slice(${MAVHEAD}.HEADER_LEN); // first10 
-    var sigBuf = msgbuf.slice(-signature_len); // last 13 or nothing 
-    var crcBuf1 = msgbuf.slice(-2); // either last-2 or last-2-prior-to-signature 
-    var crcBuf2 = msgbuf.slice(-15,-13); // either last-2 or last-2-prior-to-signature 
-    var payloadBuf = msgbuf.slice(${MAVHEAD}.HEADER_LEN, -(signature_len+2)); // the remaining bit between the header and the crc 
-    var crcCheckBuf = msgbuf.slice(1, -(signature_len+2)); // the part uses to calculate the crc - ie between the magic and signature, 
+    var crcOffset = msgbuf.length - signature_len - 2; // the crc is the last 2 bytes prior to any signature 
+    var payloadBuf = msgbuf.slice(${MAVHEAD}.HEADER_LEN, crcOffset); // the remaining bit between the header and the crc 
+    var crcCheckBuf = msgbuf.slice(1, crcOffset); // the part uses to calculate the crc - ie between the magic and signature, 
 
-    // decode the payload
-    // refs: (fmt, type, order_map, crc_extra) = ${MAVHEAD}.map[msgId]
-    var decoder = ${MAVHEAD}.map[msgId];
-
-    // decode the checksum
-    var receivedChecksum = undefined; 
-    if ( signature_len == 0 ) { // unsigned 
-        try { 
-            receivedChecksum = jspack.Unpack('<H', crcBuf1); 
-        } catch (e) { 
-            throw new Error("Unable to unpack MAVLink unsigned CRC: " + e.message); 
-        } 
-    } else { // signed 
-        try { 
-            receivedChecksum = jspack.Unpack('<H', crcBuf2); 
-        } catch (e) { 
-            throw new Error("Unable to unpack MAVLink signed CRC: " + e.message); 
-        } 
-    }
-    receivedChecksum = receivedChecksum[0]; 
+    // decode the checksum, little endian 
+    var receivedChecksum = msgbuf[crcOffset] | (msgbuf[crcOffset + 1] << 8); 
 
     // make our own chksum of the relevant part of the packet... 
     var messageChecksum = ${MAVHEAD}.x25Crc(crcCheckBuf);  
@@ -884,7 +935,7 @@ unpacked = jspack.Unpack('cBBBBB', msgbuf.slice(0, 6));
     } 
 
     // now look at the specifics of the payload... 
-    var paylen = jspack.CalcLength(decoder.format);
+    var paylen = decoder.wire_length;
 
     """, {'MAVPROCESSOR': get_mavprocessor(xml),
           'MAVHEAD': get_mavhead(xml)})
@@ -894,79 +945,20 @@ unpacked = jspack.Unpack('cBBBBB', msgbuf.slice(0, 6));
         t.write(outf, """
 //put any truncated 0's back in (ie zero-pad ) 
     if (paylen > payloadBuf.length) {
-        payloadBuf =  Buffer.concat([payloadBuf, Buffer.alloc(paylen - payloadBuf.length)]);
+        var padded = Buffer.alloc(paylen);
+        payloadBuf.copy(padded);
+        payloadBuf = padded;
     }
 """)
 
     t.write(outf, """
-    // Decode the payload and reorder the fields to match the order map.
-    try {
-        var t = jspack.Unpack(decoder.format, payloadBuf); 
-    }
-    catch (e) {
-        throw new Error('Unable to unpack MAVLink payload type='+decoder.type+' format='+decoder.format+' payloadLength='+ payloadBuf +': '+ e.message); 
-    }
-
-    // Need to check if the message contains arrays
-    var args = {};
-    const elementsInMsg = decoder.order_map.length;
-    const actualElementsInMsg = JSON.parse(JSON.stringify(t)).length;
-
-    if (elementsInMsg == actualElementsInMsg) {
-        // Reorder the fields to match the order map
-        _.each(t, function(e, i, l) {
-            args[i] = t[decoder.order_map[i]]
-        });
-    } else {
-        // This message contains arrays
-        var typeIndex = 1;
-        var orderIndex = 0;
-        var memberIndex = 0;
-        var tempArgs = {};
-
-        // Walk through the fields 
-        for(var i = 0, size = decoder.format.length-1; i <= size; ++i) {
-            var order = decoder.order_map[orderIndex];
-            var currentType =  decoder.format[typeIndex];
-
-            if (isNaN(parseInt(currentType))) {
-                // This field is not an array cehck the type and add it to the args
-                tempArgs[orderIndex] = t[memberIndex];
-                memberIndex++;
-            } else {
-                // This field is part of an array, need to find the length of the array
-                var arraySize = ''
-                var newArray = []
-                while (!isNaN(decoder.format[typeIndex])) {
-                    arraySize = arraySize + decoder.format[typeIndex];
-                    typeIndex++;
-                }
-
-                // Now that we know how long the array is, create an array with the values
-                for(var j = 0, size = parseInt(arraySize); j < size; ++j){
-                    newArray.push(t[j+orderIndex]);
-                    memberIndex++;
-                }
-
-                // Add the array to the args object
-                arraySize = arraySize + decoder.format[typeIndex];
-                currentType = arraySize;
-                tempArgs[orderIndex] = newArray;
-            }
-            orderIndex++;
-            typeIndex++;
-        }
-
-        // Finally reorder the fields to match the order map
-        _.each(t, function(e, i, l) {
-            args[i] = tempArgs[decoder.order_map[i]]
-        });
+    // Decode the payload straight into the message, using the decoder generated for this message type
+    if (paylen > payloadBuf.length) {
+        throw new Error('Unable to unpack MAVLink payload type='+decoder.type+' format='+decoder.format+' payloadLength='+ payloadBuf.length);
     }
-
-    // construct the message object
     try {
-        var m = new decoder.type(args);
-        m.set.call(m, args,false);
+        var view = new DataView(payloadBuf.buffer, payloadBuf.byteOffset, payloadBuf.length);
+        var m = decoder.unpack(payloadBuf, view);
     }
     catch (e) {
         throw new Error('Unable to instantiate MAVLink message of type '+decoder.type+' : ' + e.message);
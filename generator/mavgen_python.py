@@ -9,8 +9,10 @@ from __future__ import print_function
 
 from builtins import range
 
+import ast
 import os
 import textwrap
+from . import mavschema
 from . import mavtemplate
 
 t = mavtemplate.MAVTemplate()
@@ -320,8 +322,8 @@ def generate_message_ids(outf, msgs):
         outf.write("MAVLINK_MSG_ID_%s = %u\n" % (m.name.upper(), m.id))
 
 
-def byname_hash_from_field_attribute(m, attribute):
-    strings = []
+def field_attribute_values(m, attribute):
+    ret = []
     for field in m.fields:
         value = getattr(field, attribute, None)
         if value is None or value == "":
@@ -330,9 +332,21 @@ def byname_hash_from_field_attribute(m, attribute):
             # hack; remove the square brackets further up
             if value[0] == "[":
                 value = value[1:-1]
-        strings.append('"%s": "%s"' % (field.name, value))
+        ret.append((field.name, value))
+    return ret
+
+def byname_hash_from_field_attribute(m, attribute):
+    strings = []
+    for (name, value) in field_attribute_values(m, attribute):
+        strings.append('"%s": "%s"' % (name, value))
     return ", ".join(strings)
 
+def byname_pairs_from_field_attribute(m, attribute):
+    strings = []
+    for (name, value) in field_attribute_values(m, attribute):
+        strings.append('("%s", "%s"), ' % (name, value))
+    return "".join(strings)
+
 def generate_classes(outf, msgs):
     print("Generating class definitions")
     wrapper = textwrap.TextWrapper(initial_indent="        ", subsequent_indent="        ")
@@ -418,6 +432,287 @@ class %s(MAVLink_message):
         outf.write("), force_mavlink1=force_mavlink1)\n")
 
 
+def enum_table_source(enums):
+    '''python source of the table of enums used by lazy modules'''
+    src = "{\n"
+    for e in enums:
+        src += "    '%s' : (\n" % e.name
+        for entry in e.entry:
+            params = "".join(["(%d, '''%s'''), " % (int(param.index), param.description) for param in entry.param])
+            src += "        (%d, '%s', '''%s''', (%s)),\n" % (int(entry.value), entry.name,
+                                                          entry.description, params)
+        src += "    ),\n"
+    return src + "}"
+
+
+def generate_lazy_enums(outf, enums, schema=None):
+    print("Generating enum tables")
+    if schema:
+        outf.write("""
+from pymavlink.generator import mavschema
+_schema = mavschema.Schema(os.path.join(os.path.dirname(os.path.abspath(__file__)), '%s'))
+""" % schema)
+    outf.write("""
+class _LazyDict(dict):
+        '''dict whose values are created when first looked up'''
+        def __init__(self, keys, create):
+                dict.__init__(self)
+                self._order = list(keys)
+                self._keys = set(self._order)
+                self._create = create
+
+        def __missing__(self, key):
+                if not key in self._keys:
+                        raise KeyError(key)
+                value = self._create(key)
+                dict.__setitem__(self, key, value)
+                return value
+
+        def __contains__(self, key):
+                return key in self._keys
+
+        def __setitem__(self, key, value):
+                if not key in self._keys:
+                        self._keys.add(key)
+                        self._order.append(key)
+                dict.__setitem__(self, key, value)
+
+        def __delitem__(self, key):
+                self.load_all()
+                dict.__delitem__(self, key)
+                self._keys.remove(key)
+                self._order.remove(key)
+
+        def __len__(self):
+                return len(self._keys)
+
+        def __iter__(self):
+                return iter(dict.keys(self.load_all()))
+
+        def __repr__(self):
+                return dict.__repr__(self.load_all())
+
+        def get(self, key, default=None):
+                if key in self._keys:
+                        return self[key]
+                return default
+
+        def keys(self):
+                return dict.keys(self.load_all())
+
+        def values(self):
+                return dict.values(self.load_all())
+
+        def items(self):
+                return dict.items(self.load_all())
+
+        def copy(self):
+                return dict.copy(self.load_all())
+
+        def load_all(self):
+                '''create any values not yet created, returning self'''
+                if dict.__len__(self) != len(self._keys):
+                        for key in self._order:
+                                self[key]
+                return self
+
+# enums
+
+class EnumEntry(object):
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.param = {}
+""")
+    for e in enums:
+        outf.write("\n# %s\n" % e.name)
+        for entry in e.entry:
+            outf.write("%s = %u\n" % (entry.name, entry.value))
+    if schema:
+        outf.write("\n_enum_table = _schema.enums\n")
+    else:
+        outf.write("\n# value, name, description and parameters of each enum entry\n")
+        outf.write("_enum_table = %s\n" % enum_table_source(enums))
+    outf.write("""
+def _create_enum(name):
+    ret = {}
+    for (value, entry_name, description, params) in _enum_table[name]:
+        ret[value] = EnumEntry(entry_name, description)
+        ret[value].param.update(params)
+    return ret
+
+enums = _LazyDict(_enum_table.keys(), _create_enum)
+""")
+
+
+def encode_arguments(m):
+    '''the arguments of a message's encode and send methods'''
+    args = 'self, '
+    for i in range(len(m.fields)):
+        f = m.fields[i]
+        if f.omit_arg:
+            args += '%s=%s, ' % (f.name, f.const_value)
+        elif m.extensions_start is not None and i >= m.extensions_start:
+            args += "%s=%s, " % (f.name, m.fielddefaults[i])
+        else:
+            args += '%s, ' % f.name
+    return args[:-2]
+
+
+def message_table_source(msgs):
+    '''python source of the table of messages used by lazy modules'''
+    src = "{\n"
+    for m in msgs:
+        init_args = ""
+        for i in range(len(m.fields)):
+            fname = m.fieldnames[i]
+            if m.extensions_start is not None and i >= m.extensions_start:
+                init_args += ", %s=%s" % (fname, m.fielddefaults[i])
+            else:
+                init_args += ", %s" % fname
+        pack_args = ""
+        for field in m.ordered_fields:
+            if (field.type != "char" and field.array_length > 1):
+                for i in range(field.array_length):
+                    pack_args += ", self.{0:s}[{1:d}]".format(field.name, i)
+            else:
+                pack_args += ", self.{0:s}".format(field.name)
+        if m.instance_field is not None:
+            instance_offset = m.field_offsets[m.instance_field]
+        else:
+            instance_offset = -1
+        src += "    %u : ('%s', '''%s''', %r, %r, %r, (%s), (%s), (%s), '%s', '%s', %r, %r, %r, %u, %r, %d, %r, %r, %r),\n" % (
+            m.id, m.name.upper(), m.description.strip(),
+            tuple(m.fieldnames), tuple(m.ordered_fieldnames), tuple(m.fieldtypes),
+            byname_pairs_from_field_attribute(m, "display"),
+            byname_pairs_from_field_attribute(m, "enum"),
+            byname_pairs_from_field_attribute(m, "units"),
+            m.fmtstr, m.native_fmtstr,
+            tuple(m.order_map), tuple(m.len_map), tuple(m.array_len_map),
+            m.crc_extra, m.instance_field, instance_offset,
+            init_args, pack_args, encode_arguments(m))
+    return src + "}"
+
+
+def generate_lazy_classes(outf, msgs, schema=None):
+    print("Generating message tables")
+    if schema:
+        outf.write("\n_message_table = _schema.messages\n")
+        outf.write("_message_ids = _schema.message_ids\n")
+    else:
+        outf.write("\n# class attributes and method arguments of each message, see\n")
+        outf.write("# _create_message_class()\n")
+        outf.write("_message_table = %s\n" % message_table_source(msgs))
+        outf.write("\n_message_ids = None\n")
+    outf.write("""
+def _message_id(name):
+    '''the ID of a message given its upper case name, or None'''
+    global _message_ids
+    if _message_ids is None:
+        _message_ids = dict((v[0], k) for (k, v) in _message_table.items())
+    return _message_ids.get(name, None)
+
+def _create_message_class(msgid):
+    (name, description, fieldnames, ordered_fieldnames, fieldtypes,
+     fielddisplays, fieldenums, fieldunits, format, native_format,
+     orders, lengths, array_lengths, crc_extra, instance_field,
+     instance_offset, init_args, pack_args, encode_args) = _message_table[msgid]
+    classname = 'MAVLink_%s_message' % name.lower()
+    src = ['class %s(MAVLink_message):' % classname,
+           '        def __init__(self%s):' % init_args,
+           '                MAVLink_message.__init__(self, %s.id, %s.name)' % (classname, classname),
+           '                self._fieldnames = %s.fieldnames' % classname,
+           '                self._instance_field = %s.instance_field' % classname,
+           '                self._instance_offset = %s.instance_offset' % classname]
+    for f in fieldnames:
+        src.append('                self.%s = %s' % (f, f))
+    src.append('        def pack(self, mav, force_mavlink1=False):')
+    src.append('                return MAVLink_message.pack(self, mav, %u, struct.pack(%r%s), force_mavlink1=force_mavlink1)' % (
+        crc_extra, format, pack_args))
+    namespace = {'MAVLink_message' : MAVLink_message, 'struct' : struct, '__name__' : __name__}
+    exec('\\n'.join(src), namespace)
+    cls = namespace[classname]
+    cls.__doc__ = description
+    cls.id = msgid
+    cls.name = name
+    cls.fieldnames = list(fieldnames)
+    cls.ordered_fieldnames = list(ordered_fieldnames)
+    cls.fieldtypes = list(fieldtypes)
+    cls.fielddisplays_by_name = dict(fielddisplays)
+    cls.fieldenums_by_name = dict(fieldenums)
+    cls.fieldunits_by_name = dict(fieldunits)
+    cls.format = format
+    cls.native_format = bytearray(native_format, 'ascii')
+    cls.orders = list(orders)
+    cls.lengths = list(lengths)
+    cls.array_lengths = list(array_lengths)
+    cls.crc_extra = crc_extra
+    cls.unpacker = struct.Struct(format)
+    cls.instance_field = instance_field
+    cls.instance_offset = instance_offset
+    globals()[classname] = cls
+    return cls
+
+def __getattr__(name):
+    '''create message classes on first use'''
+    if name.startswith('MAVLink_') and name.endswith('_message'):
+        msgid = _message_id(name[8:-8].upper())
+        if msgid is not None:
+            return mavlink_map[msgid]
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+""")
+
+
+def generate_lazy_methods(outf, msgs):
+    print("Generating method creation")
+    outf.write("""
+        def __getattr__(self, name):
+                '''create the encode and send methods of messages on first use'''
+                method = _create_method(name)
+                if method is None:
+                        raise AttributeError(name)
+                return method.__get__(self, MAVLink)
+
+
+def _create_method(name):
+    '''add a MAVLink <message>_encode() or <message>_send() method,
+    returning None if name isn't one of these'''
+    if name.endswith('_encode'):
+        msgid = _message_id(name[:-7].upper())
+    elif name.endswith('_send'):
+        msgid = _message_id(name[:-5].upper())
+    else:
+        return None
+    if msgid is None:
+        return None
+    entry = _message_table[msgid]
+    lower = entry[0].lower()
+    fieldnames = ', '.join(entry[2])
+    if name.endswith('_encode'):
+        src = 'def %s(%s):\\n    return MAVLink_%s_message(%s)\\n' % (name, entry[-1], lower, fieldnames)
+    else:
+        src = 'def %s(%s, force_mavlink1=False):\\n    return self.send(self.%s_encode(%s), force_mavlink1=force_mavlink1)\\n' % (
+            name, entry[-1], lower, fieldnames)
+    namespace = {'MAVLink_%s_message' % lower : mavlink_map[msgid]}
+    exec(src, namespace)
+    method = namespace[name]
+    setattr(MAVLink, name, method)
+    return method
+
+def _load_all():
+    '''create every message class, enum and method now'''
+    mavlink_map.load_all()
+    enums.load_all()
+    for entry in _message_table.values():
+        _create_method(entry[0].lower() + '_encode')
+        _create_method(entry[0].lower() + '_send')
+
+if sys.version_info < (3, 7):
+    # module __getattr__ needs python 3.7
+    _load_all()
+""")
+
+
 def native_mavfmt(field):
     '''work out the struct format for a type (in a form expected by mavnative)'''
     map = {
@@ -472,14 +767,19 @@ def mavdefault(field):
     return "[" + ",".join([default_value] * field.array_length) + "]"
 
 
-def generate_mavlink_class(outf, msgs, xml):
+def generate_mavlink_class(outf, msgs, xml, lazy=False):
     print("Generating MAVLink class")
 
-    outf.write("\n\nmavlink_map = {\n")
-    for m in msgs:
-        outf.write("        MAVLINK_MSG_ID_%s : MAVLink_%s_message,\n" % (
-            m.name.upper(), m.name.lower()))
-    outf.write("}\n\n")
+    if lazy:
+        outf.write("\n\nmavlink_map = _LazyDict(_message_table.keys(), _create_message_class)\n\n")
+        native_map = "mavlink_map.load_all()"
+    else:
+        outf.write("\n\nmavlink_map = {\n")
+        for m in msgs:
+            outf.write("        MAVLINK_MSG_ID_%s : MAVLink_%s_message,\n" % (
+                m.name.upper(), m.name.lower()))
+        outf.write("}\n\n")
+        native_map = "mavlink_map"
 
     t.write(outf, """
 class MAVError(Exception):
@@ -560,7 +860,7 @@ class MAVLink(object):
                 self.signing = MAVLinkSigning()
                 if native_supported and (use_native or native_testing or native_force):
                     print("NOTE: mavnative is currently beta-test code")
-                    self.native = mavnative.NativeConnection(MAVLink_message, mavlink_map)
+                    self.native = mavnative.NativeConnection(MAVLink_message, ${native_map})
                 else:
                     self.native = None
                 if native_testing:
@@ -709,7 +1009,7 @@ class MAVLink(object):
         def check_signature(self, msgbuf, srcSystem, srcComponent):
             '''check signature on incoming message'''
             if isinstance(msgbuf, array.array):
-                msgbuf = msgbuf.tostring()
+                msgbuf = msgbuf.tobytes() if sys.version_info.major >= 3 else msgbuf.tostring()
             timestamp_buf = msgbuf[-12:-6]
             link_id = msgbuf[-13]
             (tlow, thigh) = self.mav_sign_unpacker.unpack(timestamp_buf)
@@ -911,7 +1211,7 @@ class MAVLink(object):
                 m._crc = crc
                 m._header = MAVLink_header(msgId, incompat_flags, compat_flags, mlen, seq, srcSystem, srcComponent)
                 return m
-""", xml)
+""", dict(vars(xml), native_map=native_map))
 
 
 def generate_methods(outf, msgs):
@@ -935,20 +1235,8 @@ def generate_methods(outf, msgs):
     for m in msgs:
         comment = "%s\n\n%s" % (wrapper.fill(m.description.strip()), field_descriptions(m.fields))
 
-        selffieldnames = 'self, '
-        for i in range(len(m.fields)):
-            f = m.fields[i]
-            if f.omit_arg:
-                selffieldnames += '%s=%s, ' % (f.name, f.const_value)
-            elif m.extensions_start is not None and i >= m.extensions_start:
-                fdefault = m.fielddefaults[i]
-                selffieldnames += "%s=%s, " % (f.name, fdefault)
-            else:
-                selffieldnames += '%s, ' % f.name
-        selffieldnames = selffieldnames[:-2]
-
         sub = {'NAMELOWER': m.name.lower(),
-               'SELFFIELDNAMES': selffieldnames,
+               'SELFFIELDNAMES': encode_arguments(m),
                'COMMENT': comment,
                'FIELDNAMES': ", ".join(m.fieldnames)}
 
@@ -971,12 +1259,31 @@ def generate_methods(outf, msgs):
 """, sub)
 
 
-def generate(basename, xml):
-    '''generate complete python implementation'''
+def generate_schema(filename, msgs, enums):
+    '''write the message and enum tables to a schema file, see mavschema'''
+    print("Generating %s" % filename)
+    # evaluate the same source lazy modules embed, so both give the
+    # same tables
+    messages = ast.literal_eval(message_table_source(msgs))
+    enum_table = ast.literal_eval(enum_table_source(enums))
+    mavschema.write_schema(filename,
+                           [(m.id, messages[m.id]) for m in msgs],
+                           [(e.name, enum_table[e.name]) for e in enums])
+
+
+def generate(basename, xml, lazy=False, schema=False):
+    '''generate complete python implementation. With lazy, message
+    classes, enums and the MAVLink encode and send methods are only
+    created when first used, making the module faster to import. With
+    schema the message and enum tables are also written to a .schema
+    file, which lazy modules then load instead of embedding them'''
     if basename.endswith('.py'):
         filename = basename
     else:
         filename = basename + '.py'
+    schema_filename = None
+    if schema:
+        schema_filename = filename[:-3] + '.schema'
 
     msgs = []
     enums = []
@@ -1013,10 +1320,23 @@ def generate(basename, xml):
     print("Generating %s" % filename)
     outf = open(filename, "w")
     generate_preamble(outf, msgs, basename, filelist, xml[0])
-    generate_enums(outf, enums)
-    generate_message_ids(outf, msgs)
-    generate_classes(outf, msgs)
-    generate_mavlink_class(outf, msgs, xml[0])
-    generate_methods(outf, msgs)
+    if lazy:
+        if schema:
+            schema_name = os.path.basename(schema_filename)
+        else:
+            schema_name = None
+        generate_lazy_enums(outf, enums, schema=schema_name)
+        generate_message_ids(outf, msgs)
+        generate_lazy_classes(outf, msgs, schema=schema_name)
+        generate_mavlink_class(outf, msgs, xml[0], lazy=True)
+        generate_lazy_methods(outf, msgs)
+    else:
+        generate_enums(outf, enums)
+        generate_message_ids(outf, msgs)
+        generate_classes(outf, msgs)
+        generate_mavlink_class(outf, msgs, xml[0])
+        generate_methods(outf, msgs)
     outf.close()
+    if schema:
+        generate_schema(schema_filename, msgs, enums)
     print("Generated %s OK" % filename)
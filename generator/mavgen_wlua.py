@@ -9,6 +9,10 @@ Instructions for use:
 1. python -m pymavlink.tools.mavgen --lang=WLua mymavlink.xml -o ~/.wireshark/plugins/mymavlink.lua
 2. convert binary stream int .pcap file format (see ../examples/mav2pcap.py)
 3. open the pcap file in Wireshark
+
+Besides UDP ports 14550 and 14580, the dissector registers itself as a
+heuristic for other UDP and TCP traffic. Test captures of any size can
+be made with tools/mavpcapgen.py.
 '''
 from __future__ import print_function
 
@@ -75,7 +79,6 @@ def generate_preamble(outf):
 """
 -- Wireshark dissector for the MAVLink protocol (please see http://qgroundcontrol.org/mavlink/start for details) 
 
-unknownFrameBeginOffset = 0
 local bit = require "bit32"
 mavlink_proto = Proto("mavlink_proto", "MAVLink protocol")
 f = mavlink_proto.fields
@@ -87,8 +90,23 @@ local function get_timezone()
 end
 local signature_time_ref = get_timezone() + os.time{year=2015, month=1, day=1, hour=0}
 
+-- payload dissectors, indexed by message id
 payload_fns = {}
 
+-- CRC-16/MCRF4XX lookup table
+local crcTable = {}
+for i = 0, 255 do
+    local tmp = bit.band(bit.bxor(i, bit.lshift(i, 4)), 0xff)
+    crcTable[i] = bit.band(bit.bxor(bit.lshift(tmp, 8), bit.lshift(tmp, 3), bit.rshift(tmp, 4)), 0xffff)
+end
+
+local function x25crc(bytes, first, last, crc)
+    for i = first, last do
+        crc = bit.bxor(bit.rshift(crc, 8), crcTable[bit.band(bit.bxor(crc, string.byte(bytes, i)), 0xff)])
+    end
+    return crc
+end
+
 """ )
     
     
@@ -127,7 +145,17 @@ messageName = {
     t.write(outf, """
 }
 
+-- CRC extra byte and payload length limits of each message, used to
+-- validate frames before dissecting them
 """)
+    for (table, attr) in [('messageCrcExtra', 'crc_extra'),
+                          ('messageMinLength', 'wire_min_length'),
+                          ('messageMaxLength', 'wire_length')]:
+        t.write(outf, "local ${table} = {\n", {'table':table})
+        for msg in msgs:
+            t.write(outf, "    [${msgid}] = ${value},\n", {'msgid':msg.id, 'value':getattr(msg, attr)})
+        t.write(outf, "}\n")
+    t.write(outf, "\n")
         
 
 def generate_msg_fields(outf, msg):
@@ -201,7 +229,7 @@ def generate_payload_dissector(outf, msg):
     t.write(outf, 
 """
 -- dissect payload of message type ${msgname}
-function payload_fns.payload_${msgid}(buffer, tree, msgid, offset, limit)
+payload_fns[${msgid}] = function(buffer, tree, msgid, offset, limit)
     local truncated = false
 """, {'msgid':msg.id, 'msgname':msg.name})
     
@@ -221,213 +249,255 @@ end
 def generate_packet_dis(outf):
     t.write(outf, 
 """
--- dissector function
-function mavlink_proto.dissector(buffer,pinfo,tree)
-    local offset = 0
-    local msgCount = 0
-    
-    -- loop through the buffer to extract all the messages in the buffer
-    while (offset < buffer:len()) 
-    do
-        msgCount = msgCount + 1
-        local subtree = tree:add (mavlink_proto, buffer(), "MAVLink Protocol ("..buffer:len()..")")
-
-        -- decode protocol version first
-        local version = buffer(offset,1):uint()
-        local protocolString = ""
-    
-    	while (true)
-		do
-            if (version == 0xfe) then
-                protocolString = "MAVLink 1.0"
-                break
-            elseif (version == 0xfd) then
-                protocolString = "MAVLink 2.0"
-                break
-            elseif (version == 0x55) then
-                protocolString = "MAVLink 0.9"
-                break
-            else
-                protocolString = "unknown"
-                -- some unknown data found, record the begin offset
-                if (unknownFrameBeginOffset == 0) then
-                    unknownFrameBeginOffset = offset
-                end
-               
-                offset = offset + 1
-                
-                if (offset < buffer:len()) then
-                    version = buffer(offset,1):uint()
-                else
-                    -- no magic value found in the whole buffer. print the raw data and exit
-                    if (unknownFrameBeginOffset ~= 0) then
-                        if (msgCount == 1) then
-                            pinfo.cols.info:set("Unknown message")
-                        else
-                            pinfo.cols.info:append("  Unknown message")
-                        end
-                        size = offset - unknownFrameBeginOffset
-                        subtree:add(f.rawpayload, buffer(unknownFrameBeginOffset,size))
-                        unknownFrameBeginOffset = 0
-                    end
-                    return
-                end
-            end	
+-- results of check_frame
+local FRAME_OK = 0
+local FRAME_UNKNOWN = 1
+local FRAME_SHORT = 2
+local FRAME_BAD = 3
+
+-- check for a MAVLink frame at offset (0 based) in the raw bytes of a
+-- buffer, without touching the protocol tree. Returns the status, the
+-- length of the frame and its message id. Frames of unknown messages
+-- can't have their CRC checked, and FRAME_SHORT means more bytes are
+-- needed to tell
+local function check_frame(bytes, offset)
+    local version = string.byte(bytes, offset + 1)
+    local avail = #bytes - offset
+    local hlen
+    local msgid
+    local siglen = 0
+    if (version == 0xfe) then
+        hlen = 6
+        if (avail < hlen) then
+            return FRAME_SHORT
         end
-        
-        if (unknownFrameBeginOffset ~= 0) then
-            pinfo.cols.info:append("Unknown message")
-            size = offset - unknownFrameBeginOffset
-            subtree:add(f.rawpayload, buffer(unknownFrameBeginOffset,size))
-            unknownFrameBeginOffset = 0
-            -- jump to next loop
-            break
+        msgid = string.byte(bytes, offset + 6)
+    elseif (version == 0xfd) then
+        hlen = 10
+        if (avail < hlen) then
+            return FRAME_SHORT
         end
-        
-        -- some Wireshark decoration
-        pinfo.cols.protocol = protocolString
+        local incompatibility_flag = string.byte(bytes, offset + 3)
+        if (incompatibility_flag == 0x01) then
+            siglen = 13
+        elseif (incompatibility_flag ~= 0) then
+            return FRAME_BAD
+        end
+        local b0, b1, b2 = string.byte(bytes, offset + 8, offset + 10)
+        msgid = b0 + b1 * 256 + b2 * 65536
+    else
+        return FRAME_BAD
+    end
 
-        -- HEADER ----------------------------------------
-    
-        local msgid
-        local length
-        local incompatibility_flag
-
-        if (version == 0xfe) then
-            if (buffer:len() - 2 - offset > 6) then
-                -- normal header
-                local header = subtree:add("Header")
-                header:add(f.magic, buffer(offset,1), version)
-                offset = offset + 1
-            
-                length = buffer(offset,1)
-                header:add(f.length, length)
-                offset = offset + 1
-            
-                local sequence = buffer(offset,1)
-                header:add(f.sequence, sequence)
-                offset = offset + 1
-            
-                local sysid = buffer(offset,1)
-                header:add(f.sysid, sysid)
-                offset = offset + 1
-        
-                local compid = buffer(offset,1)
-                header:add(f.compid, compid)
-                offset = offset + 1
-            
-                pinfo.cols.src = "System: "..tostring(sysid:uint())..', Component: '..tostring(compid:uint())
-        
-                msgid = buffer(offset,1):uint()
-                header:add(f.msgid, buffer(offset,1), msgid)
-                offset = offset + 1
-            else 
-                -- handle truncated header
-                local hsize = buffer:len() - 2 - offset
-                subtree:add(f.rawheader, buffer(offset, hsize))
-                offset = offset + hsize
-            end
-        elseif (version == 0xfd) then
-            if (buffer:len() - 2 - offset > 10) then
-                -- normal header
-                local header = subtree:add("Header")
-                header:add(f.magic, buffer(offset,1), version)
-                offset = offset + 1
-                length = buffer(offset,1)
-                header:add(f.length, length)
-                offset = offset + 1
-                incompatibility_flag = buffer(offset,1):uint()
-                header:add(f.incompatibility_flag, buffer(offset,1), incompatibility_flag)
-                offset = offset + 1
-                local compatibility_flag = buffer(offset,1)
-                header:add(f.compatibility_flag, compatibility_flag)
-                offset = offset + 1
-                local sequence = buffer(offset,1)
-                header:add(f.sequence, sequence)
-                offset = offset + 1
-                local sysid = buffer(offset,1)
-                header:add(f.sysid, sysid)
-                offset = offset + 1
-                local compid = buffer(offset,1)
-                header:add(f.compid, compid)
-                offset = offset + 1
-                pinfo.cols.src = "System: "..tostring(sysid:uint())..', Component: '..tostring(compid:uint())
-                msgid = buffer(offset,3):le_uint()
-                header:add(f.msgid, buffer(offset,3), msgid)
-                offset = offset + 3
-            else 
-                -- handle truncated header
-                local hsize = buffer:len() - 2 - offset
-                subtree:add(f.rawheader, buffer(offset, hsize))
-                offset = offset + hsize
-            end
+    local length = string.byte(bytes, offset + 2)
+    local frame_len = hlen + length + 2 + siglen
+    local crc_extra = messageCrcExtra[msgid]
+    if (crc_extra ~= nil) then
+        -- MAVLink 2 payloads may have trailing zeros removed
+        if (length > messageMaxLength[msgid] or (version == 0xfe and length < messageMinLength[msgid])) then
+            return FRAME_BAD
         end
+    end
+    if (avail < frame_len) then
+        return FRAME_SHORT, frame_len, msgid
+    end
+    if (crc_extra == nil) then
+        return FRAME_UNKNOWN, frame_len, msgid
+    end
+
+    local crc_offset = offset + hlen + length
+    local crc = x25crc(bytes, offset + 2, crc_offset, 0xffff)
+    crc = bit.bxor(bit.rshift(crc, 8), crcTable[bit.band(bit.bxor(crc, crc_extra), 0xff)])
+    local c0, c1 = string.byte(bytes, crc_offset + 1, crc_offset + 2)
+    if (crc ~= c0 + c1 * 256) then
+        return FRAME_BAD
+    end
+    return FRAME_OK, frame_len, msgid
+end
 
+-- add one checked frame to the tree
+local function dissect_frame(buffer, pinfo, tree, offset, frame_len, msgid, msgCount, status)
+    local version = buffer(offset,1):uint()
+    local subtree = tree:add(mavlink_proto, buffer(offset, frame_len), "MAVLink Protocol ("..frame_len..")")
 
-        -- BODY ----------------------------------------
-    
-        -- dynamically call the type-specific payload dissector    
-        local msgnr = msgid
-        local dissect_payload_fn = "payload_"..tostring(msgnr)
-        local fn = payload_fns[dissect_payload_fn]
-        local limit = buffer:len() - 2
-
-        if (length) then
-            length = length:uint()
+    -- some Wireshark decoration
+    if (version == 0xfe) then
+        pinfo.cols.protocol = "MAVLink 1.0"
+    else
+        pinfo.cols.protocol = "MAVLink 2.0"
+    end
+
+    -- HEADER ----------------------------------------
+
+    local header = subtree:add("Header")
+    local length
+    local incompatibility_flag = 0
+    header:add(f.magic, buffer(offset,1), version)
+    offset = offset + 1
+    length = buffer(offset,1)
+    header:add(f.length, length)
+    length = length:uint()
+    offset = offset + 1
+    if (version == 0xfd) then
+        incompatibility_flag = buffer(offset,1):uint()
+        header:add(f.incompatibility_flag, buffer(offset,1), incompatibility_flag)
+        offset = offset + 1
+        header:add(f.compatibility_flag, buffer(offset,1))
+        offset = offset + 1
+    end
+    header:add(f.sequence, buffer(offset,1))
+    offset = offset + 1
+    local sysid = buffer(offset,1)
+    header:add(f.sysid, sysid)
+    offset = offset + 1
+    local compid = buffer(offset,1)
+    header:add(f.compid, compid)
+    offset = offset + 1
+    pinfo.cols.src = "System: "..tostring(sysid:uint())..', Component: '..tostring(compid:uint())
+    if (version == 0xfd) then
+        header:add(f.msgid, buffer(offset,3), msgid)
+        offset = offset + 3
+    else
+        header:add(f.msgid, buffer(offset,1), msgid)
+        offset = offset + 1
+    end
+
+    -- BODY ----------------------------------------
+
+    local fn = payload_fns[msgid]
+    local limit = offset + length
+
+    if (status == FRAME_UNKNOWN) then
+        if (msgCount == 1) then
+            pinfo.cols.info = "Unknown message type"
         else
-            length = 0
+            pinfo.cols.info:append("   Unknown message type")
         end
-
-        if (offset + length < limit) then
-            limit = offset + length
+        subtree:add_expert_info(PI_MALFORMED, PI_ERROR, "Unknown message type")
+        if (length > 0) then
+            subtree:add(f.rawpayload, buffer(offset,length))
         end
-    
-        if (fn == nil) then
-            pinfo.cols.info:append ("Unknown message type   ")
-            subtree:add_expert_info(PI_MALFORMED, PI_ERROR, "Unknown message type")
-            size = buffer:len() - 2 - offset
-            subtree:add(f.rawpayload, buffer(offset,size))
-            offset = offset + size
-        else
-            local payload = subtree:add(f.payload, msgid)
-            pinfo.cols.dst:set(messageName[msgid])
-            if (msgCount == 1) then
+    else
+        local payload = subtree:add(f.payload, msgid)
+        pinfo.cols.dst:set(messageName[msgid])
+        if (msgCount == 1) then
             -- first message should over write the TCP/UDP info
-                pinfo.cols.info = messageName[msgid]
-            else
-                pinfo.cols.info:append("   "..messageName[msgid])
-            end
-            fn(buffer, payload, msgid, offset, limit)
-            offset = limit
+            pinfo.cols.info = messageName[msgid]
+        else
+            pinfo.cols.info:append("   "..messageName[msgid])
         end
+        fn(buffer, payload, msgid, offset, limit)
+    end
+    offset = limit
 
-        -- CRC ----------------------------------------
+    -- CRC ----------------------------------------
 
-        local crc = buffer(offset,2)
-        subtree:add_le(f.crc, crc)
-        offset = offset + 2
+    local crc = buffer(offset,2)
+    subtree:add_le(f.crc, crc)
+    offset = offset + 2
 
-        -- SIGNATURE ----------------------------------
+    -- SIGNATURE ----------------------------------
 
-        if (version == 0xfd and incompatibility_flag == 0x01) then
-            local signature = subtree:add("Signature")
+    if (version == 0xfd and incompatibility_flag == 0x01) then
+        local signature = subtree:add("Signature")
 
-            local link = buffer(offset,1)
-            signature:add(f.signature_link, link)
-            offset = offset + 1
+        local link = buffer(offset,1)
+        signature:add(f.signature_link, link)
+        offset = offset + 1
 
-            local signature_time = buffer(offset,6):le_uint64()
-            local time_secs = signature_time / 100000
-            local time_nsecs = (signature_time - (time_secs * 100000)) * 10000
-            signature:add(f.signature_time, buffer(offset,6), NSTime.new(signature_time_ref + time_secs:tonumber(), time_nsecs:tonumber()))
-            offset = offset + 6
+        local signature_time = buffer(offset,6):le_uint64()
+        local time_secs = signature_time / 100000
+        local time_nsecs = (signature_time - (time_secs * 100000)) * 10000
+        signature:add(f.signature_time, buffer(offset,6), NSTime.new(signature_time_ref + time_secs:tonumber(), time_nsecs:tonumber()))
+        offset = offset + 6
 
-            local signature_signature = buffer(offset,6)
-            signature:add(f.signature_signature, signature_signature)
-            offset = offset + 6
+        local signature_signature = buffer(offset,6)
+        signature:add(f.signature_signature, signature_signature)
+        offset = offset + 6
+    end
+end
+
+-- add bytes which aren't part of a valid frame to the tree
+local function dissect_unknown(buffer, pinfo, tree, offset, size, msgCount)
+    if (msgCount == 0) then
+        pinfo.cols.info:set("Unknown message")
+    else
+        pinfo.cols.info:append("  Unknown message")
+    end
+    local subtree = tree:add(mavlink_proto, buffer(offset, size), "MAVLink Protocol ("..size..")")
+    subtree:add(f.rawpayload, buffer(offset, size))
+end
+
+-- dissector function
+function mavlink_proto.dissector(buffer,pinfo,tree)
+    local bytes = buffer:raw()
+    local len = #bytes
+    local offset = 0
+    local msgCount = 0
+    local unknownBegin = nil
+
+    -- loop through the buffer to extract all the messages in the buffer
+    while (offset < len)
+    do
+        local status, frame_len, msgid = check_frame(bytes, offset)
+
+        if (status == FRAME_SHORT and unknownBegin == nil and pinfo.can_desegment > 0) then
+            -- ask for the rest of a frame split over TCP segments
+            pinfo.desegment_offset = offset
+            pinfo.desegment_len = DESEGMENT_ONE_MORE_SEGMENT
+            return len
+        end
+
+        if (status == FRAME_OK or status == FRAME_UNKNOWN) then
+            if (unknownBegin ~= nil) then
+                dissect_unknown(buffer, pinfo, tree, unknownBegin, offset - unknownBegin, msgCount)
+                unknownBegin = nil
+            end
+            msgCount = msgCount + 1
+            dissect_frame(buffer, pinfo, tree, offset, frame_len, msgid, msgCount, status)
+            offset = offset + frame_len
+        else
+            -- not a frame, skip to the next magic value
+            if (unknownBegin == nil) then
+                unknownBegin = offset
+            end
+            local nextMagic = string.find(bytes, "[\\253\\254]", offset + 2)
+            if (nextMagic == nil) then
+                offset = len
+            else
+                offset = nextMagic - 1
+            end
         end
+    end
+
+    if (unknownBegin ~= nil) then
+        dissect_unknown(buffer, pinfo, tree, unknownBegin, len - unknownBegin, msgCount)
+    end
+    return len
+end
 
+-- heuristic dissector, accepting UDP datagrams and TCP segments starting
+-- with a complete frame of a known message with a valid CRC
+local function heuristic_dissector(buffer, pinfo, tree)
+    local len = buffer:len()
+    if (len < 8) then
+        return false
     end
+    local version = buffer(0,1):uint()
+    if (version ~= 0xfe and version ~= 0xfd) then
+        return false
+    end
+    -- the longest possible frame is 280 bytes
+    if (len > 280) then
+        len = 280
+    end
+    if (check_frame(buffer:raw(0, len), 0) ~= FRAME_OK) then
+        return false
+    end
+    -- send the rest of the conversation straight to the dissector
+    pinfo.conversation = mavlink_proto
+    mavlink_proto.dissector(buffer, pinfo, tree)
+    return true
 end
 
 
@@ -449,6 +519,11 @@ wtap_encap:add(wtap.USER0, mavlink_proto)
 local udp_dissector_table = DissectorTable.get("udp.port")
 udp_dissector_table:add(14550, mavlink_proto)
 udp_dissector_table:add(14580, mavlink_proto)
+
+-- and try it on any other UDP or TCP traffic
+
+mavlink_proto:register_heuristic("udp", heuristic_dissector)
+mavlink_proto:register_heuristic("tcp", heuristic_dissector)
 """)
 
 def generate(basename, xml):
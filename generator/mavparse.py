@@ -339,7 +339,7 @@ class MAVXML(object):
 
                 for a_param in enum_entry.param:
                     params_dict[int(a_param.index)] = a_param
-                enum_entry.param=params_dict.values()
+                enum_entry.param=list(params_dict.values())
                 
 
 
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+'''
+compact binary description of a python dialect
+
+mavgen_python can write the message and enum tables of a dialect to a
+.schema file next to the generated module. Lazy dialect modules built
+this way load their tables from the file instead of carrying them as
+python source, and anything else needing the message formats (for
+example worker processes decoding raw packets) can read it without
+importing the dialect at all.
+
+The file is memory mapped read only, so processes using the same
+dialect share one copy of it, and each entry is only decoded when it
+is looked up.
+
+Layout: the magic string, the length of the index as a little endian
+uint32, the index, then the entries. The index and each entry are
+UTF-8 JSON; the index lists [msgid, name, offset, length] for each
+message and [name, offset, length] for each enum, with offsets from
+the start of the entries.
+
+Released under GNU GPL version 3 or later
+'''
+from __future__ import print_function
+from __future__ import absolute_import
+
+import json
+import mmap
+import struct
+
+MAGIC = b'MAVSCHEMA1\n'
+
+
+def _encode(obj):
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+def write_schema(filename, messages, enums):
+    '''write a schema file. messages and enums are lists of (msgid,
+    entry) and (name, entry) pairs, where each message entry starts
+    with the message name'''
+    data = []
+    size = 0
+    index = {'messages' : [], 'enums' : []}
+    for (msgid, entry) in messages:
+        buf = _encode(entry)
+        index['messages'].append([msgid, entry[0], size, len(buf)])
+        data.append(buf)
+        size += len(buf)
+    for (name, entry) in enums:
+        buf = _encode(entry)
+        index['enums'].append([name, size, len(buf)])
+        data.append(buf)
+        size += len(buf)
+    header = _encode(index)
+    with open(filename, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        for buf in data:
+            f.write(buf)
+
+
+class SchemaTable(object):
+    '''read only mapping of the entries in a schema, decoded when
+    looked up'''
+    def __init__(self, buf, base, index):
+        self._buf = buf
+        self._base = base
+        self._order = [key for (key, ofs, length) in index]
+        self._index = dict((key, (ofs, length)) for (key, ofs, length) in index)
+
+    def __getitem__(self, key):
+        (ofs, length) = self._index[key]
+        ofs += self._base
+        return json.loads(self._buf[ofs:ofs+length].decode('utf-8'))
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __len__(self):
+        return len(self._order)
+
+    def __iter__(self):
+        return iter(self._order)
+
+    def get(self, key, default=None):
+        if key in self._index:
+            return self[key]
+        return default
+
+    def keys(self):
+        return list(self._order)
+
+    def values(self):
+        return [self[key] for key in self._order]
+
+    def items(self):
+        return [(key, self[key]) for key in self._order]
+
+
+class Schema(object):
+    '''a memory mapped schema file. messages maps message IDs to their
+    entries, enums maps enum names to theirs and message_ids maps
+    message names to IDs'''
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._buf[:len(MAGIC)] != MAGIC:
+            self._buf.close()
+            raise ValueError("%s is not a MAVLink schema" % filename)
+        ofs = len(MAGIC)
+        (length,) = struct.unpack('<I', self._buf[ofs:ofs+4])
+        ofs += 4
+        index = json.loads(self._buf[ofs:ofs+length].decode('utf-8'))
+        base = ofs + length
+        self.messages = SchemaTable(self._buf, base,
+                                    [(msgid, ofs, length) for (msgid, name, ofs, length) in index['messages']])
+        self.enums = SchemaTable(self._buf, base, index['enums'])
+        self.message_ids = dict((str(name), msgid) for (msgid, name, ofs, length) in index['messages'])
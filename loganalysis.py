@@ -0,0 +1,375 @@
+#!/usr/bin/env python
+'''
+single pass log analysis
+
+Each analysis is an Analyzer registered against the message types it
+needs. scan_log() makes one pass over a log, asking the reader for
+only the union of those types, and hands each message to the
+analyzers that want it. The results are plain dicts, ready to be
+written out as JSON.
+
+Released under GNU GPL version 3 or later
+'''
+from __future__ import print_function
+from __future__ import absolute_import
+from builtins import object
+
+from . import mavutil
+from . import mavseq
+from .mavextra import distance_two
+
+
+class Analyzer(object):
+    '''base class for analyzers. types is the list of message types
+    the analyzer needs, or None for every message'''
+    name = None
+    types = []
+
+    def __init__(self, **options):
+        self.options = options
+
+    def start(self, mlog):
+        '''called before the first message'''
+        pass
+
+    def message(self, m, mlog):
+        '''called for each message of one of the analyzer's types'''
+        pass
+
+    def finish(self, mlog, last_timestamp):
+        '''called after the last message, returning the results as a
+        dict. last_timestamp is the time of the last message seen by
+        the scan, or None if there were none'''
+        return {}
+
+
+ANALYZERS = {}
+
+def register_analyzer(cls):
+    '''make an Analyzer class available by name'''
+    ANALYZERS[cls.name] = cls
+    return cls
+
+def create_analyzers(names=None, **options):
+    '''create analyzers by name, all registered analyzers if names is
+    None. Options are passed to every analyzer, each using the ones
+    it knows about'''
+    if names is None:
+        names = sorted(ANALYZERS.keys())
+    ret = []
+    for n in names:
+        if not n in ANALYZERS:
+            raise KeyError("Unknown analyzer %s" % n)
+        ret.append(ANALYZERS[n](**options))
+    return ret
+
+
+@register_analyzer
+class SummaryAnalyzer(Analyzer):
+    '''start time, distance travelled and autonomous time, as shown
+    by mavsummarize'''
+    name = 'summary'
+    types = ['HEARTBEAT', 'GPS_RAW_INT']
+
+    def start(self, mlog):
+        self.notimestamps = getattr(mlog, 'notimestamps', False)
+        self.autonomous_sections = 0
+        self.autonomous = False
+        self.auto_time = 0.0
+        self.start_auto_time = None
+        self.start_time = None
+        self.timestamp = None
+        self.total_dist = 0.0
+        self.first_gps_msg = None
+        self.last_gps_msg = None
+        self.true_time = None
+
+    def message(self, m, mlog):
+        timestamp = getattr(m, '_timestamp', 0.0)
+        self.timestamp = timestamp
+        if self.start_time is None:
+            self.start_time = timestamp
+        if self.true_time is None:
+            if not self.notimestamps and timestamp >= 1230768000:
+                self.true_time = timestamp
+            elif 'time_unix_usec' in m.__dict__ and m.time_unix_usec >= 1230768000:
+                self.true_time = m.time_unix_usec * 1.0e-6
+            elif 'time_usec' in m.__dict__ and m.time_usec >= 1230768000:
+                self.true_time = m.time_usec * 1.0e-6
+
+        if m.get_type() == 'GPS_RAW_INT':
+            if m.fix_type < 3 or m.lat == 0 or m.lon == 0:
+                return
+            if self.first_gps_msg is None:
+                self.first_gps_msg = m
+            last = self.last_gps_msg
+            if last is None or m.time_usec > last.time_usec or m.time_usec+30e6 < last.time_usec:
+                if last is not None:
+                    self.total_dist += distance_two(last, m)
+                self.last_gps_msg = m
+        elif m.get_type() == 'HEARTBEAT':
+            if m.type == mavutil.mavlink.MAV_TYPE_GCS:
+                return
+            auto = (m.base_mode & mavutil.mavlink.MAV_MODE_FLAG_GUIDED_ENABLED or
+                    m.base_mode & mavutil.mavlink.MAV_MODE_FLAG_AUTO_ENABLED)
+            if auto and not self.autonomous:
+                self.autonomous = True
+                self.autonomous_sections += 1
+                self.start_auto_time = timestamp
+            elif not auto and self.autonomous:
+                self.autonomous = False
+                self.auto_time += timestamp - self.start_auto_time
+
+    def finish(self, mlog, last_timestamp):
+        if self.start_time is None:
+            return {'messages' : False}
+        if self.autonomous:
+            self.auto_time += self.timestamp - self.start_auto_time
+        ret = {
+            'messages' : True,
+            'start_time' : self.true_time,
+            'total_time' : self.timestamp - self.start_time,
+            'distance' : self.total_dist,
+            'autonomous_sections' : self.autonomous_sections,
+            'autonomous_time' : self.auto_time,
+        }
+        if self.last_gps_msg is not None:
+            ret['first_position'] = (self.first_gps_msg.lat / 1e7, self.first_gps_msg.lon / 1e7)
+            ret['last_position'] = (self.last_gps_msg.lat / 1e7, self.last_gps_msg.lon / 1e7)
+        return ret
+
+
+@register_analyzer
+class FlightTimeAnalyzer(Analyzer):
+    '''time in the air and distance travelled, judged by GPS ground
+    speed, as shown by mavflighttime'''
+    name = 'flighttime'
+    types = ['GPS', 'GPS_RAW_INT']
+
+    def start(self, mlog):
+        self.groundspeed = self.options.get('groundspeed', 3.0)
+        self.in_air = False
+        self.start_time = 0.0
+        self.total_time = 0.0
+        self.total_dist = 0.0
+        self.t = None
+        self.last_msg = None
+        self.last_time_usec = None
+        self.flights = []
+
+    def message(self, m, mlog):
+        if m.get_type() == 'GPS_RAW_INT':
+            groundspeed = m.vel*0.01
+            status = m.fix_type
+            time_usec = m.time_usec
+        else:
+            groundspeed = m.Spd
+            status = m.Status
+            time_usec = m.TimeUS
+        if status < 3:
+            return
+        self.t = int(m._timestamp)
+        if groundspeed > self.groundspeed and not self.in_air:
+            self.in_air = True
+            self.start_time = self.t
+        elif groundspeed < self.groundspeed and self.in_air:
+            self.in_air = False
+            self.end_flight()
+
+        if self.last_msg is None or time_usec > self.last_time_usec or time_usec+30e6 < self.last_time_usec:
+            if self.last_msg is not None:
+                self.total_dist += distance_two(self.last_msg, m)
+            self.last_msg = m
+            self.last_time_usec = time_usec
+
+    def end_flight(self):
+        self.total_time += self.t - self.start_time
+        self.flights.append({'takeoff' : self.start_time,
+                             'landing' : self.t,
+                             'duration' : self.t - self.start_time})
+
+    def finish(self, mlog, last_timestamp):
+        if self.in_air:
+            self.end_flight()
+        return {'flights' : self.flights,
+                'total_time' : self.total_time,
+                'distance' : self.total_dist}
+
+
+@register_analyzer
+class GPSLockAnalyzer(Analyzer):
+    '''GPS lock and loss events, as shown by mavgpslock'''
+    name = 'gpslock'
+    types = ['GPS_RAW_INT', 'GPS_RAW']
+
+    def start(self, mlog):
+        self.locked = False
+        self.start_time = 0.0
+        self.total_time = 0.0
+        self.unlock_time = None
+        self.t = None
+        self.events = []
+
+    def message(self, m, mlog):
+        t = int(m._timestamp)
+        if self.unlock_time is None:
+            # the first message only sets the time we started waiting for lock
+            self.unlock_time = t
+            return
+        self.t = t
+        if m.fix_type >= 2 and not self.locked:
+            self.events.append({'event' : 'locked', 'time' : t, 'after' : t - self.unlock_time})
+            self.locked = True
+            self.start_time = t
+        elif m.fix_type <= 1 and self.locked:
+            event = 'lost_gps_lock' if m.fix_type == 1 else 'lost_protocol_lock'
+            self.events.append({'event' : event, 'time' : t})
+            self.locked = False
+            self.total_time += t - self.start_time
+            self.unlock_time = t
+
+    def finish(self, mlog, last_timestamp):
+        if self.locked:
+            self.total_time += self.t - self.start_time
+        return {'events' : self.events, 'total_time' : self.total_time}
+
+
+@register_analyzer
+class SigLossAnalyzer(Analyzer):
+    '''gaps in the message stream longer than deltat seconds, as shown
+    by mavsigloss. The sigloss_types option limits the messages looked
+    at, otherwise every message is used'''
+    name = 'sigloss'
+    types = None
+
+    def __init__(self, **options):
+        super(SigLossAnalyzer, self).__init__(**options)
+        if options.get('sigloss_types', None) is not None:
+            self.types = list(options['sigloss_types'])
+
+    def start(self, mlog):
+        self.deltat = self.options.get('deltat', 1.0)
+        self.notimestamps = getattr(mlog, 'notimestamps', False)
+        self.last_t = 0
+        self.gaps = []
+
+    def message(self, m, mlog):
+        if self.notimestamps:
+            if not 'usec' in m._fieldnames:
+                return
+            t = m.usec / 1.0e6
+        else:
+            t = m._timestamp
+        if self.last_t != 0 and t - self.last_t > self.deltat:
+            self.gaps.append({'time' : t, 'duration' : t - self.last_t})
+        self.last_t = t
+
+    def finish(self, mlog, last_timestamp):
+        return {'gaps' : self.gaps}
+
+
+@register_analyzer
+class FlightModeAnalyzer(Analyzer):
+    '''flight mode changes and time in each mode, as shown by
+    mavflightmodes'''
+    name = 'flightmodes'
+    types = ['SYS_STATUS', 'HEARTBEAT', 'MODE']
+
+    def start(self, mlog):
+        self.mode = None
+        self.mode_start = None
+        self.changes = []
+        self.time_in_mode = {}
+
+    def message(self, m, mlog):
+        mode = mlog.flightmode
+        if mode == self.mode:
+            return
+        t = m._timestamp
+        if self.mode is not None:
+            self.time_in_mode[self.mode] = self.time_in_mode.get(self.mode, 0) + (t - self.mode_start)
+        self.changes.append({'time' : t, 'mode' : mode})
+        self.mode = mode
+        self.mode_start = t
+
+    def finish(self, mlog, last_timestamp):
+        if self.mode is not None and last_timestamp is not None:
+            self.time_in_mode[self.mode] = self.time_in_mode.get(self.mode, 0) + (last_timestamp - self.mode_start)
+        return {'changes' : self.changes, 'time_in_mode' : self.time_in_mode}
+
+
+@register_analyzer
+class PacketLossAnalyzer(Analyzer):
+    '''MAVLink packet loss and the reasons for bad data, as shown by
+    mavloss'''
+    name = 'loss'
+    types = ['BAD_DATA']
+
+    def start(self, mlog):
+        self.reason_ids = set()
+        self.reasons = []
+
+    def message(self, m, mlog):
+        reason_id = ''.join(m.reason.split(' ')[0:3])
+        if reason_id not in self.reason_ids:
+            self.reason_ids.add(reason_id)
+            self.reasons.append(m.reason)
+
+    def finish(self, mlog, last_timestamp):
+        if hasattr(mlog, 'offsets') and hasattr(mlog, 'data_map'):
+            # indexed tlogs skip frames of types no analyzer asked for,
+            # so count the sequence numbers from the index instead
+            results = mavseq.analyse(*mavseq.log_sequences(mlog))
+            seq = mavseq.combine([r[0] for r in results.values()])
+            return {'packets' : seq.received,
+                    'lost' : seq.lost,
+                    'loss_percent' : seq.loss_percent(),
+                    'reasons' : self.reasons,
+                    'duplicates' : seq.duplicates,
+                    'reordered' : seq.reordered}
+        count = getattr(mlog, 'mav_count', 0)
+        loss = getattr(mlog, 'mav_loss', 0)
+        ret = {'packets' : count,
+               'lost' : loss,
+               'loss_percent' : mlog.packet_loss() if hasattr(mlog, 'packet_loss') else 0.0,
+               'reasons' : self.reasons}
+        tracker = getattr(mlog, 'seq_tracker', None)
+        if tracker is not None:
+            seq = tracker.summary()
+            ret['duplicates'] = seq.duplicates
+            ret['reordered'] = seq.reordered
+        return ret
+
+
+def scan_log(mlog, analyzers, condition=None):
+    '''make one pass over a log feeding the analyzers, returning a
+    dict of results keyed by analyzer name'''
+    dispatch = {}
+    everything = []
+    types = set()
+    for a in analyzers:
+        a.start(mlog)
+        if a.types is None:
+            everything.append(a)
+        else:
+            types.update(a.types)
+            for t in a.types:
+                dispatch.setdefault(t, []).append(a)
+    if len(everything) > 0:
+        types = None
+
+    last_timestamp = None
+    while True:
+        m = mlog.recv_match(type=types, condition=condition)
+        if m is None:
+            break
+        last_timestamp = getattr(m, '_timestamp', last_timestamp)
+        for a in everything:
+            a.message(m, mlog)
+        for a in dispatch.get(m.get_type(), []):
+            a.message(m, mlog)
+
+    ret = {}
+    for a in analyzers:
+        ret[a.name] = a.finish(mlog, last_timestamp)
+    return ret
@@ -0,0 +1,447 @@
+#!/usr/bin/env python
+'''
+export logs to columnar formats
+
+Each message type becomes a table with a timestamp column followed by
+one typed column per field. Array fields become fixed size list
+columns (or 2D datasets in HDF5), and units from FMTU/UNIT/MULT
+metadata in dataflash logs, or from the message definitions for
+MAVLink logs, are attached to the columns. Tables are written in row
+groups of a fixed number of rows, so memory use doesn't grow with the
+size of the log. Supported formats are Parquet and Arrow IPC (a
+directory with one file per message type, using pyarrow) and HDF5 (one
+file with a group per message type, using h5py). MATWriter builds
+MATLAB output in preallocated arrays for mavlogdump --format mat.
+
+Released under GNU GPL version 3 or later
+'''
+from __future__ import print_function
+from __future__ import absolute_import
+from builtins import object
+
+import fnmatch
+import os
+
+import numpy as np
+
+FORMATS = ['parquet', 'arrow', 'hdf5']
+
+DEFAULT_ROW_GROUP = 65536
+
+
+class Column(object):
+    '''a column of a table: a name, a numpy array with one row per
+    message (2D for array fields), and optional units metadata'''
+    def __init__(self, name, values, unit=None, multiplier=None):
+        self.name = name
+        self.values = values
+        self.unit = unit
+        self.multiplier = multiplier
+
+
+def _match_type(mtype, patterns):
+    for p in patterns:
+        if fnmatch.fnmatch(mtype, p):
+            return True
+    return False
+
+
+class ArrowExport(object):
+    '''write each message type to its own Parquet or Arrow IPC file
+    in a directory'''
+    def __init__(self, path, format='parquet'):
+        import pyarrow
+        self.pa = pyarrow
+        self.path = path
+        self.format = format
+        self.writers = {}
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def filename(self, name):
+        ext = '.parquet' if self.format == 'parquet' else '.arrow'
+        return os.path.join(self.path, name + ext)
+
+    def _array(self, values):
+        pa = self.pa
+        if values.ndim == 2:
+            flat = pa.array(values.reshape(-1))
+            return pa.FixedSizeListArray.from_arrays(flat, values.shape[1])
+        return pa.array(values)
+
+    def _field(self, c, array):
+        metadata = {}
+        if c.unit is not None:
+            metadata['unit'] = c.unit
+        if c.multiplier is not None:
+            metadata['multiplier'] = repr(c.multiplier)
+        return self.pa.field(c.name, array.type, metadata=metadata or None)
+
+    def write(self, name, columns):
+        pa = self.pa
+        arrays = [self._array(c.values) for c in columns]
+        if not name in self.writers:
+            schema = pa.schema([self._field(columns[i], arrays[i]) for i in range(len(columns))])
+            if self.format == 'parquet':
+                import pyarrow.parquet
+                writer = pyarrow.parquet.ParquetWriter(self.filename(name), schema)
+            else:
+                import pyarrow.ipc
+                writer = pyarrow.ipc.new_file(self.filename(name), schema)
+            self.writers[name] = (writer, schema)
+        (writer, schema) = self.writers[name]
+        table = pa.Table.from_arrays(arrays, schema=schema)
+        writer.write_table(table)
+
+    def close(self):
+        for (writer, schema) in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+
+class HDF5Export(object):
+    '''write each message type to a group in an HDF5 file, with one
+    extendable dataset per column'''
+    def __init__(self, path):
+        import h5py
+        self.h5py = h5py
+        self.f = h5py.File(path, 'w')
+
+    def write(self, name, columns):
+        if not name in self.f:
+            group = self.f.create_group(name)
+            for c in columns:
+                if c.values.dtype.kind in 'UO':
+                    dtype = self.h5py.string_dtype()
+                else:
+                    dtype = c.values.dtype
+                ds = group.create_dataset(c.name, shape=(0,) + c.values.shape[1:], dtype=dtype,
+                                          maxshape=(None,) + c.values.shape[1:],
+                                          chunks=(max(1, min(len(c.values), 65536)),) + c.values.shape[1:])
+                if c.unit is not None:
+                    ds.attrs['unit'] = c.unit
+                if c.multiplier is not None:
+                    ds.attrs['multiplier'] = c.multiplier
+        group = self.f[name]
+        for c in columns:
+            ds = group[c.name]
+            n = ds.shape[0]
+            ds.resize((n + len(c.values),) + ds.shape[1:])
+            values = c.values
+            if values.dtype.kind == 'U':
+                values = values.astype(object)
+            ds[n:] = values
+
+    def close(self):
+        self.f.close()
+
+
+def open_export(path, format):
+    '''create an exporter for one of FORMATS'''
+    if format in ['parquet', 'arrow']:
+        return ArrowExport(path, format)
+    if format == 'hdf5':
+        return HDF5Export(path)
+    raise ValueError("Unknown export format %s" % format)
+
+
+def df_units(mlog):
+    '''return (units, multipliers) dicts mapping FMTU unit and
+    multiplier characters to their labels and values, from the UNIT
+    and MULT messages in a dataflash log'''
+    units = {}
+    mults = {}
+    if not 'UNIT' in mlog.name_to_id and not 'MULT' in mlog.name_to_id:
+        return (units, mults)
+    mlog.rewind()
+    while True:
+        m = mlog.recv_match(type=['UNIT', 'MULT'])
+        if m is None:
+            break
+        if m.get_type() == 'UNIT':
+            units[chr(m.Id)] = m.Label
+        elif m.get_type() == 'MULT':
+            mults[chr(m.Id)] = m.Mult
+    mlog.rewind()
+    return (units, mults)
+
+def _df_column_units(fmt, units, mults):
+    ret = []
+    for i in range(len(fmt.columns)):
+        unit = None
+        mult = None
+        if fmt.unit_ids is not None and i < len(fmt.unit_ids):
+            unit = units.get(fmt.unit_ids[i], None)
+        if fmt.mult_ids is not None and i < len(fmt.mult_ids):
+            mult = mults.get(fmt.mult_ids[i], None)
+            if mult in [0, 1]:
+                mult = None
+        ret.append((unit, mult))
+    return ret
+
+
+def _to_column_array(values):
+    '''convert a list of field values to a numpy array, 2D for array
+    fields'''
+    if len(values) > 0 and isinstance(values[0], bytes):
+        values = [v.decode('utf-8', 'replace') for v in values]
+    try:
+        ret = np.array(values)
+    except ValueError:
+        # ragged arrays, e.g. BAD_DATA
+        ret = np.array([str(v) for v in values])
+    if ret.ndim > 2 or ret.dtype.kind == 'O':
+        ret = np.array([str(v) for v in values])
+    return ret
+
+
+class _RowBuffer(object):
+    '''rows of one message type waiting to be written'''
+    def __init__(self, fieldnames, units):
+        self.fieldnames = fieldnames
+        self.units = units
+        self.timestamps = []
+        self.rows = []
+
+    def columns(self):
+        ret = [Column('timestamp', np.array(self.timestamps, dtype=np.float64))]
+        for i in range(len(self.fieldnames)):
+            values = _to_column_array([r[i] for r in self.rows])
+            (unit, mult) = self.units[i]
+            ret.append(Column(self.fieldnames[i], values, unit, mult))
+        self.timestamps = []
+        self.rows = []
+        return ret
+
+
+def _export_df_fast(mlog, export, name, units, mults, row_group_size, counts):
+    '''export one dataflash message type straight from the file, in
+    chunks of row_group_size. Returns False if the type can't be
+    extracted in bulk'''
+    fmt = mlog.formats[mlog.name_to_id[name]]
+    column_units = _df_column_units(fmt, units, mults)
+    total = mlog.counts[fmt.type]
+    start = 0
+    while start < total:
+        cols = mlog.extract_arrays(name, start, row_group_size)
+        if cols is None:
+            return False
+        columns = [Column('timestamp', cols['_timestamp'])]
+        for i in range(len(fmt.columns)):
+            (unit, mult) = column_units[i]
+            columns.append(Column(fmt.columns[i], cols[fmt.columns[i]], unit, mult))
+        if len(cols['_timestamp']) > 0:
+            export.write(name, columns)
+            counts[name] = counts.get(name, 0) + len(cols['_timestamp'])
+        start += row_group_size
+    return True
+
+
+def export_log(mlog, path, format='parquet', types=None, nottypes=None, condition=None,
+               row_group_size=DEFAULT_ROW_GROUP):
+    '''export the messages in a log to path, one table per message
+    type. types and nottypes are lists of type patterns with
+    wildcards. Returns a dict of the number of rows written for each
+    type'''
+    export = open_export(path, format)
+    counts = {}
+    units = {}
+    mults = {}
+    isdf = hasattr(mlog, 'formats') and hasattr(mlog, 'extract_arrays')
+    if isdf:
+        (units, mults) = df_units(mlog)
+
+    wanted = None
+    if hasattr(mlog, 'name_to_id'):
+        wanted = []
+        for name in sorted(mlog.name_to_id.keys()):
+            if types is not None and not _match_type(name, types):
+                continue
+            if nottypes is not None and _match_type(name, nottypes):
+                continue
+            wanted.append(name)
+
+    # dataflash logs without a condition can be exported a chunk at a time
+    slow = wanted
+    if isdf and condition is None:
+        slow = []
+        for name in wanted:
+            if not _export_df_fast(mlog, export, name, units, mults, row_group_size, counts):
+                slow.append(name)
+
+    if slow is None or len(slow) > 0:
+        buffers = {}
+        mlog.rewind()
+        while True:
+            m = mlog.recv_match(type=slow, condition=condition)
+            if m is None:
+                break
+            mtype = m.get_type()
+            if mtype == 'BAD_DATA':
+                continue
+            if slow is not None and not mtype in slow:
+                continue
+            if slow is None:
+                if types is not None and not _match_type(mtype, types):
+                    continue
+                if nottypes is not None and _match_type(mtype, nottypes):
+                    continue
+            if not mtype in buffers:
+                fieldnames = list(m.get_fieldnames())
+                if isdf:
+                    column_units = _df_column_units(m.fmt, units, mults)
+                else:
+                    fieldunits = getattr(m, 'fieldunits_by_name', {})
+                    column_units = [(fieldunits.get(f, None), None) for f in fieldnames]
+                buffers[mtype] = _RowBuffer(fieldnames, column_units)
+            b = buffers[mtype]
+            b.timestamps.append(m._timestamp)
+            b.rows.append([getattr(m, f, None) for f in b.fieldnames])
+            if len(b.rows) >= row_group_size:
+                counts[mtype] = counts.get(mtype, 0) + len(b.rows)
+                export.write(mtype, b.columns())
+        for mtype in sorted(buffers.keys()):
+            b = buffers[mtype]
+            if len(b.rows) > 0:
+                counts[mtype] = counts.get(mtype, 0) + len(b.rows)
+                export.write(mtype, b.columns())
+        mlog.rewind()
+
+    export.close()
+    return counts
+
+
+class _MatTable(object):
+    '''rows of one message type for MAT output, kept in a preallocated
+    array: int64 if every field is an integer, float64 if every field
+    is a number, otherwise an object array which becomes a cell array.
+    These are the types savemat picked for the rows as lists'''
+    def __init__(self, fieldnames, capacity, dtype):
+        self.fieldnames = fieldnames
+        self.n = 0
+        self.data = np.empty((max(capacity, 16), len(fieldnames)), dtype=dtype)
+
+    def _grow(self, n):
+        if n <= len(self.data):
+            return
+        data = np.empty((max(n, 2*len(self.data)), self.data.shape[1]), dtype=self.data.dtype)
+        data[:self.n] = self.data[:self.n]
+        self.data = data
+
+    def append(self, values):
+        dtype = self.data.dtype
+        if dtype != object:
+            row_dtype = _row_dtype(values)
+            if row_dtype == object or (dtype == np.int64 and row_dtype == np.float64):
+                self.data = self.data.astype(row_dtype)
+        self._grow(self.n+1)
+        row = self.data[self.n]
+        for i in range(len(values)):
+            row[i] = values[i]
+        self.n += 1
+
+    def append_columns(self, columns):
+        n = len(columns[0])
+        self._grow(self.n+n)
+        for i in range(len(columns)):
+            col = columns[i]
+            if col.ndim == 1 and self.data.dtype != object:
+                self.data[self.n:self.n+n, i] = col
+            else:
+                for r in range(n):
+                    self.data[self.n+r, i] = col[r]
+        self.n += n
+
+    def array(self):
+        return self.data[:self.n]
+
+
+def _row_dtype(values):
+    '''the array type for a row of values'''
+    dtype = np.int64
+    for v in values:
+        if isinstance(v, bool) or not isinstance(v, (int, float)):
+            return object
+        if isinstance(v, float):
+            dtype = np.float64
+    return dtype
+
+
+class MATWriter(object):
+    '''collect messages for MATLAB output. Each message type becomes
+    a rows by fields matrix, plus a TYPE_label array of field names.
+    Arrays are sized from the reader's message counts where it has
+    them, so memory use is close to that of the saved data'''
+    def __init__(self, mlog):
+        self.mlog = mlog
+        self.tables = {}
+        self.bulk_done = set()
+
+    def _capacity(self, mtype):
+        try:
+            return self.mlog.counts[self.mlog.name_to_id[mtype]]
+        except (AttributeError, KeyError, IndexError):
+            return 1024
+
+    def add(self, m):
+        '''add one message'''
+        mtype = m.get_type()
+        if mtype in self.bulk_done:
+            return
+        md = m.to_dict()
+        del md['mavpackettype']
+        values = list(md.values())
+        if not mtype in self.tables:
+            self.tables[mtype] = _MatTable(list(md.keys()), self._capacity(mtype), _row_dtype(values))
+        self.tables[mtype].append(values)
+
+    def add_bulk(self, mtype, chunk=DEFAULT_ROW_GROUP):
+        '''add every message of a dataflash type straight from the log,
+        returning False if the type can't be extracted in bulk'''
+        mlog = self.mlog
+        if not hasattr(mlog, 'extract_arrays') or not mtype in mlog.name_to_id:
+            return False
+        fmt = mlog.formats[mlog.name_to_id[mtype]]
+        total = mlog.counts[fmt.type]
+        table = None
+        start = 0
+        while start < total:
+            cols = mlog.extract_arrays(mtype, start, chunk)
+            if cols is None:
+                return False
+            columns = [cols[c] for c in fmt.columns]
+            if table is None:
+                if all([c.ndim == 1 and c.dtype.kind in 'iu' for c in columns]):
+                    dtype = np.int64
+                elif all([c.ndim == 1 and c.dtype.kind in 'iuf' for c in columns]):
+                    dtype = np.float64
+                else:
+                    dtype = object
+                table = _MatTable(list(fmt.columns), total, dtype)
+            if len(columns[0]) > 0:
+                table.append_columns(columns)
+            start += chunk
+        if table is not None and table.n > 0:
+            self.tables[mtype] = table
+        self.bulk_done.add(mtype)
+        return True
+
+    def save(self, filename, do_compression=False):
+        import scipy.io
+        MAT = {}
+        for mtype in self.tables:
+            table = self.tables[mtype]
+            labels = np.zeros((len(table.fieldnames), 1), dtype=object)
+            for i in range(len(table.fieldnames)):
+                labels[i] = table.fieldnames[i]
+            MAT[mtype+'_label'] = labels
+            data = table.array()
+            if data.dtype == object:
+                # convert mixed rows the way savemat always has, e.g. to a
+                # char matrix for types with string fields
+                try:
+                    data = np.array(data.tolist())
+                except ValueError:
+                    pass
+            MAT[mtype] = data
+        scipy.io.savemat(filename, MAT, do_compression=do_compression)
@@ -0,0 +1,392 @@
+#!/usr/bin/env python
+'''
+magnetometer calibration fitting engine, shared by the magfit tools
+
+Sensor data is extracted from a log once into numpy arrays, and each
+calibration model provides vectorised residuals and an analytic
+Jacobian for scipy.optimize.leastsq, so whole flights can be fitted
+quickly.
+
+Released under GNU GPL version 3 or later
+'''
+from __future__ import print_function
+from __future__ import absolute_import
+from builtins import object
+
+import numpy as np
+
+from . import mavarray
+
+
+class MagData(object):
+    '''magnetometer samples from a log, as numpy arrays. mag holds the
+    raw sensor values (with the offsets in use at the time removed),
+    one row per sample, and offsets the last offsets seen in the log.
+    Any other arrays are lined up with mag'''
+    def __init__(self, mag, offsets, timestamps=None, **extra):
+        self.mag = np.asarray(mag, dtype=float).reshape(-1, 3)
+        self.offsets = offsets
+        if timestamps is None:
+            timestamps = np.zeros(len(self.mag))
+        self.timestamps = np.asarray(timestamps, dtype=float)
+        self.extra = list(extra.keys())
+        for k in extra:
+            setattr(self, k, np.asarray(extra[k]))
+
+    def __len__(self):
+        return len(self.mag)
+
+    def subset(self, idx):
+        '''return a MagData holding the selected samples'''
+        extra = dict((k, getattr(self, k)[idx]) for k in self.extra)
+        return MagData(self.mag[idx], self.offsets, self.timestamps[idx], **extra)
+
+
+def _xyz(arrays, fields):
+    return np.column_stack([getattr(arrays, f) for f in fields]).astype(float)
+
+def _latest(arrays, t, positions):
+    '''index of the latest message of type t at each position, or None
+    if the type isn't in the log'''
+    if not t in arrays:
+        return None
+    return arrays[t].latest_index(positions)
+
+def load_mag(mlog, mag_type='MAG', condition=None, require_offsets=False, extra_types=[]):
+    '''load magnetometer samples from a log.
+
+    For dataflash logs the samples come from mag_type (MAG, MAG2 etc,
+    or None to only use RAW_IMU)
+    and have their logged offsets removed. For telemetry logs samples
+    come from RAW_IMU with the latest SENSOR_OFFSETS removed; samples
+    before the first SENSOR_OFFSETS are dropped if require_offsets is
+    set.  Returns a MagData and the extracted arrays, which will include
+    extra_types'''
+    types = set(['RAW_IMU', 'SENSOR_OFFSETS']).union(extra_types)
+    if mag_type is not None:
+        types.add(mag_type)
+    arrays = mavarray.extract_arrays(mlog, types, condition)
+    if mag_type is not None and mag_type in arrays:
+        a = arrays[mag_type]
+        mag = _xyz(a, ['MagX', 'MagY', 'MagZ'])
+        ofs = _xyz(a, ['OfsX', 'OfsY', 'OfsZ'])
+        offsets = ofs[-1] if len(ofs) else np.zeros(3)
+        return (MagData(mag - ofs, offsets, a._timestamp, position=a._position), arrays)
+    if not 'RAW_IMU' in arrays:
+        return (MagData(np.zeros((0, 3)), np.zeros(3), position=np.zeros(0, dtype=np.int64)), arrays)
+    a = arrays['RAW_IMU']
+    mag = _xyz(a, ['xmag', 'ymag', 'zmag'])
+    idx = _latest(arrays, 'SENSOR_OFFSETS', a._position)
+    if idx is None:
+        idx = np.full(len(mag), -1)
+        ofs_table = np.zeros((1, 3))
+    else:
+        ofs_table = _xyz(arrays['SENSOR_OFFSETS'], ['mag_ofs_x', 'mag_ofs_y', 'mag_ofs_z'])
+    ofs = np.where((idx >= 0)[:, np.newaxis], ofs_table[np.maximum(idx, 0)], 0.0)
+    offsets = ofs_table[-1] if len(ofs_table) else np.zeros(3)
+    data = MagData(mag - ofs, offsets, a._timestamp, position=a._position)
+    if require_offsets:
+        data = data.subset(idx >= 0)
+    return (data, arrays)
+
+def motor_output(arrays, positions, rc3_min=1100, rc3_max=1900):
+    '''average motor output 0..1 from the latest SERVO_OUTPUT_RAW at
+    each position, zero before the first one'''
+    idx = _latest(arrays, 'SERVO_OUTPUT_RAW', positions)
+    if idx is None:
+        return np.zeros(len(positions))
+    a = arrays['SERVO_OUTPUT_RAW']
+    pwm = 0.25 * (a.servo1_raw.astype(float) + a.servo2_raw + a.servo3_raw + a.servo4_raw)
+    motor = np.clip((pwm - rc3_min) / (rc3_max - rc3_min), 0.0, 1.0)
+    return np.where(idx >= 0, motor[np.maximum(idx, 0)], 0.0)
+
+def load_gps_heading(mlog, condition=None, minspeed=5.0):
+    '''load RAW_IMU samples taken while flying, with the latest
+    ATTITUDE roll and pitch and GPS ground course. Flying means the
+    latest GPS_RAW or GPS_RAW_INT has a fix and more than minspeed
+    m/s ground speed'''
+    (data, arrays) = load_mag(mlog, None, condition, require_offsets=True,
+                              extra_types=['ATTITUDE', 'GPS_RAW', 'GPS_RAW_INT'])
+    pos = data.position
+    flying = np.zeros(len(data), dtype=bool)
+    heading = np.zeros(len(data))
+    last_gps = np.full(len(data), -1)
+    for (t, speed, fix, hdg) in [('GPS_RAW', 'v', 2, 'hdg'), ('GPS_RAW_INT', 'vel', 3, 'cog')]:
+        idx = _latest(arrays, t, pos)
+        if idx is None:
+            continue
+        a = arrays[t]
+        gps_pos = np.where(idx >= 0, a._position[np.maximum(idx, 0)], -1)
+        newer = gps_pos > last_gps
+        if t == 'GPS_RAW':
+            (v, h) = (a.v.astype(float), a.hdg.astype(float))
+        else:
+            (v, h) = (a.vel / 100, a.cog / 100)
+        ok = (v > minspeed) & (a.fix_type == fix)
+        flying = np.where(newer, ok[np.maximum(idx, 0)], flying)
+        heading = np.where(newer, h[np.maximum(idx, 0)], heading)
+        last_gps = np.maximum(last_gps, gps_pos)
+    idx = _latest(arrays, 'ATTITUDE', pos)
+    if idx is None:
+        idx = np.full(len(data), -1)
+        (roll, pitch) = (np.zeros(1), np.zeros(1))
+    else:
+        (roll, pitch) = (arrays['ATTITUDE'].roll, arrays['ATTITUDE'].pitch)
+    data.roll = roll[np.maximum(idx, 0)]
+    data.pitch = pitch[np.maximum(idx, 0)]
+    data.heading = heading
+    data.extra += ['roll', 'pitch', 'heading']
+    return (data.subset(flying & (idx >= 0)), arrays)
+
+def add_noise(data, noise, seed=None):
+    '''add a random vector of the given length to each sample'''
+    if noise == 0:
+        return data
+    rng = np.random.RandomState(seed)
+    v = rng.normal(size=data.mag.shape)
+    v /= np.linalg.norm(v, axis=1)[:, np.newaxis]
+    data.mag = data.mag + v * noise
+    return data
+
+def select_data(mag, cell=20, max_per_cell=2):
+    '''thin out samples so that at most max_per_cell fall in each cube
+    of the given size, returning the indices of the samples kept in
+    their original order'''
+    key = np.trunc(np.asarray(mag) / cell).astype(np.int64)
+    (uniq, inverse) = np.unique(key, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    order = np.argsort(inverse, kind='mergesort')
+    sorted_keys = inverse[order]
+    starts = np.searchsorted(sorted_keys, sorted_keys, side='left')
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order)) - starts
+    return np.nonzero(rank < max_per_cell)[0]
+
+def trim_by_radius(radii, fraction):
+    '''return indices of samples sorted by radius with the given
+    fraction of the samples dropped from each end'''
+    order = np.argsort(radii, kind='mergesort')
+    n = int(len(order) * fraction)
+    if n == 0:
+        return order
+    return order[n:-n]
+
+
+# sphere model: |mag + offsets| = radius
+def sphere_residuals(p, mag, radius=None):
+    '''residuals for params [ofs_x, ofs_y, ofs_z, radius]'''
+    r = p[3] if radius is None else radius
+    return r - np.linalg.norm(mag + p[0:3], axis=1)
+
+def sphere_jacobian(p, mag, radius=None):
+    v = mag + p[0:3]
+    u = v / np.linalg.norm(v, axis=1)[:, np.newaxis]
+    J = np.empty((len(mag), 4))
+    J[:, 0:3] = -u
+    J[:, 3] = 0.0 if radius is not None else 1.0
+    return J
+
+def fit_sphere(mag, radius=None, p0=None):
+    '''fit offsets and radius to samples, returning (offsets, radius)'''
+    from scipy import optimize
+    if p0 is None:
+        p0 = [0.0, 0.0, 0.0, 0.0]
+    p1, ier = optimize.leastsq(sphere_residuals, p0, args=(mag, radius), Dfun=sphere_jacobian)
+    if not ier in [1, 2, 3, 4]:
+        raise RuntimeError("Unable to find solution")
+    return (p1[0:3], p1[3] if radius is None else radius)
+
+
+# ellipsoid model: |M (mag + offsets)| = radius, with M symmetric and
+# M[0][0] fixed at 1
+def _ellipsoid_matrix(p):
+    (dx, dy, dz, odx, ody, odz) = p[4:10]
+    return np.array([[1.0, odx, ody],
+                     [odx, dy, odz],
+                     [ody, odz, dz]])
+
+def ellipsoid_correct(mag, offsets, diag, offdiag):
+    '''apply offsets and elliptical corrections to samples'''
+    M = _ellipsoid_matrix([0, 0, 0, 0] + [diag[0], diag[1], diag[2], offdiag[0], offdiag[1], offdiag[2]])
+    return (np.asarray(mag) + offsets).dot(M.T)
+
+def ellipsoid_residuals(p, mag, radius=None):
+    '''residuals for params [ofs(3), radius, diag(3), offdiag(3)]'''
+    r = p[3] if radius is None else radius
+    v = (mag + p[0:3]).dot(_ellipsoid_matrix(p).T)
+    return r - np.linalg.norm(v, axis=1)
+
+def ellipsoid_jacobian(p, mag, radius=None):
+    w = mag + p[0:3]
+    M = _ellipsoid_matrix(p)
+    v = w.dot(M.T)
+    u = v / np.linalg.norm(v, axis=1)[:, np.newaxis]
+    J = np.zeros((len(mag), 10))
+    J[:, 0:3] = -u.dot(M)
+    J[:, 3] = 0.0 if radius is not None else 1.0
+    # diag.x is fixed at 1
+    J[:, 5] = -u[:, 1] * w[:, 1]
+    J[:, 6] = -u[:, 2] * w[:, 2]
+    J[:, 7] = -(u[:, 0] * w[:, 1] + u[:, 1] * w[:, 0])
+    J[:, 8] = -(u[:, 0] * w[:, 2] + u[:, 2] * w[:, 0])
+    J[:, 9] = -(u[:, 1] * w[:, 2] + u[:, 2] * w[:, 1])
+    return J
+
+def fit_ellipsoid(mag, radius=None, p0=None):
+    '''fit offsets, radius and elliptical corrections, returning
+    (offsets, radius, diag, offdiag)'''
+    from scipy import optimize
+    if p0 is None:
+        p0 = [0.0, 0.0, 0.0, 500.0 if radius is None else radius,
+              1.0, 1.0, 1.0,
+              0.0, 0.0, 0.0]
+    p1, ier = optimize.leastsq(ellipsoid_residuals, p0, args=(mag, radius), Dfun=ellipsoid_jacobian)
+    if not ier in [1, 2, 3, 4]:
+        raise RuntimeError("Unable to find solution: %u" % ier)
+    diag = np.array([1.0, p1[5], p1[6]])
+    return (p1[0:3], p1[3] if radius is None else radius, diag, p1[7:10])
+
+
+# motor interference model: |mag + offsets + motor * motor_ofs| = radius
+def motor_residuals(p, mag, motor):
+    '''residuals for params [ofs(3), motor_ofs(3), radius]'''
+    v = mag + p[0:3] + motor[:, np.newaxis] * p[3:6]
+    return p[6] - np.linalg.norm(v, axis=1)
+
+def motor_jacobian(p, mag, motor):
+    v = mag + p[0:3] + motor[:, np.newaxis] * p[3:6]
+    u = v / np.linalg.norm(v, axis=1)[:, np.newaxis]
+    J = np.empty((len(mag), 7))
+    J[:, 0:3] = -u
+    J[:, 3:6] = -u * motor[:, np.newaxis]
+    J[:, 6] = 1.0
+    return J
+
+def fit_motors(mag, motor, p0=None):
+    '''fit offsets and motor offsets, returning (offsets, motor_ofs, radius)'''
+    from scipy import optimize
+    if p0 is None:
+        p0 = [0.0] * 7
+    p1, ier = optimize.leastsq(motor_residuals, p0, args=(mag, motor), Dfun=motor_jacobian)
+    if not ier in [1, 2, 3, 4]:
+        raise RuntimeError("Unable to find solution")
+    return (p1[0:3], p1[3:6], p1[6])
+
+
+# heading model, fitting offsets and declination to GPS ground course
+def tilt_heading(mag, roll, pitch, declination):
+    '''tilt compensated heading in degrees 0..360 from body frame mag
+    samples and roll/pitch in radians'''
+    (x, y, z) = (mag[:, 0], mag[:, 1], mag[:, 2])
+    headX = x*np.cos(pitch) + y*np.sin(roll)*np.sin(pitch) + z*np.cos(roll)*np.sin(pitch)
+    headY = y*np.cos(roll) - z*np.sin(roll)
+    heading = np.degrees(np.arctan2(-headY, headX)) + declination
+    return np.where(heading < 0, heading + 360, heading)
+
+def _wrap_180(a):
+    return np.where(a > 180, a - 360, np.where(a < -180, a + 360, a))
+
+def heading_residuals(p, mag, roll, pitch, heading, declination=None):
+    '''residuals for params [ofs(3), declination]'''
+    dec = p[3] if declination is None else declination
+    return _wrap_180(heading - tilt_heading(mag + p[0:3], roll, pitch, dec))
+
+def heading_jacobian(p, mag, roll, pitch, heading, declination=None):
+    v = mag + p[0:3]
+    (x, y, z) = (v[:, 0], v[:, 1], v[:, 2])
+    (sr, cr, sp, cp) = (np.sin(roll), np.cos(roll), np.sin(pitch), np.cos(pitch))
+    headX = x*cp + y*sr*sp + z*cr*sp
+    headY = y*cr - z*sr
+    d2 = headX**2 + headY**2
+    # heading = degrees(atan2(-headY, headX)), so
+    # dheading = degrees(headY*dheadX - headX*dheadY)/d2
+    k = np.degrees(1.0) / d2
+    J = np.empty((len(mag), 4))
+    J[:, 0] = -k * (headY * cp)
+    J[:, 1] = -k * (headY * sr * sp - headX * cr)
+    J[:, 2] = -k * (headY * cr * sp + headX * sr)
+    J[:, 3] = 0.0 if declination is not None else -1.0
+    return J
+
+def fit_heading(mag, roll, pitch, heading, declination=None):
+    '''fit offsets and declination so that the tilt compensated mag
+    heading matches the given heading, returning (offsets, declination)'''
+    from scipy import optimize
+    p0 = [0.0, 0.0, 0.0, 0.0 if declination is None else declination]
+    args = (mag, roll, pitch, heading, declination)
+    p1, ier = optimize.leastsq(heading_residuals, p0, args=args, Dfun=heading_jacobian)
+    if not ier in [1, 2, 3, 4]:
+        raise RuntimeError("Unable to find solution")
+    return (p1[0:3], p1[3] if declination is None else declination)
+
+
+class Correction(object):
+    '''a full set of compass corrections, as used by ArduPilot'''
+    def __init__(self):
+        self.offsets = np.zeros(3)
+        self.diag = np.ones(3)
+        self.offdiag = np.zeros(3)
+        self.cmot = np.zeros(3)
+        self.scaling = 1.0
+
+    def matrix(self):
+        '''the elliptical correction matrix'''
+        (d, o) = (self.diag, self.offdiag)
+        return np.array([[d[0], o[0], o[1]],
+                         [o[0], d[1], o[2]],
+                         [o[1], o[2], d[2]]])
+
+    def correct(self, mag, current=None):
+        '''apply the corrections to raw samples, with an optional
+        array of battery currents for compassmot'''
+        ret = ((np.asarray(mag) + self.offsets) * self.scaling).dot(self.matrix().T)
+        if current is not None:
+            curr = np.asarray(current, dtype=float)
+            ret = ret + np.where(np.isnan(curr), 0.0, curr)[:, np.newaxis] * self.cmot
+        return ret
+
+    def uncorrect(self, mag, logged_offsets, current=None):
+        '''remove corrections from logged samples to recover raw sensor
+        values. Returns (raw, valid) where valid marks rows that could
+        be recovered'''
+        try:
+            inv = np.linalg.inv(self.matrix())
+        except np.linalg.LinAlgError:
+            return (np.zeros_like(mag), np.zeros(len(mag), dtype=bool))
+        field = np.asarray(mag, dtype=float)
+        if current is not None:
+            curr = np.asarray(current, dtype=float)
+            field = field - np.where(np.isnan(curr), 0.0, curr)[:, np.newaxis] * self.cmot
+        field = field.dot(inv.T) * (1.0 / self.scaling) - logged_offsets
+        valid = ~np.any(np.isnan(field), axis=1)
+        return (np.trunc(np.where(np.isnan(field), 0, field)), valid)
+
+
+def wmm_yaw(mag, roll, pitch, declination):
+    '''yaw in degrees 0..360 from corrected samples and roll/pitch in
+    degrees, going via the DCM to match the ArduPilot calculation'''
+    r = np.radians(roll)
+    p = np.radians(pitch)
+    cx = -np.sin(p)
+    cy = np.sin(r) * np.cos(p)
+    cz = np.cos(r) * np.cos(p)
+    cos_pitch_sq = 1.0 - cx*cx
+    headY = mag[:, 1] * cz - mag[:, 2] * cy
+    headX = mag[:, 0] * cos_pitch_sq - cx * (mag[:, 1] * cy + mag[:, 2] * cz)
+    yaw = np.degrees(np.arctan2(-headY, headX)) + declination
+    return np.where(yaw < 0, yaw + 360, yaw)
+
+def wmm_expected(roll, pitch, yaw, earth_field):
+    '''expected body frame field for attitudes in degrees'''
+    from .rotmat import Matrix3Array
+    m = Matrix3Array()
+    m.from_euler(np.radians(roll), np.radians(pitch), np.radians(yaw))
+    return np.einsum('nji,j->ni', m.m, earth_field)
+
+def wmm_error(c, mag, roll, pitch, current, earth_field, declination):
+    '''mean distance between the corrected field and the field expected
+    from the world magnetic model'''
+    observed = c.correct(mag, current)
+    yaw = wmm_yaw(observed, roll, pitch, declination)
+    expected = wmm_expected(roll, pitch, yaw, earth_field)
+    return np.mean(np.linalg.norm(expected - observed, axis=1))
@@ -0,0 +1,481 @@
+#!/usr/bin/env python
+'''
+columnar evaluation of mavgraph style expressions over numpy arrays
+
+Expressions use the same syntax as mavutil.evaluate_expression(),
+including the EXPRESSION{CONDITION} form, but are evaluated once over
+whole columns of a log rather than once per message.  Expressions
+referencing several message types are aligned with "latest value"
+semantics, matching the behaviour of the messages dict when reading a
+log message by message.
+
+Released under GNU GPL version 3 or later
+'''
+from __future__ import print_function
+from __future__ import absolute_import
+from builtins import object
+
+import re
+
+import numpy as np
+
+from . import mavexpression
+
+re_caps = re.compile('[A-Z_][A-Z0-9_]+')
+
+
+class MessageArrays(object):
+    '''all messages of one type from a log, held as one numpy array
+    per field'''
+    def __init__(self, name, columns, timestamps, positions):
+        self._name = name
+        self._columns = columns
+        self._timestamp = timestamps
+        self._position = positions
+
+    def get_type(self):
+        return self._name
+
+    def get_fieldnames(self):
+        return list(self._columns.keys())
+
+    def __len__(self):
+        return len(self._timestamp)
+
+    def __getattr__(self, field):
+        if field.startswith('_'):
+            raise AttributeError(field)
+        try:
+            return self._columns[field]
+        except KeyError:
+            raise AttributeError(field)
+
+    def latest_index(self, positions):
+        '''return the index of the latest message of this type at or
+        before each of the given log positions, or -1 where there was
+        none yet'''
+        return np.searchsorted(self._position, positions, side='right') - 1
+
+
+class _AlignedView(object):
+    '''the columns of a message type, indexed to line up with a set of
+    events'''
+    def __init__(self, arrays, index):
+        self._arrays = arrays
+        self._index = index
+
+    def __getattr__(self, field):
+        if field.startswith('_'):
+            raise AttributeError(field)
+        return getattr(self._arrays, field)[self._index]
+
+
+class _RowView(object):
+    '''a single message from a MessageArrays, looking like a parsed
+    message'''
+    def __init__(self, arrays, row):
+        self._arrays = arrays
+        self._row = row
+        self._timestamp = float(arrays._timestamp[row])
+
+    def get_type(self):
+        return self._arrays.get_type()
+
+    def __getattr__(self, field):
+        if field.startswith('_'):
+            raise AttributeError(field)
+        v = getattr(self._arrays, field)[self._row]
+        if isinstance(v, np.ndarray):
+            return v.tolist()
+        return v.item() if isinstance(v, np.generic) else v
+
+
+def _select_rows(arrays, mask):
+    '''a MessageArrays of the rows of arrays where mask is set'''
+    columns = dict((f, c[mask]) for (f, c) in arrays._columns.items())
+    return MessageArrays(arrays._name, columns, arrays._timestamp[mask], arrays._position[mask])
+
+
+def _make_arrays(name, columns):
+    timestamps = np.asarray(columns.pop('_timestamp'), dtype=np.float64)
+    positions = np.asarray(columns.pop('_position'), dtype=np.int64)
+    return MessageArrays(name, columns, timestamps, positions)
+
+
+def _to_array(values):
+    try:
+        return np.array(values)
+    except ValueError:
+        # ragged array fields
+        ret = np.empty(len(values), dtype=object)
+        ret[:] = values
+        return ret
+
+
+def _has_type(mlog, type):
+    '''True if a log has a format for the message type, whether or not
+    its columns can be extracted in bulk'''
+    name_to_id = getattr(mlog, 'name_to_id', None)
+    if isinstance(name_to_id, dict):
+        return type in name_to_id
+    # text dataflash logs key their formats by name
+    return type in getattr(mlog, 'formats', {})
+
+
+def extract_arrays(mlog, types, condition=None):
+    '''extract all messages of the given types from a log, returning a
+    dict of MessageArrays keyed by message type.  Types not present in
+    the log are left out of the result. If a condition is given only
+    messages for which it holds are extracted'''
+    types = set(types)
+    ret = {}
+
+    if condition is not None:
+        # the condition needs its message types to be parsed too
+        types = types.union(t for t in re.findall(re_caps, condition) if t != 'MAV')
+
+    # dataflash and CSV logs can extract columns straight from the file
+    if condition is None and hasattr(mlog, 'extract_arrays'):
+        fast = {}
+        for t in types:
+            cols = mlog.extract_arrays(t)
+            if cols is None and _has_type(mlog, t):
+                fast = None
+                break
+            if cols is not None:
+                cols['_position'] = cols.pop('_offset')
+                fast[t] = cols
+        if fast is not None:
+            for t in fast:
+                ret[t] = _make_arrays(t, fast[t])
+            return ret
+
+    rows = {}
+    fieldnames = {}
+    position = 0
+    mlog.rewind()
+    while True:
+        m = mlog.recv_match(type=types, condition=condition)
+        if m is None:
+            break
+        t = m.get_type()
+        if t not in rows:
+            fieldnames[t] = m.get_fieldnames()
+            rows[t] = []
+        rows[t].append([getattr(m, f, None) for f in fieldnames[t]] + [m._timestamp, position])
+        position += 1
+    mlog.rewind()
+
+    for t in rows:
+        names = list(fieldnames[t]) + ['_timestamp', '_position']
+        columns = {}
+        for i in range(len(names)):
+            columns[names[i]] = _to_array([r[i] for r in rows[t]])
+        ret[t] = _make_arrays(t, columns)
+    return ret
+
+
+# vectorised versions of common mavextra helpers. Expressions which use
+# anything not provided here are evaluated one row at a time instead
+def _wrap_180(angle):
+    angle = np.asarray(angle, dtype=np.float64)
+    return np.where(angle > 180, angle - 360.0, np.where(angle < -180, angle + 360.0, angle))
+
+def _wrap_360(angle):
+    angle = np.asarray(angle, dtype=np.float64)
+    return np.where(angle > 360, angle - 360.0, np.where(angle < 0, angle + 360.0, angle))
+
+def _angle_diff(angle1, angle2):
+    return _wrap_180(np.asarray(angle1, dtype=np.float64) - angle2)
+
+def _kmh(mps):
+    return mps*3.6
+
+def _constrain(v, minv, maxv):
+    return np.clip(v, minv, maxv)
+
+def _gps_time_to_epoch(week, msec):
+    epoch = 86400*(10*365 + int((1980-1969)/4) + 1 + 6 - 2)
+    return epoch + 86400*7*np.asarray(week, dtype=np.float64) + msec*0.001 - 18
+
+def _mag_field(RAW_IMU, SENSOR_OFFSETS=None, ofs=None):
+    mag_x = RAW_IMU.xmag
+    mag_y = RAW_IMU.ymag
+    mag_z = RAW_IMU.zmag
+    if SENSOR_OFFSETS is not None and ofs is not None:
+        mag_x = mag_x + ofs[0] - SENSOR_OFFSETS.mag_ofs_x
+        mag_y = mag_y + ofs[1] - SENSOR_OFFSETS.mag_ofs_y
+        mag_z = mag_z + ofs[2] - SENSOR_OFFSETS.mag_ofs_z
+    return np.sqrt(mag_x**2 + mag_y**2 + mag_z**2)
+
+def _mag_field_df(MAG, ofs=None):
+    mag_x = MAG.MagX
+    mag_y = MAG.MagY
+    mag_z = MAG.MagZ
+    if ofs is not None:
+        mag_x = mag_x - MAG.OfsX + ofs[0]
+        mag_y = mag_y - MAG.OfsY + ofs[1]
+        mag_z = mag_z - MAG.OfsZ + ofs[2]
+    return np.sqrt(mag_x**2 + mag_y**2 + mag_z**2)
+
+# batch versions of the stateful mavextra filters, giving the same
+# results as feeding the values through one at a time from a fresh
+# FilterState
+def average(values, N):
+    '''average over N points'''
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return values
+    padded = np.concatenate((np.full(N-1, values[0]), values))
+    total = np.cumsum(np.concatenate(([0.0], padded)))
+    return (total[N:] - total[:-N]) / N
+
+def lowpass(values, factor):
+    '''a simple lowpass filter'''
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return values
+    try:
+        from scipy import signal
+    except ImportError:
+        ret = np.empty(len(values))
+        v = values[0]
+        for i in range(len(values)):
+            v = factor*v + (1.0 - factor)*values[i]
+            ret[i] = v
+        return ret
+    (ret, zf) = signal.lfilter([1.0 - factor], [1.0, -factor], values[1:], zi=[factor*values[0]])
+    return np.concatenate((values[:1], ret))
+
+def diff(values):
+    '''calculate differences between values'''
+    values = np.asarray(values, dtype=np.float64)
+    return np.concatenate((np.zeros(min(len(values), 1)), np.diff(values)))
+
+def delta(values, timestamps, angle=False):
+    '''calculate slope, optionally of an angle in degrees. Repeated
+    timestamps give the slope of the first value at that time'''
+    values = np.asarray(values, dtype=np.float64)
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if len(values) == 0:
+        return values
+    first = np.concatenate(([True], timestamps[1:] != timestamps[:-1]))
+    used = np.nonzero(first)[0]
+    dv = np.diff(values[used])
+    if angle:
+        dv = _wrap_180(dv)
+    with np.errstate(all='ignore'):
+        slope = np.concatenate(([0.0], dv / np.diff(timestamps[used])))
+    return slope[np.cumsum(first) - 1]
+
+def second_derivative(values, timestamps, N):
+    '''N point 2nd derivative, for N of 5 or 9'''
+    values = np.asarray(values, dtype=np.float64)
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if len(values) == 0:
+        return values
+    f = [np.concatenate((np.full(N-1-i, values[0]), values[:len(values)-(N-1-i)])) for i in range(N)]
+    h = np.concatenate(([np.nan], np.diff(timestamps)))
+    with np.errstate(all='ignore'):
+        if N == 5:
+            ret = ((f[4] + f[0]) - 2*f[2]) / (4*h**2)
+        else:
+            ret = ((f[8] + f[0]) + 4*(f[7] + f[1]) + 4*(f[6]+f[2]) - 4*(f[5]+f[3]) - 10*f[4])/(64*h**2)
+    ret[0] = 0
+    return ret
+
+def _filter_namespace(timestamps):
+    '''versions of the mavextra filters taking a key, which evaluate
+    over a whole column at the given event timestamps'''
+    def tnow(tusec):
+        if tusec is None:
+            return timestamps
+        return np.asarray(tusec, dtype=np.float64) * 1.0e-6
+    return {
+        'average' : lambda var, key, N: average(var, N),
+        'lowpass' : lambda var, key, factor: lowpass(var, factor),
+        'diff' : lambda var, key: diff(var),
+        'delta' : lambda var, key, tusec=None: delta(var, tnow(tusec)),
+        'delta_angle' : lambda var, key, tusec=None: delta(var, tnow(tusec), angle=True),
+        'second_derivative_5' : lambda var, key: second_derivative(var, timestamps, 5),
+        'second_derivative_9' : lambda var, key: second_derivative(var, timestamps, 9),
+    }
+
+vector_namespace = {
+    'np' : np,
+    'pi' : np.pi,
+    'e' : np.e,
+    'sin' : np.sin,
+    'cos' : np.cos,
+    'tan' : np.tan,
+    'asin' : np.arcsin,
+    'acos' : np.arccos,
+    'atan' : np.arctan,
+    'atan2' : np.arctan2,
+    'sqrt' : np.sqrt,
+    'exp' : np.exp,
+    'log' : np.log,
+    'log10' : np.log10,
+    'fabs' : np.fabs,
+    'abs' : np.abs,
+    'floor' : np.floor,
+    'ceil' : np.ceil,
+    'hypot' : np.hypot,
+    'degrees' : np.degrees,
+    'radians' : np.radians,
+    'isnan' : np.isnan,
+    'wrap_180' : _wrap_180,
+    'wrap_360' : _wrap_360,
+    'angle_diff' : _angle_diff,
+    'kmh' : _kmh,
+    'constrain' : _constrain,
+    'gps_time_to_epoch' : _gps_time_to_epoch,
+    'mag_field' : _mag_field,
+    'mag_field_df' : _mag_field_df,
+}
+
+
+def _events(arrays, types):
+    '''work out the combined, position ordered set of messages of the
+    given types, and the index of the latest message of each type at
+    each of those events'''
+    positions = np.concatenate([arrays[t]._position for t in types])
+    timestamps = np.concatenate([arrays[t]._timestamp for t in types])
+    order = np.argsort(positions, kind='mergesort')
+    positions = positions[order]
+    timestamps = timestamps[order]
+    index = {}
+    valid = np.ones(len(positions), dtype=bool)
+    for t in types:
+        idx = arrays[t].latest_index(positions)
+        valid &= idx >= 0
+        index[t] = idx
+    for t in types:
+        index[t] = index[t][valid]
+    return (timestamps[valid], positions[valid], index)
+
+
+def _eval_vector(expression, vars, timestamps):
+    namespace = dict(vector_namespace)
+    namespace.update(_filter_namespace(timestamps))
+    # the scalar evaluator gives None for a division by zero, so leave
+    # those to the row by row fallback
+    with np.errstate(all='ignore', divide='raise'):
+        return eval(expression, namespace, vars)
+
+
+def _eval_rows(expression, arrays, types, index, nocondition=False):
+    '''fall back to evaluating an expression one row at a time'''
+    ret = []
+    for i in range(len(index[types[0]]) if types else 0):
+        vars = {}
+        for t in types:
+            if index[t][i] >= 0:
+                vars[t] = _RowView(arrays[t], index[t][i])
+        v = mavexpression.evaluate_expression(expression, vars, nocondition)
+        ret.append(v)
+    return ret
+
+
+def _condition_mask(arrays, mtype, condition):
+    '''which messages of type mtype pass a condition, evaluated as
+    recv_match() does on the latest message of each type at the time,
+    including the message itself. Before a type is reached its first
+    message is used, as a newly opened log holds the first message of
+    each type from indexing it'''
+    positions = arrays[mtype]._position
+    types = sorted(t for t in set(re.findall(re_caps, condition)) if t in arrays and len(arrays[t]) > 0)
+    index = {}
+    for t in types:
+        index[t] = np.maximum(arrays[t].latest_index(positions), 0)
+    try:
+        vars = {}
+        for t in types:
+            vars[t] = _AlignedView(arrays[t], index[t])
+        mask = np.asarray(_eval_vector(condition, vars, arrays[mtype]._timestamp), dtype=bool)
+        return np.broadcast_to(mask, positions.shape)
+    except Exception:
+        pass
+    mask = np.zeros(len(positions), dtype=bool)
+    for i in range(len(positions)):
+        vars = {}
+        for t in types:
+            vars[t] = _RowView(arrays[t], index[t][i])
+        v = mavexpression.evaluate_expression(condition, vars)
+        mask[i] = v is not None and bool(v)
+    return mask
+
+
+def evaluate_expression(expression, arrays, condition=None):
+    '''evaluate an expression over a dict of MessageArrays as returned
+    by extract_arrays(). One result is produced for each message of the
+    types the expression references, once all of those types have been
+    seen, exactly as mavgraph would do. Messages failing condition are
+    left out, as recv_match() would skip them, so they neither produce
+    results nor update the latest values. Returns a tuple (timestamps,
+    values) of numpy arrays'''
+    if condition is not None:
+        passed = dict(arrays)
+        for t in set(re.findall(re_caps, expression)):
+            if t in arrays:
+                passed[t] = _select_rows(arrays[t], _condition_mask(arrays, t, condition))
+        arrays = passed
+
+    expr = expression
+    cond = None
+    if expr.endswith('}'):
+        startidx = expr.rfind('{')
+        if startidx == -1:
+            return (np.array([]), np.array([]))
+        cond = expr[startidx+1:-1]
+        expr = expr[:startidx]
+
+    # like mavgraph, any capitalised name is taken to be a message
+    # type, so ignore names which aren't in the log
+    types = sorted(t for t in set(re.findall(re_caps, expression)) if t in arrays)
+    if len(types) == 0:
+        return (np.array([]), np.array([]))
+    cond_types = []
+    if cond is not None:
+        cond_types = sorted(t for t in set(re.findall(re_caps, cond)) if t in arrays and t not in types)
+
+    (timestamps, positions, index) = _events(arrays, types)
+    # types only used in conditions provide context, they are not events
+    for t in cond_types:
+        index[t] = arrays[t].latest_index(positions)
+    all_types = types + cond_types
+
+    try:
+        keep = np.ones(len(timestamps), dtype=bool)
+        if cond is not None:
+            vars = {}
+            for t in all_types:
+                vars[t] = _AlignedView(arrays[t], np.maximum(index[t], 0))
+            mask = np.broadcast_to(np.asarray(_eval_vector(cond, vars, timestamps), dtype=bool), keep.shape).copy()
+            # a condition on a type not yet seen fails
+            for t in cond_types:
+                mask &= index[t] >= 0
+            keep &= mask
+        vars = {}
+        for t in types:
+            vars[t] = _AlignedView(arrays[t], index[t][keep])
+        tstamps = timestamps[keep]
+        values = np.asarray(_eval_vector(expr, vars, tstamps))
+        if values.ndim == 0:
+            values = np.broadcast_to(values, tstamps.shape)
+        if len(values) != len(tstamps):
+            raise ValueError("bad expression shape")
+        if values.dtype.kind == 'f':
+            # the scalar evaluator gives None for 0/0 and the like
+            finite = np.isfinite(values)
+            values = values[finite]
+            tstamps = tstamps[finite]
+        return (tstamps, values)
+    except Exception:
+        pass
+
+    # the expression uses something without a vector version
+    values = _eval_rows(expression, arrays, all_types, index)
+    keep = np.array([v is not None for v in values], dtype=bool)
+    values = [values[i] for i in range(len(values)) if keep[i]]
+    return (timestamps[keep], _to_array(values))
@@ -11,6 +11,7 @@ import os
 # these imports allow for mavgraph and mavlogdump to use maths expressions more easily
 from math import *
 from .mavextra import *
+from . import mavextra
 
 '''
 Support having a $HOME/.pymavlink/mavextra.py for extra graphing functions
@@ -25,6 +26,17 @@ if home is not None:
 
 def evaluate_expression(expression, vars, nocondition=False):
     '''evaluation an expression'''
+    # use the filter state of the reader the messages came from
+    state = getattr(vars.get('MAV', None), 'filter_state', None)
+    if state is None:
+        return _evaluate_expression(expression, vars, nocondition)
+    old_state = mavextra.use_filter_state(state)
+    try:
+        return _evaluate_expression(expression, vars, nocondition)
+    finally:
+        mavextra.use_filter_state(old_state)
+
+def _evaluate_expression(expression, vars, nocondition):
     # first check for conditions which take the form EXPRESSION{CONDITION}
     if expression[-1] == '}':
         startidx = expression.rfind('{')
@@ -9,6 +9,8 @@ from __future__ import print_function
 from __future__ import absolute_import
 from builtins import object
 
+import collections
+import threading
 from math import *
 
 try:
@@ -173,130 +175,146 @@ def angle_diff(angle1, angle2):
         ret += 360
     return ret
 
-average_data = {}
+class FilterState(object):
+    '''state for the stateful filter functions (average, lowpass,
+    diff, delta etc), keyed by the user supplied key.  Each log reader
+    or link has its own FilterState so several logs can be processed
+    at once'''
+    def __init__(self, mav=None):
+        self.mav = mav
+        self.reset()
+
+    def reset(self):
+        '''reset all filters'''
+        self.average_data = {}
+        self.derivative_data = {}
+        self.lowpass_data = {}
+        self.last_diff = {}
+        self.last_delta = {}
+
+    def timestamp(self):
+        '''current time for time based filters'''
+        mav = self.mav
+        if mav is None:
+            from . import mavutil
+            mav = mavutil.mavfile_global
+        return mav.timestamp
+
+    def average(self, var, key, N):
+        '''average over N points'''
+        if not key in self.average_data:
+            # ring buffer plus running sum
+            self.average_data[key] = [collections.deque([var]*N, maxlen=N), var*N, 0]
+            return var
+        d = self.average_data[key]
+        (data, total, count) = d
+        total += var - data[0]
+        data.append(var)
+        count += 1
+        if count >= N:
+            # recalculate to stop rounding errors accumulating
+            total = sum(data)
+            count = 0
+        d[1] = total
+        d[2] = count
+        return total/N
+
+    def second_derivative(self, var, key, N):
+        '''N point 2nd derivative, for N of 5 or 9'''
+        tnow = self.timestamp()
+        if not key in self.derivative_data:
+            self.derivative_data[key] = (tnow, collections.deque([var]*N, maxlen=N))
+            return 0
+        (last_time, f) = self.derivative_data[key]
+        f.append(var)
+        self.derivative_data[key] = (tnow, f)
+        h = (tnow - last_time)
+        # 2nd derivatives from
+        # http://www.holoborodko.com/pavel/numerical-methods/numerical-derivative/smooth-low-noise-differentiators/
+        if N == 5:
+            return ((f[4] + f[0]) - 2*f[2]) / (4*h**2)
+        return ((f[8] + f[0]) + 4*(f[7] + f[1]) + 4*(f[6]+f[2]) - 4*(f[5]+f[3]) - 10*f[4])/(64*h**2)
+
+    def lowpass(self, var, key, factor):
+        '''a simple lowpass filter'''
+        if not key in self.lowpass_data:
+            self.lowpass_data[key] = var
+        else:
+            self.lowpass_data[key] = factor*self.lowpass_data[key] + (1.0 - factor)*var
+        return self.lowpass_data[key]
+
+    def diff(self, var, key):
+        '''calculate differences between values'''
+        if not key in self.last_diff:
+            self.last_diff[key] = var
+            return 0
+        ret = var - self.last_diff[key]
+        self.last_diff[key] = var
+        return ret
+
+    def delta(self, var, key, tusec=None, angle=False):
+        '''calculate slope, optionally of an angle in degrees'''
+        if tusec is not None:
+            tnow = tusec * 1.0e-6
+        else:
+            tnow = self.timestamp()
+        ret = 0
+        if key in self.last_delta:
+            (last_v, last_t, last_ret) = self.last_delta[key]
+            if last_t == tnow:
+                return last_ret
+            dv = var - last_v
+            if angle:
+                if dv > 180:
+                    dv -= 360
+                if dv < -180:
+                    dv += 360
+            ret = dv / (tnow - last_t)
+        self.last_delta[key] = (var, tnow, ret)
+        return ret
+
+# filter state used when evaluating outside of a reader
+default_filter_state = FilterState()
+_filter_local = threading.local()
+
+def filter_state():
+    '''return the FilterState in use by this thread'''
+    return getattr(_filter_local, 'state', default_filter_state)
+
+def use_filter_state(state):
+    '''set the FilterState used by this thread, returning the
+    previous one'''
+    ret = filter_state()
+    _filter_local.state = state
+    return ret
 
 def average(var, key, N):
     '''average over N points'''
-    global average_data
-    if not key in average_data:
-        average_data[key] = [var]*N
-        return var
-    average_data[key].pop(0)
-    average_data[key].append(var)
-    return sum(average_data[key])/N
-
-derivative_data = {}
+    return filter_state().average(var, key, N)
 
 def second_derivative_5(var, key):
     '''5 point 2nd derivative'''
-    global derivative_data
-    from . import mavutil
-    tnow = mavutil.mavfile_global.timestamp
-
-    if not key in derivative_data:
-        derivative_data[key] = (tnow, [var]*5)
-        return 0
-    (last_time, data) = derivative_data[key]
-    data.pop(0)
-    data.append(var)
-    derivative_data[key] = (tnow, data)
-    h = (tnow - last_time)
-    # N=5 2nd derivative from
-    # http://www.holoborodko.com/pavel/numerical-methods/numerical-derivative/smooth-low-noise-differentiators/
-    ret = ((data[4] + data[0]) - 2*data[2]) / (4*h**2)
-    return ret
+    return filter_state().second_derivative(var, key, 5)
 
 def second_derivative_9(var, key):
     '''9 point 2nd derivative'''
-    global derivative_data
-    from . import mavutil
-    tnow = mavutil.mavfile_global.timestamp
-
-    if not key in derivative_data:
-        derivative_data[key] = (tnow, [var]*9)
-        return 0
-    (last_time, data) = derivative_data[key]
-    data.pop(0)
-    data.append(var)
-    derivative_data[key] = (tnow, data)
-    h = (tnow - last_time)
-    # N=5 2nd derivative from
-    # http://www.holoborodko.com/pavel/numerical-methods/numerical-derivative/smooth-low-noise-differentiators/
-    f = data
-    ret = ((f[8] + f[0]) + 4*(f[7] + f[1]) + 4*(f[6]+f[2]) - 4*(f[5]+f[3]) - 10*f[4])/(64*h**2)
-    return ret
-
-lowpass_data = {}
+    return filter_state().second_derivative(var, key, 9)
 
 def lowpass(var, key, factor):
     '''a simple lowpass filter'''
-    global lowpass_data
-    if not key in lowpass_data:
-        lowpass_data[key] = var
-    else:
-        lowpass_data[key] = factor*lowpass_data[key] + (1.0 - factor)*var
-    return lowpass_data[key]
-
-last_diff = {}
+    return filter_state().lowpass(var, key, factor)
 
 def diff(var, key):
     '''calculate differences between values'''
-    global last_diff
-    ret = 0
-    if not key in last_diff:
-        last_diff[key] = var
-        return 0
-    ret = var - last_diff[key]
-    last_diff[key] = var
-    return ret
-
-last_delta = {}
+    return filter_state().diff(var, key)
 
 def delta(var, key, tusec=None):
     '''calculate slope'''
-    global last_delta
-    if tusec is not None:
-        tnow = tusec * 1.0e-6
-    else:
-        from . import mavutil
-        tnow = mavutil.mavfile_global.timestamp
-    ret = 0
-    if key in last_delta:
-        (last_v, last_t, last_ret) = last_delta[key]
-        if last_t == tnow:
-            return last_ret
-        if tnow == last_t:
-            ret = 0
-        else:
-            ret = (var - last_v) / (tnow - last_t)
-    last_delta[key] = (var, tnow, ret)
-    return ret
+    return filter_state().delta(var, key, tusec)
 
 def delta_angle(var, key, tusec=None):
     '''calculate slope of an angle'''
-    global last_delta
-    if tusec is not None:
-        tnow = tusec * 1.0e-6
-    else:
-        from . import mavutil
-        tnow = mavutil.mavfile_global.timestamp
-    dv = 0
-    ret = 0
-    if key in last_delta:
-        (last_v, last_t, last_ret) = last_delta[key]
-        if last_t == tnow:
-            return last_ret
-        if tnow == last_t:
-            ret = 0
-        else:
-            dv = var - last_v
-            if dv > 180:
-                dv -= 360
-            if dv < -180:
-                dv += 360
-            ret = dv / (tnow - last_t)
-    last_delta[key] = (var, tnow, ret)
-    return ret
+    return filter_state().delta(var, key, tusec, angle=True)
 
 def roll_estimate(RAW_IMU,GPS_RAW_INT=None,ATTITUDE=None,SENSOR_OFFSETS=None, ofs=None, mul=None,smooth=0.7):
     '''estimate roll from accelerometer'''
@@ -1367,18 +1385,10 @@ def sim_body_rates(SIM):
 
 def reset_state_data():
     '''reset state data, used on log rewind'''
-    global average_data
-    global derivative_data
-    global lowpass_data
-    global last_diff
-    global last_delta
     global first_fix
     global dcm_state
     global earth_field
-    average_data.clear()
-    derivative_data.clear()
-    lowpass_data.clear()
-    last_delta.clear()
+    filter_state().reset()
     first_fix = None
     dcm_state = None
     earth_field = None
@@ -0,0 +1,395 @@
+#!/usr/bin/env python
+'''
+load testing with synthetic traffic from several vehicles
+
+Each SimulatedVehicle sends a set of telemetry streams at their
+configured rates, with its own system ID and sequence numbers. Frames
+can be MAVLink2 signed. The link can drop, reorder or duplicate frames
+at random. A LoadTest sends the traffic of all its vehicles from a
+background thread, over local UDP or TCP, to a mavutil connection
+which it reads in the calling thread. It then reports:
+- the receiver's throughput and the CPU time it used
+- the send to receive latency
+- how the receiver's packet_loss() compares with the loss actually
+  simulated
+
+It can also send the traffic to an outside address, to load test
+another ground station process.
+
+The stream sets follow the ArduCopter defaults listed in
+tools/mavtelemetry_datarates.py, with the rates a ground station
+typically requests.
+
+Released under GNU GPL version 3 or later
+'''
+from __future__ import print_function
+from __future__ import absolute_import
+from builtins import object
+from builtins import range
+
+import heapq
+import random
+import socket
+import threading
+import time
+
+from . import mavpcap
+from . import mavutil
+
+try:
+    clock = time.perf_counter
+except AttributeError:
+    clock = time.time
+
+# stream name, rate in Hz and messages, as in mavtelemetry_datarates.py
+STREAMS = [
+    ('RAW_SENS', 2, ['RAW_IMU', 'SCALED_IMU2', 'SCALED_PRESSURE', 'SCALED_PRESSURE2', 'SENSOR_OFFSETS']),
+    ('EXT_STAT', 2, ['SYS_STATUS', 'POWER_STATUS', 'MEMINFO', 'MISSION_CURRENT', 'GPS_RAW_INT',
+                     'NAV_CONTROLLER_OUTPUT']),
+    ('POSITION', 3, ['GLOBAL_POSITION_INT', 'LOCAL_POSITION_NED']),
+    ('RAW_CTRL', 1, ['RC_CHANNELS_SCALED']),
+    ('RC_CHAN', 2, ['SERVO_OUTPUT_RAW', 'RC_CHANNELS_RAW', 'RC_CHANNELS']),
+    ('EXTRA1', 10, ['ATTITUDE', 'AHRS2']),
+    ('EXTRA2', 10, ['VFR_HUD']),
+    ('EXTRA3', 2, ['AHRS', 'HWSTATUS', 'SYSTEM_TIME', 'EKF_STATUS_REPORT', 'VIBRATION']),
+    ('HEARTBEAT', 1, ['HEARTBEAT']),
+]
+
+# named sets of streams
+STREAM_SETS = {
+    'minimal' : ['HEARTBEAT', 'EXT_STAT', 'POSITION'],
+    'default' : [s[0] for s in STREAMS],
+    'attitude' : ['HEARTBEAT', 'EXTRA1', 'EXTRA2'],
+}
+
+
+def stream_messages(streams, mavlink_module, rate_scale=1.0):
+    '''(message name, rate) for each message in a list of stream names
+    or (stream name, rate) pairs, leaving out messages the dialect
+    doesn't have'''
+    ret = []
+    defaults = dict((s[0], (s[1], s[2])) for s in STREAMS)
+    for s in streams:
+        if isinstance(s, tuple):
+            (name, rate) = s
+        else:
+            (name, rate) = (s, defaults[s][0])
+        for m in defaults[name][1]:
+            if hasattr(mavlink_module, 'MAVLINK_MSG_ID_' + m) and rate > 0:
+                ret.append((m, rate * rate_scale))
+    return ret
+
+
+class SimulatedVehicle(object):
+    '''a vehicle sending the messages in a list of (name, rate) pairs.
+    Frames are signed with signing_key if given'''
+    def __init__(self, sysid, messages, mavlink_module, rng, signing_key=None, compid=1):
+        self.sysid = sysid
+        self.mav = mavlink_module.MAVLink(None, srcSystem=sysid, srcComponent=compid)
+        if signing_key is not None:
+            self.mav.signing.secret_key = signing_key
+            self.mav.signing.sign_outgoing = True
+            self.mav.signing.link_id = sysid & 0xff
+            self.mav.signing.timestamp = int((time.time() - 1420070400) * 100000)
+        self.signed = signing_key is not None
+        self.messages = [mavpcap.random_message(mavlink_module, name, rng) for (name, rate) in messages]
+        self.periods = [1.0 / rate for (name, rate) in messages]
+        self.packed = {}
+        # send times of recent frames, by sequence number
+        self.send_times = [None] * 256
+
+    def pack(self, i):
+        '''pack message i with the next sequence number'''
+        seq = self.mav.seq
+        if self.signed:
+            buf = self.messages[i].pack(self.mav)
+        else:
+            key = (i, seq)
+            buf = self.packed.get(key, None)
+            if buf is None:
+                buf = self.messages[i].pack(self.mav)
+                self.packed[key] = buf
+        self.mav.seq = (seq + 1) % 256
+        return (seq, buf)
+
+
+class LoadTestResult(object):
+    '''the outcome of a load test. Times are in seconds, and loss in percent'''
+    def __init__(self):
+        self.duration = 0
+        self.vehicles = 0
+        self.generated = 0
+        self.dropped = 0
+        self.reordered = 0
+        self.duplicated = 0
+        self.sent = 0
+        self.sent_bytes = 0
+        self.received = 0
+        self.received_bytes = 0
+        self.receive_cpu = None
+        self.latencies = []
+        self.simulated_loss = 0
+        self.reported_loss = None
+        self.reported_duplicates = None
+        self.reported_reordered = None
+
+    def percentile(self, p):
+        if len(self.latencies) == 0:
+            return None
+        lat = sorted(self.latencies)
+        return lat[min(len(lat)-1, int(p * len(lat)))]
+
+    def as_dict(self):
+        '''the results as a dict, e.g. for saving as JSON'''
+        ret = {
+            'duration' : self.duration,
+            'vehicles' : self.vehicles,
+            'generated' : self.generated,
+            'dropped' : self.dropped,
+            'reordered' : self.reordered,
+            'duplicated' : self.duplicated,
+            'sent' : self.sent,
+            'sent_bytes' : self.sent_bytes,
+            'received' : self.received,
+            'received_bytes' : self.received_bytes,
+            'receive_rate' : self.received / self.duration if self.duration > 0 else 0,
+            'receive_cpu' : self.receive_cpu,
+            'simulated_loss' : self.simulated_loss,
+            'reported_loss' : self.reported_loss,
+            'reported_duplicates' : self.reported_duplicates,
+            'reported_reordered' : self.reported_reordered,
+        }
+        for (name, p) in [('latency_p50', 0.5), ('latency_p90', 0.9), ('latency_p99', 0.99), ('latency_max', 1.0)]:
+            ret[name] = self.percentile(p)
+        if self.receive_cpu is not None and self.received > 0:
+            ret['cpu_per_message'] = self.receive_cpu / self.received
+        return ret
+
+    def __str__(self):
+        d = self.as_dict()
+        ret = "%u vehicles for %.1fs: sent %u (%u bytes), received %u (%u bytes), %.0f msg/s" % (
+            self.vehicles, self.duration, self.sent, self.sent_bytes, self.received,
+            self.received_bytes, d['receive_rate'])
+        if d.get('cpu_per_message', None) is not None:
+            ret += ", %.1fus CPU/msg" % (d['cpu_per_message'] * 1.0e6)
+        if d['latency_p50'] is not None:
+            ret += "\nlatency p50 %.3fms p90 %.3fms p99 %.3fms max %.3fms" % (
+                d['latency_p50']*1000, d['latency_p90']*1000, d['latency_p99']*1000, d['latency_max']*1000)
+        ret += "\ndropped %u reordered %u duplicated %u: loss simulated %.2f%%" % (
+            self.dropped, self.reordered, self.duplicated, self.simulated_loss)
+        if self.reported_loss is not None:
+            ret += " reported %.2f%%" % self.reported_loss
+        if self.reported_duplicates is not None:
+            ret += ", reported %u duplicated %u reordered" % (self.reported_duplicates, self.reported_reordered)
+        return ret
+
+
+class LoadTest(object):
+    '''simulate vehicles (system IDs sysid_base upwards) sending the
+    given streams (a STREAM_SETS name or a list for stream_messages())
+    over transport 'udp' or 'tcp'. loss, reorder and duplicate are the
+    probabilities of each frame being dropped, swapped with the
+    vehicle's next frame or sent twice. signing_key signs all frames'''
+    def __init__(self, vehicles=4, streams='default', transport='udp', rate_scale=1.0,
+                 loss=0.0, reorder=0.0, duplicate=0.0, signing_key=None,
+                 mavlink_module=None, seed=0, sysid_base=1):
+        if mavlink_module is None:
+            mavlink_module = mavutil.mavlink
+        if not transport in ['udp', 'tcp']:
+            raise ValueError("Unknown transport %s" % transport)
+        if isinstance(streams, str):
+            streams = STREAM_SETS[streams]
+        self.mavlink_module = mavlink_module
+        self.transport = transport
+        self.loss = loss
+        self.reorder = reorder
+        self.duplicate = duplicate
+        self.signing_key = signing_key
+        self.rng = random.Random(seed)
+        messages = stream_messages(streams, mavlink_module, rate_scale)
+        if len(messages) == 0:
+            raise ValueError("no messages to send")
+        self.vehicles = [SimulatedVehicle(sysid_base + i, messages, mavlink_module, self.rng,
+                                          signing_key=signing_key)
+                         for i in range(vehicles)]
+        self.result = None
+
+    def expected_rate(self):
+        '''frames per second sent by all the vehicles'''
+        return sum([sum([1.0 / p for p in v.periods]) for v in self.vehicles])
+
+    def _send_loop(self, send, duration, result):
+        '''send the vehicles' traffic for duration seconds'''
+        rng = self.rng
+        start = clock()
+        heap = []
+        for (vi, v) in enumerate(self.vehicles):
+            for (mi, period) in enumerate(v.periods):
+                # spread the vehicles' messages over their periods
+                heapq.heappush(heap, (start + rng.random() * period, vi, mi))
+        held = [None] * len(self.vehicles)
+        end = start + duration
+        while len(heap) > 0:
+            (due, vi, mi) = heap[0]
+            if due >= end:
+                break
+            now = clock()
+            if due > now:
+                time.sleep(due - now)
+            heapq.heapreplace(heap, (due + self.vehicles[vi].periods[mi], vi, mi))
+            v = self.vehicles[vi]
+            (seq, buf) = v.pack(mi)
+            result.generated += 1
+            if self.loss > 0 and rng.random() < self.loss:
+                result.dropped += 1
+                continue
+            frames = [(seq, buf)]
+            if self.duplicate > 0 and rng.random() < self.duplicate:
+                frames.append((seq, buf))
+                result.duplicated += 1
+            if held[vi] is not None:
+                frames.extend(held[vi])
+                held[vi] = None
+            elif self.reorder > 0 and rng.random() < self.reorder:
+                # send (with any duplicate) after the vehicle's next frame
+                held[vi] = frames
+                frames = []
+                result.reordered += 1
+            for (seq, buf) in frames:
+                v.send_times[seq] = clock()
+                send(vi, buf)
+                result.sent += 1
+                result.sent_bytes += len(buf)
+        for (vi, frames) in enumerate(held):
+            if frames is None:
+                continue
+            # nothing was sent after these, so they arrive in order
+            result.reordered -= 1
+            for (seq, buf) in frames:
+                self.vehicles[vi].send_times[seq] = clock()
+                send(vi, buf)
+                result.sent += 1
+                result.sent_bytes += len(buf)
+
+    def send_to(self, address, duration):
+        '''send the traffic to a UDP or TCP (host, port) for duration
+        seconds, with nothing received here, returning a LoadTestResult'''
+        result = LoadTestResult()
+        result.vehicles = len(self.vehicles)
+        send = self._open_senders(address)
+        t0 = clock()
+        try:
+            self._send_loop(send, duration, result)
+        finally:
+            self._close_senders()
+        result.duration = clock() - t0
+        result.simulated_loss = self._simulated_loss(result)
+        self.result = result
+        return result
+
+    def _open_senders(self, address):
+        '''return a send(vehicle_index, buf) function. Over UDP each
+        vehicle sends from its own port, over TCP they share a
+        connection as they would through a router'''
+        self.sockets = []
+        if self.transport == 'udp':
+            for v in self.vehicles:
+                s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                s.connect(address)
+                self.sockets.append(s)
+            def send(vi, buf):
+                try:
+                    self.sockets[vi].send(buf)
+                except socket.error:
+                    pass
+            return send
+        s = socket.create_connection(address)
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sockets.append(s)
+        def send(vi, buf):
+            s.sendall(buf)
+        return send
+
+    def _close_senders(self):
+        for s in self.sockets:
+            s.close()
+        self.sockets = []
+
+    def _simulated_loss(self, result):
+        if result.generated == 0:
+            return 0
+        return (100.0 * result.dropped) / result.generated
+
+    def run(self, duration, drain=0.5, receiver=None):
+        '''run the vehicles for duration seconds against a receiver
+        (by default a new mavutil connection on a free local port),
+        reading messages for up to drain seconds longer. Returns a
+        LoadTestResult'''
+        result = LoadTestResult()
+        result.vehicles = len(self.vehicles)
+        listener = None
+        if receiver is None:
+            if self.transport == 'udp':
+                receiver = mavutil.mavlink_connection('udpin:127.0.0.1:0')
+                address = receiver.port.getsockname()
+            else:
+                listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                listener.bind(('127.0.0.1', 0))
+                listener.listen(1)
+                address = listener.getsockname()
+                receiver = mavutil.mavlink_connection('tcp:%s:%u' % address)
+        else:
+            address = receiver.port.getsockname()
+        if self.signing_key is not None:
+            receiver.setup_signing(self.signing_key, sign_outgoing=False)
+
+        if listener is not None:
+            # the vehicles are the TCP server the receiver connected to
+            (conn, addr) = listener.accept()
+            listener.close()
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.sockets = [conn]
+            def send(vi, buf):
+                conn.sendall(buf)
+        else:
+            send = self._open_senders(address)
+
+        thread = threading.Thread(target=self._send_loop, args=(send, duration, result), name='LoadTest')
+        thread.daemon = True
+        thread_time = getattr(time, 'thread_time', None)
+        t0 = clock()
+        thread.start()
+        cpu0 = thread_time() if thread_time is not None else None
+        seq_ids = dict((v.sysid, v) for v in self.vehicles)
+        while True:
+            m = receiver.recv_msg()
+            if m is None:
+                if not thread.is_alive() and clock() > t0 + duration + drain:
+                    break
+                if result.received >= result.sent and not thread.is_alive():
+                    break
+                receiver.select(0.01)
+                continue
+            now = clock()
+            if m.get_type() == 'BAD_DATA':
+                continue
+            result.received += 1
+            result.received_bytes += len(m.get_msgbuf())
+            v = seq_ids.get(m.get_srcSystem(), None)
+            if v is not None:
+                sent = v.send_times[m.get_seq()]
+                if sent is not None:
+                    result.latencies.append(now - sent)
+        if cpu0 is not None:
+            result.receive_cpu = thread_time() - cpu0
+        thread.join()
+        result.duration = clock() - t0
+        self._close_senders()
+        result.simulated_loss = self._simulated_loss(result)
+        result.reported_loss = receiver.packet_loss()
+        seq = receiver.seq_tracker.summary()
+        result.reported_duplicates = seq.duplicates
+        result.reported_reordered = seq.reordered
+        receiver.close()
+        self.result = result
+        return result
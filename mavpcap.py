@@ -0,0 +1,587 @@
+#!/usr/bin/env python
+'''
+pcap captures of MAVLink traffic
+
+PcapWriter writes classic libpcap files, with each datagram wrapped in
+Ethernet, IPv4 and UDP headers or as bare MAVLink using the USER0
+link type (as examples/mav2pcap.py does). generate_capture() fills one
+with deterministic synthetic traffic from a number of vehicles, for
+measuring tools which read captures, such as the Wireshark dissector
+generated by mavgen, on captures of any size.
+
+read_capture() walks the UDP payloads and reassembled TCP streams of a
+pcap or pcapng capture, and mavpcaplog reads the MAVLink messages in
+them like a telemetry log, with each flow going through its own
+parser. It is what mavutil.mavlink_connection() returns for captures.
+
+Released under GNU GPL version 3 or later
+'''
+from __future__ import print_function
+from __future__ import absolute_import
+from builtins import object
+
+import itertools
+import mmap
+import random
+import struct
+import tempfile
+
+from . import mavutil
+
+PCAP_MAGIC = 0xA1B2C3D4
+PCAP_MAGIC_NSEC = 0xA1B23C4D
+PCAPNG_MAGIC = 0x0A0D0D0A
+PCAPNG_BYTE_ORDER = 0x1A2B3C4D
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_USER0 = 147
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+# out of order TCP segments held back waiting for a missing one, before
+# giving up on it
+TCP_MAX_PENDING = 256
+
+# records looked at for the first MAVLink frame, to pick the protocol version
+PROTOCOL_PROBE_RECORDS = 64
+
+GCS_ADDRESS = ('10.0.0.1', 14550)
+VEHICLE_PORT = 14555
+
+# a typical telemetry stream; messages the dialect doesn't have are skipped
+DEFAULT_MESSAGES = ['HEARTBEAT', 'SYS_STATUS', 'ATTITUDE', 'GLOBAL_POSITION_INT',
+                    'GPS_RAW_INT', 'VFR_HUD', 'RC_CHANNELS', 'SERVO_OUTPUT_RAW']
+
+_INT_RANGES = {
+    'int8_t' : (-128, 127),
+    'uint8_t' : (0, 255),
+    'int16_t' : (-32768, 32767),
+    'uint16_t' : (0, 65535),
+    'int32_t' : (-2**31, 2**31-1),
+    'uint32_t' : (0, 2**32-1),
+    'int64_t' : (-2**63, 2**63-1),
+    'uint64_t' : (0, 2**64-1),
+}
+
+
+def _checksum(header):
+    '''the IPv4 header checksum'''
+    total = sum(struct.unpack('!%uH' % (len(header) // 2), header))
+    while total > 0xffff:
+        total = (total & 0xffff) + (total >> 16)
+    return (~total) & 0xffff
+
+
+def _ip_address(address):
+    return struct.pack('BBBB', *[int(x) for x in address.split('.')])
+
+
+def udp_frame(data, src, dst):
+    '''wrap a datagram sent from src to dst, both (ip, port) pairs, in
+    Ethernet, IPv4 and UDP headers'''
+    src_ip = _ip_address(src[0])
+    dst_ip = _ip_address(dst[0])
+    # locally administered MAC addresses derived from the IP addresses
+    ethernet = b'\x02\x00' + dst_ip + b'\x02\x00' + src_ip + b'\x08\x00'
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 28 + len(data), 0, 0x4000, 64, 17, 0, src_ip, dst_ip)
+    ip = ip[:10] + struct.pack('!H', _checksum(ip)) + ip[12:]
+    # a zero UDP checksum means none was computed
+    udp = struct.pack('!HHHH', src[1], dst[1], 8 + len(data), 0)
+    return ethernet + ip + udp + data
+
+
+class PcapWriter(object):
+    '''write a classic libpcap file. linktype is LINKTYPE_ETHERNET, for
+    UDP datagrams, or LINKTYPE_USER0 for bare MAVLink'''
+    def __init__(self, filename, linktype=LINKTYPE_ETHERNET, snaplen=65535, bufsize=1<<20):
+        if hasattr(filename, 'write'):
+            self.f = filename
+            self.close_file = False
+        else:
+            self.f = open(filename, 'wb')
+            self.close_file = True
+        self.linktype = linktype
+        self.snaplen = snaplen
+        self.bufsize = bufsize
+        self.buf = []
+        self.buflen = 0
+        self.count = 0
+        self.f.write(struct.pack('<IHHiIII', PCAP_MAGIC, 2, 4, 0, 0, snaplen, linktype))
+
+    def write_frame(self, frame, timestamp):
+        '''write a link layer frame captured at timestamp (in seconds)'''
+        usec = int(round(timestamp * 1.0e6))
+        caplen = min(len(frame), self.snaplen)
+        self.buf.append(struct.pack('<IIII', usec // 1000000, usec % 1000000, caplen, len(frame)))
+        self.buf.append(frame[:caplen])
+        self.buflen += 16 + caplen
+        self.count += 1
+        if self.buflen >= self.bufsize:
+            self.flush()
+
+    def write(self, data, timestamp, src=None, dst=GCS_ADDRESS):
+        '''write a MAVLink datagram sent from src to dst, both (ip, port)
+        pairs. The addresses are ignored for USER0 captures'''
+        if self.linktype == LINKTYPE_USER0:
+            self.write_frame(data, timestamp)
+        else:
+            self.write_frame(udp_frame(data, src, dst), timestamp)
+
+    def flush(self):
+        if len(self.buf) > 0:
+            self.f.write(b''.join(self.buf))
+            self.buf = []
+            self.buflen = 0
+        self.f.flush()
+
+    def close(self):
+        if self.f is None:
+            return
+        self.flush()
+        if self.close_file:
+            self.f.close()
+        self.f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def vehicle_address(sysid):
+    '''the (ip, port) a simulated vehicle sends from'''
+    return ('10.0.%u.2' % sysid, VEHICLE_PORT)
+
+
+def _field_value(rng, ftype, array_length):
+    if ftype == 'char':
+        return ''.join(rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ_') for i in range(max(array_length, 1))).encode('ascii')
+    if ftype in ['float', 'double']:
+        values = [rng.uniform(-1000.0, 1000.0) for i in range(max(array_length, 1))]
+    else:
+        (lo, hi) = _INT_RANGES[ftype]
+        values = [rng.randint(lo, hi) for i in range(max(array_length, 1))]
+        if array_length and ftype in ['int8_t', 'uint8_t']:
+            return struct.pack('%u%s' % (array_length, 'b' if ftype == 'int8_t' else 'B'), *values)
+    if array_length:
+        return values
+    return values[0]
+
+
+def random_message(mavlink_module, name, rng):
+    '''a message of the given type with random field values'''
+    msgid = getattr(mavlink_module, 'MAVLINK_MSG_ID_' + name)
+    cls = mavlink_module.mavlink_map[msgid]
+    array_lengths = dict(zip(cls.ordered_fieldnames, cls.array_lengths))
+    args = [_field_value(rng, ftype, array_lengths[fname])
+            for (fname, ftype) in zip(cls.fieldnames, cls.fieldtypes)]
+    return cls(*args)
+
+
+def generate_capture(filename, count, vehicles=1, rate=1000.0, messages=None,
+                     mavlink_module=None, linktype=LINKTYPE_ETHERNET,
+                     frames_per_datagram=1, corrupt=0.0, seed=0, start_time=1.6e9):
+    '''write a capture of count MAVLink frames from vehicles vehicles
+    (system IDs 1 to vehicles) to filename, at rate frames per second
+    overall. Each vehicle sends the given message types in turn, with
+    its own sequence numbers, frames_per_datagram frames in each UDP
+    datagram. A corrupt fraction of frames get one byte changed.
+    Returns the number of frames written'''
+    if mavlink_module is None:
+        mavlink_module = mavutil.mavlink
+    if messages is None:
+        messages = [m for m in DEFAULT_MESSAGES if hasattr(mavlink_module, 'MAVLINK_MSG_ID_' + m)]
+    if vehicles < 1 or vehicles > 255:
+        raise ValueError("vehicles must be between 1 and 255")
+    if len(messages) == 0:
+        raise ValueError("no messages to send")
+    rng = random.Random(seed)
+
+    # the same payload is sent each time, so packing each
+    # (vehicle, message, seq) once covers any length of capture
+    links = []
+    for sysid in range(1, vehicles+1):
+        mav = mavlink_module.MAVLink(None, srcSystem=sysid, srcComponent=1)
+        links.append((mav, [random_message(mavlink_module, m, rng) for m in messages], {}))
+    seqs = [0] * vehicles
+
+    interval = 1.0 / rate
+    pending = [[] for i in range(vehicles)]
+    with PcapWriter(filename, linktype=linktype) as pcap:
+        for i in range(count):
+            v = i % vehicles
+            (mav, msgs, packed) = links[v]
+            m = (i // vehicles) % len(msgs)
+            key = (m, seqs[v])
+            buf = packed.get(key, None)
+            if buf is None:
+                mav.seq = seqs[v]
+                buf = msgs[m].pack(mav)
+                packed[key] = buf
+            seqs[v] = (seqs[v] + 1) % 256
+            if corrupt > 0 and rng.random() < corrupt:
+                damaged = bytearray(buf)
+                damaged[rng.randint(1, len(buf)-1)] ^= 0x55
+                buf = bytes(damaged)
+            pending[v].append(buf)
+            if len(pending[v]) >= frames_per_datagram or i + vehicles >= count:
+                pcap.write(b''.join(pending[v]), start_time + i * interval, src=vehicle_address(v+1))
+                pending[v] = []
+    return count
+
+
+def is_capture(filename):
+    '''True if filename is a pcap or pcapng capture'''
+    try:
+        with open(filename, 'rb') as f:
+            hdr = f.read(4)
+    except IOError:
+        return False
+    if len(hdr) < 4:
+        return False
+    return (struct.unpack('<I', hdr)[0] in [PCAP_MAGIC, PCAP_MAGIC_NSEC, PCAPNG_MAGIC] or
+            struct.unpack('>I', hdr)[0] in [PCAP_MAGIC, PCAP_MAGIC_NSEC])
+
+
+def _pcap_records(buf):
+    '''(timestamp, linktype, frame) for each record of a classic pcap file'''
+    (magic,) = struct.unpack_from('<I', buf, 0)
+    endian = '<'
+    if not magic in [PCAP_MAGIC, PCAP_MAGIC_NSEC]:
+        endian = '>'
+        (magic,) = struct.unpack_from('>I', buf, 0)
+    scale = 1.0e-9 if magic == PCAP_MAGIC_NSEC else 1.0e-6
+    (linktype,) = struct.unpack_from(endian + 'I', buf, 20)
+    linktype &= 0xffff
+    record = struct.Struct(endian + 'IIII')
+    ofs = 24
+    end = len(buf)
+    while ofs + 16 <= end:
+        (sec, frac, caplen, length) = record.unpack_from(buf, ofs)
+        ofs += 16
+        yield (sec + frac * scale, linktype, buf[ofs:ofs+caplen])
+        ofs += caplen
+
+
+def _pcapng_options(buf, ofs, end, endian):
+    '''the options of a pcapng block as a dict of code to value'''
+    ret = {}
+    while ofs + 4 <= end:
+        (code, length) = struct.unpack_from(endian + 'HH', buf, ofs)
+        if code == 0:
+            break
+        ret[code] = buf[ofs+4:ofs+4+length]
+        ofs += 4 + ((length + 3) & ~3)
+    return ret
+
+
+def _pcapng_records(buf):
+    '''(timestamp, linktype, frame) for each packet of a pcapng file'''
+    ofs = 0
+    end = len(buf)
+    endian = '<'
+    interfaces = []
+    timestamp = 0
+    while ofs + 12 <= end:
+        (btype,) = struct.unpack_from('<I', buf, ofs)
+        if btype == PCAPNG_MAGIC:
+            # a new section, possibly with a different byte order
+            (byte_order,) = struct.unpack_from('<I', buf, ofs+8)
+            endian = '<' if byte_order == PCAPNG_BYTE_ORDER else '>'
+            interfaces = []
+        (btype, blen) = struct.unpack_from(endian + 'II', buf, ofs)
+        if blen < 12:
+            break
+        if btype == 1:
+            # interface description
+            (linktype,) = struct.unpack_from(endian + 'H', buf, ofs+8)
+            scale = 1.0e-6
+            tsresol = _pcapng_options(buf, ofs+16, ofs+blen-4, endian).get(9, None)
+            if tsresol is not None and len(tsresol) > 0:
+                res = bytearray(tsresol)[0]
+                if res & 0x80:
+                    scale = 2.0 ** -(res & 0x7f)
+                else:
+                    scale = 10.0 ** -res
+            interfaces.append((linktype, scale))
+        elif btype in [2, 6]:
+            # (obsolete) packet and enhanced packet blocks
+            if btype == 6:
+                (iface, ts_high, ts_low, caplen) = struct.unpack_from(endian + 'IIII', buf, ofs+8)
+            else:
+                (iface, drops, ts_high, ts_low, caplen) = struct.unpack_from(endian + 'HHIII', buf, ofs+8)
+            if iface < len(interfaces):
+                (linktype, scale) = interfaces[iface]
+                timestamp = ((ts_high << 32) | ts_low) * scale
+                yield (timestamp, linktype, buf[ofs+28:ofs+28+caplen])
+        elif btype == 3:
+            # simple packet, with no timestamp
+            (length,) = struct.unpack_from(endian + 'I', buf, ofs+8)
+            if len(interfaces) > 0:
+                yield (timestamp, interfaces[0][0], buf[ofs+12:ofs+12+min(length, blen-16)])
+        ofs += blen
+
+
+def _ip_payload(frame, ofs):
+    '''(protocol, src, dst, payload) of the IPv4 or IPv6 packet at ofs,
+    or None if it isn't one or is a fragment'''
+    if len(frame) < ofs + 20:
+        return None
+    version = bytearray(frame[ofs:ofs+1])[0] >> 4
+    if version == 4:
+        (vhl, tos, length, ident, frag, ttl, proto) = struct.unpack_from('!BBHHHBB', frame, ofs)
+        if frag & 0x3fff:
+            # MAVLink datagrams fit in one packet, so fragments aren't reassembled
+            return None
+        hlen = (vhl & 0xf) * 4
+        return (proto, frame[ofs+12:ofs+16], frame[ofs+16:ofs+20], frame[ofs+hlen:ofs+length])
+    if version == 6 and len(frame) >= ofs + 40:
+        (length, proto) = struct.unpack_from('!HB', frame, ofs+4)
+        return (proto, frame[ofs+8:ofs+24], frame[ofs+24:ofs+40], frame[ofs+40:ofs+40+length])
+    return None
+
+
+def _network_payload(linktype, frame):
+    '''((protocol, src, sport, dst, dport), tcp, payload) for a UDP or
+    TCP packet, where tcp is (seq, flags) for TCP and None for UDP, or
+    None for anything else'''
+    if linktype == LINKTYPE_ETHERNET:
+        ofs = 12
+        (ethertype,) = struct.unpack_from('!H', frame, ofs) if len(frame) >= 14 else (0,)
+        while ethertype in [0x8100, 0x88a8] and len(frame) >= ofs + 8:
+            # VLAN tags
+            ofs += 4
+            (ethertype,) = struct.unpack_from('!H', frame, ofs)
+        if not ethertype in [0x0800, 0x86dd]:
+            return None
+        ip = _ip_payload(frame, ofs + 2)
+    elif linktype in [LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6]:
+        ip = _ip_payload(frame, 0)
+    elif linktype == LINKTYPE_NULL:
+        ip = _ip_payload(frame, 4)
+    elif linktype == LINKTYPE_LINUX_SLL:
+        ip = _ip_payload(frame, 16)
+    elif linktype == LINKTYPE_LINUX_SLL2:
+        ip = _ip_payload(frame, 20)
+    else:
+        return None
+    if ip is None:
+        return None
+    (proto, src, dst, payload) = ip
+    if proto == 17 and len(payload) >= 8:
+        (sport, dport, length) = struct.unpack_from('!HHH', payload, 0)
+        return (('udp', src, sport, dst, dport), None, payload[8:length])
+    if proto == 6 and len(payload) >= 20:
+        (sport, dport, seq, ack, offset, flags) = struct.unpack_from('!HHIIBB', payload, 0)
+        return (('tcp', src, sport, dst, dport), (seq, flags), payload[(offset >> 4) * 4:])
+    return None
+
+
+class TCPStream(object):
+    '''reassembles one direction of a TCP connection'''
+    def __init__(self):
+        self.next_seq = None
+        self.pending = {}
+
+    def _offset(self, seq):
+        '''position of seq relative to the next expected byte'''
+        return ((seq - self.next_seq + (1<<31)) & 0xffffffff) - (1<<31)
+
+    def add(self, seq, flags, data):
+        '''add a segment, returning the list of newly contiguous data'''
+        if flags & 0x02:
+            # SYN
+            self.next_seq = (seq + 1) & 0xffffffff
+            self.pending = {}
+            return []
+        if len(data) == 0:
+            return []
+        if self.next_seq is None:
+            # the capture started mid stream
+            self.next_seq = seq
+        if self._offset(seq) > 0:
+            self.pending[seq] = max(data, self.pending.get(seq, b''), key=len)
+            if len(self.pending) <= TCP_MAX_PENDING:
+                return []
+            # a segment was lost from the capture; skip over it
+            self.next_seq = min(self.pending.keys(), key=self._offset)
+        else:
+            self.pending[seq] = data
+        ret = []
+        while len(self.pending) > 0:
+            seq = min(self.pending.keys(), key=self._offset)
+            ofs = self._offset(seq)
+            if ofs > 0:
+                break
+            data = self.pending.pop(seq)[-ofs:]
+            if len(data) > 0:
+                ret.append(data)
+                self.next_seq = (self.next_seq + len(data)) & 0xffffffff
+        return ret
+
+
+def read_capture(filename):
+    '''(timestamp, flow, data) for the MAVLink data in a capture, in
+    capture order. flow is (protocol, src, sport, dst, dport) with raw
+    addresses, and TCP data is reassembled in order for each flow. USER0
+    captures are taken to be bare MAVLink, in a flow of ('raw',)'''
+    with open(filename, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        (magic,) = struct.unpack_from('<I', buf, 0)
+        if magic == PCAPNG_MAGIC:
+            records = _pcapng_records(buf)
+        else:
+            records = _pcap_records(buf)
+        streams = {}
+        for (timestamp, linktype, frame) in records:
+            if linktype == LINKTYPE_USER0:
+                yield (timestamp, ('raw',), frame)
+                continue
+            pkt = _network_payload(linktype, frame)
+            if pkt is None:
+                continue
+            (flow, tcp, payload) = pkt
+            if tcp is None:
+                if len(payload) > 0:
+                    yield (timestamp, flow, payload)
+                continue
+            if not flow in streams:
+                streams[flow] = TCPStream()
+            for data in streams[flow].add(tcp[0], tcp[1], payload):
+                yield (timestamp, flow, data)
+    finally:
+        buf.close()
+
+
+def flow_name(flow):
+    '''a readable name for a flow from read_capture()'''
+    if flow[0] == 'raw':
+        return 'raw'
+    (proto, src, sport, dst, dport) = flow
+    def addr(a):
+        a = bytearray(a)
+        if len(a) == 4:
+            return '.'.join([str(b) for b in a])
+        return '[' + ':'.join(['%x' % ((a[i] << 8) | a[i+1]) for i in range(0, 16, 2)]) + ']'
+    return '%s:%s:%u->%s:%u' % (proto, addr(src), sport, addr(dst), dport)
+
+
+class mavpcaplog(mavutil.mavmmaplog):
+    '''MAVLink messages in a pcap or pcapng capture, read like a
+    telemetry log. The capture is scanned once on opening, writing the
+    messages timestamped with their capture time to a temporary
+    telemetry log and building an index of them by type. flows maps
+    the name of each flow to the number of messages in it'''
+    def __init__(self, filename, progress_callback=None):
+        mavutil.mavmmaplog.__init__(self, filename, progress_callback=progress_callback)
+
+    def _open_data(self):
+        self.f.close()
+        self.index = {}
+        self.flows = {}
+        self.f = tempfile.TemporaryFile()
+        self._scan_capture(self.f)
+        self.f.flush()
+        self.filesize = self.f.tell()
+        if self.filesize == 0:
+            # an empty file can't be mapped
+            self.data_map = b''
+            self.data_len = 0
+        else:
+            mavutil.mavmmaplog._open_data(self)
+
+    def _detect_version(self, records):
+        '''pick the protocol version from the first record starting with
+        a MAVLink frame, returning the records with those read put back'''
+        held = []
+        for r in records:
+            held.append(r)
+            start = bytes(r[2][:1])
+            if start in [b'\xfd', b'\xfe']:
+                self.auto_mavlink_version(start)
+                break
+            if len(held) >= PROTOCOL_PROBE_RECORDS:
+                break
+        return itertools.chain(held, records)
+
+    def _scan_capture(self, f):
+        '''parse each flow as its records are read, writing the messages
+        to f as a telemetry log'''
+        records = self._detect_version(read_capture(self.filename))
+        mavlink = mavutil.mavlink
+        mavlink_map = mavlink.mavlink_map
+        index = self.index
+        parsers = {}
+        ofs = 0
+        for (timestamp, flow, data) in records:
+            p = parsers.get(flow, None)
+            if p is None:
+                mav = mavlink.MAVLink(None)
+                mav.robust_parsing = True
+                p = parsers[flow] = (mav, flow_name(flow))
+                self.flows[p[1]] = 0
+            msgs = p[0].parse_buffer(data)
+            if msgs is None:
+                continue
+            tbuf = struct.pack('>Q', int(timestamp * 1.0e6) & ~3)
+            count = 0
+            for m in msgs:
+                mtype = m.get_msgId()
+                if not mtype in mavlink_map:
+                    # bad data, or not in this dialect
+                    continue
+                buf = m.get_msgbuf()
+                if mtype in index:
+                    index[mtype].append(ofs)
+                else:
+                    index[mtype] = [ofs]
+                f.write(tbuf)
+                f.write(buf)
+                ofs += 8 + len(buf)
+                count += 1
+            self.flows[p[1]] += count
+
+    def init_arrays(self, progress_callback=None):
+        '''initialise arrays for fast recv_match() from the index built
+        while scanning the capture'''
+        self.offsets = {}
+        self.counts = {}
+        self.name_to_id = {}
+        self.id_to_name = {}
+        self.instance_offsets = {}
+        self.type_nums = None
+        mavlink = mavutil.mavlink
+        for mtype in sorted(self.index.keys(), key=lambda t: self.index[t][0]):
+            self.offsets[mtype] = self.index[mtype]
+            self.counts[mtype] = len(self.index[mtype])
+            msg = mavlink.mavlink_map[mtype]
+            self.name_to_id[msg.name] = mtype
+            self.id_to_name[mtype] = msg.name
+            self.f.seek(self.index[mtype][0])
+            m = self.recv_msg()
+            mavutil.add_message(self.messages, msg.name, m)
+            if m._instance_field is not None:
+                self.instance_offsets[mtype] = m._instance_offset
+        self._count = sum(self.counts.values())
+        self.offset = 0
+        self._rewind()
+        if progress_callback is not None:
+            progress_callback(100)
+
+    def skip_to_type(self, type):
+        '''skip fwd to next msg matching given type set, going straight
+        to the end of the log once there are no more'''
+        if self.type_nums is not None:
+            for i in range(len(self.type_nums)):
+                if self.indexes[i] < self.counts[self.type_nums[i]]:
+                    break
+            else:
+                self.f.seek(self.data_len)
+                return
+        mavutil.mavmmaplog.skip_to_type(self, type)
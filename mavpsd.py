@@ -0,0 +1,430 @@
+#!/usr/bin/env python
+'''
+streaming power spectral density estimation for IMU data in logs
+
+Samples from the IMU batch sampler (ISBH/ISBD) and from raw ACC/GYR
+messages are read in chunks through the reader's message index and
+fed to Welch averaged PSD accumulators, so memory use is bounded by
+the chunk size and FFT length rather than the size of the log.
+
+Released under GNU GPL version 3 or later
+'''
+from __future__ import print_function
+from __future__ import absolute_import
+from builtins import object
+
+import numpy as np
+
+# number of messages of each type to extract at a time
+DEFAULT_CHUNK = 20000
+
+
+def make_window(name, n):
+    '''window function of length n by name: hanning, blackman or None'''
+    if name == 'hanning':
+        return np.hanning(n)
+    if name == 'blackman':
+        return np.blackman(n)
+    return np.ones(n)
+
+
+class WelchPSD(object):
+    '''Welch averaged power spectral density of a set of channels.
+
+    Segments of nfft samples are windowed and transformed as they
+    become available, and only the running sum of the squared
+    magnitudes and any partial segment are kept'''
+    def __init__(self, nfft, sample_rate, window='hanning', overlap=0.0, channels=3, remove_dc=True):
+        self.nfft = nfft
+        self.sample_rate = sample_rate
+        self.window_name = window
+        self.window = make_window(window, nfft)
+        # sum of squares of the window, for the noise equivalent bandwidth
+        self.S2 = np.inner(self.window, self.window)
+        self.step = max(1, nfft - int(nfft * overlap))
+        self.remove_dc = remove_dc
+        self.sum = np.zeros((channels, nfft//2+1))
+        self.count = 0
+        self.pending = np.zeros((channels, 0))
+
+    def add_segments(self, segments):
+        '''add an array of shape (nsegments, channels, nfft)'''
+        if len(segments) == 0:
+            return
+        d = np.fft.rfft(segments * self.window, axis=-1)
+        p = np.square(np.abs(d))
+        if self.remove_dc:
+            p[..., 0] = 0
+            p[..., -1] = 0
+        self.sum += p.sum(axis=0)
+        self.count += len(segments)
+
+    def add_samples(self, samples):
+        '''add contiguous samples of shape (channels, n), continuing on
+        from the last call'''
+        buf = np.concatenate((self.pending, np.asarray(samples, dtype=float)), axis=1)
+        n = buf.shape[1]
+        if n < self.nfft:
+            self.pending = buf
+            return
+        nseg = (n - self.nfft) // self.step + 1
+        s = buf.strides
+        segments = np.lib.stride_tricks.as_strided(buf, shape=(nseg, buf.shape[0], self.nfft),
+                                                   strides=(s[1]*self.step, s[0], s[1]),
+                                                   writeable=False)
+        self.add_segments(segments)
+        self.pending = buf[:, nseg*self.step:].copy()
+
+    def break_stream(self):
+        '''discard any partial segment, so the next samples are not
+        treated as contiguous with earlier ones'''
+        self.pending = self.pending[:, 0:0]
+
+    def frequencies(self):
+        return np.fft.rfftfreq(self.nfft, 1.0/self.sample_rate)
+
+    def psd(self):
+        '''averaged one-sided PSD, one row per channel'''
+        if self.count == 0:
+            return np.zeros_like(self.sum)
+        return 2 * (self.sum / self.count) / (self.sample_rate * self.S2)
+
+
+class SpectrumSet(object):
+    '''a WelchPSD for each sensor and window function'''
+    def __init__(self, windows=['hanning'], overlap=0.0, nfft=None):
+        self.windows = windows
+        self.overlap = overlap
+        self.nfft = nfft
+        self.spectra = {}
+        self.order = []
+        self.skipped = 0
+
+    def get(self, tag, window):
+        return self.spectra.get((tag, window), None)
+
+    def tags(self):
+        '''sensor tags in the order first seen'''
+        return self.order
+
+    def break_stream(self, tag):
+        '''the next samples for a sensor are not contiguous with earlier ones'''
+        for w in self.windows:
+            p = self.get(tag, w)
+            if p is not None:
+                p.break_stream()
+
+    def add(self, tag, sample_rate, samples, contiguous=True):
+        '''add samples of shape (channels, n) for a sensor. Samples
+        which are not contiguous with the previous ones for the sensor
+        start a new stream. If no FFT length was given the length of
+        the first block for each sensor is used, and later blocks of a
+        different length are skipped'''
+        nfft = self.nfft
+        if nfft is None:
+            nfft = samples.shape[1]
+            first = self.get(tag, self.windows[0])
+            if first is not None and first.nfft != nfft:
+                self.skipped += 1
+                return
+        for w in self.windows:
+            key = (tag, w)
+            if not key in self.spectra:
+                if not tag in self.order:
+                    self.order.append(tag)
+                self.spectra[key] = WelchPSD(nfft, sample_rate, w, self.overlap, samples.shape[0])
+            p = self.spectra[key]
+            if not contiguous:
+                p.break_stream()
+            p.add_samples(samples)
+
+
+def _fast_path(mlog, types, condition):
+    '''true if all the types can be read through the reader's index'''
+    if condition is not None or not hasattr(mlog, 'extract_arrays'):
+        return False
+    for t in types:
+        if not t in getattr(mlog, 'name_to_id', {}):
+            continue
+        if mlog.extract_arrays(t, 0, 1) is None:
+            return False
+    return True
+
+def _chunks(mlog, type, chunk):
+    '''yield column dicts for the given type, chunk messages at a time'''
+    if not type in mlog.name_to_id:
+        return
+    start = 0
+    while True:
+        a = mlog.extract_arrays(type, start, chunk)
+        if a is None or len(a['_offset']) == 0:
+            return
+        yield a
+        start += chunk
+
+
+class ISBBatch(object):
+    '''one batch of samples from the IMU batch sampler'''
+    def __init__(self, N, sensor_type, instance, multiplier, sample_rate, sample_us):
+        self.N = N
+        self.sensor_type = sensor_type
+        self.instance = instance
+        self.multiplier = multiplier
+        self.sample_rate = sample_rate
+        self.sample_us = sample_us
+        self.seqno = -1
+        self.holes = False
+        self.parts = []
+        self.data = None
+
+    def prefix(self):
+        if self.sensor_type == 0:
+            return "Accel"
+        elif self.sensor_type == 1:
+            return "Gyro"
+        else:
+            return "?Unknown Sensor Type?"
+
+    def tag(self):
+        return str(self)
+
+    def __str__(self):
+        return "%s[%u]" % (self.prefix(), self.instance)
+
+    def add(self, N, seqno, x, y, z):
+        '''add arrays of ISBD rows, where x, y and z hold one row of
+        raw samples per message. Returns the number of rows skipped'''
+        ok = (N == self.N)
+        skipped = int(len(N) - np.count_nonzero(ok))
+        (seqno, x, y, z) = (seqno[ok], x[ok], y[ok], z[ok])
+        if self.holes:
+            return skipped + len(seqno)
+        expected = self.seqno + 1 + np.arange(len(seqno))
+        bad = np.nonzero(seqno != expected)[0]
+        if len(bad) > 0:
+            self.holes = True
+            skipped += len(seqno) - bad[0]
+            (seqno, x, y, z) = (seqno[:bad[0]], x[:bad[0]], y[:bad[0]], z[:bad[0]])
+        if len(seqno) > 0:
+            self.seqno = int(seqno[-1])
+            self.parts.append(np.stack((np.ravel(x), np.ravel(y), np.ravel(z))))
+        return skipped
+
+    def finish(self):
+        '''join the parts into data, in the logged units'''
+        if len(self.parts) == 0:
+            self.data = np.zeros((3, 0))
+        else:
+            self.data = np.concatenate(self.parts, axis=1) / float(self.multiplier)
+        self.parts = []
+        return self
+
+    def timestamps(self):
+        '''sample times in microseconds'''
+        return self.sample_us + np.arange(self.data.shape[1]) * (1.0e6 / self.sample_rate)
+
+
+def isb_batches(mlog, condition=None, chunk=DEFAULT_CHUNK, stats=None):
+    '''yield an ISBBatch for each ISBH in the log, with the samples
+    from its ISBD messages joined. Batches with missing ISBD messages
+    are cut short at the first hole. If stats is a dict, counts of
+    skipped ISBD messages are added to it'''
+    if stats is None:
+        stats = {}
+    stats.setdefault('skipped', 0)
+    if not _fast_path(mlog, ['ISBH', 'ISBD'], condition):
+        for b in _isb_batches_slow(mlog, condition, stats):
+            yield b
+        return
+    if not 'ISBH' in mlog.name_to_id:
+        return
+    headers = {}
+    for h in _chunks(mlog, 'ISBH', chunk):
+        for k in h:
+            headers.setdefault(k, []).append(h[k])
+    if len(headers) == 0:
+        return
+    for k in headers:
+        headers[k] = np.concatenate(headers[k])
+
+    def make_batch(i):
+        return ISBBatch(int(headers['N'][i]), int(headers['type'][i]), int(headers['instance'][i]),
+                        headers['mul'][i], headers['smp_rate'][i], int(headers['SampleUS'][i]))
+
+    batch = None
+    batch_idx = -1
+    for d in _chunks(mlog, 'ISBD', chunk):
+        idx = np.searchsorted(headers['_offset'], d['_offset'], side='right') - 1
+        stats['skipped'] += int(np.count_nonzero(idx < 0))
+        # split into runs of rows belonging to the same header
+        starts = np.concatenate(([0], np.nonzero(np.diff(idx))[0] + 1))
+        ends = np.concatenate((starts[1:], [len(idx)]))
+        for (s, e) in zip(starts, ends):
+            h = idx[s]
+            if h < 0:
+                continue
+            if h != batch_idx:
+                if batch is not None:
+                    yield batch.finish()
+                batch = make_batch(h)
+                batch_idx = h
+            stats['skipped'] += batch.add(d['N'][s:e], d['seqno'][s:e], d['x'][s:e], d['y'][s:e], d['z'][s:e])
+    if batch is not None:
+        yield batch.finish()
+
+def _isb_batches_slow(mlog, condition, stats):
+    '''isb_batches for readers without bulk extraction'''
+    batch = None
+    rows = []
+
+    def flush():
+        if batch is not None and len(rows) > 0:
+            stats['skipped'] += batch.add(np.array([r.N for r in rows]),
+                                          np.array([r.seqno for r in rows]),
+                                          np.array([list(r.x) for r in rows]),
+                                          np.array([list(r.y) for r in rows]),
+                                          np.array([list(r.z) for r in rows]))
+        del rows[:]
+
+    while True:
+        m = mlog.recv_match(type=['ISBH', 'ISBD'], condition=condition)
+        if m is None:
+            break
+        if m.get_type() == 'ISBH':
+            flush()
+            if batch is not None:
+                yield batch.finish()
+            batch = ISBBatch(m.N, m.type, m.instance, m.mul, m.smp_rate, m.SampleUS)
+            continue
+        if batch is None:
+            stats['skipped'] += 1
+            continue
+        rows.append(m)
+    flush()
+    if batch is not None:
+        yield batch.finish()
+
+def isb_psd(mlog, windows=['hanning'], overlap=0.0, condition=None, chunk=DEFAULT_CHUNK):
+    '''Welch averaged PSDs for each IMU batch sampler sensor, using
+    each batch as one FFT segment, or with overlap between
+    consecutive batches. Gyro rates are converted to degrees/s.
+    Returns a SpectrumSet'''
+    spectra = SpectrumSet(windows, overlap)
+    stats = {}
+    for b in isb_batches(mlog, condition, chunk, stats):
+        if b.holes or b.data.shape[1] == 0:
+            spectra.skipped += 1
+            spectra.break_stream(b.tag())
+            continue
+        data = b.data
+        if b.sensor_type == 1:
+            data = np.degrees(data)
+        spectra.add(b.tag(), b.sample_rate, data)
+    return spectra
+
+
+# raw IMU messages, either one type per instance (ACC1, GYR2 etc) or
+# one type with an instance field
+IMU_TYPES = {
+    'ACC' : ['AccX', 'AccY', 'AccZ'],
+    'GYR' : ['GyrX', 'GyrY', 'GyrZ'],
+}
+
+def _imu_types(mlog):
+    '''map of message type to (base type, instance) for raw IMU messages in the log'''
+    ret = {}
+    names = getattr(mlog, 'name_to_id', None)
+    if names is None:
+        names = {}
+    for name in names:
+        for base in IMU_TYPES:
+            if name == base:
+                ret[name] = (base, None)
+            elif name.startswith(base) and name[len(base):].isdigit():
+                ret[name] = (base, int(name[len(base):]) - 1)
+    return ret
+
+def _imu_tag(base, instance):
+    return "%s[%u]" % (base, instance)
+
+def imu_samples(mlog, condition=None, chunk=DEFAULT_CHUNK):
+    '''yield (tag, sample_us, samples) for raw ACC and GYR data, with
+    samples of shape (3, n), in chunks of up to chunk messages per
+    type. Chunks for each sensor are yielded in time order'''
+    types = _imu_types(mlog)
+    if _fast_path(mlog, types.keys(), condition):
+        for t in sorted(types.keys()):
+            (base, instance) = types[t]
+            fields = IMU_TYPES[base]
+            for a in _chunks(mlog, t, chunk):
+                if 'SampleUS' in a:
+                    us = a['SampleUS']
+                elif 'TimeUS' in a:
+                    us = a['TimeUS']
+                else:
+                    us = a['_timestamp'] * 1.0e6
+                if instance is None and 'I' in a:
+                    inst = a['I']
+                else:
+                    inst = np.full(len(us), instance or 0)
+                for i in np.unique(inst):
+                    sel = (inst == i)
+                    samples = np.stack([a[f][sel] for f in fields]).astype(float)
+                    yield (_imu_tag(base, i), us[sel].astype(float), samples)
+        return
+
+    pending = {}
+    def flush(tag):
+        (us, rows) = pending.pop(tag)
+        return (tag, np.array(us, dtype=float), np.array(rows, dtype=float).T)
+    while True:
+        m = mlog.recv_match(type=list(types.keys()), condition=condition)
+        if m is None:
+            break
+        (base, instance) = types[m.get_type()]
+        if instance is None:
+            instance = getattr(m, 'I', 0)
+        tag = _imu_tag(base, instance)
+        us = getattr(m, 'SampleUS', getattr(m, 'TimeUS', m._timestamp*1.0e6))
+        (ulist, rows) = pending.setdefault(tag, ([], []))
+        ulist.append(us)
+        rows.append([getattr(m, f) for f in IMU_TYPES[base]])
+        if len(rows) >= chunk:
+            yield flush(tag)
+    for tag in sorted(pending.keys()):
+        yield flush(tag)
+
+def imu_psd(mlog, nfft=1024, windows=['hanning'], overlap=0.5, condition=None, chunk=DEFAULT_CHUNK,
+            max_gap=2.0):
+    '''Welch averaged PSDs of raw ACC and GYR data, with gyro rates in
+    degrees/s. The sample rate of each sensor is estimated from its
+    first chunk, and gaps of more than max_gap sample periods start a
+    new stream. Returns a SpectrumSet'''
+    spectra = SpectrumSet(windows, overlap, nfft)
+    last_us = {}
+    periods = {}
+    for (tag, us, samples) in imu_samples(mlog, condition, chunk):
+        if len(us) == 0:
+            continue
+        if not tag in periods:
+            if len(us) < 2:
+                continue
+            periods[tag] = float(np.median(np.diff(us)))
+            if periods[tag] <= 0:
+                del periods[tag]
+                continue
+        if tag.startswith('GYR'):
+            samples = np.degrees(samples)
+        period = periods[tag]
+        rate = 1.0e6 / period
+        # split at gaps, including any gap since the last chunk
+        prev = last_us.get(tag, None)
+        dt = np.diff(np.concatenate(([us[0] if prev is None else prev], us)))
+        breaks = np.nonzero(dt > max_gap * period)[0]
+        bounds = np.concatenate(([0], breaks, [len(us)]))
+        for j in range(len(bounds)-1):
+            (s, e) = (bounds[j], bounds[j+1])
+            if e > s:
+                spectra.add(tag, rate, samples[:, s:e], contiguous=(s not in breaks))
+        last_us[tag] = us[-1]
+    return spectra
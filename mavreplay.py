@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+'''
+time accurate replay of telemetry logs
+
+A ReplaySchedule holds the timestamps and wire bytes of the messages
+to replay. For indexed telemetry logs (tlogs, block compressed tlogs
+and captures) it is built straight from the log's message index with
+no decoding, otherwise from recv_match(). A Replayer then writes the
+bytes to any number of mavfile outputs at 1x to 100x (or more) of the
+original rate.
+
+Send times are computed from a fixed anchor (wall clock time, log
+time) rather than from the previous message, so timing errors don't
+accumulate. Each wait sleeps until just before the send time and
+spins for the rest, and messages which are already due are sent back
+to back. If the outputs fall too far behind the anchor is moved up,
+instead of bursting out the backlog. Seeking, pausing and speed
+changes take effect immediately, also from other threads.
+
+Released under GNU GPL version 3 or later
+'''
+from __future__ import print_function
+from __future__ import absolute_import
+from builtins import object
+
+import array
+import bisect
+import struct
+import threading
+import time
+
+try:
+    clock = time.perf_counter
+except AttributeError:
+    clock = time.time
+
+MARKER_V1 = 0xFE
+MARKER_V2 = 0xFD
+
+# number of recent send timing errors kept for percentiles
+JITTER_SAMPLES = 65536
+
+
+class ReplaySchedule(object):
+    '''timestamps, message IDs and wire bytes of the messages to replay,
+    in log order'''
+    def __init__(self, times, msgids, data, offsets):
+        self.times = times
+        self.msgids = msgids
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.times)
+
+    def message(self, i):
+        '''the wire bytes of message i'''
+        return self.data[self.offsets[i]:self.offsets[i+1]]
+
+    def start_time(self):
+        return self.times[0] if len(self.times) > 0 else 0
+
+    def end_time(self):
+        return self.times[-1] if len(self.times) > 0 else 0
+
+    def duration(self):
+        return self.end_time() - self.start_time()
+
+    def index_at(self, t):
+        '''index of the first message at or after log time t'''
+        return bisect.bisect_left(self.times, t)
+
+
+def _frame_length(header):
+    '''length of the MAVLink frame starting with header, which holds at
+    least its first three bytes, or None if it isn't a frame'''
+    marker = bytearray(header[:1])[0]
+    plen = bytearray(header[1:2])[0]
+    if marker == MARKER_V1:
+        return plen + 8
+    if marker == MARKER_V2:
+        if bytearray(header[2:3])[0] & 0x01:
+            return plen + 25
+        return plen + 12
+    return None
+
+
+def _schedule_from_index(mlog, types):
+    '''build a schedule from the message index of a mavmmaplog'''
+    if types is None:
+        mtypes = list(mlog.offsets.keys())
+    else:
+        mtypes = [mlog.name_to_id[t] for t in types if t in mlog.name_to_id]
+    offsets = []
+    for mtype in mtypes:
+        offsets.extend(mlog.offsets[mtype])
+    offsets.sort()
+    data_map = mlog.data_map
+    times = array.array('d')
+    msgids = array.array('I')
+    ofs_array = array.array('L', [0])
+    data = bytearray()
+    for ofs in offsets:
+        header = data_map[ofs:ofs+18]
+        length = _frame_length(header[8:11])
+        if length is None:
+            continue
+        (tusec,) = struct.unpack('>Q', header[:8])
+        if bytearray(header[8:9])[0] == MARKER_V1:
+            msgid = bytearray(header[13:14])[0]
+        else:
+            b = bytearray(header[15:18])
+            msgid = b[0] | (b[1] << 8) | (b[2] << 16)
+        times.append(tusec * 1.0e-6)
+        msgids.append(msgid)
+        data += data_map[ofs+8:ofs+8+length]
+        ofs_array.append(len(data))
+    return ReplaySchedule(times, msgids, bytes(data), ofs_array)
+
+
+def _schedule_from_messages(mlog, types, condition):
+    '''build a schedule by reading every message'''
+    times = array.array('d')
+    msgids = array.array('I')
+    ofs_array = array.array('L', [0])
+    data = bytearray()
+    while True:
+        m = mlog.recv_match(type=types, condition=condition)
+        if m is None:
+            break
+        if m.get_type() == 'BAD_DATA':
+            continue
+        times.append(m._timestamp)
+        msgids.append(getattr(m, 'get_msgId', lambda: 0)())
+        data += m.get_msgbuf()
+        ofs_array.append(len(data))
+    return ReplaySchedule(times, msgids, bytes(data), ofs_array)
+
+
+def load_schedule(log, types=None, condition=None):
+    '''build the replay schedule for a log, given as a filename or an
+    open mavutil connection. types is a list of message names to
+    replay, and condition a condition they must meet'''
+    if isinstance(log, str):
+        from pymavlink import mavutil
+        log = mavutil.mavlink_connection(log)
+    if types is not None:
+        types = list(types)
+    if condition is None and isinstance(getattr(log, 'offsets', None), dict) and hasattr(log, 'data_map'):
+        return _schedule_from_index(log, types)
+    return _schedule_from_messages(log, types, condition)
+
+
+class ReplayStats(object):
+    '''replay rate and timing. lateness is how long after its due time
+    each message was sent, in seconds'''
+    def __init__(self, sent, nbytes, wall_time, log_time, lateness, max_lateness, resyncs):
+        self.sent = sent
+        self.bytes = nbytes
+        self.wall_time = wall_time
+        self.log_time = log_time
+        self.resyncs = resyncs
+        self.rate = sent / wall_time if wall_time > 0 else 0
+        self.speed = log_time / wall_time if wall_time > 0 else 0
+        lateness = sorted(lateness)
+        def percentile(p):
+            if len(lateness) == 0:
+                return 0
+            return lateness[min(len(lateness)-1, int(p * len(lateness)))]
+        self.mean_lateness = sum(lateness) / len(lateness) if len(lateness) > 0 else 0
+        self.median_lateness = percentile(0.5)
+        self.p99_lateness = percentile(0.99)
+        self.max_lateness = max_lateness
+
+    def __str__(self):
+        return ("%u msgs %u bytes in %.2fs: %.0f msg/s at %.2fx, late by mean %.3fms median %.3fms "
+                "p99 %.3fms max %.3fms, %u resyncs" % (
+                    self.sent, self.bytes, self.wall_time, self.rate, self.speed,
+                    self.mean_lateness*1000, self.median_lateness*1000,
+                    self.p99_lateness*1000, self.max_lateness*1000, self.resyncs))
+
+
+class Replayer(object):
+    '''replay a schedule to a list of outputs, anything with a write()
+    method taking bytes, such as mavfile connections.
+
+    spin is how long before each send time to stop sleeping and busy
+    wait (0 to always sleep), and if sends fall more than max_lag
+    seconds behind the schedule is restarted from the current message.
+    callback(timestamp, buf) is called for each message sent whose ID
+    is in callback_ids (all messages if None)'''
+    def __init__(self, schedule, outputs, speed=1.0, spin=0.0005, max_lag=0.5,
+                 callback=None, callback_ids=None, loop=False):
+        self.schedule = schedule
+        self.outputs = list(outputs)
+        self.speed = float(speed)
+        self.spin = spin
+        self.max_lag = max_lag
+        self.callback = callback
+        self.callback_ids = None if callback_ids is None else set(callback_ids)
+        self.loop = loop
+        self.index = 0
+        self.paused = False
+        self.running = False
+        self.stopping = False
+        self.finished = False
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.reset_stats()
+        self._anchor(clock(), schedule.start_time())
+
+    def _anchor(self, wall, log_time):
+        self.wall0 = wall
+        self.log0 = log_time
+
+    def reset_stats(self):
+        '''start measuring rate and timing afresh'''
+        self.sent = 0
+        self.bytes = 0
+        self.resyncs = 0
+        self.max_lateness = 0
+        self.lateness = array.array('d')
+        self.stats_wall0 = None
+        self.stats_log0 = None
+        self.stats_wall1 = None
+        self.stats_log1 = None
+
+    def stats(self):
+        '''a ReplayStats for the messages sent since reset_stats()'''
+        with self.lock:
+            if self.stats_wall0 is None:
+                return ReplayStats(0, 0, 0, 0, [], 0, 0)
+            return ReplayStats(self.sent, self.bytes, self.stats_wall1 - self.stats_wall0,
+                               self.stats_log1 - self.stats_log0, list(self.lateness),
+                               self.max_lateness, self.resyncs)
+
+    def log_time(self):
+        '''the current position in the log, in log time'''
+        with self.lock:
+            return self._log_time(clock())
+
+    def _log_time(self, now):
+        if self.paused or not self.running:
+            return self.log0
+        return self.log0 + (now - self.wall0) * self.speed
+
+    def set_speed(self, speed):
+        '''change the replay speed, keeping the current log position'''
+        with self.lock:
+            now = clock()
+            self._anchor(now, self._log_time(now))
+            self.speed = float(speed)
+        self.wakeup.set()
+
+    def seek(self, t):
+        '''continue from log time t'''
+        with self.lock:
+            self.index = self.schedule.index_at(t)
+            self.finished = False
+            self._anchor(clock(), t)
+        self.wakeup.set()
+
+    def pause(self):
+        with self.lock:
+            if not self.paused:
+                self.log0 = self._log_time(clock())
+                self.paused = True
+        self.wakeup.set()
+
+    def resume(self):
+        with self.lock:
+            if self.paused:
+                self.wall0 = clock()
+                self.paused = False
+        self.wakeup.set()
+
+    def _send(self, i, now, target):
+        buf = self.schedule.message(i)
+        for out in self.outputs:
+            out.write(buf)
+        if self.callback is not None:
+            msgid = self.schedule.msgids[i]
+            if self.callback_ids is None or msgid in self.callback_ids:
+                self.callback(self.schedule.times[i], buf)
+        late = now - target
+        if self.stats_wall0 is None:
+            self.stats_wall0 = now
+            self.stats_log0 = self.schedule.times[i]
+        self.stats_wall1 = now
+        self.stats_log1 = self.schedule.times[i]
+        self.sent += 1
+        self.bytes += len(buf)
+        if late > self.max_lateness:
+            self.max_lateness = late
+        if len(self.lateness) < JITTER_SAMPLES:
+            self.lateness.append(late)
+        else:
+            self.lateness[self.sent % JITTER_SAMPLES] = late
+
+    def run(self, end_time=None):
+        '''replay from the current position until the end of the
+        schedule (or log time end_time) or until stop() is called'''
+        times = self.schedule.times
+        n = len(self.schedule)
+        with self.lock:
+            self.running = True
+            self.wall0 = clock()
+        try:
+            while not self.stopping:
+                wait = None
+                with self.lock:
+                    i = self.index
+                    if self.paused:
+                        wait = 0.1
+                    elif i >= n or (end_time is not None and times[i] > end_time):
+                        if self.loop and n > 0:
+                            self.index = 0
+                            self._anchor(clock(), times[0])
+                            continue
+                        self.finished = True
+                        break
+                    else:
+                        target = self.wall0 + (times[i] - self.log0) / self.speed
+                        now = clock()
+                        if target - now > self.spin:
+                            wait = target - now - self.spin
+                        else:
+                            while now < target:
+                                now = clock()
+                            if now - target > self.max_lag:
+                                # too far behind, carry on from here
+                                self._anchor(now, times[i])
+                                self.resyncs += 1
+                                target = now
+                            self.index = i + 1
+                            self._send(i, now, target)
+                if wait is not None:
+                    # woken early by a seek, pause or speed change
+                    self.wakeup.wait(wait)
+                    self.wakeup.clear()
+        finally:
+            with self.lock:
+                t = self._log_time(clock())
+                if self.index < n:
+                    t = min(t, times[self.index])
+                elif n > 0:
+                    t = min(t, times[-1])
+                self.log0 = t
+                self.running = False
+                self.stopping = False
+
+    def start(self, end_time=None):
+        '''replay in a background thread'''
+        with self.lock:
+            self.running = True
+            self.stopping = False
+        self.thread = threading.Thread(target=self.run, args=(end_time,), name='Replayer')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        '''stop replaying, waiting for the background thread if any'''
+        with self.lock:
+            if self.running:
+                self.stopping = True
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
@@ -0,0 +1,436 @@
+#!/usr/bin/env python
+'''
+link quality from MAVLink sequence numbers
+
+Each source (sysid, compid) numbers its frames 0 to 255 and round
+again. Counting every jump in sequence as lost frames, as
+mavfile.packet_loss() used to, turns each reordered or duplicated
+frame into around 255 lost ones, which is common when several radios
+or routers carry the same link.
+
+Here a jump back of up to window frames is a reordered (or duplicated)
+frame, not a wrap. Each frame is placed on an unwrapped sequence, and
+frames missing from it are only counted as lost if they haven't turned
+up by the time they are window frames old. This gives separate counts
+of lost, duplicated and reordered frames, a histogram of the lengths of
+the gaps left by lost frames, and the loss over recent time periods.
+
+SequenceTracker does this a frame at a time for a live link (mavfile
+keeps one in seq_tracker), and analyse() for whole arrays of frames
+from a log, using numpy.
+
+Released under GNU GPL version 3 or later
+'''
+from __future__ import print_function
+from __future__ import absolute_import
+from builtins import object
+from builtins import range
+
+import collections
+
+# how far back (in frames) a frame can arrive and still count as reordered
+REORDER_WINDOW = 32
+
+# length of the time buckets used for loss over time, in seconds
+BUCKET_LENGTH = 1.0
+
+# number of buckets kept per source
+BUCKET_COUNT = 300
+
+# what update() found a frame to be
+SEQ_FIRST = 0
+SEQ_NEXT = 1
+SEQ_GAP = 2
+SEQ_DUPLICATE = 3
+SEQ_REORDERED = 4
+SEQ_LATE = 5
+
+
+def signed_delta(seq, last_seq, window=REORDER_WINDOW):
+    '''steps from last_seq to seq, negative for a jump back of up to window'''
+    d = (seq - last_seq) % 256
+    if d > 256 - window:
+        d -= 256
+    return d
+
+
+class SequenceSummary(object):
+    '''link quality of one source. expected is the span of sequence
+    numbers seen, unique the number of them received, and gaps a dict
+    of gap lengths to the number of gaps of that length'''
+    def __init__(self, received=0, unique=0, expected=0, duplicates=0, reordered=0, late=0,
+                 max_reorder=0, gaps=None):
+        self.received = received
+        self.unique = unique
+        self.expected = expected
+        self.duplicates = duplicates
+        self.reordered = reordered
+        self.late = late
+        self.max_reorder = max_reorder
+        self.gaps = {} if gaps is None else gaps
+
+    @property
+    def lost(self):
+        return max(self.expected - self.unique, 0)
+
+    def loss_percent(self):
+        if self.expected == 0:
+            return 0.0
+        return (100.0 * self.lost) / self.expected
+
+    def as_dict(self):
+        return {
+            'received' : self.received,
+            'unique' : self.unique,
+            'expected' : self.expected,
+            'lost' : self.lost,
+            'loss_percent' : self.loss_percent(),
+            'duplicates' : self.duplicates,
+            'reordered' : self.reordered,
+            'late' : self.late,
+            'max_reorder' : self.max_reorder,
+            'gaps' : dict(self.gaps),
+        }
+
+    def __str__(self):
+        return "%u received, %u lost (%.2f%%), %u duplicated, %u reordered (up to %u back)" % (
+            self.received, self.lost, self.loss_percent(), self.duplicates, self.reordered, self.max_reorder)
+
+
+class SourceSequence(object):
+    '''sequence state of one source'''
+    def __init__(self, window, bucket_length, bucket_count):
+        self.window = window
+        self.bucket_length = bucket_length
+        self.last_seq = None
+        self.last_ext = 0
+        self.highest = 0
+        self.lowest = 0
+        # bit i set if frame highest-i has been received
+        self.bits = 0
+        self.mask = (1 << window) - 1
+        self.received = 0
+        self.unique = 0
+        self.duplicates = 0
+        self.reordered = 0
+        self.late = 0
+        self.max_reorder = 0
+        self.gaps = {}
+        # frames missing at the old end of the window, in a run
+        self.run = 0
+        # (bucket number, expected, unique)
+        self.buckets = collections.deque(maxlen=bucket_count)
+
+    def _count(self, t, expected, unique):
+        if t is None:
+            return
+        n = int(t // self.bucket_length)
+        b = self.buckets
+        if len(b) == 0 or b[-1][0] != n:
+            b.append([n, 0, 0])
+        b[-1][1] += expected
+        b[-1][2] += unique
+
+    def _advance(self, steps):
+        '''move the window forward, finishing gaps in frames that leave it'''
+        bits = self.bits
+        window = self.window
+        leaving = self.highest - window + 1
+        for i in range(steps):
+            if leaving + i >= self.lowest:
+                if (bits >> (window - 1)) & 1:
+                    if self.run > 0:
+                        self.gaps[self.run] = self.gaps.get(self.run, 0) + 1
+                        self.run = 0
+                else:
+                    self.run += 1
+            bits = (bits << 1) & self.mask
+        self.bits = bits
+
+    def update(self, seq, t=None):
+        '''add a frame, returning the change in the number of lost frames
+        and what the frame was (SEQ_*)'''
+        self.received += 1
+        if self.last_seq is None:
+            self.last_seq = seq
+            self.bits = 1
+            self._count(t, 1, 1)
+            self.unique += 1
+            return (0, SEQ_FIRST)
+        ext = self.last_ext + signed_delta(seq, self.last_seq, self.window)
+        self.last_seq = seq
+        self.last_ext = ext
+        if ext > self.highest:
+            steps = ext - self.highest
+            self._advance(steps)
+            self.highest = ext
+            self.bits |= 1
+            self.unique += 1
+            self._count(t, steps, 1)
+            if steps == 1:
+                return (0, SEQ_NEXT)
+            return (steps - 1, SEQ_GAP)
+        back = self.highest - ext
+        if back < self.window and ext >= self.lowest:
+            if (self.bits >> back) & 1:
+                self.duplicates += 1
+                return (0, SEQ_DUPLICATE)
+            self.bits |= 1 << back
+            self.unique += 1
+            self.reordered += 1
+            if back > self.max_reorder:
+                self.max_reorder = back
+            self._count(t, 0, 1)
+            return (-1, SEQ_REORDERED)
+        if ext < self.lowest:
+            # from before the first frame seen, so nothing was lost
+            # unless there are frames between
+            lost = self.lowest - ext - 1
+            self.lowest = ext
+            self.unique += 1
+            self._count(t, 0, 1)
+            if back >= self.window:
+                self.late += 1
+                return (lost, SEQ_LATE)
+            self.bits |= 1 << back
+            self.reordered += 1
+            if back > self.max_reorder:
+                self.max_reorder = back
+            return (lost, SEQ_REORDERED)
+        # too late to tell from a duplicate, so assume it was missing
+        self.late += 1
+        self.unique += 1
+        self._count(t, 0, 1)
+        return (-1, SEQ_LATE)
+
+    def pending_gaps(self):
+        '''gaps still inside the window, which may yet be filled'''
+        gaps = {}
+        run = self.run
+        for i in range(self.window - 1, -1, -1):
+            ext = self.highest - i
+            if ext < self.lowest:
+                continue
+            if (self.bits >> i) & 1:
+                if run > 0:
+                    gaps[run] = gaps.get(run, 0) + 1
+                run = 0
+            else:
+                run += 1
+        return gaps
+
+    def summary(self):
+        gaps = dict(self.gaps)
+        for (n, count) in self.pending_gaps().items():
+            gaps[n] = gaps.get(n, 0) + count
+        return SequenceSummary(received=self.received, unique=self.unique,
+                               expected=self.highest - self.lowest + 1 if self.received > 0 else 0,
+                               duplicates=self.duplicates, reordered=self.reordered, late=self.late,
+                               max_reorder=self.max_reorder, gaps=gaps)
+
+    def loss(self, period, now=None):
+        '''(expected, unique) over the last period seconds'''
+        if len(self.buckets) == 0:
+            return (0, 0)
+        if now is None:
+            now = (self.buckets[-1][0] + 1) * self.bucket_length
+        first = int((now - period) // self.bucket_length)
+        expected = 0
+        unique = 0
+        for (n, e, u) in reversed(self.buckets):
+            if n < first:
+                break
+            expected += e
+            unique += u
+        return (expected, unique)
+
+
+class SequenceTracker(object):
+    '''link quality of each source on a link, from the sequence numbers
+    of the frames received. Loss over time is kept in buckets of
+    bucket_length seconds, for the last bucket_count buckets'''
+    def __init__(self, window=REORDER_WINDOW, bucket_length=BUCKET_LENGTH, bucket_count=BUCKET_COUNT):
+        if window < 1 or window > 128:
+            raise ValueError("reorder window must be 1 to 128")
+        self.window = window
+        self.bucket_length = bucket_length
+        self.bucket_count = bucket_count
+        self.sources = {}
+
+    def update(self, src, seq, t=None):
+        '''add a frame from src (usually (sysid, compid)) with sequence
+        number seq at time t, returning the change in the number of
+        frames lost and what the frame was (SEQ_*)'''
+        s = self.sources.get(src, None)
+        if s is None:
+            s = SourceSequence(self.window, self.bucket_length, self.bucket_count)
+            self.sources[src] = s
+        return s.update(seq, t)
+
+    def summary(self, src=None):
+        '''a SequenceSummary for one source, or all sources combined'''
+        if src is not None:
+            if not src in self.sources:
+                return SequenceSummary()
+            return self.sources[src].summary()
+        return combine([s.summary() for s in self.sources.values()])
+
+    def summaries(self):
+        '''a dict of SequenceSummary by source'''
+        return dict((src, s.summary()) for (src, s) in self.sources.items())
+
+    def loss_percent(self, period=None, src=None, now=None):
+        '''loss as a percentage, over the last period seconds (up to now,
+        by default the latest frame) or since the start'''
+        if period is None:
+            return self.summary(src).loss_percent()
+        if src is None:
+            sources = self.sources.values()
+        else:
+            sources = [self.sources[src]] if src in self.sources else []
+        expected = 0
+        unique = 0
+        for s in sources:
+            (e, u) = s.loss(period, now)
+            expected += e
+            unique += u
+        if expected <= 0:
+            return 0.0
+        return max(0.0, 100.0 * (expected - unique) / expected)
+
+
+def combine(summaries):
+    '''add up a list of SequenceSummary'''
+    ret = SequenceSummary()
+    for s in summaries:
+        ret.received += s.received
+        ret.unique += s.unique
+        ret.expected += s.expected
+        ret.duplicates += s.duplicates
+        ret.reordered += s.reordered
+        ret.late += s.late
+        ret.max_reorder = max(ret.max_reorder, s.max_reorder)
+        for (n, count) in s.gaps.items():
+            ret.gaps[n] = ret.gaps.get(n, 0) + count
+    return ret
+
+
+def log_sequences(log):
+    '''(times, sysids, compids, seqs) numpy arrays for the frames in a
+    log, given as a filename or an open mavutil connection. The headers
+    of indexed tlogs are read directly, other logs are read message by
+    message'''
+    import numpy as np
+    if isinstance(log, str):
+        from pymavlink import mavutil
+        log = mavutil.mavlink_connection(log)
+    if isinstance(getattr(log, 'offsets', None), dict) and hasattr(log, 'data_map'):
+        offsets = []
+        for ofs in log.offsets.values():
+            offsets.extend(ofs)
+        offsets = np.array(sorted(offsets), dtype=np.int64)
+        data = np.frombuffer(log.data_map, dtype=np.uint8)
+        offsets = offsets[offsets + 16 <= len(data)]
+        stamps = np.zeros(len(offsets), dtype=np.uint64)
+        for i in range(8):
+            stamps = (stamps << np.uint64(8)) | data[offsets + i].astype(np.uint64)
+        marker = data[offsets + 8]
+        # v1 headers are FE len seq sys comp, v2 are FD len iflags cflags seq sys comp
+        h = offsets + 8 + np.where(marker == 0xFD, 4, 2)
+        return (stamps * 1.0e-6, data[h + 1].astype(np.int64), data[h + 2].astype(np.int64),
+                data[h].astype(np.int64))
+    times = []
+    sysids = []
+    compids = []
+    seqs = []
+    while True:
+        m = log.recv_match()
+        if m is None:
+            break
+        if m.get_type() == 'BAD_DATA':
+            continue
+        times.append(m._timestamp)
+        sysids.append(m.get_srcSystem())
+        compids.append(m.get_srcComponent())
+        seqs.append(m.get_seq())
+    return (np.array(times, dtype=float), np.array(sysids, dtype=np.int64),
+            np.array(compids, dtype=np.int64), np.array(seqs, dtype=np.int64))
+
+
+def _unwrap(seqs, window):
+    '''unwrapped sequence numbers of one source's frames, in order'''
+    import numpy as np
+    d = np.diff(seqs) % 256
+    d = np.where(d > 256 - window, d - 256, d)
+    return np.concatenate(([0], np.cumsum(d)))
+
+
+def analyse_source(times, seqs, window=REORDER_WINDOW, period=None):
+    '''SequenceSummary for one source's frames, and if period is given
+    an array of (period start, expected, unique) for each period'''
+    import numpy as np
+    n = len(seqs)
+    if n == 0:
+        return (SequenceSummary(), None)
+    ext = _unwrap(np.asarray(seqs, dtype=np.int64), window)
+    # frames behind the highest before them
+    running = np.maximum.accumulate(ext)
+    prev_high = np.concatenate(([ext[0]], running[:-1]))
+    # the first arrival of each sequence number
+    (values, first) = np.unique(ext, return_index=True)
+    is_first = np.zeros(n, dtype=bool)
+    is_first[first] = True
+    back = prev_high - ext
+    back[0] = 0
+    reordered_mask = is_first & (back > 0)
+    reordered = int(np.count_nonzero(reordered_mask & (back < window)))
+    late = int(np.count_nonzero(reordered_mask & (back >= window)))
+    max_reorder = int(back[reordered_mask & (back < window)].max()) if reordered > 0 else 0
+    gap_lengths = np.diff(values) - 1
+    gap_lengths = gap_lengths[gap_lengths > 0]
+    (lengths, counts) = np.unique(gap_lengths, return_counts=True)
+    summary = SequenceSummary(received=n, unique=len(values), expected=int(values[-1] - values[0] + 1),
+                              duplicates=n - len(values), reordered=reordered, late=late,
+                              max_reorder=max_reorder,
+                              gaps=dict(zip(lengths.tolist(), counts.tolist())))
+    if period is None:
+        return (summary, None)
+    # expected frames are counted when the highest sequence number moves on
+    advance = np.concatenate(([1], np.diff(running)))
+    bucket = np.floor(np.asarray(times) / period).astype(np.int64)
+    b0 = bucket.min()
+    bucket -= b0
+    expected = np.bincount(bucket, weights=advance)
+    unique = np.bincount(bucket, weights=is_first.astype(float), minlength=len(expected))
+    starts = (np.arange(len(expected)) + b0) * period
+    return (summary, np.column_stack((starts, expected, unique)))
+
+
+def analyse(times, sysids, compids, seqs, window=REORDER_WINDOW, period=None):
+    '''analyse arrays of frames (as from log_sequences()), returning a
+    dict of (SequenceSummary, periods) by (sysid, compid). See
+    analyse_source()'''
+    import numpy as np
+    times = np.asarray(times)
+    key = np.asarray(sysids, dtype=np.int64) * 256 + np.asarray(compids, dtype=np.int64)
+    order = np.argsort(key, kind='stable')
+    key = key[order]
+    bounds = np.flatnonzero(np.diff(key)) + 1
+    ret = {}
+    seqs = np.asarray(seqs, dtype=np.int64)
+    for idx in np.split(order, bounds):
+        if len(idx) == 0:
+            continue
+        src = (int(sysids[idx[0]]), int(compids[idx[0]]))
+        ret[src] = analyse_source(times[idx], seqs[idx], window, period)
+    return ret
+
+
+def periods_loss(periods):
+    '''loss percentage for each row of a periods array'''
+    import numpy as np
+    expected = periods[:, 1]
+    unique = periods[:, 2]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        loss = np.where(expected > 0, 100.0 * (expected - unique) / expected, 0.0)
+    return np.maximum(loss, 0.0)
@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+'''
+receive statistics for MAVLink links
+
+A LinkStats counts the messages and bytes received from each (sysid,
+compid, msgid), with their rate over the last few seconds, receive
+errors by kind (bad CRC, bad signature, unknown message and so on), a
+histogram of how long each message took to parse and decode, and how
+many bytes were left waiting in the parser. mavfile.enable_stats()
+attaches one to a connection; until then the receive path only tests
+that mavfile.stats is None.
+
+snapshot() returns everything as plain dicts and lists, which
+to_json() and to_prometheus() format for export, and StatsServer
+serves them over HTTP for a Prometheus scraper or a dashboard.
+
+Released under GNU GPL version 3 or later
+'''
+from __future__ import print_function
+from __future__ import absolute_import
+from builtins import object
+
+import bisect
+import json
+import threading
+import time
+
+try:
+    clock = time.perf_counter
+except AttributeError:
+    clock = time.time
+
+# upper bounds of the decode time histogram buckets, in seconds
+DECODE_BUCKETS = [1.0e-6, 2.0e-6, 5.0e-6, 1.0e-5, 2.0e-5, 5.0e-5, 1.0e-4, 2.0e-4, 5.0e-4,
+                  1.0e-3, 2.0e-3, 5.0e-3, 1.0e-2, 1.0e-1]
+
+# receive errors by the start of the BAD_DATA reason
+ERROR_KINDS = [
+    ('Bad prefix', 'prefix'),
+    ('invalid MAVLink prefix', 'prefix'),
+    ('invalid MAVLink CRC', 'crc'),
+    ('Unable to unpack MAVLink CRC', 'crc'),
+    ('Invalid signature', 'signature'),
+    ('unknown MAVLink message ID', 'unknown_msgid'),
+    ('invalid MAVLink message length', 'length'),
+    ('Bad message of type', 'length'),
+    ('invalid incompat_flags', 'incompat_flags'),
+]
+
+# index of the fields in each per message counter list
+COUNT = 0
+BYTES = 1
+DECODE_TIME = 2
+WINDOW_START = 3
+WINDOW_COUNT = 4
+RATE = 5
+TYPE = 6
+
+
+def error_kind(reason):
+    '''the kind of receive error from a BAD_DATA reason'''
+    for (prefix, kind) in ERROR_KINDS:
+        if reason.startswith(prefix):
+            return kind
+    return 'other'
+
+
+def _error_source(data):
+    '''(sysid, compid) from the header of a bad frame, or None'''
+    data = bytearray(data)
+    if len(data) >= 6 and data[0] == 0xFE:
+        return (data[3], data[4])
+    if len(data) >= 10 and data[0] == 0xFD:
+        return (data[5], data[6])
+    return None
+
+
+class LinkStats(object):
+    '''receive statistics for one link. Message rates are measured over
+    windows of rate_window seconds'''
+    def __init__(self, rate_window=5.0):
+        self.rate_window = rate_window
+        self.reset()
+
+    def reset(self):
+        '''forget all statistics'''
+        self.start_time = time.time()
+        self.messages = {}
+        self.errors = {}
+        self.error_sources = {}
+        self.buckets = [0] * (len(DECODE_BUCKETS) + 1)
+        self.decode_count = 0
+        self.decode_sum = 0.0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+
+    def record(self, msg, decode_time=None, queue_depth=None):
+        '''count a received message (or BAD_DATA), which took decode_time
+        seconds to parse, leaving queue_depth bytes in the parser'''
+        if decode_time is not None:
+            self.buckets[bisect.bisect_left(DECODE_BUCKETS, decode_time)] += 1
+            self.decode_count += 1
+            self.decode_sum += decode_time
+        if queue_depth is not None:
+            self.queue_depth = queue_depth
+            if queue_depth > self.max_queue_depth:
+                self.max_queue_depth = queue_depth
+        if msg._type == 'BAD_DATA':
+            self.record_error(msg)
+            return
+        hdr = msg._header
+        key = (hdr.srcSystem, hdr.srcComponent, hdr.msgId)
+        now = clock()
+        c = self.messages.get(key, None)
+        if c is None:
+            c = [0, 0, 0.0, now, 0, 0.0, msg.get_type()]
+            self.messages[key] = c
+        c[COUNT] += 1
+        c[BYTES] += len(msg.get_msgbuf())
+        if decode_time is not None:
+            c[DECODE_TIME] += decode_time
+        c[WINDOW_COUNT] += 1
+        dt = now - c[WINDOW_START]
+        if dt >= self.rate_window:
+            c[RATE] = c[WINDOW_COUNT] / dt
+            c[WINDOW_START] = now
+            c[WINDOW_COUNT] = 0
+
+    def record_error(self, msg):
+        '''count a BAD_DATA message'''
+        kind = error_kind(getattr(msg, 'reason', ''))
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+        src = _error_source(getattr(msg, 'data', b''))
+        if src is not None and kind in ['crc', 'signature', 'length']:
+            key = (src[0], src[1], kind)
+            self.error_sources[key] = self.error_sources.get(key, 0) + 1
+
+    def snapshot(self):
+        '''the statistics as a dict of plain values'''
+        now = clock()
+        messages = []
+        for (key, c) in list(self.messages.items()):
+            rate = c[RATE]
+            dt = now - c[WINDOW_START]
+            if rate == 0 and dt > 0 and c[COUNT] > 1:
+                # no complete window yet
+                rate = c[WINDOW_COUNT] / dt
+            elif dt >= 2 * self.rate_window:
+                # the source has gone quiet
+                rate = c[WINDOW_COUNT] / dt
+            messages.append({
+                'sysid' : key[0],
+                'compid' : key[1],
+                'msgid' : key[2],
+                'type' : c[TYPE],
+                'count' : c[COUNT],
+                'bytes' : c[BYTES],
+                'rate' : rate,
+                'decode_seconds' : c[DECODE_TIME],
+            })
+        messages.sort(key=lambda m: (m['sysid'], m['compid'], m['msgid']))
+        error_sources = [{'sysid' : k[0], 'compid' : k[1], 'kind' : k[2], 'count' : n}
+                         for (k, n) in sorted(list(self.error_sources.items()))]
+        cumulative = []
+        total = 0
+        for (bound, n) in zip(DECODE_BUCKETS + [None], self.buckets):
+            total += n
+            cumulative.append((bound, total))
+        return {
+            'start_time' : self.start_time,
+            'uptime' : time.time() - self.start_time,
+            'messages' : messages,
+            'received' : sum([m['count'] for m in messages]),
+            'received_bytes' : sum([m['bytes'] for m in messages]),
+            'errors' : dict(self.errors),
+            'error_sources' : error_sources,
+            'decode' : {
+                'count' : self.decode_count,
+                'sum' : self.decode_sum,
+                'buckets' : cumulative,
+            },
+            'queue_depth' : self.queue_depth,
+            'max_queue_depth' : self.max_queue_depth,
+        }
+
+
+def link_snapshot(link):
+    '''snapshot of a mavfile with stats enabled, adding its send totals,
+    signing counts and packet loss to those of its LinkStats'''
+    snap = link.stats.snapshot()
+    mav = link.mav
+    snap['sent'] = mav.total_packets_sent
+    snap['sent_bytes'] = mav.total_bytes_sent
+    snap['packet_loss'] = link.packet_loss()
+    signing = mav.signing
+    snap['signing'] = {
+        'good' : signing.goodsig_count,
+        'bad' : signing.badsig_count,
+        'unsigned' : signing.unsigned_count,
+        'rejected' : signing.reject_count,
+    }
+    return snap
+
+
+def snapshot(links):
+    '''snapshots of a dict of named links, either mavfiles with stats
+    enabled or LinkStats objects'''
+    ret = {}
+    for (name, link) in list(links.items()):
+        if isinstance(link, LinkStats):
+            ret[name] = link.snapshot()
+        elif getattr(link, 'stats', None) is not None:
+            ret[name] = link_snapshot(link)
+    return ret
+
+
+def to_json(snapshots):
+    '''snapshots from snapshot() as JSON text'''
+    return json.dumps(snapshots, indent=1, sort_keys=True)
+
+
+def _label_value(v):
+    return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(['%s="%s"' % (k, _label_value(labels[k])) for k in sorted(labels.keys())]) + '}'
+
+
+def to_prometheus(snapshots, prefix='mavlink'):
+    '''snapshots from snapshot() in the Prometheus text format'''
+    lines = []
+    def metric(name, kind, help, samples):
+        lines.append('# HELP %s_%s %s' % (prefix, name, help))
+        lines.append('# TYPE %s_%s %s' % (prefix, name, kind))
+        for (suffix, labels, value) in samples:
+            lines.append('%s_%s%s%s %s' % (prefix, name, suffix, labels, repr(float(value))))
+
+    def per_message(field):
+        ret = []
+        for (link, snap) in sorted(snapshots.items()):
+            for m in snap['messages']:
+                ret.append(('', _labels(link=link, sysid=m['sysid'], compid=m['compid'],
+                                        msgid=m['msgid'], type=m['type']), m[field]))
+        return ret
+
+    def per_link(field):
+        return [('', _labels(link=link), snap[field])
+                for (link, snap) in sorted(snapshots.items()) if field in snap]
+
+    metric('messages_received_total', 'counter', 'Messages received', per_message('count'))
+    metric('bytes_received_total', 'counter', 'Bytes received in messages', per_message('bytes'))
+    metric('message_rate', 'gauge', 'Messages received per second', per_message('rate'))
+    metric('decode_seconds_total', 'counter', 'Time spent parsing and decoding', per_message('decode_seconds'))
+    errors = []
+    for (link, snap) in sorted(snapshots.items()):
+        for (kind, n) in sorted(snap['errors'].items()):
+            errors.append(('', _labels(link=link, kind=kind), n))
+    metric('receive_errors_total', 'counter', 'Receive errors by kind', errors)
+    sources = []
+    for (link, snap) in sorted(snapshots.items()):
+        for e in snap['error_sources']:
+            sources.append(('', _labels(link=link, sysid=e['sysid'], compid=e['compid'], kind=e['kind']), e['count']))
+    metric('source_errors_total', 'counter', 'Receive errors by source', sources)
+    decode = []
+    for (link, snap) in sorted(snapshots.items()):
+        for (bound, n) in snap['decode']['buckets']:
+            le = '+Inf' if bound is None else repr(bound)
+            decode.append(('_bucket', _labels(link=link, le=le), n))
+        decode.append(('_sum', _labels(link=link), snap['decode']['sum']))
+        decode.append(('_count', _labels(link=link), snap['decode']['count']))
+    metric('decode_seconds', 'histogram', 'Time to parse and decode each message', decode)
+    metric('parser_queue_bytes', 'gauge', 'Bytes waiting in the parser', per_link('queue_depth'))
+    metric('parser_queue_bytes_max', 'gauge', 'Most bytes seen waiting in the parser', per_link('max_queue_depth'))
+    metric('messages_sent_total', 'counter', 'Messages sent', per_link('sent'))
+    metric('bytes_sent_total', 'counter', 'Bytes sent', per_link('sent_bytes'))
+    metric('packet_loss_percent', 'gauge', 'Packet loss from sequence numbers', per_link('packet_loss'))
+    signing = []
+    for (link, snap) in sorted(snapshots.items()):
+        for (result, n) in sorted(snap.get('signing', {}).items()):
+            signing.append(('', _labels(link=link, result=result), n))
+    metric('signatures_total', 'counter', 'Signature checks by result', signing)
+    return '\n'.join(lines) + '\n'
+
+
+class StatsServer(object):
+    '''serve the statistics of a dict of named links (see snapshot())
+    over HTTP in a background thread, in the Prometheus text format on
+    /metrics and as JSON on /stats.json. Port 0 picks a free port'''
+    def __init__(self, links, host='127.0.0.1', port=0):
+        try:
+            from http.server import HTTPServer, BaseHTTPRequestHandler
+        except ImportError:
+            from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+        self.links = links
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?')[0]
+                if path == '/metrics':
+                    body = to_prometheus(snapshot(server.links))
+                    ctype = 'text/plain; version=0.0.4'
+                elif path in ['/stats.json', '/']:
+                    body = to_json(snapshot(server.links))
+                    ctype = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                body = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', ctype)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = HTTPServer((host, port), Handler)
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='StatsServer')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join()
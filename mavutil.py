@@ -13,6 +13,10 @@ import select
 import copy
 import re
 from pymavlink import mavexpression
+from pymavlink import mavextra
+from pymavlink import mavseq
+from pymavlink import mavstats
+from pymavlink import tlogwriter
 
 # adding these extra imports allows pymavlink to be used directly with pyinstaller
 # without having complex spec files. To allow for installs that don't have ardupilotmega
@@ -117,13 +121,14 @@ def set_dialect(dialect):
     try:
         mod = __import__(modname)
     except Exception:
-        # auto-generate the dialect module
-        from .generator.mavgen import mavgen_python_dialect
-        mavgen_python_dialect(dialect, wire_protocol)
-        mod = __import__(modname)
-    components = modname.split('.')
-    for comp in components[1:]:
-        mod = getattr(mod, comp)
+        # auto-generate the dialect module, once per machine
+        from .generator import mavcache
+        mod = mavcache.import_dialect(dialect, wire_protocol, modname)
+        if mod is None:
+            from .generator.mavgen import mavgen_python_dialect
+            mavgen_python_dialect(dialect, wire_protocol)
+            mod = __import__(modname)
+    mod = sys.modules[modname]
     current_dialect = dialect
     mavlink = mod
 
@@ -132,8 +137,9 @@ set_dialect(os.environ['MAVLINK_DIALECT'])
 
 class mavfile_state(object):
     '''state for a particular system id'''
-    def __init__(self):
+    def __init__(self, mav=None):
         self.messages = { 'MAV' : self }
+        self.filter_state = mavextra.FilterState(mav)
         self.flightmode = "UNKNOWN"
         self.vehicle_type = "UNKNOWN"
         self.mav_type = mavlink.MAV_TYPE_FIXED_WING
@@ -163,13 +169,14 @@ class mavfile(object):
         self.address = address
         self.timestamp = 0
         self.last_seq = {}
+        self.seq_tracker = mavseq.SequenceTracker()
         self.mav_loss = 0
         self.mav_count = 0
         self.param_fetch_start = 0
 
         # state for each sysid
         self.sysid_state = {}
-        self.sysid_state[self.sysid] = mavfile_state()
+        self.sysid_state[self.sysid] = mavfile_state(self)
 
         # param state for each sysid/compid tuple
         self.param_state = {}
@@ -193,6 +200,7 @@ class mavfile(object):
         self.WIRE_PROTOCOL_VERSION = mavlink.WIRE_PROTOCOL_VERSION
         self.stop_on_EOF = False
         self.portdead = False
+        self.stats = None
 
     @property
     def target_system(self):
@@ -206,7 +214,7 @@ class mavfile(object):
     def target_system(self, value):
         self.sysid = value
         if not self.sysid in self.sysid_state:
-            self.sysid_state[self.sysid] = mavfile_state()
+            self.sysid_state[self.sysid] = mavfile_state(self)
         if self.sysid != self.param_sysid[0]:
             self.param_sysid = (self.sysid, self.param_sysid[1])
             if not self.param_sysid in self.param_state:
@@ -368,7 +376,7 @@ class mavfile(object):
 
         if not src_system in self.sysid_state:
             # we've seen a new system
-            self.sysid_state[src_system] = mavfile_state()
+            self.sysid_state[src_system] = mavfile_state(self)
 
         add_message(self.sysid_state[src_system].messages, type, msg)
 
@@ -378,16 +386,10 @@ class mavfile(object):
                 self.sysid_state[s].messages[type] = msg
 
         if not (src_tuple == radio_tuple or msg.get_type() == 'BAD_DATA'):
-            if not src_tuple in self.last_seq:
-                last_seq = -1
-            else:
-                last_seq = self.last_seq[src_tuple]
-            seq = (last_seq+1) % 256
             seq2 = msg.get_seq()
-            if seq != seq2 and last_seq != -1:
-                diff = (seq2 - seq) % 256
-                self.mav_loss += diff
-                #print("lost %u seq=%u seq2=%u last_seq=%u src_tupe=%s %s" % (diff, seq, seq2, last_seq, str(src_tuple), msg.get_type()))
+            # reordered and duplicated frames are not counted as lost
+            (lost, seq_kind) = self.seq_tracker.update(src_tuple, seq2, msg._timestamp)
+            self.mav_loss += lost
             self.last_seq[src_tuple] = seq2
             self.mav_count += 1
         
@@ -426,13 +428,27 @@ class mavfile(object):
             self.mav.signing.link_id = msg.get_link_id()
 
 
-    def packet_loss(self):
-        '''packet loss as a percentage'''
+    def packet_loss(self, period=None):
+        '''packet loss as a percentage, over the last period seconds if
+        given. Use seq_tracker for loss, duplication and reordering by
+        source'''
+        if period is not None:
+            return self.seq_tracker.loss_percent(period)
         if self.mav_count == 0:
             return 0
         return (100.0*self.mav_loss)/(self.mav_count+self.mav_loss)
 
 
+    def _parse_char(self, s):
+        '''parse received bytes, keeping statistics if enabled'''
+        if self.stats is None:
+            return self.mav.parse_char(s)
+        t0 = mavstats.clock()
+        msg = self.mav.parse_char(s)
+        if msg is not None:
+            self.stats.record(msg, mavstats.clock() - t0, self.mav.buf_len())
+        return msg
+
     def recv_msg(self):
         '''message receive routine'''
         self.pre_message()
@@ -443,17 +459,20 @@ class mavfile(object):
 
             if numnew != 0:
                 if self.logfile_raw:
-                    self.logfile_raw.write(str(s))
+                    self.logfile_raw.write(s)
                 if self.first_byte:
                     self.auto_mavlink_version(s)
 
             # We always call parse_char even if the new string is empty, because the existing message buf might already have some valid packet
             # we can extract
-            msg = self.mav.parse_char(s)
+            msg = self._parse_char(s)
             if msg:
                 if self.logfile and  msg.get_type() != 'BAD_DATA' :
                     usec = int(time.time() * 1.0e6) & ~3
-                    self.logfile.write(str(struct.pack('>Q', usec) + msg.get_msgbuf()))
+                    if isinstance(self.logfile, tlogwriter.TlogWriter):
+                        self.logfile.write_message(msg.get_msgbuf(), usec)
+                    else:
+                        self.logfile.write(struct.pack('>Q', usec) + msg.get_msgbuf())
                 self.post_message(msg)
                 return msg
             else:
@@ -504,13 +523,36 @@ class mavfile(object):
         '''return True if using MAVLink 2.0 or later'''
         return float(self.WIRE_PROTOCOL_VERSION) >= 2
 
-    def setup_logfile(self, logfile, mode='w'):
-        '''start logging to the given logfile, with timestamps'''
-        self.logfile = open(logfile, mode=mode)
+    def setup_logfile(self, logfile, mode='w', **kwargs):
+        '''start logging to the given logfile, with timestamps. Extra
+        arguments are passed to TlogWriter for buffering, rotation and
+        compression'''
+        if isinstance(self.logfile, tlogwriter.TlogWriter):
+            self.logfile.close()
+        self.logfile = tlogwriter.TlogWriter(logfile, mode=mode, **kwargs)
+
+    def enable_stats(self, rate_window=5.0):
+        '''keep per source and message receive statistics in a
+        mavstats.LinkStats, returning it'''
+        if self.stats is None:
+            self.stats = mavstats.LinkStats(rate_window=rate_window)
+        return self.stats
+
+    def disable_stats(self):
+        '''stop keeping receive statistics'''
+        self.stats = None
+
+    def stats_snapshot(self):
+        '''receive statistics since enable_stats() as a dict, or None'''
+        if self.stats is None:
+            return None
+        return mavstats.link_snapshot(self)
 
-    def setup_logfile_raw(self, logfile, mode='w'):
+    def setup_logfile_raw(self, logfile, mode='w', **kwargs):
         '''start logging raw bytes to the given logfile, without timestamps'''
-        self.logfile_raw = open(logfile, mode=mode)
+        if isinstance(self.logfile_raw, tlogwriter.TlogWriter):
+            self.logfile_raw.close()
+        self.logfile_raw = tlogwriter.TlogWriter(logfile, mode=mode, **kwargs)
 
     def wait_heartbeat(self, blocking=True, timeout=None):
         '''wait for a heartbeat so we know the target system IDs'''
@@ -1067,7 +1109,7 @@ class mavudp(mavfile):
             if self.first_byte:
                 self.auto_mavlink_version(s)
 
-        m = self.mav.parse_char(s)
+        m = self._parse_char(s)
         if m is not None:
             self.post_message(m)
 
@@ -1143,7 +1185,7 @@ class mavmcast(mavfile):
             if self.first_byte:
                 self.auto_mavlink_version(s)
 
-        m = self.mav.parse_char(s)
+        m = self._parse_char(s)
         if m is not None:
             self.post_message(m)
 
@@ -1406,8 +1448,17 @@ class mavmmaplog(mavlogfile):
     '''a MAVLink log file accessed via mmap. Used for fast read-only
     access with low memory overhead where particular message types are wanted'''
     def __init__(self, filename, progress_callback=None):
-        import platform, mmap
         mavlogfile.__init__(self, filename)
+        self._open_data()
+        self._rewind()
+        self.init_arrays(progress_callback)
+        self._flightmodes = None
+        # the first message of each type was read while indexing
+        self._reset_sequences()
+
+    def _open_data(self):
+        '''map the log into memory, setting data_map and data_len'''
+        import platform, mmap
         self.f.seek(0, 2)
         self.data_len = self.f.tell()
         self.f.seek(0)
@@ -1415,9 +1466,6 @@ class mavmmaplog(mavlogfile):
             self.data_map = mmap.mmap(self.f.fileno(), self.data_len, None, mmap.ACCESS_READ)
         else:
             self.data_map = mmap.mmap(self.f.fileno(), self.data_len, mmap.MAP_PRIVATE, mmap.PROT_READ)
-        self._rewind()
-        self.init_arrays(progress_callback)
-        self._flightmodes = None
 
     def _rewind(self):
         '''rewind to start of log'''
@@ -1425,11 +1473,22 @@ class mavmmaplog(mavlogfile):
         self.offset = 0
         self.type_nums = None
         self.f.seek(0)
+        for s in self.sysid_state.values():
+            s.filter_state.reset()
 
     def rewind(self):
         '''rewind to start of log'''
         self._rewind()
-        
+        self._reset_sequences()
+
+    def _reset_sequences(self):
+        '''forget the sequence numbers seen, so messages read again are
+        not counted as duplicated or lost'''
+        self.last_seq = {}
+        self.seq_tracker = mavseq.SequenceTracker()
+        self.mav_loss = 0
+        self.mav_count = 0
+
     def init_arrays(self, progress_callback=None):
         '''initialise arrays for fast recv_match()'''
 
@@ -1668,6 +1727,23 @@ def mavlink_connection(device, baud=115200, source_system=255, source_component=
     if device.startswith('mcast:'):
         return mavmcast(device[6:], source_system=source_system, source_component=source_component, use_native=use_native)
 
+    if device.lower().endswith('.gz') and os.path.isfile(device):
+        # block compressed logs, as written by mavcompress.py
+        from pymavlink import seekablelog
+        if seekablelog.is_block_compressed(device):
+            m = seekablelog.open_log(device, zero_time_base=zero_time_base,
+                                     progress_callback=progress_callback)
+            mavfile_global = m
+            return m
+
+    if device.lower().endswith(('.pcap', '.pcapng', '.cap')) and os.path.isfile(device):
+        # network captures
+        from pymavlink import mavpcap
+        if mavpcap.is_capture(device):
+            m = mavpcap.mavpcaplog(device, progress_callback=progress_callback)
+            mavfile_global = m
+            return m
+
     if device.lower().endswith('.bin') or device.lower().endswith('.px4log'):
         # support dataflash logs
         from pymavlink import DFReader
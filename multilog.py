@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+'''
+run a per-log function over many log files using a pool of processes
+
+Each log is handled by func(filename, *extra) in a worker process,
+with anything it prints captured and passed back along with its
+return value, so output from different logs is never interleaved and
+an exception in one log doesn't stop the others.
+
+Released under GNU GPL version 3 or later
+'''
+from __future__ import print_function
+from builtins import object
+
+import glob
+import multiprocessing
+import sys
+import time
+import traceback
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+class LogResult(object):
+    '''the outcome of running a function on one log'''
+    def __init__(self, index, filename):
+        self.index = index
+        self.filename = filename
+        self.result = None
+        self.output = ''
+        self.error = None
+        self.elapsed = 0.0
+
+    def ok(self):
+        return self.error is None
+
+
+def _run_one(job):
+    '''run one job, in a worker process or inline'''
+    (index, filename, func, extra, capture) = job
+    r = LogResult(index, filename)
+    t0 = time.time()
+    if capture:
+        old_stdout = sys.stdout
+        sys.stdout = StringIO()
+    try:
+        r.result = func(filename, *extra)
+    except Exception:
+        r.error = traceback.format_exc()
+    finally:
+        if capture:
+            r.output = sys.stdout.getvalue()
+            sys.stdout = old_stdout
+    r.elapsed = time.time() - t0
+    return r
+
+
+def expand_globs(patterns):
+    '''expand any wildcards in a list of log names, keeping names
+    which match nothing so they are reported as errors'''
+    ret = []
+    for p in patterns:
+        matches = sorted(glob.glob(p))
+        if len(matches) == 0:
+            ret.append(p)
+        else:
+            ret.extend(matches)
+    return ret
+
+
+def default_workers():
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+def process_logs(func, filenames, workers=None, ordered=True, progress=False, extra=()):
+    '''yield a LogResult for each of filenames, calling
+    func(filename, *extra) in up to workers processes (default one
+    per CPU). With ordered results come back in the order of
+    filenames, otherwise as each log completes. func must be a module
+    level function so it can be passed to the workers. With one
+    worker logs are processed in this process without capturing
+    output'''
+    filenames = list(filenames)
+    if workers is None or workers <= 0:
+        workers = default_workers()
+    workers = max(1, min(workers, len(filenames)))
+    capture = workers > 1
+    jobs = [(i, filenames[i], func, tuple(extra), capture) for i in range(len(filenames))]
+    pool = None
+    if workers == 1:
+        results = (_run_one(j) for j in jobs)
+    else:
+        pool = multiprocessing.Pool(workers)
+        if ordered:
+            results = pool.imap(_run_one, jobs, 1)
+        else:
+            results = pool.imap_unordered(_run_one, jobs, 1)
+    count = 0
+    try:
+        for r in results:
+            count += 1
+            if progress:
+                sys.stderr.write("[%u/%u] %s %.1fs%s\n" % (count, len(jobs), r.filename, r.elapsed,
+                                                           "" if r.ok() else " FAILED"))
+            yield r
+        if pool is not None:
+            pool.close()
+            pool.join()
+            pool = None
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+def add_arguments(parser):
+    '''add the standard multi-log options to an ArgumentParser'''
+    parser.add_argument("--workers", type=int, default=0,
+                        help="number of logs to process in parallel (default one per CPU)")
+    parser.add_argument("--unordered", action='store_true',
+                        help="show results as each log completes rather than in argument order")
+    parser.add_argument("--progress", action='store_true', help="show progress on stderr")
+
+
+def run_logs(func, filenames, args, extra=()):
+    '''process logs with the options from add_arguments, printing
+    the output of each log and any errors, and yielding the
+    LogResult for each log'''
+    for r in process_logs(func, filenames, workers=args.workers, ordered=not args.unordered,
+                          progress=args.progress, extra=extra):
+        if r.output:
+            sys.stdout.write(r.output)
+        if not r.ok():
+            sys.stderr.write("Error processing %s:\n%s" % (r.filename, r.error))
+        sys.stdout.flush()
+        yield r
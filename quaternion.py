@@ -9,7 +9,7 @@ from __future__ import absolute_import, division, print_function
 
 from builtins import object
 import numpy as np
-from .rotmat import Vector3, Matrix3
+from .rotmat import Vector3, Matrix3, Vector3Array, Matrix3Array
 
 __author__ = "Thomas Gubler"
 __copyright__ = "Copyright (C) 2014 Thomas Gubler"
@@ -627,6 +627,334 @@ class Quaternion(QuaternionBase):
         """
         return Quaternion(super(Quaternion, self).__truediv__(other))
 
+class QuaternionArray(object):
+
+    """
+    An array of quaternions, stored as an Nx4 numpy array. This gives
+    the same results as applying the QuaternionBase operations to each
+    element, but without a Python loop
+
+    Usage:
+        >>> from quaternion import QuaternionArray
+        >>> import numpy as np
+        >>> q = QuaternionArray(np.radians([[20, 20, 20], [0, 0, 90]]))
+        >>> print(q.euler)
+        [[0.34906585 0.34906585 0.34906585]
+         [0.         0.         1.57079633]]
+    """
+
+    def __init__(self, attitude):
+        """
+        Construct quaternions from attitudes
+
+        :param attitude: another QuaternionArray, a list of QuaternionBase,
+            Nx3 array of [roll, pitch, yaw], Nx4 array of [w, x, y ,z],
+            Nx3x3 array of DCMs or a Matrix3Array
+        """
+        if isinstance(attitude, QuaternionArray):
+            self.q = attitude.q
+            return
+        if isinstance(attitude, Matrix3Array):
+            self.dcm = attitude.m
+            return
+        if len(attitude) > 0 and isinstance(attitude[0], QuaternionBase):
+            self.q = [a.q for a in attitude]
+            return
+        shape = np.shape(attitude)
+        if len(shape) == 3 and shape[1:] == (3, 3):
+            self.dcm = attitude
+        elif len(shape) == 2 and shape[1] == 4:
+            self.q = attitude
+        elif len(shape) == 2 and shape[1] == 3:
+            self.euler = attitude
+        else:
+            raise TypeError("attitude is not valid")
+
+    def __len__(self):
+        return len(self.q)
+
+    def __getitem__(self, index):
+        """Returns a Quaternion for an integer index, or a QuaternionArray"""
+        if isinstance(index, (int, np.integer)):
+            return Quaternion(self.q[index])
+        return QuaternionArray(self.q[index])
+
+    @property
+    def q(self):
+        """
+        Get the quaternions
+        :returns: Nx4 array of quaternion elements
+        """
+        if self._q is None:
+            if self._euler is not None:
+                self._q = self._euler_to_q(self._euler)
+            elif self._dcm is not None:
+                self._q = self._dcm_to_q(self._dcm)
+        return self._q
+
+    @q.setter
+    def q(self, q):
+        """
+        Set the quaternions
+        :param q: Nx4 array of quaternion values [w, x, y, z]
+        """
+        self._q = np.array(q, dtype=float).reshape(-1, 4)
+        self._euler = None
+        self._dcm = None
+
+    @property
+    def euler(self):
+        """
+        Get the euler angles.
+        The convention is Tait-Bryan (ZY'X'')
+
+        :returns: Nx3 array of euler angles [roll, pitch, yaw]
+        """
+        if self._euler is None:
+            self._euler = self._dcm_to_euler(self.dcm)
+        return self._euler
+
+    @euler.setter
+    def euler(self, euler):
+        """
+        Set the euler angles
+        :param euler: Nx3 array of the euler angles [roll, pitch, yaw]
+        """
+        self._euler = np.array(euler, dtype=float).reshape(-1, 3)
+        self._q = None
+        self._dcm = None
+
+    @property
+    def dcm(self):
+        """
+        Get the DCMs
+
+        :returns: Nx3x3 array
+        """
+        if self._dcm is None:
+            if self._q is not None:
+                self._dcm = self._q_to_dcm(self._q)
+            elif self._euler is not None:
+                self._dcm = self._euler_to_dcm(self._euler)
+        return self._dcm
+
+    @dcm.setter
+    def dcm(self, dcm):
+        """
+        Set the DCMs
+        :param dcm: Nx3x3 array
+        """
+        self._dcm = np.array(dcm, dtype=float).reshape(-1, 3, 3)
+        self._q = None
+        self._euler = None
+
+    def to_matrix3_array(self):
+        """
+        Get the DCMs as a Matrix3Array
+        """
+        return Matrix3Array(self.dcm)
+
+    def transform(self, v):
+        """
+        Calculates the vectors transformed by these quaternions
+        :param v: Nx3 array, 3 element vector, Vector3 or Vector3Array
+        :returns: transformed vectors, as a Vector3Array if a Vector3 or
+            Vector3Array was passed, otherwise as an Nx3 array
+        """
+        if isinstance(v, Vector3Array):
+            return Vector3Array(self.transform(v.v))
+        if isinstance(v, Vector3):
+            return Vector3Array(self.transform([v.x, v.y, v.z]))
+        assert(np.allclose(self.norm, 1))
+        q0 = self.q[:, 0:1]
+        qi = self.q[:, 1:4]
+        ui = np.asarray(v, dtype=float)
+        a = q0 * ui + np.cross(qi, ui)
+        t = np.sum(qi * ui, axis=-1)[:, np.newaxis] * qi + q0 * a - np.cross(a, qi)
+        return t
+
+    @property
+    def norm(self):
+        """
+        Returns norms of the quaternions
+
+        :returns: array of norms
+        """
+        return np.sqrt(np.sum(self.q**2, axis=1))
+
+    def normalize(self):
+        """Normalizes the quaternions"""
+        self.q = self.q / self.norm[:, np.newaxis]
+
+    @property
+    def inversed(self):
+        """
+        Get inversed quaternions
+
+        :returns: QuaternionArray
+        """
+        return QuaternionArray(self.q * np.array([1, -1, -1, -1]))
+
+    def close(self, other):
+        """
+        Equality test with tolerance
+        (same orientation, not necessarily same rotation)
+
+        :param other: a QuaternionArray
+        :returns: array of bool, true where the quaternions are almost equal
+        """
+        o = other.q if isinstance(other, (QuaternionArray, QuaternionBase)) else np.asarray(other)
+        return (np.all(np.isclose(self.q, o), axis=-1) |
+                np.all(np.isclose(self.q, -o), axis=-1))
+
+    def __mul__(self, other):
+        """
+        :param other: QuaternionArray, QuaternionBase or 4 element array
+        :returns: element by element multiplication of these quaternions
+            with other
+        """
+        if isinstance(other, (QuaternionArray, QuaternionBase)):
+            o = other.q
+        else:
+            o = np.asarray(other, dtype=float)
+        return QuaternionArray(self._mul_array(self.q, o))
+
+    def __truediv__(self, other):
+        """
+        :param other: QuaternionArray or QuaternionBase
+        :returns: division of these quaternions by other
+        """
+        if isinstance(other, QuaternionBase):
+            return self * other.inversed
+        if not isinstance(other, QuaternionArray):
+            other = QuaternionArray(other)
+        return self * other.inversed
+
+    __div__ = __truediv__
+
+    @staticmethod
+    def _mul_array(p, q):
+        """
+        Performs multiplication of the quaternion arrays p and q
+        """
+        (p, q) = np.broadcast_arrays(np.atleast_2d(p), np.atleast_2d(q))
+        p0 = p[:, 0:1]
+        pi = p[:, 1:4]
+        q0 = q[:, 0:1]
+        qi = q[:, 1:4]
+        res = np.empty(p.shape)
+        res[:, 0] = p0[:, 0] * q0[:, 0] - np.sum(pi * qi, axis=1)
+        res[:, 1:4] = p0 * qi + q0 * pi + np.cross(pi, qi)
+        return res
+
+    @staticmethod
+    def _euler_to_q(euler):
+        """
+        Create q arrays from euler angles
+        """
+        c = np.cos(euler / 2)
+        s = np.sin(euler / 2)
+        (c_phi_2, c_theta_2, c_psi_2) = (c[:, 0], c[:, 1], c[:, 2])
+        (s_phi_2, s_theta_2, s_psi_2) = (s[:, 0], s[:, 1], s[:, 2])
+        q = np.empty((len(euler), 4))
+        q[:, 0] = (c_phi_2 * c_theta_2 * c_psi_2 +
+                   s_phi_2 * s_theta_2 * s_psi_2)
+        q[:, 1] = (s_phi_2 * c_theta_2 * c_psi_2 -
+                   c_phi_2 * s_theta_2 * s_psi_2)
+        q[:, 2] = (c_phi_2 * s_theta_2 * c_psi_2 +
+                   s_phi_2 * c_theta_2 * s_psi_2)
+        q[:, 3] = (c_phi_2 * c_theta_2 * s_psi_2 -
+                   s_phi_2 * s_theta_2 * c_psi_2)
+        return q
+
+    @staticmethod
+    def _q_to_dcm(q):
+        """
+        Create DCMs from q arrays
+        """
+        assert(np.allclose(np.sqrt(np.sum(q**2, axis=1)), 1))
+        (a, b, c, d) = (q[:, 0], q[:, 1], q[:, 2], q[:, 3])
+        a_sq = a * a
+        b_sq = b * b
+        c_sq = c * c
+        d_sq = d * d
+        dcm = np.empty((len(q), 3, 3))
+        dcm[:, 0, 0] = a_sq + b_sq - c_sq - d_sq
+        dcm[:, 0, 1] = 2 * (b * c - a * d)
+        dcm[:, 0, 2] = 2 * (a * c + b * d)
+        dcm[:, 1, 0] = 2 * (b * c + a * d)
+        dcm[:, 1, 1] = a_sq - b_sq + c_sq - d_sq
+        dcm[:, 1, 2] = 2 * (c * d - a * b)
+        dcm[:, 2, 0] = 2 * (b * d - a * c)
+        dcm[:, 2, 1] = 2 * (a * b + c * d)
+        dcm[:, 2, 2] = a_sq - b_sq - c_sq + d_sq
+        return dcm
+
+    @staticmethod
+    def _dcm_to_q(dcm):
+        """
+        Create q arrays from DCMs, using the same branches as
+        QuaternionBase._dcm_to_q
+        """
+        n = len(dcm)
+        q = np.zeros((n, 4))
+        rows = np.arange(n)
+        tr = np.trace(dcm, axis1=1, axis2=2)
+        with np.errstate(all='ignore'):
+            pos = tr > 0
+            s = np.sqrt(tr[pos] + 1.0)
+            d = dcm[pos]
+            q[pos, 0] = s * 0.5
+            s = 0.5 / s
+            q[pos, 1] = (d[:, 2, 1] - d[:, 1, 2]) * s
+            q[pos, 2] = (d[:, 0, 2] - d[:, 2, 0]) * s
+            q[pos, 3] = (d[:, 1, 0] - d[:, 0, 1]) * s
+
+            neg = rows[~pos]
+            d = dcm[neg]
+            i = np.argmax(np.diagonal(d, axis1=1, axis2=2), axis=1)
+            j = (i + 1) % 3
+            k = (i + 2) % 3
+            r = np.arange(len(neg))
+            s = np.sqrt((d[r, i, i] - d[r, j, j] - d[r, k, k]) + 1.0)
+            q[neg, i + 1] = s * 0.5
+            s = 0.5 / s
+            q[neg, j + 1] = (d[r, i, j] + d[r, j, i]) * s
+            q[neg, k + 1] = (d[r, k, i] + d[r, i, k]) * s
+            q[neg, 0] = (d[r, k, j] - d[r, j, k]) * s
+        return q
+
+    @staticmethod
+    def _euler_to_dcm(euler):
+        """
+        Create DCMs from euler angle arrays
+        """
+        m = Matrix3Array()
+        m.from_euler(euler[:, 0], euler[:, 1], euler[:, 2])
+        return m.m
+
+    @staticmethod
+    def _dcm_to_euler(dcm):
+        """
+        Create euler angle arrays from DCMs
+        """
+        theta = np.arcsin(np.clip(-dcm[:, 2, 0], -1, 1))
+        phi = np.arctan2(dcm[:, 2, 1], dcm[:, 2, 2])
+        psi = np.arctan2(dcm[:, 1, 0], dcm[:, 0, 0])
+        # gimbal lock cases
+        up = np.abs(theta - np.pi/2) < 1.0e-3
+        down = np.abs(theta + np.pi/2) < 1.0e-3
+        lock = up | down
+        phi = np.where(lock, 0.0, phi)
+        psi = np.where(lock, np.arctan2(dcm[:, 1, 2] - dcm[:, 0, 1],
+                                        dcm[:, 0, 2] + dcm[:, 1, 1]), psi)
+        return np.column_stack((phi, theta, psi))
+
+    def __str__(self):
+        """String of quaternion values"""
+        return str(self.q)
+
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
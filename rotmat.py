@@ -26,6 +26,12 @@ from __future__ import print_function
 
 from math import sin, cos, sqrt, asin, atan2, pi, acos
 
+try:
+    # numpy is only needed for the Vector3Array and Matrix3Array classes
+    import numpy as np
+except ImportError:
+    pass
+
 
 class Vector3(object):
     '''a vector'''
@@ -385,6 +391,381 @@ class Matrix3(object):
     def close(self, m, tol=1e-7):
         return self.a.close(m.a, tol) and self.b.close(m.b, tol) and self.c.close(m.c, tol)
 
+class Vector3Array(object):
+    '''an array of vectors, stored as an Nx3 numpy array. This gives
+    the same results as applying the Vector3 operations to each
+    element'''
+    def __init__(self, v=None):
+        if v is None:
+            v = np.zeros((0, 3))
+        elif isinstance(v, Vector3Array):
+            v = v.v
+        elif len(v) > 0 and isinstance(v[0], Vector3):
+            v = [(e.x, e.y, e.z) for e in v]
+        self.v = np.array(v, dtype=float).reshape(-1, 3)
+
+    @classmethod
+    def from_xyz(cls, x, y, z):
+        '''create from separate arrays of x, y and z'''
+        return cls(np.column_stack(np.broadcast_arrays(x, y, z)))
+
+    def __repr__(self):
+        return 'Vector3Array(%u)' % len(self)
+
+    def __len__(self):
+        return len(self.v)
+
+    def __getitem__(self, i):
+        if isinstance(i, (int, np.integer)):
+            return Vector3(self.v[i])
+        return Vector3Array(self.v[i])
+
+    def __iter__(self):
+        for r in self.v:
+            yield Vector3(r)
+
+    @property
+    def x(self):
+        return self.v[:,0]
+
+    @property
+    def y(self):
+        return self.v[:,1]
+
+    @property
+    def z(self):
+        return self.v[:,2]
+
+    def to_list(self):
+        '''return a list of Vector3'''
+        return list(self)
+
+    def __eq__(self, v):
+        return np.array_equal(self.v, _vector_array(v))
+
+    def __ne__(self, v):
+        return not self == v
+
+    def close(self, v, tol=1e-7):
+        return bool(np.all(np.abs(self.v - _vector_array(v)) < tol))
+
+    def __add__(self, v):
+        return Vector3Array(self.v + _vector_array(v))
+
+    __radd__ = __add__
+
+    def __sub__(self, v):
+        return Vector3Array(self.v - _vector_array(v))
+
+    def __neg__(self):
+        return Vector3Array(-self.v)
+
+    def __rsub__(self, v):
+        return Vector3Array(_vector_array(v) - self.v)
+
+    def __mul__(self, v):
+        if isinstance(v, (Vector3, Vector3Array)):
+            '''dot product'''
+            return np.sum(self.v * _vector_array(v), axis=-1)
+        return Vector3Array(self.v * _column(v))
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, v):
+        return Vector3Array(self.v / _column(v))
+
+    __div__ = __truediv__
+
+    def __floordiv__(self, v):
+        return Vector3Array(self.v // _column(v))
+
+    def __mod__(self, v):
+        '''cross product'''
+        return Vector3Array(np.cross(self.v, _vector_array(v)))
+
+    def __copy__(self):
+        return Vector3Array(self.v.copy())
+
+    copy = __copy__
+
+    def length(self):
+        return np.sqrt(np.sum(self.v**2, axis=-1))
+
+    def zero(self):
+        self.v[:] = 0
+
+    def angle(self, v):
+        '''return the angle between these vectors and other vectors'''
+        return np.arccos((self * v) / (self.length() * v.length()))
+
+    def normalized(self):
+        return self / self.length()
+
+    def normalize(self):
+        self.v = self.normalized().v
+
+    def rotate_by_id(self, rot_id):
+        '''rotate the vectors using a rotation enum ID, or an array of
+        IDs, one per vector'''
+        return Matrix3Array(rotation_matrices()[rot_id]) * self
+
+    def rotate_by_inverse_id(self, rot_id):
+        '''rotate the vectors using an inverse rotation enum ID, or an
+        array of IDs, one per vector'''
+        return Matrix3Array(rotation_matrices(inverse=True)[rot_id]) * self
+
+
+def _vector_array(v):
+    '''return an Nx3 (or 3 element) array for a Vector3 or Vector3Array'''
+    if isinstance(v, Vector3Array):
+        return v.v
+    if isinstance(v, Vector3):
+        return np.array([v.x, v.y, v.z])
+    return np.asarray(v, dtype=float)
+
+def _matrix_array(m):
+    '''return an Nx3x3 (or 3x3) array for a Matrix3 or Matrix3Array'''
+    if isinstance(m, Matrix3Array):
+        return m.m
+    if isinstance(m, Matrix3):
+        return np.array([[m.a.x, m.a.y, m.a.z],
+                         [m.b.x, m.b.y, m.b.z],
+                         [m.c.x, m.c.y, m.c.z]])
+    return np.asarray(m, dtype=float)
+
+def _column(v):
+    '''allow per-element scalars to broadcast against Nx3 arrays'''
+    v = np.asarray(v, dtype=float)
+    if v.ndim == 1:
+        return v[:,np.newaxis]
+    return v
+
+
+class Matrix3Array(object):
+    '''an array of 3x3 matrices, stored as an Nx3x3 numpy array. This
+    gives the same results as applying the Matrix3 operations to each
+    element'''
+    def __init__(self, m=None, n=None):
+        if m is None:
+            m = np.tile(np.eye(3), (n or 0, 1, 1))
+        elif isinstance(m, Matrix3Array):
+            m = m.m
+        elif len(m) > 0 and isinstance(m[0], Matrix3):
+            m = [_matrix_array(e) for e in m]
+        self.m = np.array(m, dtype=float).reshape(-1, 3, 3)
+
+    @classmethod
+    def from_rows(cls, a, b, c):
+        '''create from three Vector3Array rows'''
+        return cls(np.stack((_vector_array(a), _vector_array(b), _vector_array(c)), axis=1))
+
+    def __repr__(self):
+        return 'Matrix3Array(%u)' % len(self)
+
+    def __len__(self):
+        return len(self.m)
+
+    def __getitem__(self, i):
+        if isinstance(i, (int, np.integer)):
+            r = self.m[i]
+            return Matrix3(Vector3(r[0]), Vector3(r[1]), Vector3(r[2]))
+        return Matrix3Array(self.m[i])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def a(self):
+        return Vector3Array(self.m[:,0,:])
+
+    @property
+    def b(self):
+        return Vector3Array(self.m[:,1,:])
+
+    @property
+    def c(self):
+        return Vector3Array(self.m[:,2,:])
+
+    def to_list(self):
+        '''return a list of Matrix3'''
+        return list(self)
+
+    def identity(self):
+        self.m[:] = np.eye(3)
+
+    def transposed(self):
+        return Matrix3Array(np.swapaxes(self.m, 1, 2))
+
+    def from_euler(self, roll, pitch, yaw):
+        '''fill the matrices from arrays of Euler angles in radians'''
+        (roll, pitch, yaw) = np.broadcast_arrays(np.asarray(roll, dtype=float),
+                                                 np.asarray(pitch, dtype=float),
+                                                 np.asarray(yaw, dtype=float))
+        cp = np.cos(pitch)
+        sp = np.sin(pitch)
+        sr = np.sin(roll)
+        cr = np.cos(roll)
+        sy = np.sin(yaw)
+        cy = np.cos(yaw)
+
+        m = np.empty((roll.size, 3, 3))
+        m[:,0,0] = cp * cy
+        m[:,0,1] = (sr * sp * cy) - (cr * sy)
+        m[:,0,2] = (cr * sp * cy) + (sr * sy)
+        m[:,1,0] = cp * sy
+        m[:,1,1] = (sr * sp * sy) + (cr * cy)
+        m[:,1,2] = (cr * sp * sy) - (sr * cy)
+        m[:,2,0] = -sp
+        m[:,2,1] = sr * cp
+        m[:,2,2] = cr * cp
+        self.m = m
+
+    def to_euler(self):
+        '''find Euler angles (321 convention) for the matrices'''
+        m = self.m
+        cx = m[:,2,0]
+        pitch = np.where(cx >= 1.0, pi,
+                         np.where(cx <= -1.0, -pi, -np.arcsin(np.clip(cx, -1.0, 1.0))))
+        roll = np.arctan2(m[:,2,1], m[:,2,2])
+        yaw  = np.arctan2(m[:,1,0], m[:,0,0])
+        return (roll, pitch, yaw)
+
+    def to_euler312(self):
+        '''find Euler angles (312 convention) for the matrices'''
+        m = self.m
+        yaw = np.arctan2(-m[:,0,1], m[:,1,1])
+        roll = np.arcsin(m[:,2,1])
+        pitch = np.arctan2(-m[:,2,0], m[:,2,2])
+        return (roll, pitch, yaw)
+
+    def from_euler312(self, roll, pitch, yaw):
+        '''fill the matrices from Euler angles in radians in 312 convention'''
+        (roll, pitch, yaw) = np.broadcast_arrays(np.asarray(roll, dtype=float),
+                                                 np.asarray(pitch, dtype=float),
+                                                 np.asarray(yaw, dtype=float))
+        c3 = np.cos(pitch)
+        s3 = np.sin(pitch)
+        s2 = np.sin(roll)
+        c2 = np.cos(roll)
+        s1 = np.sin(yaw)
+        c1 = np.cos(yaw)
+
+        m = np.empty((roll.size, 3, 3))
+        m[:,0,0] = c1 * c3 - s1 * s2 * s3
+        m[:,1,1] = c1 * c2
+        m[:,2,2] = c3 * c2
+        m[:,0,1] = -c2*s1
+        m[:,0,2] = s3*c1 + c3*s2*s1
+        m[:,1,0] = c3*s1 + s3*s2*c1
+        m[:,1,2] = s1*s3 - s2*c1*c3
+        m[:,2,0] = -s3*c2
+        m[:,2,1] = s2
+        self.m = m
+
+    def determinant(self):
+        '''return determinants'''
+        return np.linalg.det(self.m)
+
+    def invert(self):
+        '''invert the matrices, returning new matrices'''
+        return Matrix3Array(np.linalg.inv(self.m))
+
+    def __add__(self, m):
+        return Matrix3Array(self.m + _matrix_array(m))
+
+    __radd__ = __add__
+
+    def __sub__(self, m):
+        return Matrix3Array(self.m - _matrix_array(m))
+
+    def __rsub__(self, m):
+        return Matrix3Array(_matrix_array(m) - self.m)
+
+    def __eq__(self, m):
+        return np.array_equal(self.m, _matrix_array(m))
+
+    def __ne__(self, m):
+        return not self == m
+
+    def __mul__(self, other):
+        if isinstance(other, (Vector3, Vector3Array)):
+            v = _vector_array(other)
+            if v.ndim == 1:
+                return Vector3Array(np.einsum('nij,j->ni', self.m, v))
+            return Vector3Array(np.einsum('nij,nj->ni', self.m, v))
+        elif isinstance(other, (Matrix3, Matrix3Array)):
+            return Matrix3Array(np.matmul(self.m, _matrix_array(other)))
+        v = np.asarray(other, dtype=float)
+        if v.ndim == 1:
+            v = v[:,np.newaxis,np.newaxis]
+        return Matrix3Array(self.m * v)
+
+    def __rmul__(self, other):
+        if isinstance(other, Matrix3):
+            return Matrix3Array(np.matmul(_matrix_array(other), self.m))
+        return self * other
+
+    def __truediv__(self, v):
+        v = np.asarray(v, dtype=float)
+        if v.ndim == 1:
+            v = v[:,np.newaxis,np.newaxis]
+        return Matrix3Array(self.m / v)
+
+    __div__ = __truediv__
+
+    def __neg__(self):
+        return Matrix3Array(-self.m)
+
+    def __copy__(self):
+        return Matrix3Array(self.m.copy())
+
+    copy = __copy__
+
+    def rotate(self, g):
+        '''rotate the matrices by given amounts on 3 axes, where g is a
+        Vector3Array of delta angles'''
+        g = _vector_array(g)
+        self.m = self.m + np.cross(self.m, g[:,np.newaxis,:] if g.ndim == 2 else g)
+
+    def normalize(self):
+        '''re-normalise the rotation matrices'''
+        a = self.a
+        b = self.b
+        error = a * b
+        t0 = a - (b * (0.5 * error))
+        t1 = b - (a * (0.5 * error))
+        t2 = t0 % t1
+        self.m = Matrix3Array.from_rows(t0 * (1.0 / t0.length()),
+                                        t1 * (1.0 / t1.length()),
+                                        t2 * (1.0 / t2.length())).m
+
+    def trace(self):
+        '''the traces of the matrices'''
+        return np.trace(self.m, axis1=1, axis2=2)
+
+    def from_axis_angle(self, axis, angle):
+        '''create rotation matrices from axes and angles'''
+        u = _vector_array(axis).reshape(-1, 3)
+        angle = np.asarray(angle, dtype=float)
+        (ux, uy, uz, angle) = np.broadcast_arrays(u[:,0], u[:,1], u[:,2], angle)
+        ct = np.cos(angle)
+        st = np.sin(angle)
+        m = np.empty((ct.size, 3, 3))
+        m[:,0,0] = ct + (1-ct) * ux**2
+        m[:,0,1] = ux*uy*(1-ct) - uz*st
+        m[:,0,2] = ux*uz*(1-ct) + uy*st
+        m[:,1,0] = uy*ux*(1-ct) + uz*st
+        m[:,1,1] = ct + (1-ct) * uy**2
+        m[:,1,2] = uy*uz*(1-ct) - ux*st
+        m[:,2,0] = uz*ux*(1-ct) - uy*st
+        m[:,2,1] = uz*uy*(1-ct) + ux*st
+        m[:,2,2] = ct + (1-ct) * uz**2
+        self.m = m
+
+    def close(self, m, tol=1e-7):
+        return bool(np.all(np.abs(self.m - _matrix_array(m)) < tol))
+
 class Plane(object):
     '''a plane in 3 space, defined by a point and a vector normal'''
     def __init__(self, point=None, normal=None):
@@ -472,3 +853,16 @@ rotations = [
     Rotation("ROTATION_PITCH_7",                   0,   7,   0),
     ]
 
+
+_rotation_matrices = {}
+
+def rotation_matrices(inverse=False):
+    '''return the rotation table as an Nx3x3 numpy array, indexed by
+    rotation enum ID'''
+    if not inverse in _rotation_matrices:
+        if inverse:
+            m = [r.rt for r in rotations]
+        else:
+            m = [r.r for r in rotations]
+        _rotation_matrices[inverse] = np.array([_matrix_array(r) for r in m])
+    return _rotation_matrices[inverse]
@@ -0,0 +1,460 @@
+#!/usr/bin/env python
+'''
+block compressed logs with random access
+
+Logs are compressed as a series of independent gzip members, each
+holding at most 64k of log data, in the BGZF layout used by bgzip, so
+the result is still an ordinary gzip file. The block table can be
+built from the member headers alone, which lets the readers here
+decompress only the blocks holding the messages they need. An index
+of message offsets by type can be saved next to the log so that
+opening it doesn't need a scan of the whole log.
+
+Released under GNU GPL version 3 or later
+'''
+from __future__ import print_function
+from __future__ import absolute_import
+from builtins import object
+from builtins import range
+
+import array
+import bisect
+import collections
+import os
+import struct
+import sys
+import zlib
+
+from . import DFReader
+from . import mavutil
+
+# the largest block bgzip writes, so incompressible data still fits
+# in a 64k member
+BLOCK_SIZE = 65280
+
+INDEX_SUFFIX = '.idx'
+INDEX_MAGIC = b'MAVIDX1\n'
+
+# the empty member which marks the end of a BGZF file
+EOF_BLOCK = struct.pack('<4BIBBH2BHH', 31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, 27) + b'\x03\x00' + b'\x00' * 8
+
+
+def _block_size(f, ofs):
+    '''return (total size, header size) of the gzip member at ofs, or
+    None if it has no BGZF block size'''
+    f.seek(ofs)
+    hdr = f.read(12)
+    if len(hdr) < 12:
+        return None
+    (id1, id2, cm, flg, mtime, xfl, os_type, xlen) = struct.unpack('<4BIBBH', hdr)
+    if id1 != 31 or id2 != 139 or cm != 8 or not (flg & 4):
+        return None
+    extra = f.read(xlen)
+    i = 0
+    while i + 4 <= len(extra):
+        (si1, si2, slen) = struct.unpack('<BBH', extra[i:i+4])
+        if si1 == 66 and si2 == 67 and slen == 2:
+            (bsize,) = struct.unpack('<H', extra[i+4:i+6])
+            return (bsize + 1, 12 + xlen)
+        i += 4 + slen
+    return None
+
+def is_block_compressed(filename):
+    '''return True if filename is a block compressed (BGZF) file'''
+    try:
+        f = open(filename, 'rb')
+    except IOError:
+        return False
+    ret = _block_size(f, 0) is not None
+    f.close()
+    return ret
+
+
+class BlockWriter(object):
+    '''write a block compressed file'''
+    def __init__(self, filename, level=6):
+        self.f = open(filename, 'wb')
+        self.level = level
+        self.pending = bytearray()
+
+    def write(self, data):
+        self.pending += data
+        while len(self.pending) >= BLOCK_SIZE:
+            self._write_block(bytes(self.pending[:BLOCK_SIZE]))
+            del self.pending[:BLOCK_SIZE]
+
+    def _write_block(self, data):
+        c = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        cdata = c.compress(data) + c.flush()
+        self.f.write(struct.pack('<4BIBBH2BHH', 31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, len(cdata) + 25))
+        self.f.write(cdata)
+        self.f.write(struct.pack('<II', zlib.crc32(data) & 0xffffffff, len(data)))
+
+    def close(self):
+        if len(self.pending) > 0:
+            self._write_block(bytes(self.pending))
+            self.pending = bytearray()
+        self.f.write(EOF_BLOCK)
+        self.f.close()
+
+
+class BlockFile(object):
+    '''read only random access to the uncompressed contents of a block
+    compressed file. It supports slicing like an mmap and
+    read/seek/tell like a file, so it can stand in for either in the
+    log readers. The most recently used cache_blocks blocks are kept
+    decompressed'''
+    def __init__(self, filename, cache_blocks=64):
+        self.filename = filename
+        self.f = open(filename, 'rb')
+        self.compressed_size = os.path.getsize(filename)
+        self.cache_blocks = cache_blocks
+        self.cache = collections.OrderedDict()
+        self.block_starts = []
+        self.block_data = []
+        ofs = 0
+        length = 0
+        while ofs < self.compressed_size:
+            r = _block_size(self.f, ofs)
+            if r is None:
+                raise ValueError("%s: not a block compressed file at offset %u" % (filename, ofs))
+            (bsize, hsize) = r
+            self.f.seek(ofs + bsize - 4)
+            (isize,) = struct.unpack('<I', self.f.read(4))
+            if isize > 0:
+                self.block_starts.append(length)
+                self.block_data.append((ofs + hsize, bsize - hsize - 8))
+                length += isize
+            ofs += bsize
+        self.length = length
+        self.pos = 0
+        self._last = (0, 0, b'')
+        self.blocks_read = 0
+
+    def __len__(self):
+        return self.length
+
+    def block(self, i):
+        '''the decompressed contents of block i'''
+        if i in self.cache:
+            data = self.cache.pop(i)
+        else:
+            (ofs, size) = self.block_data[i]
+            self.f.seek(ofs)
+            data = zlib.decompress(self.f.read(size), -15)
+            self.blocks_read += 1
+            if len(self.cache) >= self.cache_blocks:
+                self.cache.popitem(last=False)
+        self.cache[i] = data
+        return data
+
+    def _read(self, start, end):
+        (bstart, bend, data) = self._last
+        if start >= bstart and end <= bend:
+            return data[start-bstart:end-bstart]
+        if start >= end:
+            return b''
+        i = bisect.bisect_right(self.block_starts, start) - 1
+        parts = []
+        while start < end and i < len(self.block_starts):
+            data = self.block(i)
+            bstart = self.block_starts[i]
+            self._last = (bstart, bstart + len(data), data)
+            parts.append(data[start-bstart:end-bstart])
+            start = bstart + len(data)
+            i += 1
+        return b''.join(parts)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            (start, stop, step) = key.indices(self.length)
+            if step != 1:
+                raise ValueError("slice step not supported")
+            return self._read(start, stop)
+        if key < 0:
+            key += self.length
+        if key < 0 or key >= self.length:
+            raise IndexError("index out of range")
+        return self._read(key, key+1)[0]
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            end = self.length
+        else:
+            end = min(self.pos + n, self.length)
+        ret = self._read(self.pos, end)
+        self.pos += len(ret)
+        return ret
+
+    def seek(self, ofs, whence=0):
+        if whence == 1:
+            ofs += self.pos
+        elif whence == 2:
+            ofs += self.length
+        self.pos = max(ofs, 0)
+
+    def tell(self):
+        return self.pos
+
+    def close(self):
+        self.f.close()
+        self.cache.clear()
+        self._last = (0, 0, b'')
+
+
+def index_filename(filename):
+    return filename + INDEX_SUFFIX
+
+def _offsets_array(values):
+    a = array.array('I', values)
+    if sys.byteorder != 'little':
+        a.byteswap()
+    return a
+
+def save_index(filename, offsets):
+    '''save message offsets for the block compressed log filename.
+    offsets maps message type numbers to sorted lists of offsets into
+    the uncompressed log'''
+    bf = BlockFile(filename, cache_blocks=1)
+    payload = []
+    for mtype in sorted(offsets.keys()):
+        offs = offsets[mtype]
+        if len(offs) == 0:
+            continue
+        deltas = _offsets_array([offs[i] - offs[i-1] for i in range(1, len(offs))])
+        payload.append(struct.pack('<IIQ', mtype, len(offs), offs[0]))
+        payload.append(deltas.tostring() if sys.version_info.major < 3 else deltas.tobytes())
+    f = open(index_filename(filename), 'wb')
+    f.write(INDEX_MAGIC + struct.pack('<QQ', bf.compressed_size, bf.length))
+    f.write(zlib.compress(b''.join(payload)))
+    f.close()
+    bf.close()
+
+def load_index(blockfile):
+    '''load the message offsets for an open BlockFile, returning a dict
+    of offset lists keyed by message type number, or None if there is
+    no index or it doesn't match the log'''
+    try:
+        f = open(index_filename(blockfile.filename), 'rb')
+    except IOError:
+        return None
+    data = f.read()
+    f.close()
+    hlen = len(INDEX_MAGIC) + 16
+    if data[:len(INDEX_MAGIC)] != INDEX_MAGIC or len(data) < hlen:
+        return None
+    (compressed_size, length) = struct.unpack('<QQ', data[len(INDEX_MAGIC):hlen])
+    if compressed_size != blockfile.compressed_size or length != blockfile.length:
+        return None
+    payload = zlib.decompress(data[hlen:])
+    ret = {}
+    i = 0
+    while i < len(payload):
+        (mtype, count, first) = struct.unpack('<IIQ', payload[i:i+16])
+        i += 16
+        deltas = array.array('I')
+        chunk = payload[i:i+4*(count-1)]
+        if sys.version_info.major < 3:
+            deltas.fromstring(chunk)
+        else:
+            deltas.frombytes(chunk)
+        if sys.byteorder != 'little':
+            deltas.byteswap()
+        i += 4*(count-1)
+        offs = [first]
+        for d in deltas:
+            first += d
+            offs.append(first)
+        ret[mtype] = offs
+    return ret
+
+def reader_offsets(mlog):
+    '''the message offsets from an indexed log reader, as a dict keyed
+    by message type number'''
+    if isinstance(mlog.offsets, dict):
+        return mlog.offsets
+    return dict([(i, mlog.offsets[i]) for i in range(len(mlog.offsets)) if len(mlog.offsets[i]) > 0])
+
+
+def _no_more_wanted(mlog):
+    '''True if a reader's skip_to_type() has run out of wanted
+    messages, so there's no need to decompress the rest of the log'''
+    for i in range(len(mlog.type_nums)):
+        if mlog.indexes[i] < mlog.counts[mlog.type_nums[i]]:
+            return False
+    return True
+
+
+class DFReader_seekable(DFReader.DFReader_binary):
+    '''a block compressed binary dataflash log'''
+    def __init__(self, filename, zero_time_base=False, progress_callback=None, cache_blocks=64):
+        self.cache_blocks = cache_blocks
+        DFReader.DFReader_binary.__init__(self, filename, zero_time_base=zero_time_base,
+                                          progress_callback=progress_callback)
+
+    def _open_data(self, filename):
+        self.filehandle = BlockFile(filename, self.cache_blocks)
+        self.data_map = self.filehandle
+        self.data_len = len(self.filehandle)
+
+    def init_arrays(self, progress_callback=None):
+        '''initialise arrays for fast recv_match(), from the saved index
+        if there is one'''
+        index = load_index(self.filehandle)
+        if index is None:
+            DFReader.DFReader_binary.init_arrays(self, progress_callback)
+            return
+        self.offsets = []
+        self.counts = []
+        self.name_to_id = {}
+        self.id_to_name = {}
+        for i in range(256):
+            self.offsets.append(index.get(i, []))
+            self.counts.append(len(self.offsets[i]))
+        self._count = sum(self.counts)
+
+        for ofs in self.offsets[0x80]:
+            if self._index_fmt(ofs, self.formats[0x80].len) is None:
+                break
+        if 'FMTU' in self.name_to_id:
+            fmtu_type = self.name_to_id['FMTU']
+            for ofs in self.offsets[fmtu_type]:
+                if not self._index_fmtu(fmtu_type, ofs, self.formats[fmtu_type].len):
+                    break
+
+        # parse the first message of each type, as a scan of the log does
+        firsts = sorted([(self.offsets[i][0], i) for i in range(256) if self.counts[i] > 0])
+        for (ofs, mtype) in firsts:
+            if mtype in self.formats:
+                self.offset = ofs
+                self._parse_next()
+        self.offset = 0
+
+    def skip_to_type(self, type):
+        '''skip fwd to next msg matching given type set, going straight
+        to the end of the log once there are no more'''
+        first = self.type_nums is None
+        if not first and _no_more_wanted(self):
+            self.offset = self.data_len
+            return
+        DFReader.DFReader_binary.skip_to_type(self, type)
+        if first and _no_more_wanted(self):
+            self.offset = self.data_len
+
+    def _data_array(self, offsets, length):
+        '''gather the blocks holding the messages at offsets into an
+        array, leaving the others undecompressed'''
+        import numpy as np
+        if len(offsets) == 0:
+            return (np.zeros(0, dtype=np.uint8), 0)
+        bf = self.filehandle
+        starts = np.array(bf.block_starts, dtype=np.int64)
+        blocks = np.unique(np.concatenate([np.searchsorted(starts, offsets, 'right') - 1,
+                                           np.searchsorted(starts, offsets + length - 1, 'right') - 1]))
+        base = int(offsets[0])
+        end = min(int(offsets[-1]) + length, bf.length)
+        data = np.zeros(end - base, dtype=np.uint8)
+        for b in blocks:
+            bstart = int(starts[b])
+            block = np.frombuffer(bf.block(b), dtype=np.uint8)
+            lo = max(bstart, base)
+            hi = min(bstart + len(block), end)
+            data[lo-base:hi-base] = block[lo-bstart:hi-bstart]
+        return (data, base)
+
+
+class mavmmaplog_seekable(mavutil.mavmmaplog):
+    '''a block compressed telemetry log'''
+    def __init__(self, filename, progress_callback=None, cache_blocks=64):
+        self.cache_blocks = cache_blocks
+        mavutil.mavmmaplog.__init__(self, filename, progress_callback=progress_callback)
+
+    def _open_data(self):
+        self.f.close()
+        self.f = BlockFile(self.filename, self.cache_blocks)
+        self.data_map = self.f
+        self.data_len = len(self.f)
+        self.filesize = self.data_len
+
+    def init_arrays(self, progress_callback=None):
+        '''initialise arrays for fast recv_match(), from the saved index
+        if there is one'''
+        index = load_index(self.f)
+        if index is None:
+            mavutil.mavmmaplog.init_arrays(self, progress_callback)
+            return
+        self.offsets = {}
+        self.counts = {}
+        self.name_to_id = {}
+        self.id_to_name = {}
+        self.instance_offsets = {}
+        self.type_nums = None
+        mavlink = mavutil.mavlink
+        for mtype in sorted(index.keys(), key=lambda t: index[t][0]):
+            if not mtype in mavlink.mavlink_map:
+                continue
+            self.offsets[mtype] = index[mtype]
+            self.counts[mtype] = len(index[mtype])
+            msg = mavlink.mavlink_map[mtype]
+            self.name_to_id[msg.name] = mtype
+            self.id_to_name[mtype] = msg.name
+            self.f.seek(index[mtype][0])
+            m = self.recv_msg()
+            mavutil.add_message(self.messages, msg.name, m)
+            if m._instance_field is not None:
+                self.instance_offsets[mtype] = m._instance_offset
+        self._count = sum(self.counts.values())
+        self.offset = 0
+        self._rewind()
+    def skip_to_type(self, type):
+        '''skip fwd to next msg matching given type set, going straight
+        to the end of the log once there are no more'''
+        first = self.type_nums is None
+        if not first and _no_more_wanted(self):
+            self.f.seek(self.data_len)
+            return
+        mavutil.mavmmaplog.skip_to_type(self, type)
+        if first and _no_more_wanted(self):
+            self.f.seek(self.data_len)
+
+
+def open_log(filename, zero_time_base=False, progress_callback=None, cache_blocks=64):
+    '''open a block compressed log, choosing the reader from the name
+    of the uncompressed log, e.g. flight.BIN.gz or flight.tlog.gz'''
+    name = filename.lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    if name.endswith('.bin') or name.endswith('.px4log'):
+        return DFReader_seekable(filename, zero_time_base=zero_time_base,
+                                 progress_callback=progress_callback, cache_blocks=cache_blocks)
+    return mavmmaplog_seekable(filename, progress_callback=progress_callback, cache_blocks=cache_blocks)
+
+def compress_log(filename, output=None, level=6, index=True):
+    '''compress a binary dataflash log or telemetry log, by default to
+    filename.gz, saving an index of its messages unless index is
+    False. Returns the name of the compressed log'''
+    if output is None:
+        output = filename + '.gz'
+    w = BlockWriter(output, level=level)
+    f = open(filename, 'rb')
+    while True:
+        data = f.read(1<<20)
+        if len(data) == 0:
+            break
+        w.write(data)
+    f.close()
+    w.close()
+    if index:
+        mlog = mavutil.mavlink_connection(filename)
+        if hasattr(mlog, 'offsets'):
+            save_index(output, reader_offsets(mlog))
+    return output
+
+def build_index(filename):
+    '''scan a block compressed log and save its index'''
+    idx = index_filename(filename)
+    if os.path.exists(idx):
+        os.unlink(idx)
+    mlog = open_log(filename)
+    save_index(filename, reader_offsets(mlog))
+    mlog.data_map.close()
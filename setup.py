@@ -18,7 +18,7 @@ version = '2.4.14'
 
 def generate_content():
     # generate the file content...
-    from generator import mavgen, mavparse
+    from generator import mavbuild, mavparse
 
     # path to message_definitions directory
     if os.getenv("MDEF",None) is not None:
@@ -45,6 +45,8 @@ def generate_content():
     v20_dialects = glob.glob(os.path.join(mdef_path, 'v1.0', '*.xml'))
 
     should_generate = not "NOGEN" in os.environ
+    lazy = "MAVLINK_LAZY_DIALECTS" in os.environ
+    schema = "MAVLINK_DIALECT_SCHEMA" in os.environ
     if should_generate:
         if len(v10_dialects) == 0:
             print("No XML message definitions found")
@@ -55,25 +57,25 @@ def generate_content():
         for xml in v20_dialects:
             shutil.copy(xml, os.path.join(dialects_path, 'v20'))
 
-        for xml in v10_dialects:
-            dialect = os.path.basename(xml)[:-4]
-            wildcard = os.getenv("MAVLINK_DIALECT",'*')
-            if not fnmatch.fnmatch(dialect, wildcard):
-                continue
-            print("Building %s for protocol 1.0" % xml)
-            if not mavgen.mavgen_python_dialect(dialect, mavparse.PROTOCOL_1_0):
-                print("Building failed %s for protocol 1.0" % xml)
-                sys.exit(1)
-
-        for xml in v20_dialects:
-            dialect = os.path.basename(xml)[:-4]
-            wildcard = os.getenv("MAVLINK_DIALECT",'*')
-            if not fnmatch.fnmatch(dialect, wildcard):
-                continue
-            print("Building %s for protocol 2.0" % xml)
-            if not mavgen.mavgen_python_dialect(dialect, mavparse.PROTOCOL_2_0):
-                print("Building failed %s for protocol 2.0" % xml)
-                sys.exit(1)
+        wildcard = os.getenv("MAVLINK_DIALECT",'*')
+        jobs = []
+        for (xmls, wire_protocol) in [(v10_dialects, mavparse.PROTOCOL_1_0),
+                                      (v20_dialects, mavparse.PROTOCOL_2_0)]:
+            for xml in xmls:
+                dialect = os.path.basename(xml)[:-4]
+                if fnmatch.fnmatch(dialect, wildcard):
+                    jobs.append((dialect, wire_protocol))
+
+        # MAVLINK_GEN_JOBS limits the number of dialects built at once,
+        # MAVLINK_GEN_FORCE rebuilds dialects which haven't changed
+        processes = os.getenv("MAVLINK_GEN_JOBS", None)
+        if processes is not None:
+            processes = int(processes)
+        failed = mavbuild.build_dialects(jobs, lazy=lazy, processes=processes,
+                                         force="MAVLINK_GEN_FORCE" in os.environ,
+                                         schema=schema)
+        if len(failed) > 0:
+            sys.exit(1)
 
 extensions = []  # Assume we might be unable to build native code
 # check if we need to compile mavnative
@@ -129,8 +131,8 @@ setup (name = 'pymavlink',
                     ],
        license='LGPLv3',
        package_dir = { 'pymavlink' : '.' },
-       package_data = { 'pymavlink.dialects.v10' : ['*.xml'],
-                        'pymavlink.dialects.v20' : ['*.xml'],
+       package_data = { 'pymavlink.dialects.v10' : ['*.xml', '*.schema'],
+                        'pymavlink.dialects.v20' : ['*.xml', '*.schema'],
                         'pymavlink.generator'    : [ '*.xsd',
                                                      'java/lib/*.*',
                                                      'java/lib/Messages/*.*',
@@ -166,6 +168,11 @@ setup (name = 'pymavlink',
                    'tools/mavfft.py',
                    'tools/mavfft_isb.py',
                    'tools/mavsummarize.py',
+                   'tools/mavanalyze.py',
+                   'tools/mavcompress.py',
+                   'tools/mavpcapgen.py',
+                   'tools/mavreplay.py',
+                   'tools/mavloadtest.py',
                    'tools/MPU6KSearch.py',
                    'tools/mavlink_bitmask_decoder.py',
                    'tools/magfit_WMM.py',
@@ -0,0 +1,425 @@
+#!/usr/bin/env python
+
+"""
+benchmarks of the MAVLink and log reading hot paths
+
+The logs are generated from a fixed random seed on each run, so results
+from different commits can be compared. Each benchmark is repeated and
+the fastest run is kept. Results can be saved as JSON and compared with
+earlier results:
+
+  bench_mavlink.py --save before.json
+  (change something)
+  bench_mavlink.py --save after.json --compare before.json
+
+--compare exits with status 1 if any benchmark got slower by more than
+--threshold.
+
+--mat-memory compares the peak memory use of the ways of writing a
+dataflash log as a MATLAB file, each run in a fresh process:
+
+  bench_mavlink.py --mat-memory -N 1000000
+"""
+
+from __future__ import absolute_import, print_function
+import json
+import os
+import platform
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+from pymavlink import mavutil
+from pymavlink import mavpcap
+from pymavlink import DFReader
+from pymavlink import CSVReader
+
+try:
+    clock = time.perf_counter
+except AttributeError:
+    clock = time.time
+
+# messages in the synthetic tlog, with relative rates
+TLOG_MESSAGES = [('ATTITUDE', 10), ('GLOBAL_POSITION_INT', 4), ('VFR_HUD', 4), ('SYS_STATUS', 2),
+                 ('RC_CHANNELS', 2), ('SERVO_OUTPUT_RAW', 2), ('GPS_RAW_INT', 2), ('HEARTBEAT', 1)]
+
+
+class DFWriter(object):
+    """minimal dataflash log writer for benchmark data"""
+    def __init__(self, filename):
+        self.f = open(filename, 'wb')
+        self.formats = {}
+
+    def fmt(self, type, name, format, columns):
+        structfmt = '<' + ''.join([DFReader.FORMAT_TO_STRUCT[c][0] for c in format])
+        self.formats[name] = (type, struct.Struct(structfmt))
+        length = 3 + struct.calcsize(structfmt)
+        self.f.write(struct.pack('<BBBBB4s16s64s', 0xA3, 0x95, 0x80, type, length,
+                                 name.encode(), format.encode(), columns.encode()))
+
+    def write(self, name, *values):
+        (type, s) = self.formats[name]
+        self.f.write(struct.pack('<BBB', 0xA3, 0x95, type) + s.pack(*values))
+
+    def close(self):
+        self.f.close()
+
+
+def tlog_frames(count, seed=0):
+    """count packed frames of TLOG_MESSAGES, in rate proportion"""
+    rng = random.Random(seed)
+    mav = mavutil.mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+    msgs = []
+    for (name, rate) in TLOG_MESSAGES:
+        if hasattr(mavutil.mavlink, 'MAVLINK_MSG_ID_' + name):
+            msgs.extend([mavpcap.random_message(mavutil.mavlink, name, rng)] * rate)
+    return [msgs[i % len(msgs)].pack(mav) for i in range(count)]
+
+
+def write_tlog(filename, frames):
+    with open(filename, 'wb') as f:
+        t_us = 1600000000 * 1000000
+        for (i, buf) in enumerate(frames):
+            f.write(struct.pack('>Q', t_us + i * 10000) + buf)
+
+
+def write_dflog(filename, count, seed=0):
+    """a dataflash log with count messages, mostly IMU and attitude"""
+    rng = random.Random(seed)
+    w = DFWriter(filename)
+    w.fmt(128, 'FMT', 'BBnNZ', 'Type,Length,Name,Format,Columns')
+    w.fmt(129, 'IMU', 'QBffffff', 'TimeUS,I,GyrX,GyrY,GyrZ,AccX,AccY,AccZ')
+    w.fmt(130, 'ATT', 'QccccCCc', 'TimeUS,DesRoll,Roll,DesPitch,Pitch,DesYaw,Yaw,ErrRP')
+    w.fmt(131, 'GPS', 'QBIHBcLLeffffB', 'TimeUS,Status,GMS,GWk,NSats,HDop,Lat,Lng,Alt,Spd,GCrs,VZ,Yaw,U')
+    w.fmt(132, 'MSG', 'QZ', 'TimeUS,Message')
+    w.write('MSG', 0, b'ArduCopter V4.5.0'.ljust(64, b'\0'))
+    for i in range(count):
+        t_us = 1000000 + i * 2500
+        if i % 10 == 9:
+            w.write('ATT', t_us, rng.randint(-3000, 3000), rng.randint(-3000, 3000), rng.randint(-3000, 3000),
+                    rng.randint(-3000, 3000), rng.randint(0, 36000), rng.randint(0, 36000), 0)
+        elif i % 40 == 20:
+            w.write('GPS', t_us, 3, t_us // 1000, 2200, 12, 80, -353632610 + i, 1491652300 - i,
+                    58430, 1.5, 90.0, 0.1, 0.0, 1)
+        else:
+            w.write('IMU', t_us, i % 2, rng.random(), rng.random(), rng.random(),
+                    rng.random(), rng.random(), 9.8 + rng.random())
+    w.close()
+
+
+def write_csv(filename, count, seed=0):
+    rng = random.Random(seed)
+    with open(filename, 'w') as f:
+        f.write("TimeUS;AccX;AccY;AccZ;Temp;Status\n")
+        for i in range(count):
+            f.write("%u;%r;%r;%r;%r;%u\n" % (1000000 + i * 1000, rng.random(), rng.random(),
+                                            9.8 + rng.random(), 35.0, i % 4))
+
+
+def timed(fn, repeat):
+    """(fastest, median) time of repeat calls of fn"""
+    times = []
+    for i in range(repeat):
+        t0 = clock()
+        fn()
+        times.append(clock() - t0)
+    times.sort()
+    return (times[0], times[len(times)//2])
+
+
+def drain(mlog, **kwargs):
+    n = 0
+    while mlog.recv_match(**kwargs) is not None:
+        n += 1
+    return n
+
+
+class Benchmarks(object):
+    """the benchmarks, on logs of N messages written to directory. Each
+    returns the number of messages it handled, counting those skipped
+    by filters"""
+    def __init__(self, directory, N=20000, seed=0):
+        self.N = N
+        self.frames = tlog_frames(N, seed)
+        self.stream = b''.join(self.frames)
+        self.mav = mavutil.mavlink.MAVLink(None, srcSystem=255)
+        self.mav.robust_parsing = True
+        self.messages = self.mav.parse_buffer(self.stream)
+        self.tlog = os.path.join(directory, 'bench.tlog')
+        self.bin = os.path.join(directory, 'bench.bin')
+        self.csv = os.path.join(directory, 'bench.csv')
+        write_tlog(self.tlog, self.frames)
+        write_dflog(self.bin, N, seed)
+        write_csv(self.csv, N // 4, seed)
+
+    def parse_char(self):
+        mav = mavutil.mavlink.MAVLink(None)
+        # feed the stream in chunks, as a link would
+        for i in range(0, len(self.stream), 256):
+            mav.parse_buffer(self.stream[i:i+256])
+        return len(self.frames)
+
+    def decode(self):
+        mav = mavutil.mavlink.MAVLink(None)
+        for buf in self.frames:
+            mav.decode(bytearray(buf))
+        return len(self.frames)
+
+    def pack(self):
+        mav = mavutil.mavlink.MAVLink(None, srcSystem=1)
+        for m in self.messages:
+            m.pack(mav, force_mavlink1=False)
+        return len(self.messages)
+
+    def x25crc(self):
+        for buf in self.frames:
+            mavutil.mavlink.x25crc(buf)
+        return len(self.frames)
+
+    def dfreader_open(self):
+        DFReader.DFReader_binary(self.bin)
+        return self.N
+
+    def dfreader_iterate(self):
+        return drain(DFReader.DFReader_binary(self.bin))
+
+    def dfreader_match(self):
+        drain(DFReader.DFReader_binary(self.bin), type='GPS')
+        return self.N
+
+    def mmaplog_index(self):
+        mavutil.mavlink_connection(self.tlog).close()
+        return self.N
+
+    def recv_match(self):
+        return drain(mavutil.mavlink_connection(self.tlog))
+
+    def recv_match_type(self):
+        drain(mavutil.mavlink_connection(self.tlog), type=['VFR_HUD', 'HEARTBEAT'])
+        return self.N
+
+    def recv_match_condition(self):
+        drain(mavutil.mavlink_connection(self.tlog), type='ATTITUDE', condition='ATTITUDE.roll > 0')
+        return self.N
+
+    def csv_read(self):
+        return drain(CSVReader.CSVReader(self.csv))
+
+    names = ['parse_char', 'decode', 'pack', 'x25crc', 'dfreader_open', 'dfreader_iterate',
+             'dfreader_match', 'mmaplog_index', 'recv_match', 'recv_match_type',
+             'recv_match_condition', 'csv_read']
+
+
+# ways of writing MAT files compared by mat_memory(): only opening the
+# log, the Python lists mavlogdump used to collect fields in, and
+# logexport.MATWriter message by message and with bulk extraction
+MAT_METHODS = ['open', 'lists', 'writer', 'bulk']
+
+
+def mat_lists(mlog, filename):
+    """write a MAT file the way mavlogdump did before MATWriter"""
+    import numpy as np
+    import scipy.io
+    MAT = {}
+    while True:
+        m = mlog.recv_match()
+        if m is None:
+            break
+        if m.get_type() == 'FMT':
+            continue
+        if m.get_type() not in MAT:
+            MAT[m.get_type()] = {}
+        md = m.to_dict()
+        del md['mavpackettype']
+        for col in md.keys():
+            if col in MAT[m.get_type()]:
+                MAT[m.get_type()][col].append(md[col])
+            else:
+                MAT[m.get_type()][col] = [md[col]]
+    MAT2 = {}
+    for packet_type in MAT:
+        vars = list(MAT[packet_type].keys())
+        data = []
+        MAT2[packet_type+'_label'] = np.zeros((len(vars), 1), dtype=object)
+        for (i, var) in enumerate(vars):
+            data.append(MAT[packet_type][var])
+            MAT2[packet_type+'_label'][i] = var
+        MAT2[packet_type] = list(map(list, zip(*data)))
+    scipy.io.savemat(filename, MAT2)
+
+
+def mat_writer(mlog, filename, bulk):
+    """write a MAT file with logexport.MATWriter, as mavlogdump does"""
+    from pymavlink import logexport
+    writer = logexport.MATWriter(mlog)
+    types = None
+    if bulk:
+        types = [t for t in sorted(mlog.name_to_id.keys()) if t != 'FMT' and not writer.add_bulk(t)]
+    if types is None or len(types) > 0:
+        while True:
+            m = mlog.recv_match(type=types)
+            if m is None:
+                break
+            if m.get_type() != 'FMT':
+                writer.add(m)
+    writer.save(filename)
+
+
+def mat_run(method, logfile, matfile):
+    """write logfile as a MAT file with one of MAT_METHODS, returning
+    (peak RSS in MB, seconds)"""
+    import resource
+    t0 = clock()
+    mlog = mavutil.mavlink_connection(logfile)
+    if method == 'lists':
+        mat_lists(mlog, matfile)
+    elif method in ['writer', 'bulk']:
+        mat_writer(mlog, matfile, method == 'bulk')
+    elif method != 'open':
+        raise ValueError("Unknown MAT method %s" % method)
+    seconds = clock() - t0
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # bytes rather than KB
+        maxrss /= 1024
+    return (maxrss / 1024.0, seconds)
+
+
+def mat_memory(N=1000000, seed=0):
+    """peak RSS and run time of each of MAT_METHODS writing a
+    synthetic dataflash log of N messages, each in a fresh process.
+    Returns a dict of (MB, seconds) by method"""
+    tmpdir = tempfile.mkdtemp()
+    try:
+        logfile = os.path.join(tmpdir, 'bench.bin')
+        write_dflog(logfile, N, seed)
+        ret = {}
+        for method in MAT_METHODS:
+            out = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--mat-run', method,
+                                           logfile, os.path.join(tmpdir, method + '.mat')])
+            (mb, seconds) = out.decode().split()[-2:]
+            ret[method] = (float(mb), float(seconds))
+    finally:
+        shutil.rmtree(tmpdir)
+    return ret
+
+
+def git_commit():
+    try:
+        out = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                      cwd=os.path.dirname(os.path.abspath(__file__)),
+                                      stderr=subprocess.STDOUT)
+        return out.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(N=20000, repeat=3, names=None, seed=0):
+    """run the benchmarks, returning a dict suitable for saving as JSON"""
+    tmpdir = tempfile.mkdtemp()
+    try:
+        b = Benchmarks(tmpdir, N, seed)
+        results = {}
+        for name in Benchmarks.names:
+            if names is not None and not name in names:
+                continue
+            fn = getattr(b, name)
+            ops = [0]
+            def call():
+                ops[0] = fn()
+            (best, median) = timed(call, repeat)
+            results[name] = {'seconds' : best, 'median' : median, 'ops' : ops[0],
+                             'ops_per_sec' : ops[0] / best if best > 0 else 0}
+    finally:
+        shutil.rmtree(tmpdir)
+    return {
+        'meta' : {
+            'commit' : git_commit(),
+            'python' : platform.python_version(),
+            'platform' : platform.platform(),
+            'wire_protocol' : mavutil.mavlink.WIRE_PROTOCOL_VERSION,
+            'N' : N,
+            'repeat' : repeat,
+            'seed' : seed,
+            'time' : time.time(),
+        },
+        'results' : results,
+    }
+
+
+def compare(old, new, threshold=0.1):
+    """compare two sets of results, returning a list of (name, old
+    seconds, new seconds, ratio, regressed). Times are scaled to the
+    same number of operations"""
+    ret = []
+    for name in sorted(new['results'].keys()):
+        if not name in old['results']:
+            continue
+        o = old['results'][name]
+        n = new['results'][name]
+        t_old = o['seconds'] / max(o['ops'], 1)
+        t_new = n['seconds'] / max(n['ops'], 1)
+        ratio = t_new / t_old if t_old > 0 else 1.0
+        ret.append((name, o['seconds'], n['seconds'], ratio, ratio > 1.0 + threshold))
+    return ret
+
+
+def print_results(results):
+    for name in Benchmarks.names:
+        if name in results['results']:
+            r = results['results'][name]
+            print("%-22s %8.4fs (median %8.4fs) %10.0f ops/s" % (name, r['seconds'], r['median'], r['ops_per_sec']))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-N", type=int, default=20000, help="number of messages in each log")
+    parser.add_argument("--repeat", type=int, default=3, help="number of runs of each benchmark")
+    parser.add_argument("--only", default=None, help="comma separated list of benchmarks to run")
+    parser.add_argument("--save", default=None, help="save results as JSON to this file")
+    parser.add_argument("--compare", default=None, help="compare with results saved in this file")
+    parser.add_argument("--results", default=None, help="compare these saved results instead of running")
+    parser.add_argument("--threshold", type=float, default=0.1, help="slowdown counted as a regression")
+    parser.add_argument("--mat-memory", action='store_true', help="compare peak memory of MAT file writing")
+    parser.add_argument("--mat-run", nargs=3, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mat_run is not None:
+        print("%.1f %.3f" % mat_run(*args.mat_run))
+        sys.exit(0)
+
+    if args.mat_memory:
+        results = mat_memory(args.N)
+        for method in MAT_METHODS:
+            print("%-8s %8.1f MB peak RSS %8.2fs" % (method, results[method][0], results[method][1]))
+        sys.exit(0)
+
+    if args.results is not None:
+        with open(args.results) as f:
+            results = json.load(f)
+    else:
+        names = None
+        if args.only is not None:
+            names = args.only.split(',')
+        results = run(args.N, args.repeat, names)
+    print_results(results)
+    if args.save is not None:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            old = json.load(f)
+        print("\ncompared with %s (commit %s)" % (args.compare, old['meta'].get('commit')))
+        regressions = 0
+        for (name, t_old, t_new, ratio, regressed) in compare(old, results, args.threshold):
+            print("%-22s %8.4fs -> %8.4fs %6.2fx%s" % (name, t_old, t_new, ratio, "  REGRESSION" if regressed else ""))
+            if regressed:
+                regressions += 1
+        if regressions > 0:
+            sys.exit(1)
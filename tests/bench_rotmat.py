@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+"""
+speed comparison of the per-element rotmat/quaternion classes against
+Vector3Array, Matrix3Array and QuaternionArray
+"""
+
+from __future__ import absolute_import, print_function
+import time
+import numpy as np
+
+from pymavlink.rotmat import Vector3, Matrix3, Vector3Array, Matrix3Array
+from pymavlink.quaternion import QuaternionBase, QuaternionArray
+
+
+def timed(fn):
+    t0 = time.time()
+    fn()
+    return time.time() - t0
+
+
+def euler_scalar(euler):
+    m = Matrix3()
+    for (r, p, y) in euler:
+        m.from_euler(r, p, y)
+        m.to_euler()
+
+def euler_array(euler):
+    m = Matrix3Array()
+    m.from_euler(euler[:,0], euler[:,1], euler[:,2])
+    m.to_euler()
+
+def rotate_scalar(euler, vectors):
+    m = Matrix3()
+    for i in range(len(vectors)):
+        m.from_euler(*euler[i])
+        m * vectors[i]
+
+def rotate_array(euler, vectors):
+    m = Matrix3Array()
+    m.from_euler(euler[:,0], euler[:,1], euler[:,2])
+    m * vectors
+
+def rotate_by_id_scalar(vectors):
+    for v in vectors:
+        v.rotate_by_id(2)
+
+def rotate_by_id_array(vectors):
+    vectors.rotate_by_id(2)
+
+def quaternion_scalar(euler, v):
+    for e in euler:
+        QuaternionBase(e).transform(v)
+
+def quaternion_array(euler, v):
+    QuaternionArray(euler).transform(np.tile(v, (len(euler), 1)))
+
+
+def run(N=100000):
+    '''run the benchmarks, returning a list of (name, scalar_time, array_time)'''
+    rng = np.random.RandomState(0)
+    euler = rng.uniform(-3, 3, (N, 3)) * [1, 0.5, 1]
+    raw = rng.uniform(-5, 5, (N, 3))
+    vectors = [Vector3(v) for v in raw]
+    varray = Vector3Array(raw)
+    v = np.array([1.0, 2.0, 3.0])
+    return [
+        ('from_euler/to_euler', timed(lambda: euler_scalar(euler)), timed(lambda: euler_array(euler))),
+        ('matrix*vector', timed(lambda: rotate_scalar(euler, vectors)), timed(lambda: rotate_array(euler, varray))),
+        ('rotate_by_id', timed(lambda: rotate_by_id_scalar(vectors)), timed(lambda: rotate_by_id_array(varray))),
+        ('quaternion transform', timed(lambda: quaternion_scalar(euler, v)), timed(lambda: quaternion_array(euler, v))),
+        ]
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("-N", type=int, default=100000, help="number of elements")
+    args = parser.parse_args()
+    for (name, t_scalar, t_array) in run(args.N):
+        print("%-22s scalar %8.3fs  array %8.4fs  speedup %6.1fx" % (name, t_scalar, t_array, t_scalar/max(t_array, 1.0e-9)))
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+
+"""
+Unit tests for the benchmark suite
+"""
+
+from __future__ import absolute_import, print_function
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import bench_mavlink
+
+
+class BenchTest(unittest.TestCase):
+
+    def test_run(self):
+        """every benchmark runs on small logs and the results are JSON"""
+        results = json.loads(json.dumps(bench_mavlink.run(N=200, repeat=1)))
+        self.assertEqual(sorted(results['results'].keys()), sorted(bench_mavlink.Benchmarks.names))
+        for r in results['results'].values():
+            self.assertTrue(r['ops'] > 0)
+            self.assertTrue(r['seconds'] > 0)
+        self.assertEqual(results['meta']['N'], 200)
+
+    def test_compare(self):
+        """slowdowns beyond the threshold are flagged, per operation"""
+        old = {'results' : {'a' : {'seconds' : 1.0, 'ops' : 100},
+                            'b' : {'seconds' : 1.0, 'ops' : 100},
+                            'c' : {'seconds' : 1.0, 'ops' : 100}}}
+        new = {'results' : {'a' : {'seconds' : 1.05, 'ops' : 100},
+                            'b' : {'seconds' : 2.0, 'ops' : 100},
+                            'c' : {'seconds' : 2.0, 'ops' : 200},
+                            'd' : {'seconds' : 1.0, 'ops' : 1}}}
+        ret = bench_mavlink.compare(old, new, threshold=0.1)
+        self.assertEqual([(r[0], r[4]) for r in ret], [('a', False), ('b', True), ('c', False)])
+        self.assertAlmostEqual(ret[1][3], 2.0)
+
+    def test_mat_memory(self):
+        """every MAT writing method runs and reports its peak memory"""
+        try:
+            import resource
+            import scipy.io
+        except ImportError:
+            self.skipTest("needs scipy and the resource module")
+        results = bench_mavlink.mat_memory(N=500)
+        self.assertEqual(sorted(results.keys()), sorted(bench_mavlink.MAT_METHODS))
+        for (mb, seconds) in results.values():
+            self.assertTrue(mb > 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+
+"""
+Unit tests for the CSV log reader
+"""
+
+from __future__ import absolute_import, print_function
+import unittest
+import os
+import shutil
+import tempfile
+
+import numpy
+
+from pymavlink import CSVReader
+from pymavlink import mavextra
+
+
+class CSVReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'test.csv')
+        f = open(self.filename, 'w')
+        f.write("WEEK_NB;TOW;ACCL_X;NAME\n")
+        for i in range(500):
+            f.write("2100.0;%r;%r;%s\n" % (371149.0 + i * 0.1, i * 0.5, 'a' if i % 2 else 'b'))
+            if i == 100:
+                f.write("\n")
+        f.close()
+        self.expression = "gps_time_to_epoch(CSV.WEEK_NB,CSV.TOW*1000.0)"
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_read(self):
+        """messages are read with typed columns, skipping blank lines"""
+        mlog = CSVReader.CSVReader(self.filename, timestamp_expression=self.expression)
+        self.assertEqual(mlog._count, 500)
+        self.assertEqual(mlog.fmt.numeric, [True, True, True, False])
+        n = 0
+        while True:
+            m = mlog.recv_match(type='CSV')
+            if m is None:
+                break
+            self.assertEqual(m.ACCL_X, n * 0.5)
+            self.assertEqual(m.NAME, 'a' if n % 2 else 'b')
+            self.assertAlmostEqual(m._timestamp, mavextra.gps_time_to_epoch(m.WEEK_NB, m.TOW*1000.0))
+            n += 1
+        self.assertEqual(n, 500)
+        mlog.rewind()
+        self.assertEqual(mlog.recv_match(type='GPS'), None)
+        mlog.rewind()
+        self.assertEqual(mlog.recv_msg().ACCL_X, 0)
+
+    def test_seek(self):
+        """seeking by time finds the first later row"""
+        mlog = CSVReader.CSVReader(self.filename, timestamp_expression=self.expression)
+        t = mavextra.gps_time_to_epoch(2100, (371149.0 + 250 * 0.1) * 1000.0)
+        mlog.skip_to_timestamp(t - 0.01)
+        self.assertEqual(mlog.recv_msg().ACCL_X, 250 * 0.5)
+
+    def test_extract_arrays(self):
+        """bulk extraction matches the parsed messages"""
+        mlog = CSVReader.CSVReader(self.filename, timestamp_expression=self.expression)
+        arrays = mlog.extract_arrays('CSV')
+        self.assertEqual(len(arrays['TOW']), 500)
+        self.assertEqual(arrays['ACCL_X'].dtype, numpy.float64)
+        self.assertEqual(list(arrays['NAME'][:2]), ['b', 'a'])
+        mlog.rewind()
+        for i in range(500):
+            m = mlog.recv_msg()
+            self.assertEqual(arrays['TOW'][i], m.TOW)
+            self.assertAlmostEqual(arrays['_timestamp'][i], m._timestamp)
+        part = mlog.extract_arrays('CSV', start=20, count=10)
+        self.assertEqual(list(part['_offset']), list(range(20, 30)))
+        self.assertEqual(mlog.extract_arrays('GPS'), None)
+
+    def test_timestamps_chunked(self):
+        """timestamps worked out a chunk of rows at a time match the messages"""
+        chunk = CSVReader.TIMESTAMP_CHUNK_ROWS
+        CSVReader.TIMESTAMP_CHUNK_ROWS = 64
+        try:
+            mlog = CSVReader.CSVReader(self.filename, timestamp_expression=self.expression)
+            timestamps = mlog.timestamps()
+        finally:
+            CSVReader.TIMESTAMP_CHUNK_ROWS = chunk
+        self.assertEqual(len(timestamps), 500)
+        mlog.rewind()
+        for i in range(500):
+            self.assertAlmostEqual(timestamps[i], mlog.recv_msg()._timestamp)
+
+
+if __name__ == '__main__':
+    unittest.main()
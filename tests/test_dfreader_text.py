@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+
+"""
+Unit tests for the indexed text dataflash log reader
+"""
+
+from __future__ import absolute_import, print_function
+import unittest
+import os
+import shutil
+import tempfile
+import pkg_resources
+
+import numpy
+
+from pymavlink import DFReader
+
+
+def write_text_log(binfile, filename):
+    """write a text log holding the messages of a binary log"""
+    mlog = DFReader.DFReader_binary(binfile)
+    f = open(filename, 'w')
+    while True:
+        m = mlog.recv_msg()
+        if m is None:
+            break
+        values = []
+        for v in m._elements:
+            if isinstance(v, bytes):
+                v = DFReader.null_term(v.decode('ascii', 'ignore'))
+            values.append(repr(v) if isinstance(v, float) else str(v))
+        f.write("%s, %s\n" % (m.fmt.name, ", ".join(values)))
+    f.close()
+
+
+class DFReaderTextTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.binfile = pkg_resources.resource_filename(__name__, "test.BIN")
+        self.filename = os.path.join(self.tmpdir, 'test.log')
+        write_text_log(self.binfile, self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_index(self):
+        """the index finds every line of each type"""
+        mlog = DFReader.DFReader_text(self.filename)
+        for mtype in ['ATT', 'GPS', 'IMU', 'MSG', 'PARM', 'MODE']:
+            n = len([l for l in open(self.filename) if l.startswith(mtype + ',')])
+            self.assertEqual(mlog.counts[mtype], n)
+        n = 0
+        while mlog.recv_match(type='GPS') is not None:
+            n += 1
+        self.assertEqual(n, mlog.counts['GPS'])
+        self.assertEqual(mlog.recv_match(type='GPS'), None)
+        mlog.rewind()
+        self.assertEqual(mlog.recv_match(type='NOSUCHTYPE'), None)
+
+    def test_extract_arrays(self):
+        """bulk extraction matches the parsed messages"""
+        mlog = DFReader.DFReader_text(self.filename)
+        arrays = mlog.extract_arrays('IMU')
+        self.assertEqual(len(arrays['TimeUS']), mlog.counts['IMU'])
+        self.assertEqual(arrays['TimeUS'].dtype, numpy.int64)
+        mlog.rewind()
+        i = 0
+        while True:
+            m = mlog.recv_match(type='IMU')
+            if m is None:
+                break
+            for c in m.get_fieldnames():
+                self.assertAlmostEqual(arrays[c][i], getattr(m, c))
+            self.assertAlmostEqual(arrays['_timestamp'][i], m._timestamp)
+            i += 1
+        self.assertEqual(i, len(arrays['TimeUS']))
+        part = mlog.extract_arrays('IMU', start=10, count=5)
+        self.assertEqual(list(part['TimeUS']), list(arrays['TimeUS'][10:15]))
+        # MSG has a string column
+        self.assertEqual(mlog.extract_arrays('MSG'), None)
+
+    def test_garbled_field(self):
+        """a field that isn't a number only drops its line from the arrays"""
+        lines = open(self.filename).readlines()
+        att = [i for i in range(len(lines)) if lines[i].startswith('ATT,')]
+        fields = lines[att[3]].split(', ')
+        fields[2] = 'nan?'
+        lines[att[3]] = ', '.join(fields)
+        open(self.filename, 'w').write(''.join(lines))
+        mlog = DFReader.DFReader_text(self.filename)
+        arrays = mlog.extract_arrays('ATT')
+        self.assertEqual(len(arrays['TimeUS']), len(att) - 1)
+        self.assertEqual(len(arrays['_offset']), len(att) - 1)
+        times = []
+        while True:
+            m = mlog.recv_match(type='ATT')
+            if m is None:
+                break
+            times.append(m.TimeUS)
+        self.assertEqual(len(times), len(att))
+        self.assertEqual(list(arrays['TimeUS']), times[:3] + times[4:])
+
+    def test_garbage(self):
+        """a long run of unparseable lines doesn't recurse"""
+        f = open(self.filename, 'a')
+        f.write("XYZ, 1, 2\n" * 5000)
+        f.write("junk\n" * 5000)
+        f.close()
+        mlog = DFReader.DFReader_text(self.filename)
+        n = 0
+        while mlog.recv_msg() is not None:
+            n += 1
+        self.assertTrue(n > 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
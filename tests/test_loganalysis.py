@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+
+"""
+Unit tests for the loganalysis library
+"""
+
+from __future__ import absolute_import, print_function
+import unittest
+import json
+import os
+import shutil
+import struct
+import tempfile
+import pkg_resources
+
+from pymavlink import mavutil
+from pymavlink import loganalysis
+
+
+class CountAnalyzer(loganalysis.Analyzer):
+    """count the messages of each type seen"""
+    name = 'count'
+    types = ['ATT', 'GPS']
+
+    def start(self, mlog):
+        self.counts = {}
+
+    def message(self, m, mlog):
+        self.counts[m.get_type()] = self.counts.get(m.get_type(), 0) + 1
+
+    def finish(self, mlog, last_timestamp):
+        return self.counts
+
+
+class LogAnalysisTest(unittest.TestCase):
+
+    """
+    Class to test single pass log analysis
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Constructor, set up some data that is reused in many tests"""
+        super(LogAnalysisTest, self).__init__(*args, **kwargs)
+        self.filepath = pkg_resources.resource_filename(__name__, "test.BIN")
+
+    def test_scan(self):
+        """Test all analyzers from one pass over a dataflash log"""
+        mlog = mavutil.mavlink_connection(self.filepath)
+        analyzers = loganalysis.create_analyzers() + [CountAnalyzer()]
+        result = loganalysis.scan_log(mlog, analyzers)
+        self.assertEqual(sorted(result.keys()),
+                         ['count', 'flightmodes', 'flighttime', 'gpslock', 'loss', 'sigloss', 'summary'])
+        self.assertEqual(result['count'], {'ATT' : 24, 'GPS' : 5})
+        self.assertEqual([c['mode'] for c in result['flightmodes']['changes']], ['MANUAL'])
+        self.assertTrue(result['flightmodes']['time_in_mode']['MANUAL'] > 0)
+        self.assertEqual(result['flighttime']['flights'], [])
+        self.assertEqual(result['sigloss']['gaps'], [])
+        self.assertEqual(result['loss']['packets'], 0)
+        json.dumps(result)
+
+    def test_loss_tlog(self):
+        """Test packet loss on a tlog whatever the other analyzers read"""
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'loss.tlog')
+            mav = mavutil.mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+            hb = mavutil.mavlink.MAVLink_heartbeat_message(1, 3, 0, 0, 0, 3)
+            att = mavutil.mavlink.MAVLink_attitude_message(0, 0.1, 0.2, 0.3, 0, 0, 0)
+            with open(filename, 'wb') as f:
+                for i in range(300):
+                    buf = (hb if i % 10 == 0 else att).pack(mav)
+                    mav.seq = (mav.seq + 1) % 256
+                    if i in (50, 51, 120, 250):
+                        continue
+                    f.write(struct.pack('>Q', 1600000000000000 + i * 100000) + buf)
+            for names in [['loss'], ['loss', 'summary'], None]:
+                mlog = mavutil.mavlink_connection(filename)
+                result = loganalysis.scan_log(mlog, loganalysis.create_analyzers(names))
+                mlog.close()
+                self.assertEqual(result['loss']['packets'], 296)
+                self.assertEqual(result['loss']['lost'], 4)
+                self.assertAlmostEqual(result['loss']['loss_percent'], 400.0 / 300)
+                self.assertEqual(result['loss']['duplicates'], 0)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_sigloss_types(self):
+        """Test restricting sigloss to some message types"""
+        mlog = mavutil.mavlink_connection(self.filepath)
+        analyzers = loganalysis.create_analyzers(['sigloss'], deltat=0.01, sigloss_types=['GPS'])
+        result = loganalysis.scan_log(mlog, analyzers)
+        self.assertEqual(len(result['sigloss']['gaps']), 4)
+        self.assertRaises(KeyError, loganalysis.create_analyzers, ['nosuch'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+
+"""
+Unit tests for columnar log export
+"""
+
+from __future__ import absolute_import, print_function
+import unittest
+import os
+import shutil
+import struct
+import tempfile
+import pkg_resources
+
+import numpy
+
+from pymavlink import mavutil
+from pymavlink import logexport
+from pymavlink import DFReader
+
+try:
+    import pyarrow.parquet
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+
+def write_df_log(filename):
+    """write a dataflash log with units metadata and an array field"""
+    f = open(filename, 'wb')
+    formats = {}
+    def fmt(type, name, format, columns):
+        structfmt = '<' + ''.join([DFReader.FORMAT_TO_STRUCT[c][0] for c in format])
+        formats[name] = (type, structfmt)
+        length = 3 + struct.calcsize(structfmt)
+        f.write(struct.pack('<BBBBB4s16s64s', 0xA3, 0x95, 0x80, type, length,
+                            name.encode(), format.encode(), columns.encode()))
+    def write(name, *values):
+        (type, structfmt) = formats[name]
+        f.write(struct.pack('<BBB', 0xA3, 0x95, type) + struct.pack(structfmt, *values))
+    fmt(200, 'UNIT', 'QbZ', 'TimeUS,Id,Label')
+    fmt(201, 'MULT', 'Qbd', 'TimeUS,Id,Mult')
+    fmt(202, 'FMTU', 'QBNN', 'TimeUS,FmtType,UnitIds,MultIds')
+    fmt(203, 'BARO', 'Qf', 'TimeUS,Alt')
+    fmt(204, 'FFT', 'QHa', 'TimeUS,N,Bins')
+    write('UNIT', 0, ord('s'), b'second')
+    write('UNIT', 0, ord('m'), b'metre')
+    write('UNIT', 0, ord('-'), b'')
+    write('MULT', 0, ord('F'), 1e-6)
+    write('MULT', 0, ord('0'), 1.0)
+    write('FMTU', 0, 203, b'sm', b'F0')
+    write('FMTU', 0, 204, b's--', b'F--')
+    for i in range(100):
+        write('BARO', 1000000 + i * 10000, 0.5 * i)
+        if i % 10 == 0:
+            write('FFT', 1000000 + i * 10000 + 1, i, struct.pack('<32h', *range(i, i + 32)))
+    f.close()
+
+
+class LogExportTest(unittest.TestCase):
+
+    """
+    Class to test exporting logs one table per message type
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filepath = pkg_resources.resource_filename(__name__, "test.BIN")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    @unittest.skipIf(pyarrow is None, "pyarrow not installed")
+    def test_parquet(self):
+        """Test parquet export of a dataflash log with units and arrays"""
+        filename = os.path.join(self.tmpdir, 'units.bin')
+        write_df_log(filename)
+        mlog = mavutil.mavlink_connection(filename)
+        path = os.path.join(self.tmpdir, 'parquet')
+        counts = logexport.export_log(mlog, path, types=['BARO', 'FFT'], row_group_size=30)
+        self.assertEqual(counts, {'BARO' : 100, 'FFT' : 10})
+
+        f = pyarrow.parquet.ParquetFile(os.path.join(path, 'BARO.parquet'))
+        self.assertEqual(f.metadata.num_row_groups, 4)
+        schema = f.schema_arrow
+        self.assertEqual(schema.names, ['timestamp', 'TimeUS', 'Alt'])
+        self.assertEqual(schema.field('TimeUS').metadata[b'unit'], b'second')
+        self.assertEqual(float(schema.field('TimeUS').metadata[b'multiplier']), 1e-6)
+        self.assertEqual(schema.field('Alt').metadata, {b'unit' : b'metre'})
+        table = f.read()
+        self.assertEqual(table.column('Alt').to_pylist()[3], 1.5)
+
+        table = pyarrow.parquet.read_table(os.path.join(path, 'FFT.parquet'))
+        bins = table.column('Bins').to_pylist()
+        self.assertEqual(len(bins), 10)
+        self.assertEqual(bins[2], list(range(20, 52)))
+
+    @unittest.skipIf(pyarrow is None, "pyarrow not installed")
+    def test_condition(self):
+        """Test arrow export through the message by message path"""
+        mlog = mavutil.mavlink_connection(self.filepath)
+        path = os.path.join(self.tmpdir, 'arrow')
+        counts = logexport.export_log(mlog, path, format='arrow', types=['GPS', 'AT*'],
+                                      condition='GPS.Lat < 0')
+        self.assertEqual(sorted(counts.keys()), ['ATT', 'GPS'])
+        table = pyarrow.ipc.open_file(os.path.join(path, 'GPS.arrow')).read_all()
+        self.assertEqual(table.num_rows, 5)
+        self.assertAlmostEqual(table.column('Lat').to_pylist()[0], -35.3626277)
+
+    @unittest.skipIf(h5py is None, "h5py not installed")
+    def test_hdf5(self):
+        """Test HDF5 export matches the parsed messages"""
+        mlog = mavutil.mavlink_connection(self.filepath)
+        path = os.path.join(self.tmpdir, 'log.h5')
+        logexport.export_log(mlog, path, format='hdf5', nottypes=['PARM'], row_group_size=10)
+        f = h5py.File(path, 'r')
+        self.assertFalse('PARM' in f)
+        mlog.rewind()
+        imu = []
+        while True:
+            m = mlog.recv_match(type='IMU')
+            if m is None:
+                break
+            imu.append((m._timestamp, m.AccX))
+        self.assertTrue(numpy.allclose(f['IMU']['timestamp'][:], [x[0] for x in imu]))
+        self.assertTrue(numpy.allclose(f['IMU']['AccX'][:], [x[1] for x in imu]))
+        self.assertEqual(f['MSG']['Message'][0].decode(), 'ArduPlane V3.8.2-dev (8178ab40)')
+        f.close()
+
+    def test_mat(self):
+        """Test MAT output from bulk extraction matches message by message"""
+        try:
+            import scipy.io
+        except ImportError:
+            self.skipTest("scipy not installed")
+        mlog = mavutil.mavlink_connection(self.filepath)
+        bulk = logexport.MATWriter(mlog)
+        for t in ['IMU', 'GPS', 'PARM', 'MODE']:
+            self.assertTrue(bulk.add_bulk(t, chunk=10))
+        slow = logexport.MATWriter(mlog)
+        while True:
+            m = mlog.recv_match(type=['IMU', 'GPS', 'PARM', 'MODE'])
+            if m is None:
+                break
+            slow.add(m)
+            bulk.add(m)
+        self.assertEqual(bulk.tables['IMU'].n, 45)
+        for (writer, name) in [(bulk, 'bulk.mat'), (slow, 'slow.mat')]:
+            writer.save(os.path.join(self.tmpdir, name))
+        a = scipy.io.loadmat(os.path.join(self.tmpdir, 'bulk.mat'))
+        b = scipy.io.loadmat(os.path.join(self.tmpdir, 'slow.mat'))
+        self.assertEqual(a['IMU'].shape, (45, 14))
+        self.assertTrue(numpy.allclose(a['IMU'], b['IMU']))
+        self.assertTrue(numpy.allclose(a['GPS'], b['GPS']))
+        self.assertTrue((a['PARM'] == b['PARM']).all())
+        # all integer types stay integers
+        self.assertEqual(a['MODE'].dtype, numpy.int64)
+        self.assertEqual(b['MODE'].dtype, numpy.int64)
+        self.assertTrue((a['MODE'] == b['MODE']).all())
+        self.assertEqual(a['IMU'].dtype, numpy.float64)
+        self.assertEqual(a['GPS_label'][0][0][0], 'TimeUS')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+
+"""
+Unit tests for the magfit library
+"""
+
+from __future__ import absolute_import, print_function
+import unittest
+import os
+import shutil
+import struct
+import tempfile
+
+import numpy
+
+from pymavlink import mavutil
+from pymavlink import magfit
+from pymavlink.rotmat import Vector3, Matrix3
+
+
+def sphere_points(N, radius, seed=0):
+    """N points spread over a sphere"""
+    rng = numpy.random.RandomState(seed)
+    v = rng.normal(size=(N, 3))
+    return radius * v / numpy.linalg.norm(v, axis=1)[:, numpy.newaxis]
+
+
+class MagfitTest(unittest.TestCase):
+
+    """
+    Class to test the magnetometer fitting engine
+    """
+
+    def check_jacobian(self, residuals, jacobian, p, args):
+        """check an analytic jacobian against finite differences"""
+        J = jacobian(numpy.array(p, dtype=float), *args)
+        eps = 1.0e-6
+        for i in range(len(p)):
+            p1 = numpy.array(p, dtype=float)
+            p2 = numpy.array(p, dtype=float)
+            p1[i] -= eps
+            p2[i] += eps
+            numeric = (residuals(p2, *args) - residuals(p1, *args)) / (2*eps)
+            self.assertTrue(numpy.allclose(J[:, i], numeric, atol=1.0e-4), "param %u" % i)
+
+    def test_jacobians(self):
+        """Test analytic jacobians match numerical differentiation"""
+        mag = sphere_points(50, 400)
+        motor = numpy.linspace(0, 1, 50)
+        self.check_jacobian(magfit.sphere_residuals, magfit.sphere_jacobian,
+                            [10, -20, 30, 400], (mag, None))
+        self.check_jacobian(magfit.ellipsoid_residuals, magfit.ellipsoid_jacobian,
+                            [10, -20, 30, 400, 1, 1.1, 0.9, 0.05, -0.02, 0.03], (mag, None))
+        self.check_jacobian(magfit.motor_residuals, magfit.motor_jacobian,
+                            [10, -20, 30, 5, 6, -7, 400], (mag, motor))
+        roll = numpy.radians(numpy.linspace(-20, 20, 50))
+        pitch = numpy.radians(numpy.linspace(10, -10, 50))
+        heading = numpy.linspace(0, 350, 50)
+        self.check_jacobian(magfit.heading_residuals, magfit.heading_jacobian,
+                            [10, -20, 30, 5], (mag, roll, pitch, heading, None))
+
+    def test_sphere(self):
+        """Test fitting offsets to points on a sphere"""
+        ofs = numpy.array([100, -50, 25])
+        mag = sphere_points(500, 450) - ofs
+        (offsets, radius) = magfit.fit_sphere(mag)
+        self.assertTrue(numpy.allclose(offsets, ofs, atol=1.0e-3))
+        self.assertAlmostEqual(radius, 450, 3)
+
+    def test_ellipsoid(self):
+        """Test fitting elliptical corrections"""
+        ofs = numpy.array([100, -50, 25])
+        diag = numpy.array([1.0, 1.1, 0.9])
+        offdiag = numpy.array([0.05, -0.02, 0.03])
+        M = magfit.ellipsoid_correct(numpy.eye(3), numpy.zeros(3), diag, offdiag)
+        mag = sphere_points(500, 500).dot(numpy.linalg.inv(M).T) - ofs
+        (offsets, radius, diag2, offdiag2) = magfit.fit_ellipsoid(mag)
+        self.assertTrue(numpy.allclose(offsets, ofs, atol=1.0e-3))
+        self.assertTrue(numpy.allclose(diag2, diag, atol=1.0e-6))
+        self.assertTrue(numpy.allclose(offdiag2, offdiag, atol=1.0e-6))
+
+    def test_select_data(self):
+        """Test thinning out of samples"""
+        mag = numpy.array([[1, 1, 1], [2, 2, 2], [3, 3, 3], [30, 1, 1], [4, 4, 4]])
+        self.assertEqual(list(magfit.select_data(mag)), [0, 1, 3])
+        self.assertEqual(list(magfit.trim_by_radius(numpy.arange(16)[::-1], 1.0/8)), list(range(13, 1, -1)))
+
+    def test_wmm_error(self):
+        """Test the world magnetic model error against a per-sample calculation"""
+        rng = numpy.random.RandomState(1)
+        N = 20
+        mag = rng.uniform(-300, 300, (N, 3))
+        roll = rng.uniform(-30, 30, N)
+        pitch = rng.uniform(-30, 30, N)
+        current = rng.uniform(0, 20, N)
+        current[3] = numpy.nan
+        earth_field = numpy.array([230.0, 50.0, -520.0])
+        declination = 12.5
+        c = magfit.Correction()
+        c.offsets = numpy.array([10.0, -20.0, 30.0])
+        c.diag = numpy.array([1.0, 1.1, 0.95])
+        c.offdiag = numpy.array([0.01, -0.02, 0.03])
+        c.cmot = numpy.array([0.5, -0.3, 0.2])
+        c.scaling = 1.1
+
+        total = 0
+        for i in range(N):
+            m = (Vector3(mag[i]) + Vector3(c.offsets)) * c.scaling
+            mat = Matrix3(Vector3(c.diag[0], c.offdiag[0], c.offdiag[1]),
+                          Vector3(c.offdiag[0], c.diag[1], c.offdiag[2]),
+                          Vector3(c.offdiag[1], c.offdiag[2], c.diag[2]))
+            m = mat * m
+            if not numpy.isnan(current[i]):
+                m += Vector3(c.cmot) * current[i]
+            dcm = Matrix3()
+            dcm.from_euler(numpy.radians(roll[i]), numpy.radians(pitch[i]), 0)
+            cos_pitch_sq = 1.0-(dcm.c.x*dcm.c.x)
+            headY = m.y * dcm.c.z - m.z * dcm.c.y
+            headX = m.x * cos_pitch_sq - dcm.c.x * (m.y * dcm.c.y + m.z * dcm.c.z)
+            yaw = numpy.degrees(numpy.arctan2(-headY, headX)) + declination
+            rot = Matrix3()
+            rot.from_euler(numpy.radians(roll[i]), numpy.radians(pitch[i]), numpy.radians(yaw))
+            total += (rot.transposed() * Vector3(earth_field) - m).length()
+
+        err = magfit.wmm_error(c, mag, roll, pitch, current, earth_field, declination)
+        self.assertAlmostEqual(err, total / N, 6)
+
+        (raw, valid) = c.uncorrect(c.correct(mag, current), c.offsets, current)
+        self.assertTrue(numpy.all(valid))
+        self.assertTrue(numpy.all(numpy.abs(raw - mag) <= 1.0))
+
+    def test_tlog(self):
+        """Test extracting RAW_IMU data and fitting motor interference"""
+        ofs = numpy.array([100, -50, 25])
+        motor_ofs = numpy.array([30, -20, 40])
+        sensor_ofs = numpy.array([-10, 5, 7])
+        N = 1000
+        field = sphere_points(N, 450)
+        motor = numpy.linspace(0, 1, N) ** 2
+        pwm = 1100 + motor * 800
+        mag = numpy.round(field - ofs - motor[:, numpy.newaxis] * motor_ofs + sensor_ofs)
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'magfit.tlog')
+            mav = mavutil.mavlink.MAVLink(None)
+            with open(filename, 'wb') as f:
+                def write(usec, msg):
+                    f.write(struct.pack('>Q', usec) + msg.pack(mav))
+                write(1000, mavutil.mavlink.MAVLink_sensor_offsets_message(
+                    sensor_ofs[0], sensor_ofs[1], sensor_ofs[2], 0, 0, 0, 0, 0, 0, 0, 0, 0))
+                for i in range(N):
+                    t = 2000000 + i * 10000
+                    p = int(pwm[i])
+                    write(t, mavutil.mavlink.MAVLink_servo_output_raw_message(0, 0, p, p, p, p, 0, 0, 0, 0))
+                    write(t + 1, mavutil.mavlink.MAVLink_raw_imu_message(
+                        0, 0, 0, 0, 0, 0, 0, int(mag[i][0]), int(mag[i][1]), int(mag[i][2])))
+            mlog = mavutil.mavlink_connection(filename)
+            (data, arrays) = magfit.load_mag(mlog, None, extra_types=['SERVO_OUTPUT_RAW'])
+        finally:
+            shutil.rmtree(tmpdir)
+
+        self.assertEqual(len(data), N)
+        self.assertTrue(numpy.allclose(data.offsets, sensor_ofs))
+        motor2 = magfit.motor_output(arrays, data.position)
+        self.assertTrue(numpy.allclose(motor2, (numpy.trunc(pwm) - 1100) / 800.0))
+        (offsets, motor_ofs2, radius) = magfit.fit_motors(data.mag, motor2)
+        self.assertTrue(numpy.allclose(offsets, ofs, atol=1))
+        self.assertTrue(numpy.allclose(motor_ofs2, motor_ofs, atol=2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+
+"""
+Unit tests for the mavarray library
+"""
+
+from __future__ import absolute_import, print_function
+import unittest
+import re
+import pkg_resources
+
+import numpy
+
+from pymavlink import mavutil
+from pymavlink import mavextra
+from pymavlink import mavarray
+
+
+class MAVArrayTest(unittest.TestCase):
+
+    """
+    Class to test columnar expression evaluation against the
+    message by message evaluation done by mavgraph
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Constructor, set up some data that is reused in many tests"""
+        super(MAVArrayTest, self).__init__(*args, **kwargs)
+        self.filepath = pkg_resources.resource_filename(__name__, "test.BIN")
+
+    def scalar(self, expression, condition=None):
+        """evaluate an expression one message at a time"""
+        mavextra.reset_state_data()
+        mlog = mavutil.mavlink_connection(self.filepath)
+        types = set(re.findall(mavarray.re_caps, expression))
+        messages = {}
+        t = []
+        v = []
+        while True:
+            m = mlog.recv_match(condition=condition)
+            if m is None:
+                break
+            messages[m.get_type()] = m
+            if m.get_type() not in types:
+                continue
+            value = mavutil.evaluate_expression(expression, messages)
+            if value is None:
+                continue
+            t.append(m._timestamp)
+            v.append(value)
+        return (t, v)
+
+    def vector(self, expression, condition=None):
+        """evaluate an expression over whole columns"""
+        mavextra.reset_state_data()
+        mlog = mavutil.mavlink_connection(self.filepath)
+        types = set(re.findall(mavarray.re_caps, expression))
+        if condition is not None:
+            types = types.union(re.findall(mavarray.re_caps, condition))
+        arrays = mavarray.extract_arrays(mlog, types)
+        return mavarray.evaluate_expression(expression, arrays, condition)
+
+    def check_same(self, expression, condition=None):
+        (t1, v1) = self.scalar(expression, condition)
+        (t2, v2) = self.vector(expression, condition)
+        self.assertTrue(len(t1) > 0)
+        self.assertEqual(len(t1), len(t2))
+        self.assertTrue(numpy.allclose(t1, t2))
+        self.assertTrue(numpy.allclose(numpy.array(v1, dtype=float), v2.astype(float)))
+
+    def test_extract(self):
+        """Test extracted columns match parsed messages"""
+        mlog = mavutil.mavlink_connection(self.filepath)
+        arrays = mavarray.extract_arrays(mlog, ['ATT', 'GPS', 'PARM', 'FMT', 'NOSUCH'])
+        self.assertFalse('NOSUCH' in arrays)
+        # FMT can't be extracted in bulk, so is read message by message
+        self.assertTrue(len(arrays['FMT']) > 0)
+        mlog.rewind()
+        parm = []
+        while True:
+            m = mlog.recv_match(type='PARM')
+            if m is None:
+                break
+            parm.append(m)
+        self.assertEqual(len(arrays['PARM']), len(parm))
+        self.assertEqual(arrays['PARM'].Name[5], parm[5].Name)
+        self.assertEqual(arrays['PARM'].Value[5], parm[5].Value)
+        self.assertEqual(arrays['PARM']._timestamp[5], parm[5]._timestamp)
+
+    def test_single_type(self):
+        """Test expressions on one message type"""
+        self.check_same("ATT.Roll*2")
+        self.check_same("degrees(IMU.GyrX)")
+        self.check_same("wrap_180(ATT.Yaw)")
+        self.check_same("mag_field_df(MAG)")
+
+    def test_latest_value(self):
+        """Test expressions aligning several message types"""
+        self.check_same("ATT.Roll-IMU.GyrX")
+        self.check_same("ATT.Roll{IMU.AccZ<-9.8}")
+
+    def test_condition(self):
+        """Test expressions with a separate condition"""
+        self.check_same("ATT.Pitch", "IMU.AccZ<-9.8")
+        # messages failing the condition don't update the latest values
+        self.check_same("ATT.Roll-IMU.GyrX", "IMU.AccZ<-9.8")
+        self.check_same("IMU.AccX", "IMU.AccZ<-9.8")
+        self.check_same("ATT.Roll", "GPS.Status>=3")
+        (t, v) = self.vector("ATT.Roll", "GPS2.Status>=3")
+        self.assertEqual(len(t), 0)
+
+    def test_divide_by_zero(self):
+        """Test results of dividing by zero are dropped"""
+        self.check_same("AETR.Ail/AETR.Elev")
+        self.check_same("AETR.Ail//AETR.Elev")
+        self.check_same("(AETR.Elev*0.0)/AETR.Elev")
+
+    def test_filters(self):
+        """Test stateful filters in expressions"""
+        self.check_same("lowpass(ATT.Roll,'r',0.9)")
+        self.check_same("average(IMU.AccX,'a',5)")
+        self.check_same("diff(ATT.Roll,'d')-IMU.GyrX")
+
+    def test_batch_filters(self):
+        """Test batch filters match feeding a FilterState one value at a time"""
+        values = numpy.sin(numpy.arange(100) * 0.3) * 200
+        timestamps = 10 + numpy.floor(numpy.arange(100) / 3.0) * 0.1
+        class reader(object):
+            timestamp = 0
+        mav = reader()
+        state = mavextra.FilterState(mav)
+        def run(f):
+            state.reset()
+            ret = []
+            for i in range(len(values)):
+                mav.timestamp = timestamps[i]
+                ret.append(f(values[i]))
+            return numpy.array(ret)
+        self.assertTrue(numpy.allclose(run(lambda v: state.average(v, 'k', 7)), mavarray.average(values, 7)))
+        self.assertTrue(numpy.allclose(run(lambda v: state.lowpass(v, 'k', 0.8)), mavarray.lowpass(values, 0.8)))
+        self.assertTrue(numpy.allclose(run(lambda v: state.diff(v, 'k')), mavarray.diff(values)))
+        self.assertTrue(numpy.allclose(run(lambda v: state.delta(v, 'k')), mavarray.delta(values, timestamps)))
+        self.assertTrue(numpy.allclose(run(lambda v: state.delta(v, 'k', angle=True)),
+                                       mavarray.delta(values, timestamps, angle=True)))
+
+    def test_fallback(self):
+        """Test expressions with no vectorised version"""
+        self.check_same("demix1(ATT.Roll,ATT.Pitch)")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+
+"""
+Unit tests for building several dialects at once
+"""
+
+from __future__ import absolute_import, print_function
+import unittest
+import os
+import shutil
+import tempfile
+
+from pymavlink.generator import mavbuild
+from pymavlink.generator import mavgen
+from pymavlink.generator import mavparse
+
+
+class MAVBuildTest(unittest.TestCase):
+
+    def setUp(self):
+        self.jobs = [('minimal', mavparse.PROTOCOL_1_0), ('test', mavparse.PROTOCOL_2_0)]
+        for (dialect, wire_protocol) in self.jobs:
+            if not os.path.exists(mavgen.dialect_paths(dialect, wire_protocol)[1]):
+                self.skipTest("%s.xml not available" % dialect)
+
+    def test_incremental(self):
+        """unchanged dialects aren't rebuilt"""
+        self.assertEqual(mavbuild.build_dialects(self.jobs, processes=1, force=True), [])
+        (py, xml) = mavgen.dialect_paths('minimal', mavparse.PROTOCOL_1_0)
+        mtime = os.path.getmtime(py)
+        hashes = mavbuild._load_hashes(os.path.dirname(py))
+        self.assertTrue('minimal.py' in hashes)
+        self.assertEqual(mavbuild.build_dialects(self.jobs, processes=1), [])
+        self.assertEqual(os.path.getmtime(py), mtime)
+        self.assertEqual(mavbuild._load_hashes(os.path.dirname(py)), hashes)
+
+    def test_shared_cache(self):
+        """dialects generated from shared parsed XML are unchanged"""
+        tmpdir = tempfile.mkdtemp()
+        try:
+            cache = mavgen.XMLCache()
+            xml = mavgen.dialect_paths('test', mavparse.PROTOCOL_2_0)[1]
+            out = []
+            for (name, c) in [('out_plain', None), ('out_cached1', cache), ('out_cached2', cache)]:
+                opts = mavgen.Opts(os.path.join(tmpdir, name), mavparse.PROTOCOL_2_0, validate=False)
+                self.assertTrue(mavgen.mavgen(opts, [xml], cache=c))
+                with open(os.path.join(tmpdir, name + '.py')) as f:
+                    out.append(f.read().replace(name, ''))
+            self.assertEqual(out[0], out[1])
+            self.assertEqual(out[0], out[2])
+            self.assertEqual(len(cache.parsed), 1)
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+
+"""
+Unit tests for the generated dialect cache
+"""
+
+from __future__ import absolute_import, print_function
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+
+from pymavlink.generator import mavcache
+from pymavlink.generator import mavgen
+from pymavlink.generator import mavparse
+
+
+class MAVCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.saved_env = os.environ.get('MAVLINK_DIALECT_CACHE', None)
+        os.environ['MAVLINK_DIALECT_CACHE'] = os.path.join(self.tmpdir, 'cache')
+
+    def tearDown(self):
+        if self.saved_env is None:
+            del os.environ['MAVLINK_DIALECT_CACHE']
+        else:
+            os.environ['MAVLINK_DIALECT_CACHE'] = self.saved_env
+        sys.modules.pop('mavcache_test_dialect', None)
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, text):
+        f = open(os.path.join(self.tmpdir, name), 'w')
+        f.write(text)
+        f.close()
+        return os.path.join(self.tmpdir, name)
+
+    def test_hash(self):
+        """the hash covers included files"""
+        root = self.write('root.xml', '<mavlink><include>child.xml</include></mavlink>')
+        self.write('child.xml', '<mavlink><messages/></mavlink>')
+        self.assertEqual(mavcache.xml_files(root), [root, os.path.join(self.tmpdir, 'child.xml')])
+        h1 = mavcache.dialect_hash(root, mavparse.PROTOCOL_2_0)
+        self.assertEqual(h1, mavcache.dialect_hash(root, mavparse.PROTOCOL_2_0))
+        self.assertNotEqual(h1, mavcache.dialect_hash(root, mavparse.PROTOCOL_1_0))
+        self.write('child.xml', '<mavlink><enums/><messages/></mavlink>')
+        self.assertNotEqual(h1, mavcache.dialect_hash(root, mavparse.PROTOCOL_2_0))
+
+    def test_import(self):
+        """a dialect is generated once then loaded from the cache"""
+        (py, xml) = mavgen.dialect_paths('test', mavparse.PROTOCOL_2_0)
+        if not os.path.exists(xml):
+            self.skipTest("test.xml not available")
+        mod = mavcache.import_dialect('test', mavparse.PROTOCOL_2_0, 'mavcache_test_dialect')
+        self.assertEqual(mod.DIALECT, 'test')
+        self.assertTrue('TEST_TYPES' in [c.name for c in mod.mavlink_map.values()])
+        path = mavcache.cached_dialect('test', mavparse.PROTOCOL_2_0)
+        self.assertTrue(os.path.exists(os.path.join(os.path.dirname(path), '__pycache__')))
+
+        # the second import mustn't generate anything
+        saved = mavgen.mavgen_python_dialect
+        def fail(*args, **kwargs):
+            raise RuntimeError("regenerated")
+        mavgen.mavgen_python_dialect = fail
+        try:
+            mod = mavcache.import_dialect('test', mavparse.PROTOCOL_2_0, 'mavcache_test_dialect')
+        finally:
+            mavgen.mavgen_python_dialect = saved
+        self.assertEqual(mod.DIALECT, 'test')
+        entries = os.listdir(os.environ['MAVLINK_DIALECT_CACHE'])
+        self.assertEqual(len(entries), 1)
+
+    def test_disabled(self):
+        """an empty MAVLINK_DIALECT_CACHE disables the cache"""
+        os.environ['MAVLINK_DIALECT_CACHE'] = ''
+        self.assertEqual(mavcache.cached_dialect('test', mavparse.PROTOCOL_2_0), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,6 +10,7 @@ import unittest
 import random
 
 from pymavlink import mavexpression
+from pymavlink import mavextra
 
 class ExpressionTest(unittest.TestCase):
 
@@ -42,5 +43,22 @@ class ExpressionTest(unittest.TestCase):
         assert mavexpression.evaluate_expression('kmh(10)', {}) == 36
         assert mavexpression.evaluate_expression('angle_diff(170, -90)', {}) == -100
         
+    def test_filter_state(self):
+        """Test stateful filters are kept separately for each reader"""
+        class reader(object):
+            def __init__(self):
+                self.timestamp = 0
+                self.filter_state = mavextra.FilterState(self)
+        mav1 = reader()
+        mav2 = reader()
+        for v in [1, 2, 3]:
+            mavexpression.evaluate_expression("diff(x,'d')", {'MAV' : mav1, 'x' : v})
+        assert mavexpression.evaluate_expression("diff(x,'d')", {'MAV' : mav1, 'x' : 5}) == 2
+        assert mavexpression.evaluate_expression("diff(x,'d')", {'MAV' : mav2, 'x' : 5}) == 0
+        assert mavexpression.evaluate_expression("average(x,'a',2)", {'MAV' : mav2, 'x' : 4}) == 4
+        assert mavexpression.evaluate_expression("average(x,'a',2)", {'MAV' : mav2, 'x' : 6}) == 5
+        mav1.filter_state.reset()
+        assert mavexpression.evaluate_expression("diff(x,'d')", {'MAV' : mav1, 'x' : 7}) == 0
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+
+"""
+Unit tests for python dialects generated with lazily created classes
+"""
+
+from __future__ import absolute_import, print_function
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+import importlib
+
+from pymavlink.generator import mavgen
+from pymavlink.generator import mavparse
+
+
+class FakeFile(object):
+    def __init__(self):
+        self.buf = bytearray()
+
+    def write(self, buf):
+        self.buf += buf
+
+
+@unittest.skipIf(sys.version_info < (3, 7), "needs module __getattr__")
+class LazyDialectTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        xml = os.path.join(os.path.dirname(mavgen.__file__), '..', 'dialects', 'v20', 'common.xml')
+        if not os.path.exists(xml):
+            self.skipTest("common.xml not available")
+        for (name, lazy) in [('eager_common', False), ('lazy_common', True)]:
+            opts = mavgen.Opts(os.path.join(self.tmpdir, name), mavparse.PROTOCOL_2_0,
+                               validate=False, lazy=lazy)
+            self.assertTrue(mavgen.mavgen(opts, [xml]))
+        sys.path.insert(0, self.tmpdir)
+        self.eager = importlib.import_module('eager_common')
+        self.lazy = importlib.import_module('lazy_common')
+
+    def tearDown(self):
+        sys.path.remove(self.tmpdir)
+        for name in ['eager_common', 'lazy_common']:
+            sys.modules.pop(name, None)
+        shutil.rmtree(self.tmpdir)
+
+    def test_classes(self):
+        """lazily created classes match the generated ones"""
+        self.assertFalse('MAVLink_heartbeat_message' in self.lazy.__dict__)
+        self.assertEqual(self.lazy.MAVLink_heartbeat_message.id, self.lazy.MAVLINK_MSG_ID_HEARTBEAT)
+        self.assertEqual(len(self.lazy.mavlink_map), len(self.eager.mavlink_map))
+        for (msgid, eager_cls) in self.eager.mavlink_map.items():
+            self.assertTrue(msgid in self.lazy.mavlink_map)
+            cls = self.lazy.mavlink_map[msgid]
+            self.assertEqual(cls.__name__, eager_cls.__name__)
+            for attr in ['name', 'fieldnames', 'ordered_fieldnames', 'fieldtypes',
+                         'fielddisplays_by_name', 'fieldenums_by_name', 'fieldunits_by_name',
+                         'format', 'native_format', 'orders', 'lengths', 'array_lengths',
+                         'crc_extra', 'instance_field', 'instance_offset']:
+                self.assertEqual(getattr(cls, attr), getattr(eager_cls, attr))
+        self.assertRaises(AttributeError, getattr, self.lazy, 'MAVLink_no_such_message')
+
+    def test_enums(self):
+        """lazily created enums match the generated ones"""
+        self.assertEqual(self.lazy.MAV_TYPE_GCS, self.eager.MAV_TYPE_GCS)
+        self.assertEqual(sorted(self.lazy.enums.keys()), sorted(self.eager.enums.keys()))
+        for name in self.eager.enums:
+            self.assertEqual(sorted(self.lazy.enums[name].keys()), sorted(self.eager.enums[name].keys()))
+            for (value, entry) in self.eager.enums[name].items():
+                self.assertEqual(self.lazy.enums[name][value].name, entry.name)
+                self.assertEqual(self.lazy.enums[name][value].description, entry.description)
+                self.assertEqual(self.lazy.enums[name][value].param, entry.param)
+
+    def test_send(self):
+        """messages sent through both modules are identical and decode"""
+        out = []
+        for mod in [self.eager, self.lazy]:
+            f = FakeFile()
+            mav = mod.MAVLink(f, 1, 1)
+            mav.heartbeat_send(mod.MAV_TYPE_GCS, mod.MAV_AUTOPILOT_INVALID, 0, 0, 0)
+            mav.param_set_send(1, 1, b'FOO', 1.5, 9)
+            mav.command_long_send(1, 1, mod.MAV_CMD_DO_SET_MODE, 0, 1, 2, 3, 4, 5, 6, 7)
+            msgs = mav.parse_buffer(bytes(f.buf))
+            self.assertEqual([m.get_type() for m in msgs], ['HEARTBEAT', 'PARAM_SET', 'COMMAND_LONG'])
+            out.append(bytes(f.buf))
+        self.assertEqual(out[0], out[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
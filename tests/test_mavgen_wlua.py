@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+
+"""
+Unit tests for the generated Wireshark dissector
+"""
+
+from __future__ import absolute_import, print_function
+import unittest
+import os
+import re
+import shutil
+import tempfile
+
+from pymavlink.generator import mavgen
+from pymavlink.generator import mavparse
+
+
+class WLuaTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def generate(self, dialect, wire_protocol):
+        xml = mavgen.dialect_paths(dialect, wire_protocol)[1]
+        if not os.path.exists(xml):
+            self.skipTest("%s.xml not available" % dialect)
+        output = os.path.join(self.tmpdir, dialect + '.lua')
+        opts = mavgen.Opts(output, wire_protocol, language='WLua', validate=False)
+        self.assertTrue(mavgen.mavgen(opts, [xml]))
+        with open(output) as f:
+            lua = f.read()
+        parsed = mavparse.MAVXML(xml, wire_protocol)
+        return (lua, parsed.message)
+
+    def table(self, lua, name):
+        body = re.search(r'local %s = \{\n(.*?)\n\}' % name, lua, re.S).group(1)
+        return dict((int(k), int(v)) for (k, v) in re.findall(r'\[(\d+)\] = (\d+),', body))
+
+    def test_tables(self):
+        """the validation tables match the message definitions"""
+        for (dialect, wire_protocol) in [('minimal', mavparse.PROTOCOL_1_0), ('test', mavparse.PROTOCOL_2_0)]:
+            (lua, msgs) = self.generate(dialect, wire_protocol)
+            self.assertEqual(self.table(lua, 'messageCrcExtra'), dict((m.id, m.crc_extra) for m in msgs))
+            self.assertEqual(self.table(lua, 'messageMinLength'), dict((m.id, m.wire_min_length) for m in msgs))
+            self.assertEqual(self.table(lua, 'messageMaxLength'), dict((m.id, m.wire_length) for m in msgs))
+            for m in msgs:
+                self.assertTrue('payload_fns[%u] = function(' % m.id in lua)
+
+    def test_registration(self):
+        """the dissector is registered as a heuristic for UDP and TCP"""
+        (lua, msgs) = self.generate('minimal', mavparse.PROTOCOL_2_0)
+        self.assertTrue('mavlink_proto:register_heuristic("udp", heuristic_dissector)' in lua)
+        self.assertTrue('mavlink_proto:register_heuristic("tcp", heuristic_dissector)' in lua)
+        self.assertTrue('"[\\253\\254]"' in lua)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+
+"""
+Unit tests for the load test harness
+"""
+
+from __future__ import absolute_import, print_function
+import unittest
+
+from pymavlink import mavloadtest
+from pymavlink import mavutil
+
+
+class LoadTestTest(unittest.TestCase):
+
+    def test_streams(self):
+        """stream sets expand to the dialect's messages at their rates"""
+        msgs = mavloadtest.stream_messages(['HEARTBEAT', ('EXTRA1', 4)], mavutil.mavlink, rate_scale=2)
+        self.assertEqual(msgs, [('HEARTBEAT', 2), ('ATTITUDE', 8), ('AHRS2', 8)])
+        test = mavloadtest.LoadTest(vehicles=3, streams='minimal')
+        self.assertEqual([v.sysid for v in test.vehicles], [1, 2, 3])
+        self.assertRaises(ValueError, mavloadtest.LoadTest, transport='serial')
+
+    def check_run(self, transport):
+        test = mavloadtest.LoadTest(vehicles=3, streams=[('EXTRA1', 50), ('HEARTBEAT', 20)],
+                                    transport=transport, loss=0.1, seed=1)
+        result = test.run(0.5)
+        self.assertTrue(result.generated > 100)
+        self.assertEqual(result.sent, result.generated - result.dropped)
+        self.assertEqual(result.received, result.sent)
+        self.assertEqual(len(result.latencies), result.received)
+        self.assertTrue(result.dropped > 0)
+        # with loss alone the receiver's estimate is exact
+        self.assertAlmostEqual(result.reported_loss, result.simulated_loss, delta=1.0)
+        d = result.as_dict()
+        self.assertTrue(d['latency_p50'] <= d['latency_p99'] <= d['latency_max'])
+        self.assertTrue(d['receive_rate'] > 0)
+
+    def test_udp(self):
+        """all frames sent over UDP are received"""
+        self.check_run('udp')
+
+    def test_tcp(self):
+        """all frames sent over TCP are received"""
+        self.check_run('tcp')
+
+    def test_impairments(self):
+        """reordered and duplicated frames are all delivered"""
+        test = mavloadtest.LoadTest(vehicles=2, streams=[('EXTRA1', 100)], reorder=0.1, duplicate=0.1, seed=2)
+        result = test.run(0.3)
+        self.assertTrue(result.reordered > 0)
+        self.assertTrue(result.duplicated > 0)
+        self.assertEqual(result.dropped, 0)
+        self.assertEqual(result.sent, result.generated + result.duplicated)
+        self.assertEqual(result.received, result.sent)
+        # the receiver doesn't count them as lost
+        self.assertEqual(result.reported_loss, 0)
+        self.assertEqual(result.reported_duplicates, result.duplicated)
+        self.assertEqual(result.reported_reordered, result.reordered)
+
+    @unittest.skipIf(mavutil.mavlink.WIRE_PROTOCOL_VERSION != '2.0', "signing needs MAVLink2")
+    def test_signing(self):
+        """signed frames are accepted by a receiver with the key"""
+        test = mavloadtest.LoadTest(vehicles=2, streams=[('EXTRA1', 50)], signing_key=b'\x42' * 32)
+        result = test.run(0.3)
+        self.assertTrue(result.sent > 0)
+        self.assertEqual(result.received, result.sent)
+        self.assertEqual(result.reported_loss, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
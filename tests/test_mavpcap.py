@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+
+
+"""
+Unit tests for writing pcap captures of MAVLink traffic
+"""
+
+from __future__ import absolute_import, print_function
+import unittest
+import os
+import shutil
+import struct
+import tempfile
+
+from pymavlink import mavpcap
+from pymavlink import mavutil
+
+
+def read_records(filename):
+    '''the link type and (timestamp, frame) records of a pcap file'''
+    with open(filename, 'rb') as f:
+        data = f.read()
+    (magic, major, minor, zone, sigfigs, snaplen, linktype) = struct.unpack('<IHHiIII', data[:24])
+    assert magic == mavpcap.PCAP_MAGIC
+    ofs = 24
+    records = []
+    while ofs < len(data):
+        (sec, usec, caplen, length) = struct.unpack('<IIII', data[ofs:ofs+16])
+        ofs += 16
+        records.append((sec + usec * 1.0e-6, data[ofs:ofs+caplen]))
+        ofs += caplen
+    return (linktype, records)
+
+
+class PcapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'test.pcap')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def parse(self, datagrams):
+        mav = mavutil.mavlink.MAVLink(None)
+        mav.robust_parsing = True
+        msgs = []
+        for d in datagrams:
+            msgs.extend([m for m in mav.parse_buffer(d) or [] if m.get_type() != 'BAD_DATA'])
+        return (mav, msgs)
+
+    def test_udp(self):
+        """frames are wrapped in valid UDP datagrams, with per vehicle sequence numbers"""
+        mavpcap.generate_capture(self.filename, 300, vehicles=3, rate=100.0)
+        (linktype, records) = read_records(self.filename)
+        self.assertEqual(linktype, mavpcap.LINKTYPE_ETHERNET)
+        self.assertEqual(len(records), 300)
+        self.assertAlmostEqual(records[-1][0] - records[0][0], 2.99, places=3)
+        datagrams = []
+        for (timestamp, frame) in records:
+            self.assertEqual(frame[12:14], b'\x08\x00')
+            ip = frame[14:34]
+            self.assertEqual(mavpcap._checksum(ip), 0)
+            (sport, dport, length) = struct.unpack('!HHH', frame[34:40])
+            self.assertEqual(dport, 14550)
+            self.assertEqual(length, len(frame) - 34)
+            datagrams.append(frame[42:])
+        (mav, msgs) = self.parse(datagrams)
+        self.assertEqual(len(msgs), 300)
+        self.assertEqual(mav.total_receive_errors, 0)
+        for sysid in [1, 2, 3]:
+            seqs = [m.get_seq() for m in msgs if m.get_srcSystem() == sysid]
+            self.assertEqual(seqs, [i % 256 for i in range(100)])
+        types = [m.get_type() for m in msgs if m.get_srcSystem() == 1]
+        self.assertEqual(types[0], 'HEARTBEAT')
+
+    def test_raw(self):
+        """USER0 captures hold bare MAVLink, several frames per record"""
+        mavpcap.generate_capture(self.filename, 100, vehicles=2, frames_per_datagram=4,
+                                 linktype=mavpcap.LINKTYPE_USER0, messages=['HEARTBEAT', 'ATTITUDE'])
+        (linktype, records) = read_records(self.filename)
+        self.assertEqual(linktype, mavpcap.LINKTYPE_USER0)
+        self.assertEqual(len(records), 26)
+        (mav, msgs) = self.parse([frame for (timestamp, frame) in records])
+        self.assertEqual(len(msgs), 100)
+        self.assertEqual(set([m.get_type() for m in msgs]), set(['HEARTBEAT', 'ATTITUDE']))
+
+    def test_corrupt(self):
+        """corrupted frames fail to parse, the same way for the same seed"""
+        mavpcap.generate_capture(self.filename, 1000, corrupt=0.1, seed=3)
+        (linktype, records) = read_records(self.filename)
+        (mav, msgs) = self.parse([frame[42:] for (timestamp, frame) in records])
+        self.assertTrue(850 < len(msgs) < 950)
+        other = os.path.join(self.tmpdir, 'other.pcap')
+        mavpcap.generate_capture(other, 1000, corrupt=0.1, seed=3)
+        with open(self.filename, 'rb') as f1, open(other, 'rb') as f2:
+            self.assertEqual(f1.read(), f2.read())
+
+
+def tcp_frame(data, seq, flags=0x18):
+    '''an Ethernet/IPv4/TCP frame from 10.0.0.2:5760 to 10.0.0.1:40000'''
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 40 + len(data), 0, 0, 64, 6, 0,
+                     b'\x0a\x00\x00\x02', b'\x0a\x00\x00\x01')
+    tcp = struct.pack('!HHIIBBHHH', 5760, 40000, seq, 0, 5 << 4, flags, 65535, 0, 0)
+    return b'\x02' * 12 + b'\x08\x00' + ip + tcp + data
+
+
+def pcapng_block(btype, body):
+    body += b'\x00' * (-len(body) % 4)
+    return struct.pack('<II', btype, len(body) + 12) + body + struct.pack('<I', len(body) + 12)
+
+
+class PcapReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'test.pcap')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_udp(self):
+        """messages are read from each flow with their capture times"""
+        mavpcap.generate_capture(self.filename, 600, vehicles=3, rate=100.0, frames_per_datagram=2)
+        self.assertTrue(mavpcap.is_capture(self.filename))
+        mlog = mavutil.mavlink_connection(self.filename)
+        self.assertTrue(isinstance(mlog, mavpcap.mavpcaplog))
+        self.assertEqual(sorted(mlog.flows.items()),
+                         [('udp:10.0.%u.2:14555->10.0.0.1:14550' % i, 200) for i in [1, 2, 3]])
+        msgs = []
+        while True:
+            m = mlog.recv_match()
+            if m is None:
+                break
+            msgs.append(m)
+        self.assertEqual(len(msgs), 600)
+        self.assertAlmostEqual(msgs[0]._timestamp, 1.6e9 + 0.03, places=3)
+        self.assertAlmostEqual(msgs[-1]._timestamp, 1.6e9 + 5.99, places=3)
+        mlog.rewind()
+        atts = []
+        while True:
+            m = mlog.recv_match(type='ATTITUDE')
+            if m is None:
+                break
+            atts.append(m)
+        expected = [m for m in msgs if m.get_type() == 'ATTITUDE']
+        self.assertEqual(len(atts), len(expected))
+        self.assertEqual([(m.get_srcSystem(), m.get_seq(), m._timestamp) for m in atts],
+                         [(m.get_srcSystem(), m.get_seq(), m._timestamp) for m in expected])
+
+    def test_empty(self):
+        """a capture with no MAVLink in it reads as an empty log"""
+        mavpcap.generate_capture(self.filename, 0)
+        mlog = mavutil.mavlink_connection(self.filename)
+        self.assertEqual(mlog.flows, {})
+        self.assertEqual(mlog.data_len, 0)
+        self.assertEqual(mlog.recv_match(), None)
+        mlog.close()
+
+    def test_pcapng_tcp(self):
+        """TCP streams in pcapng captures are reassembled"""
+        mav = mavutil.mavlink.MAVLink(None, srcSystem=7)
+        stream = b''
+        for i in range(20):
+            m = mavutil.mavlink.MAVLink_heartbeat_message(2, 3, 4, i, 5, 3)
+            stream += m.pack(mav)
+            mav.seq += 1
+        # split mid frame, reordered, with a retransmission
+        chunks = [(1000, stream[:15]), (1015 + 20, stream[35:]), (1015, stream[15:35]), (1000, stream[:30])]
+        data = pcapng_block(mavpcap.PCAPNG_MAGIC, struct.pack('<IHHq', mavpcap.PCAPNG_BYTE_ORDER, 1, 0, -1))
+        # nanosecond timestamps
+        data += pcapng_block(1, struct.pack('<HHI', 1, 0, 65535) + struct.pack('<HHB', 9, 1, 9) + b'\x00' * 3 +
+                             b'\x00' * 4)
+        frames = [tcp_frame(b'', 999, flags=0x02)] + [tcp_frame(d, seq) for (seq, d) in chunks]
+        for (i, frame) in enumerate(frames):
+            ts = 1600000000 * 10**9 + i * 10**6
+            data += pcapng_block(6, struct.pack('<IIIII', 0, ts >> 32, ts & 0xffffffff, len(frame), len(frame)) + frame)
+        filename = os.path.join(self.tmpdir, 'test.pcapng')
+        with open(filename, 'wb') as f:
+            f.write(data)
+        mlog = mavutil.mavlink_connection(filename)
+        self.assertEqual(mlog.flows, {'tcp:10.0.0.2:5760->10.0.0.1:40000' : 20})
+        msgs = []
+        while True:
+            m = mlog.recv_match(type='HEARTBEAT')
+            if m is None:
+                break
+            msgs.append(m)
+        self.assertEqual([m.custom_mode for m in msgs], list(range(20)))
+        self.assertEqual(msgs[0].get_srcSystem(), 7)
+        # the first frame is only complete once the reordered segment arrives
+        self.assertAlmostEqual(msgs[0]._timestamp, 1.6e9 + 0.003, places=4)
+
+    def test_tcp_stream(self):
+        """segments are delivered once, in order, skipping lost ones"""
+        s = mavpcap.TCPStream()
+        self.assertEqual(s.add(99, 0x02, b''), [])
+        self.assertEqual(s.add(100, 0x18, b'abc'), [b'abc'])
+        self.assertEqual(s.add(106, 0x18, b'ghi'), [])
+        self.assertEqual(s.add(101, 0x18, b'bcdef'), [b'def', b'ghi'])
+        self.assertEqual(s.add(100, 0x18, b'abc'), [])
+        for i in range(mavpcap.TCP_MAX_PENDING + 1):
+            ret = s.add(120 + i, 0x18, b'x')
+        self.assertEqual(b''.join(ret), b'x' * (mavpcap.TCP_MAX_PENDING + 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
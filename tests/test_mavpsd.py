@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+
+"""
+Unit tests for the mavpsd library
+"""
+
+from __future__ import absolute_import, print_function
+import unittest
+import os
+import shutil
+import struct
+import tempfile
+
+import numpy
+
+from pymavlink import mavutil
+from pymavlink import mavpsd
+from pymavlink import DFReader
+
+
+class DFWriter(object):
+    """minimal dataflash log writer for test data"""
+    def __init__(self, filename):
+        self.f = open(filename, 'wb')
+        self.formats = {}
+
+    def fmt(self, type, name, format, columns):
+        structfmt = '<' + ''.join([DFReader.FORMAT_TO_STRUCT[c][0] for c in format])
+        self.formats[name] = (type, structfmt)
+        length = 3 + struct.calcsize(structfmt)
+        self.f.write(struct.pack('<BBBBB4s16s64s', 0xA3, 0x95, 0x80, type, length,
+                                 name.encode(), format.encode(), columns.encode()))
+
+    def write(self, name, *values):
+        (type, structfmt) = self.formats[name]
+        self.f.write(struct.pack('<BBB', 0xA3, 0x95, type) + struct.pack(structfmt, *values))
+
+    def close(self):
+        self.f.close()
+
+
+class MAVPSDTest(unittest.TestCase):
+
+    """
+    Class to test streaming PSD estimation
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_welch(self):
+        """Test streaming Welch PSD against a one-shot calculation"""
+        from scipy import signal
+        rng = numpy.random.RandomState(0)
+        data = rng.normal(size=(3, 5000))
+        p = mavpsd.WelchPSD(256, 1000.0, 'hanning', overlap=0.5, remove_dc=False)
+        for chunk in numpy.array_split(data, 17, axis=1):
+            p.add_samples(chunk)
+        (f, expected) = signal.welch(data, 1000.0, window=numpy.hanning(256), nperseg=256,
+                                     noverlap=128, detrend=False, axis=-1)
+        self.assertTrue(numpy.allclose(p.frequencies(), f))
+        self.assertTrue(numpy.allclose(p.psd()[:, 1:-1], expected[:, 1:-1]))
+        self.assertTrue(p.pending.shape[1] < 256)
+
+    def write_log(self):
+        """write a log with batch sampler and raw accel data"""
+        filename = os.path.join(self.tmpdir, 'psd.bin')
+        w = DFWriter(filename)
+        w.fmt(200, 'ISBH', 'QHBBHHQf', 'TimeUS,N,type,instance,mul,smp_cnt,SampleUS,smp_rate')
+        w.fmt(201, 'ISBD', 'QHHaaa', 'TimeUS,N,seqno,x,y,z')
+        w.fmt(202, 'ACC1', 'QQfff', 'TimeUS,SampleUS,AccX,AccY,AccZ')
+        rate = 1000.0
+        nbatch = 1024
+        t_us = 1000000
+        N = 0
+        for b in range(6):
+            for (sensor, instance, freq) in [(0, 0, 80.0), (1, 0, 150.0), (0, 1, 200.0)]:
+                t = (b * 2 * nbatch + numpy.arange(nbatch)) / rate
+                x = numpy.round(1000 * numpy.sin(2 * numpy.pi * freq * t)).astype(int)
+                w.write('ISBH', t_us, N, sensor, instance, 100, nbatch, t_us, rate)
+                for seq in range(nbatch // 32):
+                    if b == 3 and sensor == 0 and instance == 1 and seq == 5:
+                        # leave a hole in one batch
+                        continue
+                    chunk = x[seq*32:(seq+1)*32]
+                    payload = struct.pack('<32h', *chunk)
+                    w.write('ISBD', t_us + seq, N, seq, payload, payload, payload)
+                t_us += 100000
+                N += 1
+        for i in range(4000):
+            t = i / rate
+            w.write('ACC1', t_us + i * 1000, t_us + i * 1000, numpy.sin(2 * numpy.pi * 120 * t), 0, 9.8)
+        w.close()
+        return filename
+
+    def peak(self, spectra, tag):
+        p = spectra.get(tag, 'hanning')
+        return p.frequencies()[numpy.argmax(p.psd()[0])]
+
+    def test_isb(self):
+        """Test batch sampler spectra from a log"""
+        filename = self.write_log()
+        mlog = mavutil.mavlink_connection(filename)
+        batches = list(mavpsd.isb_batches(mlog, chunk=50))
+        self.assertEqual(len(batches), 18)
+        self.assertEqual([b.holes for b in batches].count(True), 1)
+        self.assertEqual(batches[0].data.shape, (3, 1024))
+        self.assertAlmostEqual(batches[0].data[0][1], round(1000 * numpy.sin(2 * numpy.pi * 0.08)) / 100.0)
+
+        mlog.rewind()
+        spectra = mavpsd.isb_psd(mlog, windows=['hanning', 'blackman'], overlap=0.5, chunk=50)
+        self.assertEqual(spectra.tags(), ['Accel[0]', 'Gyro[0]', 'Accel[1]'])
+        self.assertTrue(abs(self.peak(spectra, 'Accel[0]') - 80) < 1)
+        self.assertTrue(abs(self.peak(spectra, 'Gyro[0]') - 150) < 1)
+        self.assertTrue(abs(self.peak(spectra, 'Accel[1]') - 200) < 1)
+        self.assertEqual(spectra.get('Accel[0]', 'blackman').count, 11)
+        self.assertEqual(spectra.get('Accel[1]', 'hanning').count, 8)
+
+        # reading message by message gives the same result
+        mlog.rewind()
+        slow = mavpsd.isb_psd(mlog, windows=['hanning'], overlap=0.5, condition='True')
+        for tag in spectra.tags():
+            self.assertTrue(numpy.allclose(slow.get(tag, 'hanning').psd(),
+                                           spectra.get(tag, 'hanning').psd()))
+
+    def test_imu(self):
+        """Test raw accel spectra from a log"""
+        filename = self.write_log()
+        mlog = mavutil.mavlink_connection(filename)
+        spectra = mavpsd.imu_psd(mlog, nfft=512, chunk=1000)
+        self.assertEqual(spectra.tags(), ['ACC[0]'])
+        p = spectra.get('ACC[0]', 'hanning')
+        self.assertAlmostEqual(p.sample_rate, 1000.0)
+        self.assertEqual(p.count, (4000 - 512) // 256 + 1)
+        self.assertTrue(abs(self.peak(spectra, 'ACC[0]') - 120) < 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
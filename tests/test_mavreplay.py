@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+
+"""
+Unit tests for log replay
+"""
+
+from __future__ import absolute_import, print_function
+import unittest
+import os
+import shutil
+import tempfile
+import time
+
+from pymavlink import mavreplay
+from pymavlink import mavutil
+from pymavlink import tlogwriter
+
+
+class Recorder(object):
+    """an output recording what is written to it and when"""
+    def __init__(self):
+        self.writes = []
+
+    def write(self, buf):
+        self.writes.append((mavreplay.clock(), bytes(buf)))
+
+
+class ReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'test.tlog')
+        mav = mavutil.mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+        w = tlogwriter.TlogWriter(self.filename)
+        self.packed = []
+        # 10 seconds at 20Hz, alternating message types
+        for i in range(200):
+            if i % 2 == 0:
+                m = mav.attitude_encode(i, 0.1, 0.2, 0.3, 0, 0, 0)
+            else:
+                m = mav.heartbeat_encode(2, 3, 0, i, 4)
+            buf = m.pack(mav)
+            mav.seq = (mav.seq + 1) % 256
+            self.packed.append(buf)
+            w.write_message(buf, 1500000000000000 + i * 50000)
+        w.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_schedule(self):
+        """schedules from the log index and from reading messages agree"""
+        schedule = mavreplay.load_schedule(self.filename)
+        self.assertEqual(len(schedule), 200)
+        self.assertAlmostEqual(schedule.duration(), 9.95)
+        self.assertEqual([schedule.message(i) for i in range(200)], [bytes(b) for b in self.packed])
+        self.assertEqual(list(schedule.msgids[:2]), [mavutil.mavlink.MAVLINK_MSG_ID_ATTITUDE,
+                                                     mavutil.mavlink.MAVLINK_MSG_ID_HEARTBEAT])
+        self.assertEqual(schedule.index_at(schedule.start_time() + 1.0), 20)
+
+        mlog = mavutil.mavlink_connection(self.filename)
+        slow = mavreplay.load_schedule(mlog, types=['ATTITUDE'], condition='ATTITUDE.time_boot_ms >= 0')
+        fast = mavreplay.load_schedule(self.filename, types=['ATTITUDE'])
+        self.assertEqual(len(fast), 100)
+        self.assertEqual(list(slow.times), list(fast.times))
+        self.assertEqual(slow.data, fast.data)
+
+    def test_replay(self):
+        """messages are sent at their log times scaled by the speed, to each output"""
+        schedule = mavreplay.load_schedule(self.filename)
+        outputs = [Recorder(), Recorder()]
+        replayer = mavreplay.Replayer(schedule, outputs, speed=20.0)
+        t0 = mavreplay.clock()
+        replayer.run()
+        elapsed = mavreplay.clock() - t0
+        self.assertTrue(replayer.finished)
+        for out in outputs:
+            self.assertEqual([buf for (t, buf) in out.writes], [bytes(b) for b in self.packed])
+        self.assertTrue(0.45 < elapsed < 0.75)
+        # each message goes out no earlier than due
+        first = outputs[0].writes[0][0]
+        for (i, (t, buf)) in enumerate(outputs[0].writes):
+            self.assertTrue(t - first >= i * 0.05 / 20.0 - 0.001)
+        stats = replayer.stats()
+        self.assertEqual(stats.sent, 200)
+        self.assertTrue(15 < stats.speed < 25)
+        self.assertTrue(stats.median_lateness < 0.02)
+
+    def test_seek(self):
+        """seeking, pausing and stopping a background replay"""
+        schedule = mavreplay.load_schedule(self.filename)
+        out = Recorder()
+        replayer = mavreplay.Replayer(schedule, [out], speed=10.0)
+        replayer.seek(schedule.start_time() + 5.0)
+        replayer.start()
+        time.sleep(0.1)
+        replayer.pause()
+        n = len(out.writes)
+        position = replayer.log_time()
+        self.assertTrue(5.0 < position - schedule.start_time() < 7.0)
+        time.sleep(0.1)
+        self.assertEqual(len(out.writes), n)
+        self.assertEqual(replayer.log_time(), position)
+        self.assertEqual(out.writes[0][1], bytes(self.packed[100]))
+        replayer.seek(schedule.start_time() + 9.0)
+        replayer.resume()
+        replayer.thread.join(2)
+        self.assertTrue(replayer.finished)
+        self.assertEqual(out.writes[-1][1], bytes(self.packed[-1]))
+        self.assertEqual(out.writes[n][1], bytes(self.packed[180]))
+        replayer.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+
+"""
+Unit tests for dialect schema files
+"""
+
+from __future__ import absolute_import, print_function
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+import importlib
+
+from pymavlink.generator import mavgen
+from pymavlink.generator import mavparse
+from pymavlink.generator import mavschema
+
+
+class FakeFile(object):
+    def __init__(self):
+        self.buf = bytearray()
+
+    def write(self, buf):
+        self.buf += buf
+
+
+class SchemaFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'test.schema')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_roundtrip(self):
+        """entries read back match those written, in order"""
+        messages = [(30, ('ATTITUDE', '<Iffffff', [1, 2])), (0, ('HEARTBEAT', '<IBBBBB', []))]
+        enums = [('MAV_TYPE', [[0, 'MAV_TYPE_GENERIC', u'Generic \u00b0', []]])]
+        mavschema.write_schema(self.filename, messages, enums)
+        schema = mavschema.Schema(self.filename)
+        self.assertEqual(schema.messages.keys(), [30, 0])
+        self.assertEqual(len(schema.messages), 2)
+        self.assertEqual(schema.messages[30], ['ATTITUDE', '<Iffffff', [1, 2]])
+        self.assertTrue(0 in schema.messages)
+        self.assertEqual(schema.messages.get(1), None)
+        self.assertEqual(schema.message_ids, {'ATTITUDE' : 30, 'HEARTBEAT' : 0})
+        self.assertEqual(schema.enums['MAV_TYPE'][0][2], u'Generic \u00b0')
+        self.assertRaises(KeyError, schema.messages.__getitem__, 1)
+
+    def test_bad_file(self):
+        """other files are rejected"""
+        with open(self.filename, 'wb') as f:
+            f.write(b'not a schema file')
+        self.assertRaises(ValueError, mavschema.Schema, self.filename)
+
+
+@unittest.skipIf(sys.version_info < (3, 7), "needs module __getattr__")
+class SchemaDialectTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        xml = os.path.join(os.path.dirname(mavgen.__file__), '..', 'dialects', 'v20', 'common.xml')
+        if not os.path.exists(xml):
+            self.skipTest("common.xml not available")
+        for (name, lazy, schema) in [('eager_common', False, False), ('schema_common', True, True)]:
+            opts = mavgen.Opts(os.path.join(self.tmpdir, name), mavparse.PROTOCOL_2_0,
+                               validate=False, lazy=lazy, schema=schema)
+            self.assertTrue(mavgen.mavgen(opts, [xml]))
+        self.assertTrue(os.path.exists(os.path.join(self.tmpdir, 'schema_common.schema')))
+        sys.path.insert(0, self.tmpdir)
+        self.eager = importlib.import_module('eager_common')
+        self.lazy = importlib.import_module('schema_common')
+
+    def tearDown(self):
+        sys.path.remove(self.tmpdir)
+        for name in ['eager_common', 'schema_common']:
+            sys.modules.pop(name, None)
+        shutil.rmtree(self.tmpdir)
+
+    def test_tables(self):
+        """messages and enums loaded from the schema match the generated ones"""
+        self.assertTrue(isinstance(self.lazy._message_table, mavschema.SchemaTable))
+        self.assertEqual(len(self.lazy.mavlink_map), len(self.eager.mavlink_map))
+        for (msgid, eager_cls) in self.eager.mavlink_map.items():
+            cls = self.lazy.mavlink_map[msgid]
+            self.assertEqual(cls.__name__, eager_cls.__name__)
+            for attr in ['name', 'fieldnames', 'ordered_fieldnames', 'fieldtypes',
+                         'fielddisplays_by_name', 'fieldenums_by_name', 'fieldunits_by_name',
+                         'format', 'native_format', 'orders', 'lengths', 'array_lengths',
+                         'crc_extra', 'instance_field', 'instance_offset']:
+                self.assertEqual(getattr(cls, attr), getattr(eager_cls, attr))
+        self.assertEqual(sorted(self.lazy.enums.keys()), sorted(self.eager.enums.keys()))
+        for name in self.eager.enums:
+            for (value, entry) in self.eager.enums[name].items():
+                self.assertEqual(self.lazy.enums[name][value].name, entry.name)
+                self.assertEqual(self.lazy.enums[name][value].description, entry.description)
+                self.assertEqual(self.lazy.enums[name][value].param, entry.param)
+
+    def test_send(self):
+        """messages sent through both modules are identical"""
+        out = []
+        for mod in [self.eager, self.lazy]:
+            f = FakeFile()
+            mav = mod.MAVLink(f, 1, 1)
+            mav.heartbeat_send(mod.MAV_TYPE_GCS, mod.MAV_AUTOPILOT_INVALID, 0, 0, 0)
+            mav.param_set_send(1, 1, b'FOO', 1.5, 9)
+            msgs = mav.parse_buffer(bytes(f.buf))
+            self.assertEqual([m.get_type() for m in msgs], ['HEARTBEAT', 'PARAM_SET'])
+            out.append(bytes(f.buf))
+        self.assertEqual(out[0], out[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+
+"""
+Unit tests for sequence number link quality
+"""
+
+from __future__ import absolute_import, print_function
+import os
+import random
+import shutil
+import struct
+import tempfile
+import unittest
+
+import numpy
+
+from pymavlink import mavseq
+from pymavlink import mavutil
+
+
+def impaired(n, seed, loss=0.1, duplicate=0.05, reorder=0.05):
+    '''(time, seq) of n frames with random loss, duplication and reordering'''
+    rng = random.Random(seed)
+    frames = []
+    seq = rng.randrange(256)
+    for i in range(n):
+        seq = (seq + 1) % 256
+        if rng.random() < loss:
+            continue
+        frames.append((i * 0.01, seq))
+        if rng.random() < duplicate:
+            frames.append((i * 0.01, seq))
+    for i in range(len(frames) - 5):
+        if rng.random() < reorder:
+            j = i + rng.randrange(1, 5)
+            (frames[i], frames[j]) = (frames[j], frames[i])
+    return frames
+
+
+class SequenceTrackerTest(unittest.TestCase):
+
+    def test_classify(self):
+        """gaps, duplicates and reordered frames are told apart"""
+        t = mavseq.SequenceTracker()
+        kinds = [t.update((1, 1), seq) for seq in [254, 255, 2, 0, 0, 1, 3, 7]]
+        self.assertEqual(kinds, [(0, mavseq.SEQ_FIRST), (0, mavseq.SEQ_NEXT), (2, mavseq.SEQ_GAP),
+                                 (-1, mavseq.SEQ_REORDERED), (0, mavseq.SEQ_DUPLICATE),
+                                 (-1, mavseq.SEQ_REORDERED), (0, mavseq.SEQ_NEXT), (3, mavseq.SEQ_GAP)])
+        s = t.summary((1, 1))
+        self.assertEqual((s.received, s.expected, s.lost), (8, 10, 3))
+        self.assertEqual((s.duplicates, s.reordered, s.max_reorder), (1, 2, 2))
+        self.assertEqual(s.gaps, {3 : 1})
+        self.assertEqual(t.summary((2, 1)).received, 0)
+
+    def test_sources(self):
+        """each source is tracked separately"""
+        t = mavseq.SequenceTracker()
+        for seq in range(10):
+            t.update((1, 1), seq)
+            t.update((2, 1), seq * 2)
+        self.assertEqual(t.summary((1, 1)).lost, 0)
+        self.assertEqual(t.summary((2, 1)).lost, 9)
+        self.assertEqual(t.summary().lost, 9)
+        self.assertEqual(sorted(t.summaries().keys()), [(1, 1), (2, 1)])
+
+    def test_period(self):
+        """loss is measured over recent periods"""
+        t = mavseq.SequenceTracker()
+        for i in range(300):
+            if i >= 200 and i % 2 == 0:
+                continue
+            t.update((1, 1), i % 256, i * 0.1)
+        self.assertAlmostEqual(t.loss_percent(period=10), 50.0, delta=5)
+        self.assertAlmostEqual(t.loss_percent(), 100.0 * 50 / 299, delta=0.1)
+
+    def test_vectorised(self):
+        """analyse() agrees with the frame by frame tracker"""
+        for seed in range(20):
+            frames = impaired(3000, seed)
+            t = mavseq.SequenceTracker()
+            lost = 0
+            for (tm, seq) in frames:
+                lost += t.update((1, 1), seq, tm)[0]
+            expected = t.summary((1, 1)).as_dict()
+            self.assertEqual(lost, expected['lost'])
+            times = numpy.array([f[0] for f in frames])
+            seqs = numpy.array([f[1] for f in frames])
+            ones = numpy.ones(len(frames), dtype=int)
+            results = mavseq.analyse(times, ones, ones, seqs, period=5.0)
+            (summary, periods) = results[(1, 1)]
+            self.assertEqual(summary.as_dict(), expected)
+            self.assertEqual(periods[:, 1].sum(), summary.expected)
+            self.assertEqual(periods[:, 2].sum(), summary.unique)
+
+
+class LogSequenceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_tlog(self):
+        """sequences are read from a tlog, and the log's packet loss ignores reordering"""
+        filename = os.path.join(self.tmpdir, 'seq.tlog')
+        mav = mavutil.mavlink.MAVLink(None, srcSystem=3, srcComponent=1)
+        msg = mav.heartbeat_encode(2, 3, 0, 0, 4)
+        frames = impaired(2000, 1)
+        with open(filename, 'wb') as f:
+            for (t, seq) in frames:
+                mav.seq = seq
+                f.write(struct.pack('>Q', int((1.6e9 + t) * 1.0e6)) + msg.pack(mav))
+        (times, sysids, compids, seqs) = mavseq.log_sequences(filename)
+        self.assertEqual(seqs.tolist(), [f[1] for f in frames])
+        self.assertEqual(set(sysids.tolist()), set([3]))
+        self.assertTrue(numpy.allclose(times - 1.6e9, [f[0] for f in frames], atol=1.0e-5))
+
+        summary = mavseq.analyse(times, sysids, compids, seqs)[(3, 1)][0]
+        mlog = mavutil.mavlink_connection(filename)
+        while mlog.recv_match() is not None:
+            pass
+        self.assertEqual(mlog.mav_loss, summary.lost)
+        self.assertEqual(mlog.seq_tracker.summary((3, 1)).as_dict(), summary.as_dict())
+        self.assertTrue(summary.duplicates > 0 and summary.reordered > 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
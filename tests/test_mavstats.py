@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+
+"""
+Unit tests for the link statistics
+"""
+
+from __future__ import absolute_import, print_function
+import json
+import socket
+import unittest
+
+from pymavlink import mavstats
+from pymavlink import mavutil
+
+
+class LinkStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.link = mavutil.mavlink_connection('udpin:127.0.0.1:0')
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.connect(self.link.port.getsockname())
+
+    def tearDown(self):
+        self.sock.close()
+        self.link.close()
+
+    def send(self, frames):
+        for buf in frames:
+            self.sock.send(bytes(buf))
+        received = []
+        while len(received) < len(frames):
+            self.link.select(1.0)
+            m = self.link.recv_msg()
+            if m is not None:
+                received.append(m)
+        return received
+
+    def frames(self):
+        mav = mavutil.mavlink.MAVLink(None, srcSystem=7, srcComponent=1)
+        ret = []
+        for i in range(10):
+            ret.append(mav.heartbeat_encode(2, 3, 0, 0, 4).pack(mav))
+            mav.seq += 1
+        for i in range(4):
+            ret.append(mav.attitude_encode(i, 0.1, 0.2, 0.3, 0, 0, 0).pack(mav))
+            mav.seq += 1
+        bad = bytearray(ret[0])
+        bad[-1] ^= 0xff
+        ret.append(bad)
+        return ret
+
+    def test_disabled(self):
+        """nothing is kept until stats are enabled"""
+        self.send(self.frames()[:2])
+        self.assertEqual(self.link.stats, None)
+        self.assertEqual(self.link.stats_snapshot(), None)
+
+    def test_counts(self):
+        """messages and errors are counted per source and message ID"""
+        frames = self.frames()
+        self.link.enable_stats()
+        self.send(frames)
+        snap = self.link.stats_snapshot()
+        counts = dict(((m['sysid'], m['compid'], m['type']), m['count']) for m in snap['messages'])
+        self.assertEqual(counts, {(7, 1, 'HEARTBEAT') : 10, (7, 1, 'ATTITUDE') : 4})
+        self.assertEqual(snap['received'], 14)
+        self.assertEqual(snap['received_bytes'], sum([len(f) for f in frames[:-1]]))
+        self.assertEqual(snap['errors'], {'crc' : 1})
+        self.assertEqual(snap['error_sources'], [{'sysid' : 7, 'compid' : 1, 'kind' : 'crc', 'count' : 1}])
+        self.assertEqual(snap['decode']['count'], 15)
+        self.assertEqual(snap['decode']['buckets'][-1], (None, 15))
+        for m in snap['messages']:
+            self.assertTrue(m['rate'] > 0)
+        json.loads(mavstats.to_json({'udp' : snap}))
+
+    def test_prometheus(self):
+        """the Prometheus export has a sample per source and message"""
+        self.link.enable_stats()
+        self.send(self.frames())
+        text = mavstats.to_prometheus(mavstats.snapshot({'udp' : self.link}))
+        self.assertTrue('mavlink_messages_received_total{compid="1",link="udp",msgid="0",sysid="7",type="HEARTBEAT"} 10.0' in text)
+        self.assertTrue('mavlink_receive_errors_total{kind="crc",link="udp"} 1.0' in text)
+        self.assertTrue('mavlink_decode_seconds_count{link="udp"} 15.0' in text)
+        self.assertTrue('mavlink_decode_seconds_bucket{le="+Inf",link="udp"} 15.0' in text)
+
+    def test_server(self):
+        """the statistics are served over HTTP"""
+        try:
+            from urllib.request import urlopen
+        except ImportError:
+            from urllib2 import urlopen
+        self.link.enable_stats()
+        self.send(self.frames()[:3])
+        server = mavstats.StatsServer({'udp' : self.link})
+        try:
+            url = 'http://127.0.0.1:%u' % server.port
+            text = urlopen(url + '/metrics').read().decode('utf-8')
+            self.assertTrue('mavlink_messages_received_total' in text)
+            stats = json.loads(urlopen(url + '/stats.json').read().decode('utf-8'))
+            self.assertEqual(stats['udp']['received'], 3)
+        finally:
+            server.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
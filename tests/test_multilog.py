@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+
+"""
+Unit tests for the multilog library
+"""
+
+from __future__ import absolute_import, print_function
+import unittest
+import os
+import pkg_resources
+
+from pymavlink import mavutil
+from pymavlink import multilog
+
+
+def count_messages(filename, type):
+    """count messages of a type in a log, printing the count"""
+    mlog = mavutil.mavlink_connection(filename)
+    count = 0
+    while mlog.recv_match(type=type) is not None:
+        count += 1
+    print("%s %u" % (type, count))
+    return count
+
+
+class MultiLogTest(unittest.TestCase):
+
+    """
+    Class to test processing logs in parallel
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Constructor, set up some data that is reused in many tests"""
+        super(MultiLogTest, self).__init__(*args, **kwargs)
+        self.filepath = pkg_resources.resource_filename(__name__, "test.BIN")
+
+    def test_parallel(self):
+        """Test results, output and errors from worker processes"""
+        missing = os.path.join(os.path.dirname(self.filepath), "nonexistent.BIN")
+        logs = [self.filepath, missing, self.filepath]
+        results = list(multilog.process_logs(count_messages, logs, workers=2, extra=('ATT',)))
+        self.assertEqual([r.index for r in results], [0, 1, 2])
+        self.assertEqual(results[0].result, 24)
+        self.assertEqual(results[0].output, "ATT 24\n")
+        self.assertFalse(results[1].ok())
+        self.assertTrue('nonexistent.BIN' in results[1].error)
+        self.assertEqual(results[2].result, 24)
+
+        unordered = list(multilog.process_logs(count_messages, logs, workers=3, ordered=False, extra=('ATT',)))
+        self.assertEqual(sorted([r.index for r in unordered]), [0, 1, 2])
+
+    def test_inline(self):
+        """Test processing in this process with one worker"""
+        results = list(multilog.process_logs(count_messages, [self.filepath, "nonexistent.BIN"],
+                                             workers=1, extra=('GPS',)))
+        self.assertEqual(results[0].result, 5)
+        self.assertEqual(results[0].output, '')
+        self.assertFalse(results[1].ok())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,8 +8,8 @@ Unit tests for the quaternion library
 from __future__ import absolute_import, division, print_function
 import unittest
 import numpy as np
-from pymavlink.quaternion import QuaternionBase, Quaternion
-from pymavlink.rotmat import Vector3, Matrix3
+from pymavlink.quaternion import QuaternionBase, Quaternion, QuaternionArray
+from pymavlink.rotmat import Vector3, Matrix3, Vector3Array, Matrix3Array
 
 __author__ = "Thomas Gubler"
 __copyright__ = "Copyright (C) 2014 Thomas Gubler"
@@ -336,5 +336,64 @@ class QuaternionTest(QuaternionBaseTest):
                 assert r_dcm.close(r.dcm)
 
 
+class QuaternionArrayTest(unittest.TestCase):
+
+    """
+    Class to test QuaternionArray against QuaternionBase
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Constructor, set up some data that is reused in many tests"""
+        super(QuaternionArrayTest, self).__init__(*args, **kwargs)
+        self.angles = np.array(QuaternionBaseTest._all_angles(self, step=np.radians(20)))
+        self.quaternions = [QuaternionBase(e) for e in self.angles]
+
+    def test_constructor(self):
+        """Test construction from euler angles, q and dcm"""
+        qa = QuaternionArray(self.angles)
+        np.testing.assert_almost_equal(qa.q, [q.q for q in self.quaternions])
+        np.testing.assert_almost_equal(qa.dcm, [q.dcm for q in self.quaternions])
+        qa = QuaternionArray(np.array([q.q for q in self.quaternions]))
+        np.testing.assert_almost_equal(qa.euler, [QuaternionBase(q.q).euler for q in self.quaternions])
+        qa = QuaternionArray(np.array([q.dcm for q in self.quaternions]))
+        assert np.all(qa.close(QuaternionArray(self.quaternions)))
+        qa = QuaternionArray(Matrix3Array(np.array([q.dcm for q in self.quaternions])))
+        assert np.all(qa.close(QuaternionArray(self.quaternions)))
+        assert qa[3].close(Quaternion(self.quaternions[3].q))
+
+    def test_gimbal_lock(self):
+        """Test euler angles at +-90 degrees pitch"""
+        angles = [[0.1, np.pi/2, 0.3], [0.2, -np.pi/2, 1.0]]
+        qa = QuaternionArray(QuaternionArray(angles).q)
+        np.testing.assert_almost_equal(qa.euler, [QuaternionBase(QuaternionBase(e).q).euler for e in angles])
+
+    def test_norm(self):
+        """Test the norm functions"""
+        qa = QuaternionArray([[1, 2, 3, 4], [0, 0, 0, 2]])
+        np.testing.assert_almost_equal(qa.norm, [np.sqrt(30), 2])
+        qa.normalize()
+        np.testing.assert_almost_equal(qa.norm, [1, 1])
+
+    def test_mul(self):
+        """Test multiplication, division and inverse"""
+        qa = QuaternionArray(self.quaternions)
+        qr = QuaternionArray(qa.q[::-1])
+        r = qa * qr
+        expected = [p * q for (p, q) in zip(self.quaternions, self.quaternions[::-1])]
+        np.testing.assert_almost_equal(r.q, [q.q for q in expected])
+        assert np.all((qa / qr).close(qa * qr.inversed))
+        assert np.all((qa * self.quaternions[5]).close(QuaternionArray([q * self.quaternions[5] for q in self.quaternions])))
+
+    def test_transform(self):
+        """Test transform"""
+        qa = QuaternionArray(self.quaternions)
+        v = np.tile([1.0, 2.0, 3.0], (len(qa), 1))
+        t = qa.transform(v)
+        np.testing.assert_almost_equal(t, [q.transform([1, 2, 3]) for q in self.quaternions])
+        np.testing.assert_almost_equal(qa.inversed.transform(t), v)
+        tv = qa.transform(Vector3Array(v))
+        assert tv.close(Vector3Array(t))
+
+
 if __name__ == '__main__':
     unittest.main()
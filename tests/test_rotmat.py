@@ -11,7 +11,7 @@ import unittest
 import random
 import numpy as np
 
-from pymavlink.rotmat import Vector3, Matrix3, Plane, Line
+from pymavlink.rotmat import Vector3, Matrix3, Plane, Line, Vector3Array, Matrix3Array, rotations
 
 class VectorTest(unittest.TestCase):
 
@@ -163,5 +163,99 @@ class LinePlaneTest(unittest.TestCase):
         p = line.plane_intersection(plane)
         assert p.close(Vector3(11.11, 11.11, 0.00), tol=1e-2)
 
+class ArrayTest(unittest.TestCase):
+
+    """
+    Class to test Vector3Array and Matrix3Array give the same results
+    as Vector3 and Matrix3
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Constructor, set up some data that is reused in many tests"""
+        super(ArrayTest, self).__init__(*args, **kwargs)
+        rng = np.random.RandomState(1)
+        self.vectors = [Vector3(v) for v in rng.uniform(-5, 5, (200, 3))]
+        self.others = [Vector3(v) for v in rng.uniform(-5, 5, (200, 3))]
+        self.euler = rng.uniform(-3, 3, (200, 3)) * [1, 0.5, 1]
+        self.matrices = []
+        for (r, p, y) in self.euler:
+            m = Matrix3()
+            m.from_euler(r, p, y)
+            self.matrices.append(m)
+
+    def test_vector_maths(self):
+        """Test vector maths"""
+        v1 = Vector3Array(self.vectors)
+        v2 = Vector3Array(self.others)
+        assert v1[3] == self.vectors[3]
+        assert (v1 + v2).close(Vector3Array([a + b for (a, b) in zip(self.vectors, self.others)]))
+        assert (v1 - v2).close(Vector3Array([a - b for (a, b) in zip(self.vectors, self.others)]))
+        assert (v1 * 3).close(Vector3Array([a * 3 for a in self.vectors]))
+        assert (v1 / 2.1).close(Vector3Array([a / 2.1 for a in self.vectors]))
+        assert (v1 % v2).close(Vector3Array([a % b for (a, b) in zip(self.vectors, self.others)]))
+        np.testing.assert_almost_equal(v1 * v2, [a * b for (a, b) in zip(self.vectors, self.others)])
+        np.testing.assert_almost_equal(v1.length(), [a.length() for a in self.vectors])
+        np.testing.assert_almost_equal(v1.angle(v2), [a.angle(b) for (a, b) in zip(self.vectors, self.others)])
+        assert v1.normalized().close(Vector3Array([a.normalized() for a in self.vectors]))
+
+    def test_rotate_by_id(self):
+        """Test rotation table lookups"""
+        v1 = Vector3Array(self.vectors)
+        ids = np.arange(len(v1)) % len(rotations)
+        expected = [v.rotate_by_id(i) for (v, i) in zip(self.vectors, ids)]
+        assert v1.rotate_by_id(ids).close(Vector3Array(expected))
+        expected = [v.rotate_by_inverse_id(5) for v in self.vectors]
+        assert v1.rotate_by_inverse_id(5).close(Vector3Array(expected))
+
+    def test_euler(self):
+        """Test from_euler() and to_euler()"""
+        m = Matrix3Array()
+        m.from_euler(self.euler[:,0], self.euler[:,1], self.euler[:,2])
+        assert m.close(Matrix3Array(self.matrices))
+        np.testing.assert_almost_equal(np.column_stack(m.to_euler()), self.euler)
+        m.from_euler312(self.euler[:,1], self.euler[:,0], self.euler[:,2])
+        expected = []
+        for (r, p, y) in self.euler:
+            m1 = Matrix3()
+            m1.from_euler312(p, r, y)
+            expected.append(m1.to_euler312())
+        np.testing.assert_almost_equal(np.column_stack(m.to_euler312()), expected)
+
+    def test_matrix_maths(self):
+        """Test matrix maths"""
+        m = Matrix3Array(self.matrices)
+        v = Vector3Array(self.vectors)
+        assert m[7] == self.matrices[7]
+        assert (m * v).close(Vector3Array([a * b for (a, b) in zip(self.matrices, self.vectors)]))
+        assert (m * m.transposed()).close(Matrix3Array([a * a.transposed() for a in self.matrices]))
+        assert m.invert().close(Matrix3Array([a.invert() for a in self.matrices]))
+        np.testing.assert_almost_equal(m.determinant(), [a.determinant() for a in self.matrices])
+        np.testing.assert_almost_equal(m.trace(), [a.trace() for a in self.matrices])
+
+    def test_matrixops(self):
+        """Test rotate(), normalize() and from_axis_angle()"""
+        m = Matrix3Array(self.matrices)
+        g = Vector3Array(self.others) * 0.01
+        m.rotate(g)
+        m.normalize()
+        expected = []
+        for (a, b) in zip(self.matrices, self.others):
+            a = a.copy()
+            a.rotate(b * 0.01)
+            a.normalize()
+            expected.append(a)
+        assert m.close(Matrix3Array(expected))
+
+        axis = Vector3Array(self.vectors).normalized()
+        angle = self.euler[:,0]
+        m.from_axis_angle(axis, angle)
+        expected = []
+        for (a, b) in zip(axis, angle):
+            m1 = Matrix3()
+            m1.from_axis_angle(a, b)
+            expected.append(m1)
+        assert m.close(Matrix3Array(expected))
+
+
 if __name__ == '__main__':
     unittest.main()
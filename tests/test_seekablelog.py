@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+
+"""
+Unit tests for block compressed logs
+"""
+
+from __future__ import absolute_import, print_function
+import unittest
+import gzip
+import os
+import shutil
+import tempfile
+import pkg_resources
+
+from pymavlink import mavutil
+from pymavlink import seekablelog
+from pymavlink import tlogwriter
+
+
+class SeekableLogTest(unittest.TestCase):
+
+    """
+    Class to test reading block compressed logs
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def compare(self, plain, compressed, types):
+        """check both logs give the same messages"""
+        a = mavutil.mavlink_connection(plain)
+        b = mavutil.mavlink_connection(compressed)
+        count = 0
+        while True:
+            ma = a.recv_match(type=types)
+            mb = b.recv_match(type=types)
+            if ma is None:
+                self.assertTrue(mb is None)
+                break
+            self.assertEqual(str(ma), str(mb))
+            self.assertEqual(ma._timestamp, mb._timestamp)
+            count += 1
+        return (b, count)
+
+    def test_dataflash(self):
+        """Test a compressed dataflash log with and without an index"""
+        filepath = pkg_resources.resource_filename(__name__, "test.BIN")
+        plain = os.path.join(self.tmpdir, 'test.BIN')
+        shutil.copy(filepath, plain)
+        compressed = seekablelog.compress_log(plain)
+        self.assertTrue(seekablelog.is_block_compressed(compressed))
+        self.assertEqual(gzip.open(compressed, 'rb').read(), open(plain, 'rb').read())
+        for index in [True, False]:
+            if not index:
+                os.unlink(seekablelog.index_filename(compressed))
+            (mlog, count) = self.compare(plain, compressed, ['GPS', 'ATT'])
+            self.assertTrue(isinstance(mlog, seekablelog.DFReader_seekable))
+            self.assertEqual(count, 29)
+            self.assertEqual(len(mlog.extract_arrays('IMU')['AccX']), 45)
+
+    def test_tlog(self):
+        """Test that only the blocks with wanted messages are read"""
+        plain = os.path.join(self.tmpdir, 'test.tlog')
+        mav = mavutil.mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+        w = tlogwriter.TlogWriter(plain)
+        for i in range(20000):
+            w.write_message(mav.attitude_encode(i, 0.01 * (i % 100), 0, 0, 0, 0, 0).pack(mav),
+                            1500000000000000 + i * 10000)
+            if i % 10000 == 0:
+                w.write_message(mav.heartbeat_encode(1, 3, 0, 0, 0).pack(mav))
+        w.close()
+        compressed = seekablelog.compress_log(plain, level=1)
+
+        (mlog, count) = self.compare(plain, compressed, ['HEARTBEAT'])
+        self.assertTrue(isinstance(mlog, seekablelog.mavmmaplog_seekable))
+        self.assertEqual(count, 2)
+        self.assertTrue(mlog.f.blocks_read < len(mlog.f.block_starts) // 2)
+
+        (mlog, count) = self.compare(plain, compressed, None)
+        self.assertEqual(count, 20002)
+
+
+if __name__ == '__main__':
+    unittest.main()
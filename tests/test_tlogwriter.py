@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+
+"""
+Unit tests for the buffered tlog writer
+"""
+
+from __future__ import absolute_import, print_function
+import unittest
+import gzip
+import os
+import shutil
+import tempfile
+import time
+
+from pymavlink import mavutil
+from pymavlink import tlogwriter
+
+
+class TlogWriterTest(unittest.TestCase):
+
+    """
+    Class to test writing telemetry logs
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.mav = mavutil.mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def messages(self, count):
+        """a list of packed ATTITUDE messages"""
+        ret = []
+        for i in range(count):
+            m = self.mav.attitude_encode(i * 10, 0.1 * i, 0.2, 0.3, 0, 0, 0)
+            ret.append(m.pack(self.mav))
+        return ret
+
+    def read_log(self, filename):
+        """return (timestamp, time_boot_ms) for each message in a tlog"""
+        mlog = mavutil.mavlink_connection(filename)
+        ret = []
+        while True:
+            m = mlog.recv_match(type='ATTITUDE')
+            if m is None:
+                break
+            ret.append((m._timestamp, m.time_boot_ms))
+        mlog.close()
+        return ret
+
+    def test_write(self):
+        """Test buffered writing with a small buffer and a background thread"""
+        filename = os.path.join(self.tmpdir, 'test.tlog')
+        for background in [False, True]:
+            w = tlogwriter.TlogWriter(filename, buffer_size=1000, background=background)
+            for (i, buf) in enumerate(self.messages(200)):
+                w.write_message(buf, 1500000000000000 + i * 1000000)
+            w.close()
+            msgs = self.read_log(filename)
+            self.assertEqual(len(msgs), 200)
+            self.assertEqual(msgs[10], (1500000010.0, 100))
+
+    def test_idle_flush(self):
+        """Test buffered data reaches the file when no more messages arrive"""
+        filename = os.path.join(self.tmpdir, 'test.tlog')
+        bufs = self.messages(10)
+        for background in [False, True]:
+            w = tlogwriter.TlogWriter(filename, flush_interval=0.2, background=background)
+            for buf in bufs:
+                w.write_message(buf)
+            time.sleep(1.0)
+            self.assertEqual(os.path.getsize(filename), 10 * (8 + len(bufs[0])))
+            w.close()
+
+    def test_rotate(self):
+        """Test rotation by size and gzip compression"""
+        filename = os.path.join(self.tmpdir, 'test.tlog.gz')
+        w = tlogwriter.TlogWriter(filename, max_size=2000)
+        bufs = self.messages(100)
+        for buf in bufs:
+            w.write_message(buf)
+        w.close()
+        self.assertEqual(w.compress, 'gzip')
+        self.assertEqual(w.filenames[1], os.path.join(self.tmpdir, 'test.1.tlog.gz'))
+        size = 8 + len(bufs[0])
+        self.assertEqual(len(w.filenames), (100 * size) // 2000 + 1)
+        data = b''.join([gzip.open(f, 'rb').read() for f in w.filenames])
+        self.assertEqual(len(data), 100 * size)
+        self.assertEqual(data[8:size], bytes(bufs[0]))
+
+    def test_rotate_background(self):
+        """Test rotations queued faster than the background thread writes"""
+        filename = os.path.join(self.tmpdir, 'test.tlog')
+        w = tlogwriter.TlogWriter(filename, buffer_size=1000, max_size=500, background=True)
+        bufs = self.messages(200)
+        for buf in bufs:
+            w.write_message(buf)
+        w.close()
+        size = 8 + len(bufs[0])
+        self.assertTrue(len(w.filenames) > 5)
+        for f in w.filenames:
+            self.assertTrue(os.path.exists(f))
+        self.assertEqual(sum([os.path.getsize(f) for f in w.filenames]), 200 * size)
+
+    def test_setup_logfile(self):
+        """Test logging received messages from a connection"""
+        src = os.path.join(self.tmpdir, 'src.tlog')
+        w = tlogwriter.TlogWriter(src)
+        for buf in self.messages(50):
+            w.write_message(buf)
+        w.close()
+
+        dst = os.path.join(self.tmpdir, 'dst.tlog')
+        mlog = mavutil.mavlink_connection(src)
+        mlog.setup_logfile(dst, flush_interval=None)
+        while mlog.recv_match() is not None:
+            pass
+        mlog.logfile.close()
+        self.assertEqual([m[1] for m in self.read_log(dst)], [i * 10 for i in range(50)])
+
+
+if __name__ == '__main__':
+    unittest.main()
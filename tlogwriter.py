@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+'''
+buffered telemetry log writer
+
+Messages are appended as an 8 byte big endian microsecond timestamp
+followed by the raw wire bytes, the same format mavlogfile reads. Data
+is collected in a preallocated buffer and written out in large chunks,
+optionally from a background thread, with support for rotating to a
+new file by size or age and for gzip, bz2 or xz compression.
+
+Released under GNU GPL version 3 or later
+'''
+from __future__ import print_function
+from __future__ import absolute_import
+from builtins import object
+
+import atexit
+import os
+import struct
+import threading
+import time
+import weakref
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+COMPRESSION_EXTENSIONS = {'.gz' : 'gzip', '.bz2' : 'bz2', '.xz' : 'xz'}
+
+_ROTATE = object()
+_STOP = object()
+
+_open_writers = weakref.WeakSet()
+
+def _close_all():
+    for w in list(_open_writers):
+        w.close()
+
+atexit.register(_close_all)
+
+
+def compression_for(filename):
+    '''the compression implied by a filename's extension, or None'''
+    return COMPRESSION_EXTENSIONS.get(os.path.splitext(filename)[1].lower(), None)
+
+def open_compressed(filename, mode, compress):
+    '''open a file for binary writing with the given compression'''
+    if compress is None:
+        return open(filename, mode)
+    if compress == 'gzip':
+        import gzip
+        return gzip.open(filename, mode)
+    if compress == 'bz2':
+        import bz2
+        return bz2.BZ2File(filename, mode)
+    if compress == 'xz':
+        import lzma
+        return lzma.open(filename, mode)
+    raise ValueError("Unknown compression %s" % compress)
+
+
+class TlogWriter(object):
+    '''buffered writer for telemetry logs.
+
+    buffer_size is the size of the in-memory buffer, flush_interval
+    the longest time in seconds data may stay buffered (None to only
+    flush when the buffer fills), and with background the file writes
+    happen in a separate thread. Buffered data is also flushed when no
+    messages arrive for flush_interval, from the background thread or
+    a timer thread. max_size (bytes) and max_time
+    (seconds) start a new file, named by rotated_filename(), once the
+    current one is big or old enough. compress is 'gzip', 'bz2', 'xz'
+    or None, defaulting from the file extension'''
+    def __init__(self, filename, mode='w', buffer_size=1<<20, flush_interval=1.0,
+                 background=False, max_size=None, max_time=None, compress='auto'):
+        if compress == 'auto':
+            compress = compression_for(filename)
+        self.filename = filename
+        self.compress = compress
+        self.mode = mode.replace('b', '') + 'b'
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.max_time = max_time
+        self.buf = bytearray(buffer_size)
+        self.pos = 0
+        self.lock = threading.Lock()
+        self.closed = False
+        self.rotation = 0
+        self.filenames = [filename]
+        self.file_bytes = 0
+        self.file_start = time.time()
+        self.last_flush = self.file_start
+        self.messages = 0
+        self.f = open_compressed(filename, self.mode, self.compress)
+        self.queue = None
+        self.thread = None
+        self.timer = None
+        self.stop_event = threading.Event()
+        if background:
+            self.queue = queue.Queue()
+            self.thread = threading.Thread(target=self._writer_thread, name='TlogWriter')
+            self.thread.daemon = True
+            self.thread.start()
+        elif flush_interval is not None:
+            self.timer = threading.Thread(target=self._timer_thread, name='TlogWriter flush')
+            self.timer.daemon = True
+            self.timer.start()
+        _open_writers.add(self)
+
+    def rotated_filename(self, n):
+        '''name of the n'th file after rotation, e.g. flight.3.tlog'''
+        (base, ext) = os.path.splitext(self.filename)
+        cext = ''
+        if ext.lower() in COMPRESSION_EXTENSIONS:
+            cext = ext
+            (base, ext) = os.path.splitext(base)
+        return "%s.%u%s%s" % (base, n, ext, cext)
+
+    def write_message(self, msgbuf, usec=None):
+        '''log one message given its wire bytes, with a timestamp in
+        microseconds since 1970 (default now). The bottom two bits of
+        the timestamp hold the link number, as in mavlogfile'''
+        if usec is None:
+            usec = int(time.time() * 1.0e6) & ~3
+        n = len(msgbuf)
+        with self.lock:
+            if self.pos + 8 + n > self.buffer_size:
+                self._flush_locked()
+                if 8 + n > self.buffer_size:
+                    self._output(struct.pack('>Q', usec) + bytes(msgbuf))
+                    self._message_written(8 + n)
+                    return
+            struct.pack_into('>Q', self.buf, self.pos, usec)
+            self.buf[self.pos+8:self.pos+8+n] = msgbuf
+            self.pos += 8 + n
+            self._message_written(8 + n)
+
+    def write(self, buf):
+        '''log raw bytes with no timestamp, so a writer can be used
+        anywhere a binary file is'''
+        n = len(buf)
+        if n == 0:
+            return
+        with self.lock:
+            if self.pos + n > self.buffer_size:
+                self._flush_locked()
+                if n > self.buffer_size:
+                    self._output(bytes(buf))
+                    self.file_bytes += n
+                    return
+            self.buf[self.pos:self.pos+n] = buf
+            self.pos += n
+            self.file_bytes += n
+            self._check_flush(time.time())
+
+    def _message_written(self, n):
+        self.messages += 1
+        self.file_bytes += n
+        self._check_flush(time.time())
+
+    def _check_flush(self, now):
+        '''flush or rotate if due, at a message boundary. Ages are by
+        the wall clock, not message timestamps'''
+        if ((self.max_size is not None and self.file_bytes >= self.max_size) or
+            (self.max_time is not None and now - self.file_start >= self.max_time)):
+            self._rotate_locked(now)
+        elif self.flush_interval is not None and now - self.last_flush >= self.flush_interval:
+            self._flush_locked()
+            self.last_flush = now
+
+    def _flush_locked(self):
+        '''hand the buffered data to the file, caller holds the lock'''
+        if self.pos == 0:
+            return
+        chunk = bytes(self.buf[:self.pos])
+        self.pos = 0
+        self._output(chunk)
+
+    def _rotate_locked(self, now):
+        self._flush_locked()
+        self.rotation += 1
+        self.filenames.append(self.rotated_filename(self.rotation))
+        self.file_bytes = 0
+        self.file_start = now
+        self.last_flush = now
+        if self.queue is not None:
+            # the thread may be several rotations behind, so tell it the name
+            self.queue.put((_ROTATE, self.filenames[-1]))
+        else:
+            self._reopen(self.filenames[-1])
+
+    def _reopen(self, filename):
+        self.f.close()
+        self.f = open_compressed(filename, 'wb', self.compress)
+
+    def _output(self, chunk):
+        if self.queue is not None:
+            self.queue.put(chunk)
+        else:
+            self.f.write(chunk)
+            self.f.flush()
+
+    def _idle_flush(self):
+        '''flush data left buffered for flush_interval while no
+        messages arrived'''
+        with self.lock:
+            now = time.time()
+            if not self.closed and self.pos > 0 and now - self.last_flush >= self.flush_interval:
+                self._flush_locked()
+                self.last_flush = now
+
+    def _timer_thread(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self._idle_flush()
+
+    def _writer_thread(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                # the flushed chunk is queued, keeping the writes in order
+                self._idle_flush()
+                continue
+            if item is _STOP:
+                break
+            if isinstance(item, tuple) and item[0] is _ROTATE:
+                self._reopen(item[1])
+            else:
+                self.f.write(item)
+                self.f.flush()
+
+    def flush(self):
+        '''write out all buffered data'''
+        with self.lock:
+            if self.closed:
+                return
+            self._flush_locked()
+            self.last_flush = time.time()
+
+    def close(self):
+        '''flush and close the log'''
+        with self.lock:
+            if self.closed:
+                return
+            self._flush_locked()
+            self.closed = True
+        self.stop_event.set()
+        if self.timer is not None:
+            self.timer.join()
+        if self.thread is not None:
+            self.queue.put(_STOP)
+            self.thread.join()
+        self.f.close()
+        _open_writers.discard(self)
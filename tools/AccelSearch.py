@@ -5,12 +5,12 @@ search a set of log files for bad accel values
 '''
 from __future__ import print_function
 from builtins import input
-from builtins import range
 
 import sys, os
 import zipfile
 
 from pymavlink import mavutil
+from pymavlink import multilog
 
 # extra imports for pyinstaller
 import json
@@ -29,13 +29,14 @@ parser.add_argument("--directory", action='append', default=search_dirs, help="d
 parser.add_argument("--post-boot", action='store_true', help="post boot only")
 parser.add_argument("--init-only", action='store_true', help="init only")
 parser.add_argument("--single-axis", action='store_true', help="single axis only")
+parser.add_argument("directories", metavar="DIR", nargs="*", help="directories or logs to search")
+multilog.add_arguments(parser)
 
 args = parser.parse_args()
 
-logcount = 0
-
 def AccelSearch(filename):
-    global logcount
+    '''search a log for bad accel values, returning a tuple of
+    whether it matched and whether it had any IMU data'''
     mlog = mavutil.mavlink_connection(filename)
     badcount = 0
     badval = None
@@ -44,13 +45,11 @@ def AccelSearch(filename):
     while True:
         m = mlog.recv_match(type=['PARAM_VALUE','RAW_IMU'])
         if m is None:
-            if last_t != 0:
-                logcount += 1
-            return False
+            return (False, last_t != 0)
         if m.get_type() == 'PARAM_VALUE':
             if m.param_id.startswith('INS_PRODUCT_ID'):
                 if m.param_value not in [0.0, 5.0]:
-                    return False
+                    return (False, False)
         if m.get_type() == 'RAW_IMU':
             if m.time_usec < last_t:
                 have_ok = False
@@ -75,74 +74,80 @@ def AccelSearch(filename):
                         badcount += 1
                         badval = m
                         if badcount > 5:
-                            logcount += 1
                             if args.init_only and have_ok:
                                 continue
                             print(have_ok, badcount, badval, m)
-                            return True
+                            return (True, True)
                     else:
                         badcount = 1
                         badval = m
             if badcount == 0:
                 have_ok = True
-    if last_t != 0:
-        logcount += 1
-    return True
-
-found = []
-directories = args.directory
-
-# allow drag and drop
-if len(sys.argv) > 1:
-    directories = sys.argv[1:]
-
-filelist = []
-
-for d in directories:
-    if not os.path.exists(d):
-        continue
-    if os.path.isdir(d):
-        print("Searching in %s" % d)
-        for (root, dirs, files) in os.walk(d):
-            for f in files:
-                if not f.endswith('.tlog'):
-                    continue
-                path = os.path.join(root, f)
-                filelist.append(path)
-    elif d.endswith('.tlog'):
-        filelist.append(d)
+    return (True, last_t != 0)
+
+def main():
+    found = []
+    logcount = 0
+    directories = args.directory
+
+    # allow drag and drop
+    if len(args.directories) > 0:
+        directories = args.directories
+
+    filelist = []
+
+    for d in directories:
+        if not os.path.exists(d):
+            continue
+        if os.path.isdir(d):
+            print("Searching in %s" % d)
+            for (root, dirs, files) in os.walk(d):
+                for f in files:
+                    if not f.endswith('.tlog'):
+                        continue
+                    path = os.path.join(root, f)
+                    filelist.append(path)
+        elif d.endswith('.tlog'):
+            filelist.append(d)
+
+    for r in multilog.run_logs(AccelSearch, filelist, args):
+        print("Checked %s ... [found=%u logcount=%u i=%u/%u]" % (r.filename, len(found), logcount, r.index, len(filelist)))
+        if not r.ok():
+            continue
+        (matched, counted) = r.result
+        if counted:
+            logcount += 1
+        if matched:
+            found.append(r.filename)
+
+
+    if len(found) == 0:
+        print("No matching files found - all OK!")
+        input('Press enter to close')
+        sys.exit(0)
+
+    print("Creating zip file %s" % results)
+    try:
+        zip = zipfile.ZipFile(results, 'w')
+    except Exception:
+        print("Unable to create zip file %s" % results)
+        print("Please send matching files manually")
+        for f in found:
+            print('MATCHED: %s' % f)
+        input('Press enter to close')
+        sys.exit(1)
 
-for i in range(len(filelist)):
-    f = filelist[i]
-    print("Checking %s ... [found=%u logcount=%u i=%u/%u]" % (f, len(found), logcount, i, len(filelist)))
-    if AccelSearch(f):
-        found.append(f)
+    for f in found:
+        zip.write(f, arcname=os.path.basename(f))
+    zip.close()
 
+    print('==============================================')
+    print("Created %s with %u of %u matching logs" % (results, len(found), logcount))
+    print("Please send this file to %s" % email)
+    print('==============================================')
 
-if len(found) == 0:
-    print("No matching files found - all OK!")
     input('Press enter to close')
     sys.exit(0)
 
-print("Creating zip file %s" % results)
-try:
-    zip = zipfile.ZipFile(results, 'w')
-except Exception:
-    print("Unable to create zip file %s" % results)
-    print("Please send matching files manually")
-    for f in found:
-        print('MATCHED: %s' % f)
-    input('Press enter to close')
-    sys.exit(1)
-
-for f in found:
-    zip.write(f, arcname=os.path.basename(f))
-zip.close()
-
-print('==============================================')
-print("Created %s with %u of %u matching logs" % (results, len(found), logcount))
-print("Please send this file to %s" % email)
-print('==============================================')
-
-input('Press enter to close')
-sys.exit(0)
+if __name__ == '__main__':
+    main()
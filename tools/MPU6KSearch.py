@@ -11,6 +11,7 @@ import sys, time, os
 import zipfile
 
 from pymavlink import mavutil
+from pymavlink import multilog
 from math import degrees
 
 # extra imports for pyinstaller
@@ -24,6 +25,13 @@ search_dirs = ['c:\Program Files\APM Planner',
 results = 'SearchResults.zip'
 email = 'Craig Elder <craig@3drobotics.com>'
 
+from argparse import ArgumentParser
+parser = ArgumentParser(description=__doc__)
+parser.add_argument("directories", metavar="DIR", nargs="*", help="directories or logs to search")
+multilog.add_arguments(parser)
+
+args = parser.parse_args()
+
 def IMUCheckFail(filename):
     try:
         mlog = mavutil.mavlink_connection(filename)
@@ -130,13 +138,6 @@ def IMUCheckFail(filename):
         
     return False
 
-found = []
-directories = sys.argv[1:]
-if not directories:
-    directories = search_dirs
-    
-filelist = []
-
 extensions = ['.tlog','.bin']
 
 def match_extension(f):
@@ -144,59 +145,68 @@ def match_extension(f):
     (root,ext) = os.path.splitext(f)
     return ext.lower() in extensions
 
-for d in directories:
-    if not os.path.exists(d):
-        continue
-    if os.path.isdir(d):
-        print("Searching in %s" % d)
-        for (root, dirs, files) in os.walk(d):
-            for f in files:
-                if not match_extension(f):
-                    continue
-                path = os.path.join(root, f)
-                filelist.append(path)
-    elif match_extension(d):
-        filelist.append(d)
-
-for i in range(len(filelist)):
-    f = filelist[i]
-    print("Checking %s ... [found=%u i=%u/%u]" % (f, len(found), i, len(filelist)))
+def main():
+    found = []
+    directories = args.directories
+    if not directories:
+        directories = search_dirs
+
+    filelist = []
+
+    for d in directories:
+        if not os.path.exists(d):
+            continue
+        if os.path.isdir(d):
+            print("Searching in %s" % d)
+            for (root, dirs, files) in os.walk(d):
+                for f in files:
+                    if not match_extension(f):
+                        continue
+                    path = os.path.join(root, f)
+                    filelist.append(path)
+        elif match_extension(d):
+            filelist.append(d)
+
+    for r in multilog.run_logs(IMUCheckFail, filelist, args):
+        print("Checked %s ... [found=%u i=%u/%u]" % (r.filename, len(found), r.index, len(filelist)))
+        if not r.ok():
+            print("Failed - %s" % r.error.strip().split('\n')[-1])
+            continue
+        if r.result:
+            found.append(r.filename)
+        sys.stdout.flush()
+
+    if len(found) == 0:
+        print("No matching files found - all OK!")
+        input('Press enter to close')
+        sys.exit(0)
+
+    print("Creating zip file %s" % results)
     try:
-        if IMUCheckFail(f):
-            found.append(f)
-    except Exception as e:
-        print("Failed - %s" % e)
-        continue
-    sys.stdout.flush()
-
-if len(found) == 0:
-    print("No matching files found - all OK!")
-    input('Press enter to close')
-    sys.exit(0)
+        zip = zipfile.ZipFile(results, 'w')
+    except Exception:
+        print("Unable to create zip file %s" % results)
+        print("Please send matching files manually")
+        for f in found:
+            print('MATCHED: %s' % f)
+        input('Press enter to close')
+        sys.exit(1)
 
-print("Creating zip file %s" % results)
-try:
-    zip = zipfile.ZipFile(results, 'w')
-except Exception:
-    print("Unable to create zip file %s" % results)
-    print("Please send matching files manually")
     for f in found:
-        print('MATCHED: %s' % f)
+        arcname=os.path.basename(f)
+        if not arcname.startswith('201'):
+            mtime = os.path.getmtime(f)
+            arcname = "%s-%s" % (time.strftime("%Y-%m-%d-%H-%M-%S", time.localtime(mtime)), arcname)
+        zip.write(f, arcname=arcname)
+    zip.close()
+
+    print('==============================================')
+    print("Created %s with %u of %u matching logs" % (results, len(found), len(filelist)))
+    print("Please send this file to %s" % email)
+    print('==============================================')
+
     input('Press enter to close')
-    sys.exit(1)
-
-for f in found:
-    arcname=os.path.basename(f)
-    if not arcname.startswith('201'):
-        mtime = os.path.getmtime(f)
-        arcname = "%s-%s" % (time.strftime("%Y-%m-%d-%H-%M-%S", time.localtime(mtime)), arcname)
-    zip.write(f, arcname=arcname)
-zip.close()
-
-print('==============================================')
-print("Created %s with %u of %u matching logs" % (results, len(found), len(filelist)))
-print("Please send this file to %s" % email)
-print('==============================================')
-
-input('Press enter to close')
-sys.exit(0)
+    sys.exit(0)
+
+if __name__ == '__main__':
+    main()
@@ -4,7 +4,7 @@
 fit best estimate of magnetometer offsets, diagonals, off-diagonals, cmot and scaling using WMM target
 '''
 
-import sys, time, os, math, copy
+import sys, time, os, copy
 
 from argparse import ArgumentParser
 parser = ArgumentParser(description=__doc__)
@@ -33,8 +33,9 @@ args = parser.parse_args()
 
 from pymavlink import mavutil
 from pymavlink import mavextra
+from pymavlink import mavarray
+from pymavlink import magfit as fit
 from pymavlink.rotmat import Vector3
-from pymavlink.rotmat import Matrix3
 
 import matplotlib
 import matplotlib.pyplot as pyplot
@@ -48,137 +49,71 @@ if args.mag > 1:
 else:
     mag_idx = ''
 
-class Correction:
-    def __init__(self):
-        self.offsets = Vector3(0.0, 0.0, 0.0)
-        self.diag = Vector3(1.0, 1.0, 1.0)
-        self.offdiag = Vector3(0.0, 0.0, 0.0)
-        self.cmot = Vector3(0.0, 0.0, 0.0)
-        self.scaling = 1.0
-
-    def show_parms(self):
-        print("COMPASS_OFS%s_X %d" % (mag_idx, int(self.offsets.x)))
-        print("COMPASS_OFS%s_Y %d" % (mag_idx, int(self.offsets.y)))
-        print("COMPASS_OFS%s_Z %d" % (mag_idx, int(self.offsets.z)))
-        print("COMPASS_DIA%s_X %.3f" % (mag_idx, self.diag.x))
-        print("COMPASS_DIA%s_Y %.3f" % (mag_idx, self.diag.y))
-        print("COMPASS_DIA%s_Z %.3f" % (mag_idx, self.diag.z))
-        print("COMPASS_ODI%s_X %.3f" % (mag_idx, self.offdiag.x))
-        print("COMPASS_ODI%s_Y %.3f" % (mag_idx, self.offdiag.y))
-        print("COMPASS_ODI%s_Z %.3f" % (mag_idx, self.offdiag.z))
-        print("COMPASS_MOT%s_X %.3f" % (mag_idx, self.cmot.x))
-        print("COMPASS_MOT%s_Y %.3f" % (mag_idx, self.cmot.y))
-        print("COMPASS_MOT%s_Z %.3f" % (mag_idx, self.cmot.z))
-        print("COMPASS_SCALE%s %.2f" % (mag_idx, self.scaling))
-        if args.cmot:
-            print("COMPASS_MOTCT 2")
-
-def correct(MAG, BAT, c):
-    '''correct a mag sample, returning a Vector3'''
-    mag = Vector3(MAG.MagX, MAG.MagY, MAG.MagZ)
-
-    # add the given offsets
-    mag += c.offsets
-
-    # multiply by scale factor
-    mag *= c.scaling
-
-    # apply elliptical corrections
-    mat = Matrix3(
-        Vector3(c.diag.x,    c.offdiag.x,  c.offdiag.y),
-        Vector3(c.offdiag.x, c.diag.y,     c.offdiag.z),
-        Vector3(c.offdiag.y, c.offdiag.z,  c.diag.z))
-
-    mag = mat * mag
-
-    # apply compassmot corrections
-    if BAT is not None and hasattr(BAT, 'Curr') and not math.isnan(BAT.Curr):
-        mag += c.cmot * BAT.Curr
-
-    return mag
-
-def get_yaw(ATT,MAG,BAT,c):
-    '''calculate heading from raw magnetometer and new offsets'''
-
-    mag = correct(MAG, BAT, c)
-
-    # go via a DCM matrix to match the APM calculation
-    dcm_matrix = mavextra.rotation_df(ATT)
-    cos_pitch_sq = 1.0-(dcm_matrix.c.x*dcm_matrix.c.x)
-    headY = mag.y * dcm_matrix.c.z - mag.z * dcm_matrix.c.y
-    headX = mag.x * cos_pitch_sq - dcm_matrix.c.x * (mag.y * dcm_matrix.c.y + mag.z * dcm_matrix.c.z)
-
-    global declination
-    yaw = math.degrees(math.atan2(-headY,headX)) + declination
-    if yaw < 0:
-        yaw += 360
-    return yaw
-
-def expected_field(ATT, yaw):
-    '''return expected magnetic field for attitude'''
-    global earth_field
-
-    roll = ATT.Roll
-    pitch = ATT.Pitch
-
-    rot = Matrix3()
-    rot.from_euler(math.radians(roll), math.radians(pitch), math.radians(yaw))
-
-    field = rot.transposed() * earth_field
-
-    return field
+def show_parms(c):
+    print("COMPASS_OFS%s_X %d" % (mag_idx, int(c.offsets[0])))
+    print("COMPASS_OFS%s_Y %d" % (mag_idx, int(c.offsets[1])))
+    print("COMPASS_OFS%s_Z %d" % (mag_idx, int(c.offsets[2])))
+    print("COMPASS_DIA%s_X %.3f" % (mag_idx, c.diag[0]))
+    print("COMPASS_DIA%s_Y %.3f" % (mag_idx, c.diag[1]))
+    print("COMPASS_DIA%s_Z %.3f" % (mag_idx, c.diag[2]))
+    print("COMPASS_ODI%s_X %.3f" % (mag_idx, c.offdiag[0]))
+    print("COMPASS_ODI%s_Y %.3f" % (mag_idx, c.offdiag[1]))
+    print("COMPASS_ODI%s_Z %.3f" % (mag_idx, c.offdiag[2]))
+    print("COMPASS_MOT%s_X %.3f" % (mag_idx, c.cmot[0]))
+    print("COMPASS_MOT%s_Y %.3f" % (mag_idx, c.cmot[1]))
+    print("COMPASS_MOT%s_Z %.3f" % (mag_idx, c.cmot[2]))
+    print("COMPASS_SCALE%s %.2f" % (mag_idx, c.scaling))
+    if args.cmot:
+        print("COMPASS_MOTCT 2")
+
+def show_corrections(name, c):
+    print("%s: %s diag: %s offdiag: %s cmot: %s scale: %.2f" % (
+        name, Vector3(c.offsets), Vector3(c.diag), Vector3(c.offdiag), Vector3(c.cmot), c.scaling))
 
 data = None
-old_corrections = Correction()
+old_corrections = fit.Correction()
 
-def wmm_error(p):
-    '''world magnetic model error with correction fit'''
+def params_to_correction(p):
+    '''make a Correction from the fit parameters'''
     p = list(p)
     c = copy.copy(old_corrections)
 
-    c.offsets = Vector3(p.pop(0), p.pop(0), p.pop(0))
+    c.offsets = numpy.array([p.pop(0), p.pop(0), p.pop(0)])
     c.scaling = p.pop(0)
     if args.elliptical:
-        c.diag = Vector3(p.pop(0), p.pop(0), p.pop(0))
-        c.offdiag = Vector3(p.pop(0), p.pop(0), p.pop(0))
+        c.diag = numpy.array([p.pop(0), p.pop(0), p.pop(0)])
+        c.offdiag = numpy.array([p.pop(0), p.pop(0), p.pop(0)])
     else:
-        c.diag = Vector3(1.0, 1.0, 1.0)
-        c.offdiag = Vector3(0.0, 0.0, 0.0)
+        c.diag = numpy.ones(3)
+        c.offdiag = numpy.zeros(3)
 
     if args.cmot:
-        c.cmot = Vector3(p.pop(0), p.pop(0), p.pop(0))
-
-    ret = 0
-
-    for (MAG,ATT,BAT) in data:
-        yaw = get_yaw(ATT,MAG,BAT,c)
-        expected = expected_field(ATT, yaw)
-        observed = correct(MAG,BAT,c)
-
-        error = (expected - observed).length()
-        ret += error
-
-    ret /= len(data)
+        c.cmot = numpy.array([p.pop(0), p.pop(0), p.pop(0)])
+    return c
 
-    return ret
+def wmm_error(p):
+    '''world magnetic model error with correction fit'''
+    c = params_to_correction(p)
+    return fit.wmm_error(c, data['mag'], data['roll'], data['pitch'], data['current'],
+                         earth_field, declination)
 
 def fit_WWW():
     from scipy import optimize
 
     c = copy.copy(old_corrections)
-    p = [c.offsets.x, c.offsets.y, c.offsets.z, c.scaling]
+    p = [c.offsets[0], c.offsets[1], c.offsets[2], c.scaling]
     if args.elliptical:
-        p.extend([c.diag.x, c.diag.y, c.diag.z, c.offdiag.x, c.offdiag.y, c.offdiag.z])
+        p.extend([c.diag[0], c.diag[1], c.diag[2], c.offdiag[0], c.offdiag[1], c.offdiag[2]])
     if args.cmot:
-        p.extend([c.cmot.x, c.cmot.y, c.cmot.z])
+        p.extend([c.cmot[0], c.cmot[1], c.cmot[2]])
 
     ofs = args.max_offset
     min_scale_delta = 0.00001
     bounds = [(-ofs,ofs),(-ofs,ofs),(-ofs,ofs),(args.min_scale,max(args.min_scale+min_scale_delta,args.max_scale))]
     if args.no_offset_change:
-        bounds[0] = (c.offsets.x, c.offsets.x)
-        bounds[1] = (c.offsets.y, c.offsets.y)
-        bounds[2] = (c.offsets.z, c.offsets.z)
+        bounds[0] = (c.offsets[0], c.offsets[0])
+        bounds[1] = (c.offsets[1], c.offsets[1])
+        bounds[2] = (c.offsets[2], c.offsets[2])
 
     if args.elliptical:
         for i in range(3):
@@ -188,9 +123,9 @@ def fit_WWW():
 
     if args.cmot:
         if args.no_cmot_change:
-            bounds.append((c.cmot.x, c.cmot.x))
-            bounds.append((c.cmot.y, c.cmot.y))
-            bounds.append((c.cmot.z, c.cmot.z))
+            bounds.append((c.cmot[0], c.cmot[0]))
+            bounds.append((c.cmot[1], c.cmot[1]))
+            bounds.append((c.cmot[2], c.cmot[2]))
         else:
             for i in range(3):
                 bounds.append((-args.max_cmot,args.max_cmot))
@@ -199,48 +134,11 @@ def fit_WWW():
     if imode != 0:
         print("Fit failed: %s" % smode)
         sys.exit(1)
-    p = list(p)
-
-    c.offsets = Vector3(p.pop(0), p.pop(0), p.pop(0))
-    c.scaling = p.pop(0)
-
-    if args.elliptical:
-        c.diag = Vector3(p.pop(0), p.pop(0), p.pop(0))
-        c.offdiag = Vector3(p.pop(0), p.pop(0), p.pop(0))
-    else:
-        c.diag = Vector3(1.0, 1.0, 1.0)
-        c.offdiag = Vector3(0.0, 0.0, 0.0)
-
-    if args.cmot:
-        c.cmot = Vector3(p.pop(0), p.pop(0), p.pop(0))
-    else:
-        c.cmot = Vector3(0.0, 0.0, 0.0)
+    c = params_to_correction(p)
+    if not args.cmot:
+        c.cmot = numpy.zeros(3)
     return c
 
-def remove_offsets(MAG, BAT, c):
-    '''remove all corrections to get raw sensor data'''
-    correction_matrix = Matrix3(Vector3(c.diag.x,    c.offdiag.x, c.offdiag.y),
-                                Vector3(c.offdiag.x, c.diag.y,    c.offdiag.z),
-                                Vector3(c.offdiag.y, c.offdiag.z, c.diag.z))
-    try:
-        correction_matrix = correction_matrix.invert()
-    except Exception:
-        return False
-
-    field = Vector3(MAG.MagX, MAG.MagY, MAG.MagZ)
-    if BAT is not None and hasattr(BAT,'Curr') and not math.isnan(BAT.Curr):
-        field -= c.cmot * BAT.Curr
-    field = correction_matrix * field
-    field *= 1.0 / c.scaling
-    field -= Vector3(MAG.OfsX, MAG.OfsY, MAG.OfsZ)
-
-    if math.isnan(field.x) or math.isnan(field.y) or math.isnan(field.z):
-        return False
-    MAG.MagX = int(field.x)
-    MAG.MagY = int(field.y)
-    MAG.MagZ = int(field.z)
-    return True
-
 def magfit(logfile):
     '''find best magnetometer offset fit to a log file'''
 
@@ -250,22 +148,15 @@ def magfit(logfile):
     global earth_field, declination
 
     global data
-    data = []
-
-    ATT = None
-    BAT = None
 
     mag_msg = 'MAG%s' % mag_idx
 
-    count = 0
-    parameters = {}
-
     # get parameters
-    while True:
-        msg = mlog.recv_match(type=['PARM'])
-        if msg is None:
-            break
-        parameters[msg.Name] = msg.Value
+    parameters = {}
+    PARM = mavarray.extract_arrays(mlog, ['PARM']).get('PARM', None)
+    if PARM is not None:
+        for i in range(len(PARM)):
+            parameters[PARM.Name[i]] = PARM.Value[i]
 
     mlog.rewind()
 
@@ -276,48 +167,59 @@ def magfit(logfile):
 
     if args.att_source is not None:
         ATT_NAME = args.att_source
-    if parameters['AHRS_EKF_TYPE'] == 2:
+    elif parameters.get('AHRS_EKF_TYPE', None) == 2:
         ATT_NAME = 'NKF1'
-    elif parameters['AHRS_EKF_TYPE'] == 3:
+    elif parameters.get('AHRS_EKF_TYPE', None) == 3:
         ATT_NAME = 'XKF1'
     else:
         ATT_NAME = 'ATT'
     print("Attitude source %s" % ATT_NAME);
 
     # extract MAG data
-    while True:
-        msg = mlog.recv_match(type=['GPS',mag_msg,ATT_NAME,'CTUN','BARO', 'BAT'], condition=args.condition)
-        if msg is None:
-            break
-        if msg.get_type() == 'GPS' and msg.Status >= 3 and earth_field is None:
-            earth_field = mavextra.expected_earth_field(msg)
-            (declination,inclination,intensity) = mavextra.get_mag_field_ef(msg.Lat, msg.Lng)
+    arrays = mavarray.extract_arrays(mlog, ['GPS',mag_msg,ATT_NAME,'BAT'], condition=args.condition)
+    if earth_field is None and 'GPS' in arrays:
+        GPS = arrays['GPS']
+        fix = numpy.nonzero(GPS.Status >= 3)[0]
+        if len(fix) > 0:
+            i = fix[0]
+            earth_field = mavextra.expected_earth_field_lat_lon(GPS.Lat[i], GPS.Lng[i])
+            (declination,inclination,intensity) = mavextra.get_mag_field_ef(GPS.Lat[i], GPS.Lng[i])
             print("Earth field: %s  strength %.0f declination %.1f degrees" % (earth_field, earth_field.length(), declination))
-        if msg.get_type() == ATT_NAME:
-            ATT = msg
-        if msg.get_type() == 'BAT':
-            BAT = msg
-        if msg.get_type() == mag_msg and ATT is not None:
-            if count % args.reduce == 0:
-                data.append((msg,ATT,BAT))
-            count += 1
-
-    old_corrections.offsets = Vector3(parameters.get('COMPASS_OFS%s_X' % mag_idx,0.0),
-                                      parameters.get('COMPASS_OFS%s_Y' % mag_idx,0.0),
-                                      parameters.get('COMPASS_OFS%s_Z' % mag_idx,0.0))
-    old_corrections.diag = Vector3(parameters.get('COMPASS_DIA%s_X' % mag_idx,1.0),
-                                   parameters.get('COMPASS_DIA%s_Y' % mag_idx,1.0),
-                                   parameters.get('COMPASS_DIA%s_Z' % mag_idx,1.0))
-    if old_corrections.diag == Vector3(0,0,0):
-        old_corrections.diag = Vector3(1,1,1)
-    old_corrections.offdiag = Vector3(parameters.get('COMPASS_ODI%s_X' % mag_idx,0.0),
-                                      parameters.get('COMPASS_ODI%s_Y' % mag_idx,0.0),
-                                      parameters.get('COMPASS_ODI%s_Z' % mag_idx,0.0))
+
+    if not mag_msg in arrays or not ATT_NAME in arrays or earth_field is None:
+        print("No %s, %s or GPS data" % (mag_msg, ATT_NAME))
+        return
+    MAG = arrays[mag_msg]
+    ATT = arrays[ATT_NAME]
+
+    # use every reduce'th mag sample after the first attitude
+    att_idx = ATT.latest_index(MAG._position)
+    keep = numpy.nonzero(att_idx >= 0)[0][::args.reduce]
+    att_idx = att_idx[keep]
+    mag = numpy.column_stack((MAG.MagX, MAG.MagY, MAG.MagZ))[keep].astype(float)
+    logged_ofs = numpy.column_stack((MAG.OfsX, MAG.OfsY, MAG.OfsZ))[keep].astype(float)
+    current = numpy.full(len(keep), numpy.nan)
+    if 'BAT' in arrays and 'Curr' in arrays['BAT'].get_fieldnames():
+        BAT = arrays['BAT']
+        bat_idx = BAT.latest_index(MAG._position[keep])
+        current = numpy.where(bat_idx >= 0, BAT.Curr[numpy.maximum(bat_idx, 0)], numpy.nan)
+
+    old_corrections.offsets = numpy.array([parameters.get('COMPASS_OFS%s_X' % mag_idx,0.0),
+                                           parameters.get('COMPASS_OFS%s_Y' % mag_idx,0.0),
+                                           parameters.get('COMPASS_OFS%s_Z' % mag_idx,0.0)])
+    old_corrections.diag = numpy.array([parameters.get('COMPASS_DIA%s_X' % mag_idx,1.0),
+                                        parameters.get('COMPASS_DIA%s_Y' % mag_idx,1.0),
+                                        parameters.get('COMPASS_DIA%s_Z' % mag_idx,1.0)])
+    if numpy.all(old_corrections.diag == 0):
+        old_corrections.diag = numpy.ones(3)
+    old_corrections.offdiag = numpy.array([parameters.get('COMPASS_ODI%s_X' % mag_idx,0.0),
+                                           parameters.get('COMPASS_ODI%s_Y' % mag_idx,0.0),
+                                           parameters.get('COMPASS_ODI%s_Z' % mag_idx,0.0)])
     if parameters.get('COMPASS_MOTCT',0) == 2:
         # only support current based corrections for now
-        old_corrections.cmot = Vector3(parameters.get('COMPASS_MOT%s_X' % mag_idx,0.0),
-                                       parameters.get('COMPASS_MOT%s_Y' % mag_idx,0.0),
-                                       parameters.get('COMPASS_MOT%s_Z' % mag_idx,0.0))
+        old_corrections.cmot = numpy.array([parameters.get('COMPASS_MOT%s_X' % mag_idx,0.0),
+                                            parameters.get('COMPASS_MOT%s_Y' % mag_idx,0.0),
+                                            parameters.get('COMPASS_MOT%s_Z' % mag_idx,0.0)])
     old_corrections.scaling = parameters.get('COMPASS_SCALE%s' % mag_idx, None)
     if old_corrections.scaling is None or old_corrections.scaling < 0.1:
         force_scale = False
@@ -326,16 +228,19 @@ def magfit(logfile):
         force_scale = True
 
     # remove existing corrections
-    data2 = []
-    for (MAG,ATT,BAT) in data:
-        if remove_offsets(MAG, BAT, old_corrections):
-            data2.append((MAG,ATT,BAT))
-    data = data2
-
-    print("Extracted %u points" % len(data))
-    print("Current: %s diag: %s offdiag: %s cmot: %s scale: %.2f" % (
-        old_corrections.offsets, old_corrections.diag, old_corrections.offdiag, old_corrections.cmot, old_corrections.scaling))
-    if len(data) == 0:
+    (raw, valid) = old_corrections.uncorrect(mag, logged_ofs, current)
+    data = {
+        'mag' : raw[valid],
+        'roll' : ATT.Roll[att_idx][valid].astype(float),
+        'pitch' : ATT.Pitch[att_idx][valid].astype(float),
+        'yaw' : ATT.Yaw[att_idx][valid].astype(float),
+        'current' : current[valid],
+    }
+    earth_field = numpy.array([earth_field.x, earth_field.y, earth_field.z])
+
+    print("Extracted %u points" % len(data['mag']))
+    show_corrections("Current", old_corrections)
+    if len(data['mag']) == 0:
         return
 
     # do fit
@@ -343,7 +248,7 @@ def magfit(logfile):
 
     # normalise diagonals to scale factor
     if force_scale:
-        avgdiag = (c.diag.x + c.diag.y + c.diag.z)/3.0
+        avgdiag = numpy.mean(c.diag)
         calc_scale = c.scaling
         c.scaling *= avgdiag
         if c.scaling > args.max_scale:
@@ -351,68 +256,43 @@ def magfit(logfile):
         if c.scaling < args.min_scale:
             c.scaling = args.min_scale
         scale_change = c.scaling / calc_scale
-        c.diag *= 1.0/scale_change
-        c.offdiag *= 1.0/scale_change
-
-    print("New: %s diag: %s offdiag: %s cmot: %s scale: %.2f" % (
-        c.offsets, c.diag, c.offdiag, c.cmot, c.scaling))
-
-    x = []
-
-    corrected = {}
-    corrected['Yaw'] = []
-    expected1 = {}
-    expected2 = {}
-    uncorrected = {}
-    uncorrected['Yaw'] = []
-    yaw_change1 = []
-    yaw_change2 = []
-    for i in range(len(data)):
-        (MAG,ATT,BAT) = data[i]
-        yaw1 = get_yaw(ATT,MAG,BAT,c)
-        corrected['Yaw'].append(yaw1)
-        ef1 = expected_field(ATT, yaw1)
-        cf = correct(MAG, BAT, c)
-
-        yaw2 = get_yaw(ATT,MAG,BAT,old_corrections)
-        ef2 = expected_field(ATT, yaw2)
-        uncorrected['Yaw'].append(yaw2)
-        uf = correct(MAG, BAT, old_corrections)
-
-        yaw_change1.append(mavextra.wrap_180(yaw1 - yaw2))
-        yaw_change2.append(mavextra.wrap_180(yaw1 - ATT.Yaw))
-        for axis in ['x','y','z']:
-            if not axis in corrected:
-                corrected[axis] = []
-                uncorrected[axis] = []
-                expected1[axis] = []
-                expected2[axis] = []
-            corrected[axis].append(getattr(cf, axis))
-            uncorrected[axis].append(getattr(uf, axis))
-            expected1[axis].append(getattr(ef1, axis))
-            expected2[axis].append(getattr(ef2, axis))
-        x.append(i)
-
-    c.show_parms()
+        c.diag = c.diag * (1.0/scale_change)
+        c.offdiag = c.offdiag * (1.0/scale_change)
+
+    show_corrections("New", c)
+
+    def fields(c):
+        observed = c.correct(data['mag'], data['current'])
+        yaw = fit.wmm_yaw(observed, data['roll'], data['pitch'], declination)
+        expected = fit.wmm_expected(data['roll'], data['pitch'], yaw, earth_field)
+        return (observed, expected, yaw)
+
+    (cf, ef1, yaw1) = fields(c)
+    (uf, ef2, yaw2) = fields(old_corrections)
+    yaw_change1 = mavarray._wrap_180(yaw1 - yaw2)
+    yaw_change2 = mavarray._wrap_180(yaw1 - data['yaw'])
+    x = numpy.arange(len(yaw1))
+
+    show_parms(c)
 
     fig, axs = pyplot.subplots(3, 1, sharex=True)
 
-    for axis in ['x','y','z']:
-        axs[0].plot(numpy.array(x), numpy.array(uncorrected[axis]), label='Uncorrected %s' % axis.upper() )
-        axs[0].plot(numpy.array(x), numpy.array(expected2[axis]), label='Expected %s' % axis.upper() )
+    for i, axis in enumerate(['x','y','z']):
+        axs[0].plot(x, uf[:,i], label='Uncorrected %s' % axis.upper() )
+        axs[0].plot(x, ef2[:,i], label='Expected %s' % axis.upper() )
         axs[0].legend(loc='upper left')
         axs[0].set_title('Original')
         axs[0].set_ylabel('Field (mGauss)')
 
-        axs[1].plot(numpy.array(x), numpy.array(corrected[axis]), label='Corrected %s' % axis.upper() )
-        axs[1].plot(numpy.array(x), numpy.array(expected1[axis]), label='Expected %s' % axis.upper() )
+        axs[1].plot(x, cf[:,i], label='Corrected %s' % axis.upper() )
+        axs[1].plot(x, ef1[:,i], label='Expected %s' % axis.upper() )
         axs[1].legend(loc='upper left')
         axs[1].set_title('Corrected')
         axs[1].set_ylabel('Field (mGauss)')
 
     # show change in yaw estimate from old corrections to new
-    axs[2].plot(numpy.array(x), numpy.array(yaw_change1), label='Mag Yaw Change')
-    axs[2].plot(numpy.array(x), numpy.array(yaw_change2), label='ATT Yaw Change')
+    axs[2].plot(x, yaw_change1, label='Mag Yaw Change')
+    axs[2].plot(x, yaw_change2, label='ATT Yaw Change')
     axs[2].set_title('Yaw Change (degrees)')
     axs[2].legend(loc='upper left')
 
@@ -26,6 +26,7 @@ parser.add_argument("logs", metavar="LOG", nargs="+")
 args = parser.parse_args()
 
 from pymavlink import mavutil
+from pymavlink import magfit as fit
 from pymavlink.rotmat import Vector3
 
 
@@ -103,24 +104,11 @@ def magfit(logfile):
     # open the log file
     mlog = mavutil.mavlink_connection(filename, notimestamps=args.notimestamps)
 
-    data = []
-    mag = None
-    offsets = Vector3(0,0,0)
-
-    # now gather all the data
-    while True:
-        # get the next MAVLink message in the log
-        m = mlog.recv_match(condition=args.condition)
-        if m is None:
-            break
-        if m.get_type() == "SENSOR_OFFSETS":
-            # update offsets that were used during this flight
-            offsets = Vector3(m.mag_ofs_x, m.mag_ofs_y, m.mag_ofs_z)
-        if m.get_type() == "RAW_IMU" and offsets is not None:
-            # extract one mag vector, removing the offsets that were
-            # used during that flight to get the raw sensor values
-            mag = Vector3(m.xmag, m.ymag, m.zmag) - offsets
-            data.append(mag)
+    # extract the mag vectors, removing the offsets that were used
+    # during that flight to get the raw sensor values
+    (magdata, arrays) = fit.load_mag(mlog, None, condition=args.condition)
+    data = [Vector3(v) for v in magdata.mag]
+    offsets = Vector3(magdata.offsets)
 
     print("Extracted %u data points" % len(data))
     print("Current offsets: %s" % offsets)
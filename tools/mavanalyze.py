@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+'''
+run several log analyses in a single pass over each log, producing a
+JSON report
+'''
+from __future__ import print_function
+
+import json
+import sys
+
+from argparse import ArgumentParser
+parser = ArgumentParser(description=__doc__)
+parser.add_argument("--condition", default=None, help="condition for packets")
+parser.add_argument("--analyzers", default=None,
+                    help="comma separated list of analyses to run (default all)")
+parser.add_argument("--groundspeed", type=float, default=3.0, help="groundspeed threshold for flighttime")
+parser.add_argument("--deltat", type=float, default=1.0, help="minimum gap to report for sigloss")
+parser.add_argument("--sigloss-types", default=None,
+                    help="comma separated message types for sigloss (default all)")
+parser.add_argument("--output", default=None, help="write the JSON report to this file")
+parser.add_argument("--indent", type=int, default=2, help="JSON indent")
+parser.add_argument("--list", action='store_true', help="list the available analyses")
+parser.add_argument("logs", metavar="LOG", nargs="*")
+
+from pymavlink import multilog
+multilog.add_arguments(parser)
+
+args = parser.parse_args()
+
+from pymavlink import mavutil
+from pymavlink import loganalysis
+
+
+def analyze(logfile):
+    '''run the selected analyses over one log'''
+    names = None
+    if args.analyzers is not None:
+        names = args.analyzers.split(',')
+    sigloss_types = None
+    if args.sigloss_types is not None:
+        sigloss_types = args.sigloss_types.split(',')
+    analyzers = loganalysis.create_analyzers(names,
+                                             groundspeed=args.groundspeed,
+                                             deltat=args.deltat,
+                                             sigloss_types=sigloss_types)
+    mlog = mavutil.mavlink_connection(logfile)
+    return loganalysis.scan_log(mlog, analyzers, condition=args.condition)
+
+if __name__ == '__main__':
+    if args.list:
+        for name in sorted(loganalysis.ANALYZERS.keys()):
+            print("%-12s %s" % (name, ' '.join(loganalysis.ANALYZERS[name].__doc__.split())))
+        sys.exit(0)
+
+    report = []
+    for r in multilog.run_logs(analyze, multilog.expand_globs(args.logs), args):
+        entry = {'filename' : r.filename}
+        if r.ok():
+            entry['analyses'] = r.result
+        else:
+            entry['error'] = r.error.strip().split('\n')[-1]
+        report.append(entry)
+
+    if args.output is not None:
+        f = open(args.output, 'w')
+    else:
+        f = sys.stdout
+    json.dump(report, f, indent=args.indent, sort_keys=True)
+    f.write('\n')
+    if args.output is not None:
+        f.close()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+
+'''
+compress dataflash and telemetry logs into block compressed gzip files
+which pymavlink can read without decompressing the whole log
+'''
+from __future__ import print_function
+
+import os
+
+from argparse import ArgumentParser
+parser = ArgumentParser(description=__doc__)
+parser.add_argument("--level", type=int, default=6, help="compression level, 1 to 9")
+parser.add_argument("--output", default=None, help="output file, when compressing a single log")
+parser.add_argument("--no-index", action='store_true', help="don't save a message index")
+parser.add_argument("--reindex", action='store_true',
+                    help="rebuild the index of already compressed logs")
+parser.add_argument("logs", metavar="LOG", nargs="+")
+
+args = parser.parse_args()
+
+from pymavlink import seekablelog
+
+if args.output is not None and len(args.logs) > 1:
+    print("--output can only be used with a single log")
+    raise SystemExit(1)
+
+for filename in args.logs:
+    if args.reindex:
+        seekablelog.build_index(filename)
+        print("Indexed %s" % filename)
+        continue
+    output = seekablelog.compress_log(filename, output=args.output, level=args.level,
+                                      index=not args.no_index)
+    size = os.path.getsize(filename)
+    csize = os.path.getsize(output)
+    print("%s -> %s %u bytes (%.1f%%)" % (filename, output, csize, (100.0 * csize) / max(size, 1)))
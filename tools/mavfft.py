@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 
 '''
-fit best estimate of magnetometer offsets
+display Welch averaged power spectral density of raw ACC and GYR data
 '''
 from __future__ import print_function
 
@@ -11,12 +11,14 @@ import pylab
 from argparse import ArgumentParser
 parser = ArgumentParser(description=__doc__)
 parser.add_argument("--condition", default=None, help="select packets by condition")
-parser.add_argument("--sample-length", type=int, default=0, help="number of samples to run FFT over")
+parser.add_argument("--sample-length", type=int, default=1024, help="number of samples to run each FFT over")
+parser.add_argument("--window", default='hanning', help="windowing function: 'hanning', 'blackman' or 'None'")
 parser.add_argument("logs", metavar="LOG", nargs="+")
 
 args = parser.parse_args()
 
 from pymavlink import mavutil
+from pymavlink import mavpsd
 
 def fft(logfile):
     '''display fft for raw ACC data in logfile'''
@@ -24,57 +26,19 @@ def fft(logfile):
     print("Processing log %s" % filename)
     mlog = mavutil.mavlink_connection(filename)
 
-    data = {'ACC1.rate' : 1000,
-            'ACC2.rate' : 1600,
-            'ACC3.rate' : 1000,
-            'GYR1.rate' : 1000,
-            'GYR2.rate' :  800,
-            'GYR3.rate' : 1000}
-    for acc in ['ACC1','ACC2','ACC3']:
-        for ax in ['AccX', 'AccY', 'AccZ']:
-            data[acc+'.'+ax] = []
-    for gyr in ['GYR1','GYR2','GYR3']:
-        for ax in ['GyrX', 'GyrY', 'GyrZ']:
-            data[gyr+'.'+ax] = []
+    spectra = mavpsd.imu_psd(mlog, nfft=args.sample_length, windows=[args.window], condition=args.condition)
 
-    # now gather all the data
-    while True:
-        m = mlog.recv_match(condition=args.condition)
-        if m is None:
-            break
-        type = m.get_type()
-        if type.startswith("ACC"):
-            data[type+'.AccX'].append(m.AccX)
-            data[type+'.AccY'].append(m.AccY)
-            data[type+'.AccZ'].append(m.AccZ)
-        if type.startswith("GYR"):
-            data[type+'.GyrX'].append(m.GyrX)
-            data[type+'.GyrY'].append(m.GyrY)
-            data[type+'.GyrZ'].append(m.GyrZ)
-
-    print("Extracted %u data points" % len(data['ACC1.AccX']))
-
-    for msg in ['ACC1', 'ACC2', 'ACC3', 'GYR1', 'GYR2', 'GYR3']:
-        pylab.figure()
-
-        if msg.startswith('ACC'):
-            prefix = 'Acc'
-        else:
-            prefix = 'Gyr'
-        for axis in ['X', 'Y', 'Z']:
-            field = msg + '.' + prefix + axis
-            d = data[field]
-            if args.sample_length != 0:
-                d = d[0:args.sample_length]
-            d = numpy.array(d)
-            if len(d) == 0:
-                continue
-            avg = numpy.sum(d) / len(d)
-            d -= avg
-            d_fft = numpy.fft.rfft(d)
-            freq  = numpy.fft.rfftfreq(len(d), 1.0 / data[msg+'.rate'])
-            pylab.plot( freq, numpy.abs(d_fft), label=field )
+    numpy.seterr(divide = 'ignore')
+    for sensor in spectra.tags():
+        welch = spectra.get(sensor, args.window)
+        print("%s: %.0f Hz, %u segments" % (sensor, welch.sample_rate, welch.count))
+        pylab.figure(sensor)
+        psd = welch.psd()
+        for i, axis in enumerate(['X', 'Y', 'Z']):
+            pylab.plot(welch.frequencies(), 10 * numpy.log10(psd[i]), label=sensor + '.' + axis)
         pylab.legend(loc='upper right')
+        pylab.xlabel('Hz')
+        pylab.ylabel('PSD dB')
 
 for filename in args.logs:
     fft(filename)
@@ -18,6 +18,7 @@ parser.add_argument("logs", metavar="LOG", nargs="+")
 args = parser.parse_args()
 
 from pymavlink import mavutil
+from pymavlink import mavarray
 
 try:
     raw_input          # Python 2
@@ -79,31 +80,18 @@ def fft(logfile):
             'GYR1.rate' : 1000,
             'GYR2.rate' :  800,
             'GYR3.rate' : 1000}
-    for acc in ['ACC1','ACC2','ACC3']:
-        for ax in ['AccX', 'AccY', 'AccZ', 'SampleC', 'TimeUS']:
-            data[acc+'.'+ax] = []
-    for gyr in ['GYR1','GYR2','GYR3']:
-        for ax in ['GyrX', 'GyrY', 'GyrZ', 'SampleC', 'TimeUS']:
-            data[gyr+'.'+ax] = []
+    fields = {'ACC' : ['AccX', 'AccY', 'AccZ', 'SampleC', 'TimeUS'],
+              'GYR' : ['GyrX', 'GyrY', 'GyrZ', 'SampleC', 'TimeUS']}
+    types = ['ACC1', 'ACC2', 'ACC3', 'GYR1', 'GYR2', 'GYR3']
 
     # now gather all the data
-    while True:
-        m = mlog.recv_match(condition=args.condition)
-        if m is None:
-            break
-        type = m.get_type()
-        if type.startswith("ACC"):
-            data[type+'.AccX'].append(m.AccX)
-            data[type+'.AccY'].append(m.AccY)
-            data[type+'.AccZ'].append(m.AccZ)
-            data[type+'.SampleC'].append(m.SampleC)
-            data[type+'.TimeUS'].append(m.TimeUS)
-        if type.startswith("GYR"):
-            data[type+'.GyrX'].append(m.GyrX)
-            data[type+'.GyrY'].append(m.GyrY)
-            data[type+'.GyrZ'].append(m.GyrZ)
-            data[type+'.SampleC'].append(m.SampleC)
-            data[type+'.TimeUS'].append(m.TimeUS)
+    arrays = mavarray.extract_arrays(mlog, types, args.condition)
+    for type in types:
+        for ax in fields[type[:3]]:
+            if type in arrays:
+                data[type+'.'+ax] = getattr(arrays[type], ax)
+            else:
+                data[type+'.'+ax] = numpy.zeros(0)
 
     # SampleC is just a sample counter
     ts = 1e-6 * numpy.array(data['ACC1.TimeUS'])
@@ -183,7 +171,7 @@ def fft(logfile):
                 if len(d) == 0:
                     continue
     
-                d = numpy.array(d)
+                d = numpy.array(d, dtype=float)
                 freq  = numpy.fft.rfftfreq(len(d), 1.0 / data[msg+'.rate'])
                 # remove mean
                 avg[axis] = numpy.mean(d)
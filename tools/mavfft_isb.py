@@ -10,7 +10,6 @@ import os
 import pylab
 import sys
 import time
-import copy
 
 from argparse import ArgumentParser
 import scipy.signal as signal
@@ -27,212 +26,65 @@ parser.add_argument("--notch-params", default=False, action='store_true', help="
 args = parser.parse_args()
 
 from pymavlink import mavutil
+from pymavlink import mavarray
+from pymavlink import mavpsd
 
 def mavfft_fttd(logfile):
     '''display fft for raw ACC data in logfile'''
 
-    '''object to store data about a single FFT plot'''
-    class PlotData(object):
-        def __init__(self, ffth):
-            self.seqno = -1
-            self.fftnum = ffth.N
-            self.sensor_type = ffth.type
-            self.instance = ffth.instance
-            self.sample_rate_hz = ffth.smp_rate
-            self.multiplier = ffth.mul
-            self.data = {}
-            self.data["X"] = []
-            self.data["Y"] = []
-            self.data["Z"] = []
-            self.holes = False
-            self.freq = None
-
-        def add_fftd(self, fftd):
-            if fftd.N != self.fftnum:
-                print("Skipping ISBD with wrong fftnum (%u vs %u)\n" % (fftd.N, self.fftnum))
-                return
-            if self.holes:
-                print("Skipping ISBD(%u) for ISBH(%u) with holes in it" % (fftd.seqno, self.fftnum))
-                return
-            if fftd.seqno != self.seqno+1:
-                print("ISBH(%u) has holes in it" % fftd.N)
-                self.holes = True
-                return
-            self.seqno += 1
-            self.data["X"].extend(fftd.x)
-            self.data["Y"].extend(fftd.y)
-            self.data["Z"].extend(fftd.z)
-
-        def overlap_windows(self, plotdata):
-            newplotdata = copy.deepcopy(self)
-            if plotdata.tag() != self.tag():
-                print("Invalid FFT data tag (%s vs %s) for window overlap" % (plotdata.tag(), self.tag()))
-                return self
-            if plotdata.fftnum <= self.fftnum:
-                print("Invalid FFT sequence (%u vs %u) for window overlap" % (plotdata.fftnum, self.fftnum))
-                return self
-            newplotdata.data["X"] = numpy.split(numpy.asarray(self.data["X"]), 2)[1].tolist() + numpy.split(numpy.asarray(plotdata.data["X"]), 2)[0].tolist()
-            newplotdata.data["Y"] = numpy.split(numpy.asarray(self.data["Y"]), 2)[1].tolist() + numpy.split(numpy.asarray(plotdata.data["Y"]), 2)[0].tolist()
-            newplotdata.data["Z"] = numpy.split(numpy.asarray(self.data["Z"]), 2)[1].tolist() + numpy.split(numpy.asarray(plotdata.data["Z"]), 2)[0].tolist()
-            return newplotdata
-
-        def prefix(self):
-            if self.sensor_type == 0:
-                return "Accel"
-            elif self.sensor_type == 1:
-                return "Gyro"
-            else:
-                return "?Unknown Sensor Type?"
-
-        def tag(self):
-            return str(self)
-
-        def __str__(self):
-            return "%s[%u]" % (self.prefix(), self.instance)
-
     print("Processing log %s" % logfile)
     mlog = mavutil.mavlink_connection(logfile)
 
     # see https://holometer.fnal.gov/GH_FFT.pdf for a description of the techniques used here
-    things_to_plot = []
-    plotdata = None
-    prev_plotdata = {}
-    msgcount = 0
+    start_time = time.time()
+    overlap = 0.5 if args.fft_overlap else 0.0
+    spectra = mavpsd.isb_psd(mlog, windows=[args.fft_window], overlap=overlap, condition=args.condition)
+
     hntch_mode = None
     hntch_option = None
     batch_mode = None
-    start_time = time.time()
-    thr_total = 0.
-    thr_count = 0
-
-    while True:
-        m = mlog.recv_match(condition=args.condition)
-        if m is None:
-            break
-        msgcount += 1
-        if msgcount % 1000 == 0:
-            sys.stderr.write(".")
-        msg_type = m.get_type()
-        if msg_type == "ISBH":
-            if plotdata is not None:
-                sensor = plotdata.tag()
-                # close off previous data collection
-                # in order to get 50% window overlap we need half the old data + half the new data and then the new data itself
-                if args.fft_overlap and sensor in prev_plotdata:
-                    things_to_plot.append(prev_plotdata[sensor].overlap_windows(plotdata))
-                things_to_plot.append(plotdata)
-                prev_plotdata[sensor] = plotdata
-            plotdata = PlotData(m)
-            continue
-
-        if msg_type == "ISBD":
-            if plotdata is None:
-                sys.stderr.write("?(fftnum=%u)" % m.N)
-                continue
-            plotdata.add_fftd(m)
-        
-        if msg_type == "PARM":
-            if m.Name == "INS_HNTCH_MODE":
-                hntch_mode = m.Value
-            elif m.Name == "INS_HNTCH_OPTS":
-                hntch_option = m.Value
-            elif m.Name == "INS_LOG_BAT_OPT":
-                batch_mode = m.Value
+    mlog.rewind()
+    arrays = mavarray.extract_arrays(mlog, ['PARM', 'CTUN'], args.condition)
+    if 'PARM' in arrays:
+        parms = dict(zip(arrays['PARM'].Name, arrays['PARM'].Value))
+        hntch_mode = parms.get("INS_HNTCH_MODE", None)
+        hntch_option = parms.get("INS_HNTCH_OPTS", None)
+        batch_mode = parms.get("INS_LOG_BAT_OPT", None)
 
-        # get an average read of the throttle value assuming a stable hover above 1m
-        if args.notch_params and msg_type == "CTUN":
-            if m.Alt > 1:
-                thr_total += m.ThO
-                thr_count = thr_count + 1
-
-    print("", file=sys.stderr)
     time_delta = time.time() - start_time
-    print("%us messages  %u messages/second  %u kB/second" % (msgcount, msgcount/time_delta, os.stat(filename).st_size/time_delta))
-    print("Extracted %u fft data sets" % len(things_to_plot), file=sys.stderr)
+    print("%u kB/second" % (os.stat(logfile).st_size/(1024*time_delta)))
+    print("Extracted %u fft data sets" % sum([spectra.get(t, args.fft_window).count for t in spectra.tags()]), file=sys.stderr)
+    if spectra.skipped:
+        print("Skipped %u data sets with missing data" % spectra.skipped, file=sys.stderr)
     if args.notch_params:
-        thr_ref = thr_total / thr_count
+        # get an average read of the throttle value assuming a stable hover above 1m
+        thr_ref = 0
+        if 'CTUN' in arrays:
+            hover = arrays['CTUN'].Alt > 1
+            thr_ref = numpy.mean(arrays['CTUN'].ThO[hover])
         print("Throttle average %f" % thr_ref)
 
-    sum_fft = {}
-    freqmap = {}
-    sample_rates = {}
-    counts = {}
-    window = {}
-    S2 = {}
     hntch_mode_names = { 0:"No", 1:"Throttle", 2:"RPM", 3:"ESC", 4:"FFT"}
     hntch_option_names = { 0:"Single", 1:"Double", 2:"Dynamic Harmonic", 3:"Double+Dynamic"}
     batch_mode_names = { 0:"Pre-filter", 1:"Sensor-rate", 2:"Post-filter" }
 
-    first_freq = None
-    for thing_to_plot in things_to_plot:
-
-        fft_len = len(thing_to_plot.data["X"])
-
-        if thing_to_plot.tag() not in sum_fft:
-            sum_fft[thing_to_plot.tag()] = {
-                "X": numpy.zeros(fft_len//2+1),
-                "Y": numpy.zeros(fft_len//2+1),
-                "Z": numpy.zeros(fft_len//2+1),
-            }
-            counts[thing_to_plot.tag()] = 0
-
-        if thing_to_plot.tag() not in window:
-            if args.fft_window == 'hanning':
-                # create hanning window
-                window[thing_to_plot.tag()] = numpy.hanning(fft_len)
-            elif args.fft_window == 'blackman':
-                # create blackman window
-                window[thing_to_plot.tag()] = numpy.blackman(fft_len)
-            else:
-                window[thing_to_plot.tag()] = numpy.arange(fft_len)
-                window[thing_to_plot.tag()].fill(1)
-            # calculate NEBW constant
-            S2[thing_to_plot.tag()] = numpy.inner(window[thing_to_plot.tag()], window[thing_to_plot.tag()])
-
-        for axis in [ "X","Y","Z" ]:
-            # normalize data and convert to dps in order to produce more meaningful magnitudes
-            if thing_to_plot.sensor_type == 1:
-                d = numpy.array(numpy.degrees(thing_to_plot.data[axis])) / float(thing_to_plot.multiplier)
-            else:
-                d = numpy.array(thing_to_plot.data[axis]) / float(thing_to_plot.multiplier)
-            if len(d) == 0:
-                print("No data?!?!?!")
-                continue
-            if len(window[thing_to_plot.tag()]) != fft_len:
-                print("Skipping corrupted frame of length %d" % fft_len)
-                continue
-
-            # apply window to the input
-            d *= window[thing_to_plot.tag()]
-            # perform RFFT
-            d_fft = numpy.fft.rfft(d)
-            # convert to squared complex magnitude
-            d_fft = numpy.square(abs(d_fft))
-            # remove DC component
-            d_fft[0] = 0
-            d_fft[-1] = 0
-            # accumulate the sums
-            sum_fft[thing_to_plot.tag()][axis] += d_fft
-            freq = numpy.fft.rfftfreq(len(d), 1.0/thing_to_plot.sample_rate_hz)
-            freqmap[thing_to_plot.tag()] = freq
-
-        sample_rates[thing_to_plot.tag()] = thing_to_plot.sample_rate_hz
-        counts[thing_to_plot.tag()] += 1
-
     numpy.seterr(divide = 'ignore')
-    for sensor in sum_fft:
+    for sensor in spectra.tags():
         print("Sensor: %s" % str(sensor))
         fig = pylab.figure(str(sensor))
-        for axis in [ "X","Y","Z" ]:
-            # normalize output to averaged PSD
-            psd = 2 * (sum_fft[sensor][axis] / counts[sensor]) / (sample_rates[sensor] * S2[sensor])
+        welch = spectra.get(sensor, args.fft_window)
+        freq = welch.frequencies()
+        all_psd = welch.psd()
+        for i, axis in enumerate([ "X","Y","Z" ]):
+            # normalized averaged PSD
+            psd = all_psd[i]
 
             # calculate peaks from linear accel data
             # the accel data is less noisy than the gyro data
             if sensor == 'Accel[0]' and axis == "X" and args.notch_params:
                 linear_psd = numpy.sqrt(psd)
                 peaks, _ = signal.find_peaks(psd, prominence=0.1)
-                peak_freqs = freqmap[sensor][peaks]
+                peak_freqs = freq[peaks]
                 print("Peaks: %s" % str(peak_freqs))
                 print("INS_HNTCH_REF = %.4f" % thr_ref)
                 print("INS_HNTCH_FREQ = %.1f" % float(peak_freqs[0]))
@@ -244,7 +96,7 @@ def mavfft_fttd(logfile):
             # convert to db if requested
             if args.fft_scale == 'db':
                 psd = 10 * numpy.log10 (psd)
-            pylab.plot(freqmap[sensor], psd, label=axis)
+            pylab.plot(freq, psd, label=axis)
         pylab.legend(loc='upper right')
         pylab.xlabel('Hz')
         scale_label=''
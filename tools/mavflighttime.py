@@ -6,7 +6,6 @@ work out total flight time for a mavlink log
 from __future__ import print_function
 
 import time
-import glob
 
 from argparse import ArgumentParser
 parser = ArgumentParser(description=__doc__)
@@ -14,6 +13,9 @@ parser.add_argument("--condition", default=None, help="condition for packets")
 parser.add_argument("--groundspeed", type=float, default=3.0, help="groundspeed threshold")
 parser.add_argument("logs", metavar="LOG", nargs="+")
 
+from pymavlink import multilog
+multilog.add_arguments(parser)
+
 args = parser.parse_args()
 
 from pymavlink import mavutil
@@ -22,8 +24,8 @@ from pymavlink.mavextra import distance_two
 
 def flight_time(logfile):
     '''work out flight time for a log file'''
-    print("Processing log %s" % filename)
-    mlog = mavutil.mavlink_connection(filename)
+    print("Processing log %s" % logfile)
+    mlog = mavutil.mavlink_connection(logfile)
 
     in_air = False
     start_time = 0.0
@@ -69,13 +71,15 @@ def flight_time(logfile):
             last_time_usec = time_usec
     return (total_time, total_dist)
 
-total_time = 0.0
-total_dist = 0.0
-for filename in args.logs:
-    for f in glob.glob(filename):
-        (ftime, fdist) = flight_time(f)
+if __name__ == '__main__':
+    total_time = 0.0
+    total_dist = 0.0
+    for r in multilog.run_logs(flight_time, multilog.expand_globs(args.logs), args):
+        if not r.ok():
+            continue
+        (ftime, fdist) = r.result
         total_time += ftime
         total_dist += fdist
 
-print("Total time in air: %u:%02u" % (int(total_time)//60, int(total_time)%60))
-print("Total distance travelled: %.1f meters" % total_dist)
+    print("Total time in air: %u:%02u" % (int(total_time)//60, int(total_time)%60))
+    print("Total distance travelled: %.1f meters" % total_dist)
@@ -25,6 +25,8 @@ parser.add_argument("--wire-protocol", choices=[mavparse.PROTOCOL_0_9, mavparse.
 parser.add_argument("--no-validate", action="store_false", dest="validate", default=mavgen.DEFAULT_VALIDATE, help="Do not perform XML validation. Can speed up code generation if XML files are known to be correct.")
 parser.add_argument("--error-limit", default=mavgen.DEFAULT_ERROR_LIMIT, help="maximum number of validation errors to display")
 parser.add_argument("--strict-units", action="store_true", dest="strict_units", default=mavgen.DEFAULT_STRICT_UNITS, help="Perform validation of units attributes.")
+parser.add_argument("--lazy", action="store_true", default=mavgen.DEFAULT_LAZY, help="Python only: create message classes and enums when first used, for faster imports.")
+parser.add_argument("--schema", action="store_true", default=mavgen.DEFAULT_SCHEMA, help="Python only: also write the message and enum tables to a compact .schema file, which lazy modules load instead of embedding them.")
 parser.add_argument("definitions", metavar="XML", nargs="+", help="MAVLink definitions")
 args = parser.parse_args()
 
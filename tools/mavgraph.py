@@ -200,6 +200,7 @@ parser.add_argument("--flightmode", default=None,
 parser.add_argument("--dialect", default="ardupilotmega", help="MAVLink dialect")
 parser.add_argument("--output", default=None, help="provide an output format")
 parser.add_argument("--timeshift", type=float, default=0, help="shift time on first graph in seconds")
+parser.add_argument("--vector", action='store_true', help="evaluate fields over whole columns of the log at once using numpy.  Cannot be specified with --xaxis.")
 parser.add_argument("logs_fields", metavar="<LOG or FIELD>", nargs="+")
 args = parser.parse_args()
 
@@ -209,6 +210,10 @@ if args.flightmode is not None and args.xaxis:
     print("Cannot request flightmode backgrounds with an x-axis expression")
     sys.exit(1)
 
+if args.vector and args.xaxis:
+    print("Cannot use vector evaluation with an x-axis expression")
+    sys.exit(1)
+
 if args.flightmode is not None and args.flightmode not in colourmap:
     print("Unknown flight controller '%s' in specification of --flightmode (choose from %s)" % (args.flightmode, ",".join(colourmap.keys())))
     sys.exit(1)
@@ -277,10 +282,41 @@ def add_data(t, msg, vars, flightmode):
         y[i].append(v)
         x[i].append(xv)
 
+def process_file_vector(mlog, timeshift):
+    '''process one file, evaluating each field over whole columns'''
+    from pymavlink import mavarray
+    types = set(msg_types)
+    if args.condition is not None:
+        # types only in the condition are needed to evaluate it
+        types = types.union(re.findall(re_caps, args.condition))
+    arrays = mavarray.extract_arrays(mlog, types)
+    if args.flightmode is not None:
+        for (mode, t0, t1) in mlog.flightmode_list():
+            modes.append((matplotlib.dates.date2num(datetime.datetime.fromtimestamp(t0+timeshift)), mode))
+    for i in range(0, len(fields)):
+        f = fields[i]
+        if f.endswith(":2"):
+            axes[i] = 2
+            f = f[:-2]
+        if f.endswith(":1"):
+            first_only[i] = True
+            f = f[:-2]
+        (t, v) = mavarray.evaluate_expression(f, arrays, args.condition)
+        if len(t) == 0:
+            continue
+        # convert to matplotlib dates relative to the first sample
+        t0 = t[0] + timeshift
+        base = matplotlib.dates.date2num(datetime.datetime.fromtimestamp(t0))
+        x[i].extend((base + (t + timeshift - t0) / 86400.0).tolist())
+        y[i].extend(v.tolist())
+
 def process_file(filename, timeshift):
     '''process one file'''
     print("Processing %s" % filename)
     mlog = mavutil.mavlink_connection(filename, notimestamps=args.notimestamps, zero_time_base=args.zero_time_base, dialect=args.dialect)
+    if args.vector:
+        process_file_vector(mlog, timeshift)
+        return
     vars = {}
     all_messages = {}
 
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+'''
+load test MAVLink receiving with synthetic traffic from several vehicles
+'''
+from __future__ import print_function
+
+import json
+import os
+
+from argparse import ArgumentParser
+parser = ArgumentParser(description=__doc__)
+parser.add_argument("--vehicles", type=int, default=4, help="number of vehicles")
+parser.add_argument("--sysid", type=int, default=1, help="system ID of the first vehicle")
+parser.add_argument("--streams", default='default',
+                    help="stream set (minimal, default or attitude) or comma separated STREAM:RATE list")
+parser.add_argument("--rate-scale", type=float, default=1.0, help="multiply all stream rates by this")
+parser.add_argument("--duration", type=float, default=10.0, help="seconds to send for")
+parser.add_argument("--transport", default='udp', choices=['udp', 'tcp'], help="transport to send over")
+parser.add_argument("--loss", type=float, default=0.0, help="fraction of frames to drop")
+parser.add_argument("--reorder", type=float, default=0.0, help="fraction of frames to send late")
+parser.add_argument("--duplicate", type=float, default=0.0, help="fraction of frames to send twice")
+parser.add_argument("--signing-key", default=None, help="sign frames with the SHA256 of this passphrase")
+parser.add_argument("--target", default=None,
+                    help="send to HOST:PORT instead of a receiver in this process")
+parser.add_argument("--mav20", action='store_true', help="send MAVLink2")
+parser.add_argument("--dialect", default="ardupilotmega", help="MAVLink dialect")
+parser.add_argument("--seed", type=int, default=0, help="random seed")
+parser.add_argument("--json", default=None, help="also save the results as JSON to this file")
+args = parser.parse_args()
+
+if args.mav20 or args.signing_key is not None:
+    os.environ['MAVLINK20'] = '1'
+else:
+    os.environ.pop('MAVLINK20', None)
+
+from pymavlink import mavloadtest
+from pymavlink import mavutil
+
+mavutil.set_dialect(args.dialect)
+
+streams = args.streams
+if not streams in mavloadtest.STREAM_SETS:
+    streams = []
+    for s in args.streams.split(','):
+        if ':' in s:
+            (name, rate) = s.split(':')
+            streams.append((name, float(rate)))
+        else:
+            streams.append(s)
+
+key = None
+if args.signing_key is not None:
+    import hashlib
+    key = hashlib.sha256(args.signing_key.encode('utf-8')).digest()
+
+test = mavloadtest.LoadTest(vehicles=args.vehicles, streams=streams, transport=args.transport,
+                            rate_scale=args.rate_scale, loss=args.loss, reorder=args.reorder,
+                            duplicate=args.duplicate, signing_key=key, seed=args.seed,
+                            sysid_base=args.sysid)
+print("Sending %.0f msg/s from %u vehicles for %.1fs" % (test.expected_rate(), args.vehicles, args.duration))
+if args.target is not None:
+    (host, port) = args.target.rsplit(':', 1)
+    result = test.send_to((host, int(port)), args.duration)
+else:
+    result = test.run(args.duration)
+print(result)
+
+if args.json is not None:
+    with open(args.json, 'w') as f:
+        json.dump(result.as_dict(), f, indent=1, sort_keys=True)
@@ -32,12 +32,14 @@ parser.add_argument("--condition", default=None, help="select packets by conditi
 parser.add_argument("-q", "--quiet", action='store_true', help="don't display packets")
 parser.add_argument("-o", "--output", default=None, help="output matching packets to give file")
 parser.add_argument("-p", "--parms", action='store_true', help="preserve parameters in output with -o")
-parser.add_argument("--format", default=None, help="Change the output format between 'standard', 'json', 'csv' and 'mat'. For the CSV output, you must supply types that you want. For MAT output, specify output file with --mat_file")
+parser.add_argument("--format", default=None, help="Change the output format between 'standard', 'json', 'csv', 'mat', 'parquet', 'arrow' and 'hdf5'. For the CSV output, you must supply types that you want. For MAT output, specify output file with --mat_file. For parquet, arrow and hdf5 output, specify the output directory or file with --export_path")
 parser.add_argument("--csv_sep", dest="csv_sep", default=",", help="Select the delimiter between columns for the output CSV file. Use 'tab' to specify tabs. Only applies when --format=csv")
 parser.add_argument("--types", default=None, help="types of messages (comma separated with wildcard)")
 parser.add_argument("--nottypes", default=None, help="types of messages not to include (comma separated with wildcard)")
 parser.add_argument("--mat_file", dest="mat_file", help="Output file path for MATLAB file output. Only applies when --format=mat")
 parser.add_argument("-c", "--compress", action='store_true', help="Compress .mat file data")
+parser.add_argument("--export_path", dest="export_path", help="Output directory for parquet and arrow output (one file per message type) or file for hdf5 output")
+parser.add_argument("--row_group_size", dest="row_group_size", type=int, default=65536, help="Rows per row group for parquet, arrow and hdf5 output")
 parser.add_argument("--dialect", default="ardupilotmega", help="MAVLink dialect")
 parser.add_argument("--zero-time-base", action='store_true', help="use Z time base for DF logs")
 parser.add_argument("--no-bad-data", action='store_true', help="Don't output corrupted messages")
@@ -68,10 +70,9 @@ if args.profile:
     import yappi    # We do the import here so that we won't barf if run normally and yappi not available
     yappi.start()
 
-if args.format == 'mat':
-    # Load these modules here, as they're only needed for MAT file creation
-    import scipy.io
-    import numpy as np
+if args.format in ['mat', 'parquet', 'arrow', 'hdf5']:
+    # Load this module here, as it's only needed for MAT and columnar output
+    from pymavlink import logexport
 
 filename = args.log
 mlog = mavutil.mavlink_connection(filename, planner_format=args.planner,
@@ -181,9 +182,39 @@ if isbin and args.format == 'csv':
     # we need FMT messages for column headings
     match_types.append("FMT")
 
+if args.format in ['parquet', 'arrow', 'hdf5']:
+    # columnar output writes a table per message type without going through the loop below
+    if args.export_path is None:
+        print("You must specify an output path with --export_path for %s output" % args.format)
+        sys.exit(1)
+    counts = logexport.export_log(mlog, args.export_path, format=args.format,
+                                  types=types, nottypes=nottypes, condition=args.condition,
+                                  row_group_size=args.row_group_size)
+    if not args.quiet:
+        for mtype in sorted(counts.keys()):
+            print("%s %u" % (mtype, counts[mtype]))
+    sys.exit(0)
+
 # Keep track of data from the current timestep. If the following timestep has the same data, it's stored in here as well. Output should therefore have entirely unique timesteps.
-MAT = {}    # Dictionary to hold output data for 'mat' format option
-while True:
+MAT = None  # collects output data for 'mat' format option
+bulk_only = False
+if args.format == 'mat':
+    MAT = logexport.MATWriter(mlog)
+    if (isbin and args.condition is None and not args.reduce and output is None and
+        args.source_system is None and args.source_component is None and args.link is None):
+        # without per-message filtering, dataflash columns can be copied straight from the log
+        remaining = []
+        for k in sorted(mlog.name_to_id.keys()):
+            if k == 'FMT' or (types is not None and not match_type(k, types)):
+                continue
+            if nottypes is not None and match_type(k, nottypes):
+                continue
+            if not MAT.add_bulk(k):
+                remaining.append(k)
+        match_types = remaining
+        bulk_only = len(remaining) == 0
+
+while not bulk_only:
     m = mlog.recv_match(blocking=args.follow, type=match_types)
     if m is None:
         # write the final csv line before exiting
@@ -309,22 +340,7 @@ while True:
         # packet), append the data in this packet to the
         # corresponding list
         if m.get_type()!='FMT':
-
-            # If this packet type has not yet been
-            # seen, add a new entry to the big dict
-            if m.get_type() not in MAT:
-                MAT[m.get_type()] = {}
-
-            md = m.to_dict()
-            del md['mavpackettype']
-            cols = md.keys()
-            for col in cols:
-                # If this column hasn't had data entered,
-                # make a new key and list
-                if col in MAT[m.get_type()]:
-                    MAT[m.get_type()][col].append(md[col])
-                else:
-                    MAT[m.get_type()][col] = [md[col]]
+            MAT.add(m)
     elif args.show_types:
         # do nothing
         pass
@@ -347,22 +363,7 @@ while True:
 
 # Export the .mat file
 if args.format == 'mat':
-    # Rearrange the dictionary so it exports correctly
-    MAT2 = {}
-    for packet_type in MAT:
-        vars = list(MAT[packet_type].keys())
-        data = []   # 2D list
-        i = 0
-        MAT2[packet_type+'_label'] = np.zeros((len(vars), 1), dtype=object)
-        for var in vars:
-            data.append(MAT[packet_type][var])
-            MAT2[packet_type+'_label'][i] = var
-            i += 1
-        # Transpose the list of lists
-        MAT2[packet_type] = list(map(list, zip(*data)))
-
-    # Save file
-    scipy.io.savemat(args.mat_file, MAT2, do_compression=args.compress)
+    MAT.save(args.mat_file, do_compression=args.compress)
 
 if args.show_types:
     for msgType in available_types:
@@ -5,6 +5,8 @@ show MAVLink packet loss
 '''
 from __future__ import print_function
 
+import time
+
 from argparse import ArgumentParser
 parser = ArgumentParser(description=__doc__)
 parser.add_argument("--no-timestamps", dest="notimestamps", action='store_true', help="Log doesn't have timestamps")
@@ -12,26 +14,26 @@ parser.add_argument("--planner", action='store_true', help="use planner file for
 parser.add_argument("--robust", action='store_true', help="Enable robust parsing (skip over bad data)")
 parser.add_argument("--condition", default=None, help="condition for packets")
 parser.add_argument("--dialect", default="ardupilotmega", help="MAVLink dialect")
+parser.add_argument("--window", type=int, default=32,
+                    help="frames arriving up to this many behind are reordered rather than lost")
+parser.add_argument("--period", type=float, default=None, help="also show the loss over periods of this many seconds")
+parser.add_argument("--gaps", action='store_true', help="show histograms of the lengths of gaps")
 parser.add_argument("logs", metavar="LOG", nargs="+")
 
 args = parser.parse_args()
 
 from pymavlink import mavutil
+from pymavlink import mavseq
 
 
-def mavloss(logfile):
-    '''work out signal loss times for a log file'''
-    print("Processing log %s" % filename)
-    mlog = mavutil.mavlink_connection(filename,
-                                      planner_format=args.planner,
-                                      notimestamps=args.notimestamps,
-                                      dialect=args.dialect,
-                                      robust_parsing=args.robust)
-
+def read_messages(mlog):
+    '''read every message, returning the sequence arrays and the
+    reasons for parsing errors'''
+    import numpy as np
     # Track the reasons for MAVLink parsing errors and print them all out at the end.
     reason_ids = set()
     reasons = []
-
+    frames = []
     while True:
         m = mlog.recv_match(condition=args.condition)
 
@@ -45,10 +47,44 @@ def mavloss(logfile):
             if reason_id not in reason_ids:
                 reason_ids.add(reason_id)
                 reasons.append(m.reason)
+            continue
+        frames.append((m._timestamp, m.get_srcSystem(), m.get_srcComponent(), m.get_seq()))
+    if len(frames) == 0:
+        return ((np.zeros(0), np.zeros(0, int), np.zeros(0, int), np.zeros(0, int)), reasons)
+    a = np.array(frames)
+    return ((a[:,0], a[:,1].astype(int), a[:,2].astype(int), a[:,3].astype(int)), reasons)
+
+
+def mavloss(logfile):
+    '''work out signal loss times for a log file'''
+    print("Processing log %s" % filename)
+    mlog = mavutil.mavlink_connection(filename,
+                                      planner_format=args.planner,
+                                      notimestamps=args.notimestamps,
+                                      dialect=args.dialect,
+                                      robust_parsing=args.robust)
+
+    if args.condition is None and hasattr(mlog, 'offsets'):
+        # indexed logs have no bad data, and the headers can be read directly
+        arrays = mavseq.log_sequences(mlog)
+        reasons = []
+    else:
+        (arrays, reasons) = read_messages(mlog)
+
+    results = mavseq.analyse(*arrays, window=args.window, period=args.period)
+    total = mavseq.combine([r[0] for r in results.values()])
 
     # Print out the final packet loss results
-    print("%u packets, %u lost %.1f%%" % (
-            mlog.mav_count, mlog.mav_loss, mlog.packet_loss()))
+    print("%u packets, %u lost %.1f%%, %u duplicated, %u reordered" % (
+            total.received, total.lost, total.loss_percent(), total.duplicates, total.reordered))
+    for src in sorted(results.keys()):
+        (summary, periods) = results[src]
+        print("  %u:%u %s" % (src[0], src[1], summary))
+        if args.gaps and len(summary.gaps) > 0:
+            print("    gaps: %s" % ' '.join(["%ux%u" % (n, summary.gaps[n]) for n in sorted(summary.gaps.keys())]))
+        if periods is not None:
+            for (row, loss) in zip(periods, mavseq.periods_loss(periods)):
+                print("    %s %4u expected %5.1f%% lost" % (time.asctime(time.localtime(row[0])), row[1], loss))
 
     # Also print out the reasons why losses occurred
     if len(reasons) > 0:
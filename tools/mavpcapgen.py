@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+'''
+generate a pcap capture of synthetic MAVLink traffic from several
+vehicles, for measuring capture tools such as the Wireshark dissector
+'''
+from __future__ import print_function
+
+import time
+
+from argparse import ArgumentParser
+parser = ArgumentParser(description=__doc__)
+parser.add_argument("--count", type=int, default=1000000, help="number of MAVLink frames")
+parser.add_argument("--vehicles", type=int, default=10, help="number of vehicles")
+parser.add_argument("--rate", type=float, default=1000.0, help="frames per second")
+parser.add_argument("--messages", default=None, help="comma separated list of message types to send")
+parser.add_argument("--frames-per-datagram", type=int, default=1, help="MAVLink frames in each UDP datagram")
+parser.add_argument("--corrupt", type=float, default=0.0, help="fraction of frames to corrupt")
+parser.add_argument("--raw", action='store_true', help="write bare MAVLink with the USER0 link type")
+parser.add_argument("--dialect", default="ardupilotmega", help="MAVLink dialect")
+parser.add_argument("--mav10", action='store_true', help="use MAVLink 1.0")
+parser.add_argument("--seed", type=int, default=0, help="random seed")
+parser.add_argument("output", metavar="PCAP")
+
+args = parser.parse_args()
+
+import os
+if args.mav10:
+    os.environ.pop('MAVLINK20', None)
+else:
+    os.environ['MAVLINK20'] = '1'
+
+from pymavlink import mavpcap
+from pymavlink import mavutil
+
+mavutil.set_dialect(args.dialect)
+
+messages = None
+if args.messages is not None:
+    messages = [m.strip().upper() for m in args.messages.split(',')]
+
+t0 = time.time()
+mavpcap.generate_capture(args.output, args.count, vehicles=args.vehicles, rate=args.rate,
+                         messages=messages, frames_per_datagram=args.frames_per_datagram,
+                         corrupt=args.corrupt, seed=args.seed,
+                         linktype=mavpcap.LINKTYPE_USER0 if args.raw else mavpcap.LINKTYPE_ETHERNET)
+print("Wrote %u frames to %s (%u bytes) in %.1fs" % (args.count, args.output,
+                                                     os.path.getsize(args.output), time.time() - t0))
@@ -4,7 +4,8 @@
 play back a mavlink log as a FlightGear FG NET stream, and as a
 realtime mavlink stream
 
-Useful for visualising flights
+Useful for visualising flights. The replay timing is done by
+pymavlink.mavreplay; see tools/mavreplay.py for replaying without a GUI
 '''
 from __future__ import print_function
 from future import standard_library
@@ -40,6 +41,12 @@ from pymavlink import mavutil
 
 filename = args.log
 
+from pymavlink import mavreplay
+
+# messages used for the FlightGear output and the display
+HANDLED_MESSAGES = ['GPS_RAW', 'GPS_RAW_INT', 'VFR_HUD', 'ATTITUDE', 'RC_CHANNELS_SCALED',
+                    'STATUSTEXT', 'HEARTBEAT']
+
 
 def LoadImage(filename):
     '''return an image from the images/ directory'''
@@ -52,11 +59,15 @@ class App(object):
     def __init__(self, filename):
         self.root = tkinter.Tk()
 
-        self.filesize = os.path.getsize(filename)
-        self.filepos = 0.0
-
         self.mlog = mavutil.mavlink_connection(filename, planner_format=args.planner,
                                                robust_parsing=True)
+        self.schedule = mavreplay.load_schedule(self.mlog, condition=args.condition)
+        if len(self.schedule) == 0:
+            sys.exit(1)
+        self.start_time = self.schedule.start_time()
+        self.duration = max(self.schedule.duration(), 1.0e-3)
+        self.filepos = 0.0
+
         self.mout = []
         for m in args.out:
             self.mout.append(mavutil.mavlink_connection(m, input=False, baud=args.baudrate))
@@ -66,11 +77,13 @@ class App(object):
             self.fgout.append(mavutil.mavudp(f, input=False))
 
         self.fdm = fgFDM.fgFDM()
+        self.decoder = mavutil.mavlink.MAVLink(None)
+        self.flightmode_text = ''
 
-        self.msg = self.mlog.recv_match(condition=args.condition)
-        if self.msg is None:
-            sys.exit(1)
-        self.last_timestamp = getattr(self.msg, '_timestamp')
+        ids = [getattr(mavutil.mavlink, 'MAVLINK_MSG_ID_' + name, None) for name in HANDLED_MESSAGES]
+        self.replayer = mavreplay.Replayer(self.schedule, self.mout,
+                                           callback=self.handle_message,
+                                           callback_ids=[i for i in ids if i is not None])
 
         self.paused = False
 
@@ -87,10 +100,11 @@ class App(object):
         self.clock = tkinter.Label(self.topframe,text="")
         self.clock.pack(side=tkinter.RIGHT)
 
-        self.playback = tkinter.Spinbox(self.topframe, from_=0, to=20, increment=0.1, width=3)
+        self.playback = tkinter.Spinbox(self.topframe, from_=0, to=100, increment=0.1, width=4)
         self.playback.pack(side=tkinter.BOTTOM)
         self.playback.delete(0, "end")
         self.playback.insert(0, 1)
+        self.speed = 1.0
 
         self.buttons = {}
         self.button('quit', 'gtk-quit.gif', self.frame.quit)
@@ -101,8 +115,11 @@ class App(object):
         self.flightmode = tkinter.Label(self.frame,text="")
         self.flightmode.pack(side=tkinter.RIGHT)
 
-        self.next_message()
+        self.replayer.start()
+        self.update_display()
         self.root.mainloop()
+        self.replayer.stop()
+        print(self.replayer.stats())
 
     def button(self, name, filename, command):
         '''add a button'''
@@ -119,90 +136,64 @@ class App(object):
     def pause(self):
         '''pause playback'''
         self.paused = not self.paused
+        if self.paused:
+            self.replayer.pause()
+        elif self.speed > 0:
+            self.replayer.resume()
+
+    def seek(self, t):
+        '''continue playback from log time t'''
+        t = min(max(t, self.start_time), self.start_time + self.duration)
+        self.replayer.seek(t)
+        if not self.replayer.running:
+            self.replayer.start()
 
     def rewind(self):
         '''rewind 10%'''
-        pos = int(self.mlog.f.tell() - 0.1*self.filesize)
-        if pos < 0:
-            pos = 0
-        self.mlog.f.seek(pos)
-        self.find_message()
+        self.seek(self.replayer.log_time() - 0.1*self.duration)
 
     def forward(self):
         '''forward 10%'''
-        pos = int(self.mlog.f.tell() + 0.1*self.filesize)
-        if pos > self.filesize:
-            pos = self.filesize - 2048
-        self.mlog.f.seek(pos)
-        self.find_message()
+        self.seek(self.replayer.log_time() + 0.1*self.duration)
 
     def status(self):
         '''show status'''
-        for m in sorted(self.mlog.messages.keys()):
-            print(str(self.mlog.messages[m]))
-
-
-
-    def find_message(self):
-        '''find the next valid message'''
-        while True:
-            self.msg = self.mlog.recv_match(condition=args.condition)
-            if self.msg is not None and self.msg.get_type() != 'BAD_DATA':
-                break
-            if self.mlog.f.tell() > self.filesize - 10:
-                self.paused = True
-                break
-        self.last_timestamp = getattr(self.msg, '_timestamp')
+        print(self.replayer.stats())
 
     def slew(self, value):
-        '''move to a given position in the file'''
+        '''move to a given position in the log'''
         if float(value) != self.filepos:
-            pos = float(value) * self.filesize
-            self.mlog.f.seek(int(pos))
-            self.find_message()
-
-
-    def next_message(self):
-        '''called as each msg is ready'''
-
-        msg = self.msg
-        if msg is None:
-            self.paused = True
-
-        if self.paused:
-            self.root.after(100, self.next_message)
-            return
+            self.seek(self.start_time + float(value) * self.duration)
 
+    def update_display(self):
+        '''called periodically to follow the replay'''
         try:
             speed = float(self.playback.get())
         except:
             speed = 0.0
-        timestamp = getattr(msg, '_timestamp')
-
+        if speed != self.speed:
+            if speed <= 0:
+                self.replayer.pause()
+            else:
+                self.replayer.set_speed(speed)
+                if not self.paused:
+                    self.replayer.resume()
+            self.speed = speed
+
+        timestamp = self.replayer.log_time()
         now = time.strftime("%H:%M:%S", time.localtime(timestamp))
         self.clock.configure(text=now)
-
-        if speed == 0.0:
-            self.root.after(200, self.next_message)
-        else:
-            self.root.after(int(1000*(timestamp - self.last_timestamp) / speed), self.next_message)
-        self.last_timestamp = timestamp
-
-        while True:
-            self.msg = self.mlog.recv_match(condition=args.condition)
-            if self.msg is None and self.mlog.f.tell() > self.filesize - 10:
-                self.paused = True
-                return
-            if self.msg is not None and self.msg.get_type() != "BAD_DATA":
-                break
-
-        pos = float(self.mlog.f.tell()) / self.filesize
-        self.slider.set(pos)
+        self.slider.set((timestamp - self.start_time) / self.duration)
         self.filepos = self.slider.get()
+        self.flightmode.configure(text=self.flightmode_text)
+        self.root.after(200, self.update_display)
 
-        if msg.get_type() != "BAD_DATA":
-            for m in self.mout:
-                m.write(msg.get_msgbuf())
+    def handle_message(self, timestamp, buf):
+        '''called from the replay thread for messages we use'''
+        try:
+            msg = self.decoder.decode(bytearray(buf))
+        except Exception:
+            return
 
         if msg.get_type() == "GPS_RAW":
             self.fdm.set('latitude', msg.lat, units='degrees')
@@ -240,13 +231,8 @@ class App(object):
         if msg.get_type() == 'STATUSTEXT':
             print("APM: %s" % msg.text)
 
-        if msg.get_type() == 'SYS_STATUS':
-            self.flightmode.configure(text=self.mlog.flightmode)
-
-        if msg.get_type() == "BAD_DATA":
-            if mavutil.all_printable(msg.data):
-                sys.stdout.write(msg.data)
-                sys.stdout.flush()
+        if msg.get_type() == 'HEARTBEAT':
+            self.flightmode_text = mavutil.mode_string_v10(msg)
 
         if self.fdm.get('latitude') != 0:
             for f in self.fgout:
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+'''
+replay a telemetry log (or capture) to one or more MAVLink outputs at
+its original timing, or faster
+'''
+from __future__ import print_function
+
+import time
+
+from argparse import ArgumentParser
+parser = ArgumentParser(description=__doc__)
+parser.add_argument("--out", action='append', default=[], help="MAVLink output, e.g. udpout:127.0.0.1:14550")
+parser.add_argument("--speed", type=float, default=1.0, help="replay speed")
+parser.add_argument("--start", type=float, default=0, help="start this many seconds into the log")
+parser.add_argument("--end", type=float, default=None, help="stop this many seconds into the log")
+parser.add_argument("--types", default=None, help="comma separated list of message types to replay")
+parser.add_argument("--condition", default=None, help="only replay messages matching condition")
+parser.add_argument("--loop", action='store_true', help="replay the log repeatedly")
+parser.add_argument("--spin", type=float, default=0.0005,
+                    help="busy wait this many seconds before each send, for more accurate timing")
+parser.add_argument("--max-lag", type=float, default=0.5,
+                    help="restart the timing when this many seconds behind")
+parser.add_argument("--stats-interval", type=float, default=5.0, help="seconds between statistics")
+parser.add_argument("--baudrate", type=int, default=57600, help="baud rate for serial outputs")
+parser.add_argument("--dialect", default=None, help="MAVLink dialect")
+parser.add_argument("log", metavar="LOG")
+args = parser.parse_args()
+
+from pymavlink import mavreplay
+from pymavlink import mavutil
+
+if len(args.out) == 0:
+    args.out = ['udpout:127.0.0.1:14550']
+
+types = None
+if args.types is not None:
+    types = [t.strip() for t in args.types.split(',')]
+
+t0 = time.time()
+mlog = mavutil.mavlink_connection(args.log, dialect=args.dialect)
+schedule = mavreplay.load_schedule(mlog, types=types, condition=args.condition)
+if len(schedule) == 0:
+    print("No messages to replay")
+    raise SystemExit(1)
+print("Loaded %u messages over %.1fs in %.1fs" % (len(schedule), schedule.duration(), time.time() - t0))
+
+outputs = [mavutil.mavlink_connection(o, input=False, baud=args.baudrate) for o in args.out]
+replayer = mavreplay.Replayer(schedule, outputs, speed=args.speed, spin=args.spin,
+                              max_lag=args.max_lag, loop=args.loop)
+start = schedule.start_time()
+replayer.seek(start + args.start)
+end_time = None
+if args.end is not None:
+    end_time = start + args.end
+
+replayer.start(end_time=end_time)
+try:
+    while replayer.thread.is_alive():
+        replayer.thread.join(args.stats_interval)
+        print("%.1fs: %s" % (replayer.log_time() - start, replayer.stats()))
+except KeyboardInterrupt:
+    replayer.stop()
+print(replayer.stats())
@@ -6,6 +6,7 @@ search a set of log files for a condition
 from __future__ import print_function
 
 from pymavlink import mavutil
+from pymavlink import multilog
 
 from argparse import ArgumentParser
 parser = ArgumentParser(description=__doc__)
@@ -14,6 +15,7 @@ parser.add_argument("--types", default=None, help="message types to look for (co
 parser.add_argument("--stop", action='store_true', help="stop when message type found")
 parser.add_argument("--stopcondition", action='store_true', help="stop when condition met")
 parser.add_argument("logs", metavar="LOG", nargs="+")
+multilog.add_arguments(parser)
 
 args = parser.parse_args()
 
@@ -36,5 +38,6 @@ def mavsearch(filename):
             break
 
 
-for f in args.logs:
-    mavsearch(f)
+if __name__ == '__main__':
+    for r in multilog.run_logs(mavsearch, args.logs, args):
+        pass
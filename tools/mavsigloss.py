@@ -15,11 +15,35 @@ parser.add_argument("--robust", action='store_true', help="Enable robust parsing
 parser.add_argument("--deltat", type=float, default=1.0, help="loss threshold in seconds")
 parser.add_argument("--condition", default=None, help="select packets by condition")
 parser.add_argument("--types", default=None, help="types of messages (comma separated)")
+parser.add_argument("--loss", type=float, default=None,
+                    help="also show periods of --period seconds losing more than this percentage of packets")
+parser.add_argument("--period", type=float, default=1.0, help="period for --loss in seconds")
 parser.add_argument("logs", metavar="LOG", nargs="+")
 
 args = parser.parse_args()
 
 from pymavlink import mavutil
+from pymavlink import mavseq
+
+
+def show_gaps(times):
+    '''print the gaps longer than deltat in an array of times'''
+    import numpy as np
+    gaps = np.flatnonzero(np.diff(times) > args.deltat)
+    for i in gaps:
+        t = times[i+1]
+        print("Sig lost for %.1fs at %s" % (t-times[i], time.asctime(time.localtime(t))))
+
+
+def show_loss(arrays):
+    '''print the periods with more than the loss threshold lost'''
+    results = mavseq.analyse(*arrays, period=args.period)
+    for src in sorted(results.keys()):
+        periods = results[src][1]
+        for (row, loss) in zip(periods, mavseq.periods_loss(periods)):
+            if loss > args.loss:
+                print("%u:%u lost %.1f%% of %u packets at %s" % (
+                    src[0], src[1], loss, row[1], time.asctime(time.localtime(row[0]))))
 
 
 def sigloss(logfile):
@@ -30,16 +54,28 @@ def sigloss(logfile):
                                       notimestamps=args.notimestamps,
                                       robust_parsing=args.robust)
 
+    if (args.condition is None and args.types is None and not args.notimestamps and
+        hasattr(mlog, 'offsets')):
+        # read the timestamps and sequence numbers straight from the index
+        arrays = mavseq.log_sequences(mlog)
+        show_gaps(arrays[0])
+        if args.loss is not None:
+            show_loss(arrays)
+        return
+
     last_t = 0
 
     types = args.types
     if types is not None:
         types = types.split(',')
 
+    frames = []
     while True:
         m = mlog.recv_match(condition=args.condition)
         if m is None:
-            return
+            break
+        if args.loss is not None and m.get_type() != 'BAD_DATA':
+            frames.append((m._timestamp, m.get_srcSystem(), m.get_srcComponent(), m.get_seq()))
         if types is not None and m.get_type() not in types:
             continue
         if args.notimestamps:
@@ -53,6 +89,11 @@ def sigloss(logfile):
                 print("Sig lost for %.1fs at %s" % (t-last_t, time.asctime(time.localtime(t))))
         last_t = t
 
+    if args.loss is not None and len(frames) > 0:
+        import numpy as np
+        a = np.array(frames)
+        show_loss((a[:,0], a[:,1].astype(int), a[:,2].astype(int), a[:,3].astype(int)))
+
 total = 0.0
 for filename in args.logs:
     sigloss(filename)
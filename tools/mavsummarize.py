@@ -6,7 +6,6 @@ Summarize MAVLink logs. Useful for identifying which log is of interest in a lar
 from __future__ import print_function
 from builtins import object
 
-import glob
 import time
 
 from argparse import ArgumentParser
@@ -16,6 +15,9 @@ parser.add_argument("--condition", default=None, help="condition for packets")
 parser.add_argument("--dialect", default="ardupilotmega", help="MAVLink dialect")
 parser.add_argument("logs", metavar="LOG", nargs="+")
 
+from pymavlink import multilog
+multilog.add_arguments(parser)
+
 args = parser.parse_args()
 
 from pymavlink import mavutil
@@ -38,9 +40,11 @@ class Totals(object):
 totals = Totals()
 
 def PrintSummary(logfile):
-    '''Calculate some interesting datapoints of the file'''
+    '''Calculate some interesting datapoints of the file, returning
+    the total time and distance'''
+    print("Processing log %s" % logfile)
     # Open the log file
-    mlog = mavutil.mavlink_connection(filename, notimestamps=args.notimestamps, dialect=args.dialect)
+    mlog = mavutil.mavlink_connection(logfile, notimestamps=args.notimestamps, dialect=args.dialect)
 
     autonomous_sections = 0 # How many different autonomous sections there are
     autonomous = False # Whether the vehicle is currently autonomous at this point in the logfile
@@ -119,7 +123,7 @@ def PrintSummary(logfile):
     # If there were no messages processed, say so
     if start_time is None:
         print("ERROR: No messages found.")
-        return
+        return None
 
     # If the vehicle ends in autonomous mode, make sure we log the total time
     if autonomous:
@@ -150,13 +154,14 @@ def PrintSummary(logfile):
     if autonomous_sections > 0:
         print("Autonomous time (mm:ss): {:3.0f}:{:02.0f}".format(auto_time / 60, auto_time % 60))
 
-    totals.time += total_time
-    totals.distance += total_dist
-    totals.flights += 1
+    return (total_time, total_dist)
 
-for filename in args.logs:
-    for f in glob.glob(filename):
-        print("Processing log %s" % filename)
-        PrintSummary(f)
+if __name__ == '__main__':
+    for r in multilog.run_logs(PrintSummary, multilog.expand_globs(args.logs), args):
+        if r.result is None:
+            continue
+        totals.time += r.result[0]
+        totals.distance += r.result[1]
+        totals.flights += 1
 
-totals.print_summary()
+    totals.print_summary()